@@ -0,0 +1,499 @@
+# This file implements a small client of the adb server protocol, which talks to the adb server socket directly instead
+#   of spawning one adb process per command (e.g., the readiness probes polled every second, the coverage pulls).
+# The host services (e.g., get-state) and the shell commands take one short-lived connection each (the adb server
+#   serves one service per connection), while the file transfers of a device (pull, push, install) share one
+#   persistent sync connection, which is reopened only when it breaks.
+# The adb server is the one of ANDROID_ADB_SERVER_PORT (default: 5037) on localhost, so the client can also be pointed
+#   at a fake adb server for testing.
+# The emulator console commands (e.g., "adb emu kill") do not go through the adb server, the client sends them to the
+#   console port of the emulator (its avd serial's port) directly, after the auth token of the console.
+# Usage (for the harnesses, see harness_common.sh):
+#   python3 adb_client.py -s emulator-5554 wait-for-boot 120
+#   python3 adb_client.py -s emulator-5554 wait-for-package com.x 30
+#   python3 adb_client.py -s emulator-5554 root 60
+#   python3 adb_client.py -s emulator-5554 install xx.apk -g
+#   python3 adb_client.py -s emulator-5554 install-until-installed xx.apk com.x 3 -g
+#   python3 adb_client.py -s emulator-5554 shell getprop sys.boot_completed
+#   python3 adb_client.py -s emulator-5554 push ape.jar /data/local/tmp/
+#   python3 adb_client.py -s emulator-5554 pull /sdcard/x.ec x.ec
+#   python3 adb_client.py -s emulator-5554 logcat logcat.log -v time AndroidRuntime:E '*:S'
+#   python3 adb_client.py -s emulator-5554 kill-processes monkey 30
+#   python3 adb_client.py -s emulator-5554 emu-kill 30
+
+import os
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import threading
+import time
+from argparse import ArgumentParser, REMAINDER
+from typing import Dict, Optional
+
+DEFAULT_ADB_SERVER_PORT = 5037
+# the time (in seconds) to wait for a reply of the adb server
+SOCKET_TIMEOUT = 30
+# the maximum size of a DATA chunk of the sync protocol
+SYNC_DATA_MAX = 64 * 1024
+POLL_INTERVAL = 1
+# the dir on the device where the apks are pushed before being installed
+INSTALL_TMP_DIR = "/data/local/tmp"
+# the time (in seconds) to wait for pm to install an apk
+INSTALL_TIMEOUT = 300
+# the time (in seconds) for adbd to go down after "adb root"
+ROOT_RESTART_TIMEOUT = 5
+# the auth token of the emulator console, in $ANDROID_EMULATOR_HOME or the home dir
+EMULATOR_CONSOLE_AUTH_TOKEN = ".emulator_console_auth_token"
+
+
+class AdbError(Exception):
+    pass
+
+
+class SyncFailure(AdbError):
+    # the device refused the transfer (e.g., no such file)
+    pass
+
+
+def get_adb_server_port():
+    return int(os.environ.get('ANDROID_ADB_SERVER_PORT', DEFAULT_ADB_SERVER_PORT))
+
+
+def read_exactly(sock: socket.socket, size: int):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if len(chunk) == 0:
+            raise AdbError("the adb server closed the connection")
+        data += chunk
+    return data
+
+
+def read_until_closed(sock: socket.socket):
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if len(chunk) == 0:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def get_console_auth_token():
+    for directory in [os.environ.get('ANDROID_EMULATOR_HOME'), os.path.expanduser("~")]:
+        if directory is None:
+            continue
+        token_path = os.path.join(directory, EMULATOR_CONSOLE_AUTH_TOKEN)
+        if os.path.exists(token_path):
+            with open(token_path, "r") as token_file:
+                return token_file.read().strip()
+    return None
+
+
+def emulator_console(port: int, command: str, timeout: float = SOCKET_TIMEOUT):
+    # the reply of the emulator console to the command, the same as "adb -s emulator-<port> emu <command>"
+    with socket.create_connection(("127.0.0.1", port), timeout=timeout) as sock:
+        reader = sock.makefile("rb")
+
+        def read_reply():
+            # the lines until the one starting with OK or KO, or until the emulator closes the console (e.g., kill)
+            lines = []
+            while True:
+                line = reader.readline()
+                if len(line) == 0:
+                    break
+                lines.append(line.decode("utf-8", errors="replace"))
+                if line.startswith(b"OK") or line.startswith(b"KO"):
+                    break
+            return "".join(lines)
+
+        # the banner of the console
+        read_reply()
+        token = get_console_auth_token()
+        if token is not None:
+            sock.sendall(("auth %s\n" % token).encode("utf-8"))
+            reply = read_reply()
+            if not reply.startswith("OK"):
+                raise AdbError("the emulator console refused the auth token: %s" % reply.strip())
+        sock.sendall((command + "\n").encode("utf-8"))
+        return read_reply()
+
+
+class AdbClient:
+
+    def __init__(self, host: str = "127.0.0.1", port: Optional[int] = None, timeout: float = SOCKET_TIMEOUT):
+        self.host = host
+        self.port = port if port is not None else get_adb_server_port()
+        self.timeout = timeout
+        self.server_started = False
+
+    def connect(self):
+        try:
+            return socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except ConnectionRefusedError:
+            if self.server_started:
+                raise
+            # the same as the adb command line, start the adb server on demand
+            subprocess.run(['adb', '-P', str(self.port), 'start-server'], stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+            self.server_started = True
+            return socket.create_connection((self.host, self.port), timeout=self.timeout)
+
+    def send_request(self, sock: socket.socket, request: str):
+        payload = request.encode("utf-8")
+        sock.sendall(b"%04x" % len(payload) + payload)
+        status = read_exactly(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            length = int(read_exactly(sock, 4), 16)
+            raise AdbError(read_exactly(sock, length).decode("utf-8", errors="replace"))
+        raise AdbError("unexpected reply of the adb server: %r" % status)
+
+    def query(self, request: str):
+        # a host service replying with one length-prefixed string, e.g., "host-serial:emulator-5554:get-state"
+        with self.connect() as sock:
+            self.send_request(sock, request)
+            length = int(read_exactly(sock, 4), 16)
+            return read_exactly(sock, length).decode("utf-8", errors="replace")
+
+    def open_service(self, serial: str, service: str):
+        # a connection to the service (e.g., "shell:ls", "sync:") of the device
+        sock = self.connect()
+        try:
+            self.send_request(sock, "host:transport:%s" % serial)
+            self.send_request(sock, service)
+        except (AdbError, OSError):
+            sock.close()
+            raise
+        return sock
+
+    def devices(self) -> Dict[str, str]:
+        devices = {}
+        for line in self.query("host:devices").splitlines():
+            if "\t" in line:
+                serial, state = line.split("\t", 1)
+                devices[serial] = state
+        return devices
+
+    def device(self, serial: str):
+        return AdbDevice(self, serial)
+
+
+class AdbDevice:
+
+    def __init__(self, client: AdbClient, serial: str):
+        self.client = client
+        self.serial = serial
+        self.sync_socket: Optional[socket.socket] = None
+        self.sync_lock = threading.Lock()
+
+    def get_state(self):
+        try:
+            return self.client.query("host-serial:%s:get-state" % self.serial)
+        except (AdbError, OSError):
+            return "offline"
+
+    def shell(self, command: str, timeout: Optional[float] = None):
+        # the stdout and stderr of the command, as "adb shell" without a pty
+        with self.client.open_service(self.serial, "shell:" + command) as sock:
+            if timeout is not None:
+                sock.settimeout(timeout)
+            return read_until_closed(sock).decode("utf-8", errors="replace")
+
+    def shell_lines(self, command: str):
+        # yield the output lines of a long-running command (e.g., logcat) until it exits or the connection breaks
+        with self.client.open_service(self.serial, "shell:" + command) as sock:
+            sock.settimeout(None)
+            pending = b""
+            while True:
+                chunk = sock.recv(65536)
+                if len(chunk) == 0:
+                    break
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    yield line.decode("utf-8", errors="replace").rstrip("\r")
+
+    def exec_out(self, command: str, output_file):
+        # the raw (binary) stdout of the command, streamed into the given file
+        size = 0
+        with self.client.open_service(self.serial, "exec:" + command) as sock:
+            while True:
+                chunk = sock.recv(65536)
+                if len(chunk) == 0:
+                    return size
+                output_file.write(chunk)
+                size += len(chunk)
+
+    def root(self, timeout: float):
+        # restart adbd as root, and wait until the device answers again
+        with self.client.open_service(self.serial, "root:") as sock:
+            output = read_until_closed(sock).decode("utf-8", errors="replace")
+        if "restarting" in output:
+            self.wait_until(ROOT_RESTART_TIMEOUT, lambda: not self.is_online())
+        self.wait_until(timeout, self.is_boot_completed)
+        return output
+
+    def logcat(self, output_file, *options: str):
+        # clear the log, then stream the new lines of "logcat <options>" into the file until the connection breaks
+        #   (or the process is killed), each line is flushed for the readers of the live log (e.g., early_stop.py)
+        self.shell("logcat -c")
+        for line in self.shell_lines(" ".join(["logcat"] + list(options))):
+            output_file.write(line + "\n")
+            output_file.flush()
+
+    def get_pids(self, name: str):
+        # the pids of the processes whose "ps" line contains the name, the same as "ps | grep <name>"
+        pids = []
+        for line in self.shell("ps").splitlines()[1:]:
+            fields = line.split()
+            if name in line and len(fields) > 1:
+                pids.append(fields[1])
+        return pids
+
+    def kill_processes(self, name: str, timeout: float):
+        # kill the processes of the name (e.g., the fuzzing tool), and return whether they exited in time
+        pids = self.get_pids(name)
+        if len(pids) > 0:
+            self.shell("kill " + " ".join(pids))
+        return self.wait_until(timeout, lambda: len(self.get_pids(name)) == 0)
+
+    def kill_emulator(self, timeout: float):
+        # kill the emulator through its console, and return whether it went offline in time (its port is then free)
+        try:
+            emulator_console(int(self.serial.split("-")[1]), "kill")
+        except OSError:
+            # the console is already closed
+            pass
+        return self.wait_until(timeout, lambda: not self.is_online())
+
+    def getprop(self, name: str):
+        return self.shell("getprop " + name).strip()
+
+    def is_online(self):
+        return self.get_state() == "device"
+
+    def is_boot_completed(self):
+        try:
+            return self.getprop("sys.boot_completed") == "1"
+        except (AdbError, OSError):
+            return False
+
+    def has_package(self, package_name: str):
+        try:
+            return "package:" in self.shell("pm path " + package_name)
+        except (AdbError, OSError):
+            return False
+
+    def wait_until(self, timeout: float, probe, *args):
+        deadline = time.monotonic() + timeout
+        while not probe(*args):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+        return True
+
+    # the sync protocol, over the persistent connection of the device
+
+    def get_sync_socket(self):
+        if self.sync_socket is None:
+            self.sync_socket = self.client.open_service(self.serial, "sync:")
+        return self.sync_socket
+
+    def close_sync(self):
+        if self.sync_socket is not None:
+            try:
+                self.sync_socket.sendall(b"QUIT" + struct.pack("<I", 0))
+            except OSError:
+                pass
+            self.sync_socket.close()
+            self.sync_socket = None
+
+    def sync_request(self, action):
+        # run the transfer on the sync connection, reopen the connection once if it was broken (the device also
+        #   closes the connection after refusing a transfer)
+        with self.sync_lock:
+            for attempt in range(2):
+                try:
+                    return action(self.get_sync_socket())
+                except (OSError, AdbError) as e:
+                    self.close_sync()
+                    if attempt == 1 or isinstance(e, SyncFailure):
+                        raise
+
+    def stat(self, remote_path: str):
+        # (mode, size, mtime) of the remote file, mode is 0 if it does not exist
+        def action(sock: socket.socket):
+            path = remote_path.encode("utf-8")
+            sock.sendall(b"STAT" + struct.pack("<I", len(path)) + path)
+            reply = read_exactly(sock, 16)
+            if reply[:4] != b"STAT":
+                raise AdbError("unexpected sync reply: %r" % reply[:4])
+            return struct.unpack("<III", reply[4:])
+        return self.sync_request(action)
+
+    def list_dir(self, remote_path: str):
+        # the (name, mode, size) of the entries of the remote dir, without "." and ".."
+        def action(sock: socket.socket):
+            path = remote_path.encode("utf-8")
+            sock.sendall(b"LIST" + struct.pack("<I", len(path)) + path)
+            entries = []
+            while True:
+                header = read_exactly(sock, 20)
+                if header[:4] == b"DONE":
+                    return entries
+                if header[:4] != b"DENT":
+                    raise AdbError("unexpected sync reply: %r" % header[:4])
+                mode, size, _, name_length = struct.unpack("<IIII", header[4:])
+                name = read_exactly(sock, name_length).decode("utf-8", errors="replace")
+                if name not in (".", ".."):
+                    entries.append((name, mode, size))
+        return self.sync_request(action)
+
+    def pull_dir(self, remote_path: str, local_path: str):
+        # pull the remote dir recursively into the local dir, return the total size of the pulled files
+        os.makedirs(local_path, exist_ok=True)
+        size = 0
+        for name, mode, _ in self.list_dir(remote_path):
+            remote_child, local_child = remote_path.rstrip("/") + "/" + name, os.path.join(local_path, name)
+            if stat.S_ISDIR(mode):
+                size += self.pull_dir(remote_child, local_child)
+            elif stat.S_ISREG(mode):
+                size += self.pull(remote_child, local_child)
+        return size
+
+    def pull(self, remote_path: str, local_path: str):
+        # return the size of the pulled file
+        def action(sock: socket.socket):
+            path = remote_path.encode("utf-8")
+            sock.sendall(b"RECV" + struct.pack("<I", len(path)) + path)
+            size = 0
+            temp_path = local_path + ".part"
+            try:
+                with open(temp_path, "wb") as local_file:
+                    while True:
+                        header = read_exactly(sock, 8)
+                        chunk_id, length = header[:4], struct.unpack("<I", header[4:])[0]
+                        if chunk_id == b"DATA":
+                            local_file.write(read_exactly(sock, length))
+                            size += length
+                        elif chunk_id == b"DONE":
+                            break
+                        elif chunk_id == b"FAIL":
+                            message = read_exactly(sock, length).decode("utf-8", errors="replace")
+                            raise SyncFailure("cannot pull %s: %s" % (remote_path, message))
+                        else:
+                            raise AdbError("unexpected sync reply: %r" % chunk_id)
+            except BaseException:
+                # do not leave the partial file behind, e.g., the device refused the transfer or the connection broke
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            os.replace(temp_path, local_path)
+            return size
+        return self.sync_request(action)
+
+    def push(self, local_path: str, remote_path: str, mode: int = 0o644):
+        def action(sock: socket.socket):
+            path = ("%s,%d" % (remote_path, stat.S_IFREG | mode)).encode("utf-8")
+            sock.sendall(b"SEND" + struct.pack("<I", len(path)) + path)
+            with open(local_path, "rb") as local_file:
+                for chunk in iter(lambda: local_file.read(SYNC_DATA_MAX), b""):
+                    sock.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+            sock.sendall(b"DONE" + struct.pack("<I", int(os.path.getmtime(local_path))))
+            header = read_exactly(sock, 8)
+            chunk_id, length = header[:4], struct.unpack("<I", header[4:])[0]
+            if chunk_id == b"FAIL":
+                message = read_exactly(sock, length).decode("utf-8", errors="replace")
+                raise SyncFailure("cannot push %s: %s" % (remote_path, message))
+            if chunk_id != b"OKAY":
+                raise AdbError("unexpected sync reply: %r" % chunk_id)
+        return self.sync_request(action)
+
+    def install(self, apk_path: str, *options: str):
+        # the same as the legacy "adb install": push the apk, install it with pm and remove it
+        remote_path = "%s/%s" % (INSTALL_TMP_DIR, os.path.basename(apk_path).replace(" ", "_").replace("#", "_"))
+        self.push(apk_path, remote_path)
+        try:
+            return self.shell("pm install -r %s '%s'" % (" ".join(options), remote_path), timeout=INSTALL_TIMEOUT)
+        finally:
+            self.shell("rm -f '%s'" % remote_path)
+
+    def install_until_installed(self, apk_path: str, package_name: str, retries: int, *options: str):
+        # install the apk until the package manager lists its package, return whether it is installed and the outputs
+        #   of the attempts (the attempts and their probes run in this one process, see install_app in
+        #   harness_common.sh)
+        outputs = []
+        for attempt in range(retries):
+            try:
+                outputs.append(self.install(apk_path, *options))
+            except (AdbError, OSError) as e:
+                outputs.append("Error: %s\n" % e)
+            if self.has_package(package_name):
+                return True, "".join(outputs)
+            if attempt < retries - 1:
+                time.sleep(POLL_INTERVAL)
+        return False, "".join(outputs)
+
+
+if __name__ == '__main__':
+    ap = ArgumentParser()
+    ap.add_argument('-s', type=str, dest='serial', required=True, help="the device serial, e.g., emulator-5554")
+    ap.add_argument('-P', type=int, dest='port', default=None,
+                    help="the port of the adb server, default: $ANDROID_ADB_SERVER_PORT or 5037")
+    ap.add_argument('command', choices=['shell', 'pull', 'push', 'install', 'install-until-installed', 'get-state',
+                                        'wait-for-boot', 'wait-for-package', 'root', 'logcat', 'kill-processes',
+                                        'emu-kill'])
+    ap.add_argument('args', nargs=REMAINDER)
+    args = ap.parse_args()
+
+    device = AdbClient(port=args.port).device(args.serial)
+    try:
+        if args.command == 'shell':
+            sys.stdout.write(device.shell(" ".join(args.args)))
+        elif args.command == 'pull':
+            # the same as "adb pull": a remote dir is pulled recursively, into the given local dir if it exists
+            remote_path, local_path = args.args[0], args.args[1]
+            if os.path.isdir(local_path):
+                local_path = os.path.join(local_path, os.path.basename(remote_path.rstrip("/")))
+            if stat.S_ISDIR(device.stat(remote_path)[0]):
+                size = device.pull_dir(remote_path, local_path)
+            else:
+                size = device.pull(remote_path, local_path)
+            print("%s: %d bytes pulled" % (remote_path, size))
+        elif args.command == 'push':
+            # the same as "adb push": a remote path ending with "/" is the dir of the pushed file
+            remote_path = args.args[1]
+            if remote_path.endswith("/"):
+                remote_path += os.path.basename(args.args[0])
+            device.push(args.args[0], remote_path)
+        elif args.command == 'install':
+            output = device.install(args.args[0], *args.args[1:])
+            sys.stdout.write(output)
+            sys.exit(0 if "Success" in output else 1)
+        elif args.command == 'install-until-installed':
+            installed, output = device.install_until_installed(args.args[0], args.args[1], int(args.args[2]),
+                                                               *args.args[3:])
+            sys.stdout.write(output)
+            sys.exit(0 if installed else 1)
+        elif args.command == 'get-state':
+            print(device.get_state())
+        elif args.command == 'wait-for-boot':
+            sys.exit(0 if device.wait_until(float(args.args[0]), device.is_boot_completed) else 1)
+        elif args.command == 'wait-for-package':
+            sys.exit(0 if device.wait_until(float(args.args[1]), device.has_package, args.args[0]) else 1)
+        elif args.command == 'root':
+            sys.stdout.write(device.root(float(args.args[0])))
+        elif args.command == 'logcat':
+            with open(args.args[0], "a") as logcat_file:
+                device.logcat(logcat_file, *args.args[1:])
+        elif args.command == 'kill-processes':
+            sys.exit(0 if device.kill_processes(args.args[0], float(args.args[1])) else 1)
+        elif args.command == 'emu-kill':
+            sys.exit(0 if device.kill_emulator(float(args.args[0])) else 1)
+    except (AdbError, OSError) as e:
+        print("Error: %s" % e, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        device.close_sync()
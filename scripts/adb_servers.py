@@ -0,0 +1,82 @@
+# This file partitions the adb servers of themis.py (see --adb-server-per-slot).
+# By default, all the emulators share the adb server on port 5037, so a stalled or restarted server disrupts every
+#   running run, and the commands to different devices queue behind each other. With the partition, each device slot
+#   gets its own adb server (on ADB_SERVER_BASE_PORT + the slot index), passed to the harness, its tools and the
+#   python tooling (adb_client.py) through ANDROID_ADB_SERVER_PORT.
+# The slot servers do not scan the local emulator ports (ADB_EMU=0). Each emulator registers itself with the server
+#   given by the ANDROID_ADB_SERVER_PORT it is started with, so a slot server only sees the emulator of its slot.
+# Before each run, the server of the slot is checked and restarted if it does not answer, without affecting the
+#   other slots.
+
+import os
+import subprocess
+from typing import Dict, List, Optional
+
+from adb_client import AdbClient, AdbError
+from slot_isolation import SlotIsolation
+
+ADB_SERVER_BASE_PORT = 5038
+# the time (in seconds) to wait for the answer of a slot server before restarting it
+ADB_SERVER_CHECK_TIMEOUT = 10
+
+
+def get_adb_server_env(port: int) -> Dict[str, str]:
+    # the environment of the processes using the adb server on the given port
+    return dict(os.environ, ANDROID_ADB_SERVER_PORT=str(port), ADB_EMU="0")
+
+
+class AdbServerPartition:
+
+    def __init__(self, avd_serial_list: List[str], base_port: int = ADB_SERVER_BASE_PORT,
+                 slot_isolation: Optional[SlotIsolation] = None):
+        # the cpus of each slot (see slot_isolation.py), the server daemon inherits them from "adb start-server"
+        self.slot_isolation = slot_isolation
+        self.ports: Dict[str, int] = {}
+        for index, avd_serial in enumerate(avd_serial_list):
+            self.ports[avd_serial] = base_port + index
+
+    def get_port(self, avd_serial: str) -> Optional[int]:
+        return self.ports.get(avd_serial)
+
+    def get_env(self, avd_serial: str) -> Dict[str, str]:
+        return get_adb_server_env(self.ports[avd_serial])
+
+    def start(self):
+        for avd_serial, port in self.ports.items():
+            self.start_server(avd_serial, port)
+
+    def start_server(self, avd_serial: str, port: int):
+        print("start the adb server of %s on port %d" % (avd_serial, port))
+        argv = ['adb', '-P', str(port), 'start-server']
+        if self.slot_isolation is not None:
+            argv = self.slot_isolation.wrap_argv(avd_serial, argv)
+        subprocess.run(argv, env=get_adb_server_env(port),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def kill_server(self, port: int):
+        try:
+            subprocess.run(['adb', '-P', str(port), 'kill-server'], env=get_adb_server_env(port),
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=ADB_SERVER_CHECK_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            pass
+
+    def is_server_responsive(self, port: int):
+        try:
+            AdbClient(port=port, timeout=ADB_SERVER_CHECK_TIMEOUT).query("host:version")
+            return True
+        except (AdbError, OSError):
+            return False
+
+    def ensure_running(self, avd_serial: str):
+        # called by the device slot before each run: restart the server of the slot if it stalled or died
+        port = self.ports[avd_serial]
+        if self.is_server_responsive(port):
+            return True
+        print("Warning: the adb server of %s (port %d) does not answer, restart it" % (avd_serial, port))
+        self.kill_server(port)
+        self.start_server(avd_serial, port)
+        return self.is_server_responsive(port)
+
+    def stop(self):
+        for port in self.ports.values():
+            self.kill_server(port)
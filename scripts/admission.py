@@ -0,0 +1,136 @@
+# This file implements the resource-aware admission control of themis.py.
+# Before a device slot starts its next run, the host's cpu load, free memory and /dev/kvm availability are sampled
+#   from procfs, and the run is only admitted while enough headroom remains for one more emulator (and its tool).
+# Each admission decision is logged to "admission.log" under the output dir.
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# how long (in seconds) to wait before re-checking a denied admission
+ADMISSION_RETRY_INTERVAL = 30
+# the resources of a just admitted run are not yet visible in procfs while its emulator boots, so they are reserved
+#   for this long (in seconds) after the admission
+RAMP_UP_TIME = 180
+
+
+def read_cpu_times():
+    # the aggregated (busy, total) cpu jiffies from /proc/stat
+    with open("/proc/stat", "r") as stat_file:
+        fields = stat_file.readline().split()
+    values = [int(v) for v in fields[1:]]
+    idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+    total = sum(values[:8])  # exclude guest time, which is already counted in user time
+    return total - idle, total
+
+
+def read_meminfo():
+    meminfo: Dict[str, int] = {}
+    with open("/proc/meminfo", "r") as meminfo_file:
+        for line in meminfo_file:
+            name, value = line.split(":", 1)
+            meminfo[name] = int(value.split()[0])  # in kB
+    return meminfo
+
+
+def read_loadavg():
+    with open("/proc/loadavg", "r") as loadavg_file:
+        return float(loadavg_file.read().split()[0])
+
+
+def is_kvm_available():
+    return os.path.exists("/dev/kvm") and os.access("/dev/kvm", os.R_OK | os.W_OK)
+
+
+def sample_host_resources(interval: float = 1.0):
+    busy_1, total_1 = read_cpu_times()
+    time.sleep(interval)
+    busy_2, total_2 = read_cpu_times()
+    number_of_cpus = os.cpu_count()
+    cpu_busy = (busy_2 - busy_1) / (total_2 - total_1) if total_2 > total_1 else 0.0
+    meminfo = read_meminfo()
+    return {'cpus': number_of_cpus,
+            'cpu_busy': cpu_busy,
+            'idle_cpus': number_of_cpus * (1.0 - cpu_busy),
+            'load1': read_loadavg(),
+            'mem_available_mb': meminfo.get('MemAvailable', meminfo.get('MemFree', 0)) // 1024,
+            'kvm': is_kvm_available()}
+
+
+class AdmissionController:
+
+    def __init__(self, max_emulators: int, emulator_cpus: float, emulator_memory_mb: int,
+                 log_file_path: Optional[str] = None, enabled: bool = True):
+        self.max_emulators = max_emulators
+        self.emulator_cpus = emulator_cpus
+        self.emulator_memory_mb = emulator_memory_mb
+        self.log_file_path = log_file_path
+        self.enabled = enabled
+
+        self.running_slots: List[str] = []
+        # the admission times of the recently admitted runs
+        self.recent_admissions: List[float] = []
+        self.lock = threading.Lock()
+
+    def log(self, avd_serial: str, admitted: bool, reason: str, resources: Optional[Dict] = None):
+        line = "%s %s %s: %s" % (time.strftime("%Y-%m-%d-%H:%M:%S"), avd_serial,
+                                 "ADMIT" if admitted else "DENY", reason)
+        if resources is not None:
+            line += " (cpus: %d, idle cpus: %.1f, load1: %.1f, available memory: %d MB, kvm: %s, running: %d)" % (
+                resources['cpus'], resources['idle_cpus'], resources['load1'], resources['mem_available_mb'],
+                resources['kvm'], len(self.running_slots))
+        print("[admission] " + line)
+        if self.log_file_path is not None:
+            with open(self.log_file_path, "a") as log_file:
+                log_file.write(line + "\n")
+
+    def check(self, resources: Dict):
+        # return (admitted, reason) for one more run, called with the lock held
+        now = time.time()
+        self.recent_admissions = [t for t in self.recent_admissions if now - t < RAMP_UP_TIME]
+        number_of_ramping_up_runs = len(self.recent_admissions)
+
+        if len(self.running_slots) >= self.max_emulators:
+            return False, "%d emulators are running (--max-emu %d)" % (len(self.running_slots), self.max_emulators)
+        if len(self.running_slots) == 0:
+            # always admit the first run, otherwise the campaign may never start on a small host
+            return True, "no emulator is running"
+        if not resources['kvm']:
+            return False, "/dev/kvm is not available, run only one emulator at a time"
+
+        idle_cpus = resources['idle_cpus'] - number_of_ramping_up_runs * self.emulator_cpus
+        if idle_cpus < self.emulator_cpus:
+            return False, "not enough idle cpus (%.1f < %.1f, %d runs ramping up)" % (
+                idle_cpus, self.emulator_cpus, number_of_ramping_up_runs)
+        available_memory_mb = resources['mem_available_mb'] - number_of_ramping_up_runs * self.emulator_memory_mb
+        if available_memory_mb < self.emulator_memory_mb:
+            return False, "not enough available memory (%d MB < %d MB, %d runs ramping up)" % (
+                available_memory_mb, self.emulator_memory_mb, number_of_ramping_up_runs)
+        return True, "enough headroom (%.1f idle cpus, %d MB available memory)" % (idle_cpus, available_memory_mb)
+
+    def acquire(self, avd_serial: str):
+        # block until one more run can be admitted on this host
+        while True:
+            resources = sample_host_resources() if self.enabled else None
+            with self.lock:
+                if resources is None:
+                    if len(self.running_slots) < self.max_emulators:
+                        admitted, reason = True, "admission control is disabled"
+                    else:
+                        admitted, reason = False, "%d emulators are running (--max-emu %d)" % (
+                            len(self.running_slots), self.max_emulators)
+                else:
+                    admitted, reason = self.check(resources)
+                if admitted:
+                    self.running_slots.append(avd_serial)
+                    self.recent_admissions.append(time.time())
+                self.log(avd_serial, admitted, reason, resources)
+            if admitted:
+                return
+            time.sleep(ADMISSION_RETRY_INTERVAL)
+
+    def release(self, avd_serial: str):
+        with self.lock:
+            if avd_serial in self.running_slots:
+                self.running_slots.remove(avd_serial)
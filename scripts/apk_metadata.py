@@ -0,0 +1,275 @@
+# This file reads the metadata of the apks under test (package name, version, launchable activity, min/target sdk and
+#   permissions) without aapt: the binary AndroidManifest.xml is parsed from the apk (a zip file) in pure python.
+# The metadata is cached in "apk_metadata.json" next to the apks, keyed by the sha1 of the apk content, so that the
+#   harnesses (see get_app_package_name in harness_common.sh) and the post-processing (e.g., check_crash.py) read
+#   each apk only once.
+# Usage (for the harnesses):
+#   python3 apk_metadata.py xx.apk [--field package]
+
+import fcntl
+import hashlib
+import json
+import os
+import struct
+import sys
+import zipfile
+from argparse import ArgumentParser
+from typing import Dict, List, Optional
+
+APK_METADATA_FILE_NAME = "apk_metadata.json"
+MANIFEST_FILE_NAME = "AndroidManifest.xml"
+# bump to invalidate the cached metadata when the parser changes
+APK_METADATA_VERSION = 1
+
+# the chunk types of the binary xml (see ResourceTypes.h of aosp)
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_TYPE = 0x0003
+RES_XML_START_ELEMENT_TYPE = 0x0102
+RES_XML_END_ELEMENT_TYPE = 0x0103
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+UTF8_FLAG = 1 << 8
+NO_ENTRY = 0xFFFFFFFF
+
+# the types of the attribute values
+TYPE_REFERENCE = 0x01
+TYPE_STRING = 0x03
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+TYPE_INT_BOOLEAN = 0x12
+
+# the resource ids of the android attributes, whose names may be stripped from the string pool (e.g., by obfuscators)
+ANDROID_ATTRIBUTE_IDS = {
+    0x01010003: 'name',
+    0x0101021b: 'versionCode',
+    0x0101021c: 'versionName',
+    0x0101020c: 'minSdkVersion',
+    0x01010270: 'targetSdkVersion',
+}
+
+LAUNCHER_ACTION = "android.intent.action.MAIN"
+LAUNCHER_CATEGORY = "android.intent.category.LAUNCHER"
+
+
+class ManifestParseError(Exception):
+    pass
+
+
+def read_string_pool(data: bytes, offset: int) -> List[str]:
+    header_size, chunk_size = struct.unpack_from('<HI', data, offset + 2)
+    string_count, _, flags, strings_start, _ = struct.unpack_from('<IIIII', data, offset + 8)
+    is_utf8 = (flags & UTF8_FLAG) != 0
+    string_offsets = struct.unpack_from('<%dI' % string_count, data, offset + header_size)
+    strings = []
+    for string_offset in string_offsets:
+        position = offset + strings_start + string_offset
+        if is_utf8:
+            # the utf-16 length and the utf-8 length, each in one or two bytes
+            for _ in range(2):
+                length = data[position]
+                position += 1
+                if length & 0x80:
+                    length = ((length & 0x7F) << 8) | data[position]
+                    position += 1
+            strings.append(data[position:position + length].decode('utf-8', errors='replace'))
+        else:
+            length = struct.unpack_from('<H', data, position)[0]
+            position += 2
+            if length & 0x8000:
+                length = ((length & 0x7FFF) << 16) | struct.unpack_from('<H', data, position)[0]
+                position += 2
+            strings.append(data[position:position + length * 2].decode('utf-16-le', errors='replace'))
+    return strings
+
+
+def parse_binary_xml(data: bytes):
+    # yield ("start", tag, attributes) and ("end", tag, None) events of the binary xml, a truncated or malformed binary
+    #   xml raises ManifestParseError
+    try:
+        yield from read_binary_xml_events(data)
+    except (struct.error, IndexError) as e:
+        raise ManifestParseError("corrupted binary xml: %s" % e) from e
+
+
+def read_binary_xml_events(data: bytes):
+    if len(data) < 8:
+        raise ManifestParseError("the binary xml is truncated")
+    chunk_type, header_size, total_size = struct.unpack_from('<HHI', data, 0)
+    if chunk_type != RES_XML_TYPE:
+        raise ManifestParseError("not a binary xml (chunk type 0x%04x)" % chunk_type)
+    strings: List[str] = []
+    resource_ids: List[int] = []
+    offset = header_size
+    end = min(total_size, len(data))
+    while offset + 8 <= end:
+        chunk_type, header_size, chunk_size = struct.unpack_from('<HHI', data, offset)
+        if chunk_size < 8:
+            raise ManifestParseError("corrupted chunk at %d" % offset)
+        if chunk_type == RES_STRING_POOL_TYPE:
+            strings = read_string_pool(data, offset)
+        elif chunk_type == RES_XML_RESOURCE_MAP_TYPE:
+            resource_ids = list(struct.unpack_from('<%dI' % ((chunk_size - header_size) // 4), data,
+                                                   offset + header_size))
+        elif chunk_type == RES_XML_START_ELEMENT_TYPE:
+            ext = offset + header_size
+            _, name, attribute_start, attribute_size, attribute_count = struct.unpack_from('<IIHHH', data, ext)
+            attributes = {}
+            for i in range(attribute_count):
+                position = ext + attribute_start + i * attribute_size
+                _, attribute_name, raw_value, _, _, data_type, value = struct.unpack_from('<IIIHBBI', data, position)
+                key = ANDROID_ATTRIBUTE_IDS.get(resource_ids[attribute_name]) \
+                    if attribute_name < len(resource_ids) else None
+                if key is None:
+                    key = strings[attribute_name]
+                attributes[key] = get_attribute_value(strings, raw_value, data_type, value)
+            yield "start", strings[name], attributes
+        elif chunk_type == RES_XML_END_ELEMENT_TYPE:
+            name = struct.unpack_from('<I', data, offset + header_size + 4)[0]
+            yield "end", strings[name], None
+        offset += chunk_size
+
+
+def get_attribute_value(strings: List[str], raw_value: int, data_type: int, value: int):
+    if raw_value != NO_ENTRY:
+        return strings[raw_value]
+    if data_type == TYPE_STRING:
+        return strings[value]
+    if data_type == TYPE_INT_DEC or data_type == TYPE_INT_HEX:
+        return value - (1 << 32) if value & 0x80000000 else value
+    if data_type == TYPE_INT_BOOLEAN:
+        return value != 0
+    if data_type == TYPE_REFERENCE:
+        # the resource (e.g., @string/version_name) cannot be resolved without resources.arsc
+        return "@0x%08x" % value
+    return value
+
+
+def get_class_name(package_name: str, name: str):
+    # the class names in the manifest may be relative to the package, e.g., ".MainActivity"
+    if name.startswith("."):
+        return package_name + name
+    if "." not in name:
+        return package_name + "." + name
+    return name
+
+
+def read_manifest(apk_path: str):
+    with zipfile.ZipFile(apk_path) as apk:
+        manifest = apk.read(MANIFEST_FILE_NAME)
+
+    metadata = {'package': None, 'version_code': None, 'version_name': None, 'launchable_activity': None,
+                'min_sdk': None, 'target_sdk': None, 'permissions': []}
+    # the current activity (or activity-alias), and the actions and categories of its current intent filter
+    activity: Optional[str] = None
+    actions: List[str] = []
+    categories: List[str] = []
+    for event, tag, attributes in parse_binary_xml(manifest):
+        if event == "start":
+            if tag == "manifest":
+                metadata['package'] = attributes.get('package')
+                metadata['version_code'] = attributes.get('versionCode')
+                metadata['version_name'] = attributes.get('versionName')
+            elif tag == "uses-sdk":
+                metadata['min_sdk'] = attributes.get('minSdkVersion')
+                metadata['target_sdk'] = attributes.get('targetSdkVersion')
+            elif tag in ("uses-permission", "uses-permission-sdk-23"):
+                if attributes.get('name') is not None:
+                    metadata['permissions'].append(attributes['name'])
+            elif tag in ("activity", "activity-alias"):
+                activity = attributes.get('name')
+            elif tag == "intent-filter":
+                actions = []
+                categories = []
+            elif tag == "action":
+                actions.append(attributes.get('name'))
+            elif tag == "category":
+                categories.append(attributes.get('name'))
+        else:
+            if tag == "intent-filter" and activity is not None and metadata['launchable_activity'] is None and \
+                    LAUNCHER_ACTION in actions and LAUNCHER_CATEGORY in categories:
+                metadata['launchable_activity'] = get_class_name(metadata['package'] or "", activity)
+            elif tag in ("activity", "activity-alias"):
+                activity = None
+    if metadata['package'] is None:
+        raise ManifestParseError("no package name in the manifest of %s" % apk_path)
+    return metadata
+
+
+def get_apk_digest(apk_path: str):
+    digest = hashlib.sha1()
+    with open(apk_path, "rb") as apk_file:
+        for chunk in iter(lambda: apk_file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_apk_metadata(apk_path: str) -> Dict:
+    # the (cached) metadata of the apk
+    apk_digest = get_apk_digest(apk_path)
+    cache_file_path = os.path.join(os.path.dirname(os.path.abspath(apk_path)), APK_METADATA_FILE_NAME)
+    cache = read_metadata_cache(cache_file_path)
+    metadata = cache.get(apk_digest)
+    if metadata is not None and metadata.get('metadata_version') == APK_METADATA_VERSION:
+        return metadata
+
+    metadata = read_manifest(apk_path)
+    metadata['apk'] = os.path.basename(apk_path)
+    metadata['metadata_version'] = APK_METADATA_VERSION
+    try:
+        update_metadata_cache(cache_file_path, apk_digest, metadata)
+    except OSError as e:
+        # e.g., the apk dir is read-only, the metadata is then read again next time
+        print("Warning: cannot update %s: %s" % (cache_file_path, e), file=sys.stderr)
+    return metadata
+
+
+def get_app_package_name(apk_path: str):
+    return get_apk_metadata(apk_path)['package']
+
+
+def read_metadata_cache(cache_file_path: str) -> Dict[str, Dict]:
+    if not os.path.exists(cache_file_path):
+        return {}
+    try:
+        with open(cache_file_path, "r") as cache_file:
+            return json.load(cache_file)
+    except ValueError:
+        print("Warning: ignore the corrupted metadata cache %s" % cache_file_path, file=sys.stderr)
+        return {}
+
+
+def update_metadata_cache(cache_file_path: str, apk_digest: str, metadata: Dict):
+    # the harnesses of concurrent runs may update the cache at the same time. The lock is taken on the dir of the
+    #   cache, i.e., no lock file is left next to the apks, and the cache file itself is replaced (a lock on it would
+    #   be lost with the replaced file)
+    dir_fd = os.open(os.path.dirname(cache_file_path) or ".", os.O_RDONLY)
+    try:
+        fcntl.flock(dir_fd, fcntl.LOCK_EX)
+        cache = read_metadata_cache(cache_file_path)
+        cache[apk_digest] = metadata
+        temp_file_path = cache_file_path + ".tmp"
+        with open(temp_file_path, "w") as cache_file:
+            json.dump(cache, cache_file, indent=2, sort_keys=True)
+        os.replace(temp_file_path, cache_file_path)
+    finally:
+        os.close(dir_fd)
+
+
+if __name__ == '__main__':
+    ap = ArgumentParser()
+    ap.add_argument('apk', type=str, help="the apk file")
+    ap.add_argument('--field', type=str, dest='field', default=None,
+                    help="only print the given field (e.g., package, launchable_activity), default: print all as json")
+    args = ap.parse_args()
+
+    try:
+        apk_metadata = get_apk_metadata(args.apk)
+    except (OSError, KeyError, zipfile.BadZipFile, ManifestParseError) as e:
+        print("Error: cannot read the manifest of %s: %s" % (args.apk, e), file=sys.stderr)
+        sys.exit(1)
+
+    if args.field is None:
+        print(json.dumps(apk_metadata, indent=2, sort_keys=True))
+    elif isinstance(apk_metadata.get(args.field), list):
+        print("\n".join(apk_metadata[args.field]))
+    else:
+        print(apk_metadata.get(args.field, ""))
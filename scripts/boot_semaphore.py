@@ -0,0 +1,57 @@
+# This file implements the host-wide emulator boot semaphore of themis.py (see --max-boots).
+# The cold boot is the most cpu- and io-heavy phase of a run, and when many emulators boot at the same time (e.g., at
+#   the start of a campaign), the boots slow each other down until they time out and are retried. The semaphore limits
+#   the number of concurrent cold boots on the host to K, including the boots of other themis.py processes: it is made
+#   of K lock files ("boot.<i>.lock" under the lock dir), and a boot holds the flock of one of them until the emulator
+#   is booted (or the boot times out). The kernel drops the lock of a killed process, so no slot leaks.
+# The harnesses take the same lock files with flock(1) (see acquire_boot_slot in harness_common.sh), and the pool
+#   (see emulator_pool.py) with fcntl.flock. The wait for a slot and the boot itself are recorded separately, i.e.,
+#   "boot_queue" and "boot" in readiness.log (harnesses) and emulator_pool.log (pool).
+
+import fcntl
+import os
+import time
+from typing import Optional, TextIO
+
+# the environment variables passed to the harnesses
+BOOT_SLOTS_ENV = "THEMIS_BOOT_SLOTS"
+BOOT_LOCK_DIR_ENV = "THEMIS_BOOT_LOCK_DIR"
+DEFAULT_BOOT_SLOTS = 4
+# shared by all the themis.py processes on the host
+DEFAULT_BOOT_LOCK_DIR = "/tmp/themis_boot_locks"
+# how long (in seconds) to wait before trying the lock files again
+BOOT_SLOT_POLL_INTERVAL = 1
+
+
+class BootSemaphore:
+
+    def __init__(self, slots: Optional[int] = None, lock_dir: Optional[str] = None):
+        self.slots = slots if slots is not None else int(os.environ.get(BOOT_SLOTS_ENV, DEFAULT_BOOT_SLOTS))
+        self.lock_dir = lock_dir if lock_dir is not None else os.environ.get(BOOT_LOCK_DIR_ENV, DEFAULT_BOOT_LOCK_DIR)
+
+    def get_lock_file_path(self, index: int):
+        return os.path.join(self.lock_dir, "boot.%d.lock" % index)
+
+    def try_acquire(self) -> Optional[TextIO]:
+        # the opened lock file of a free slot, or None if all the slots are taken
+        for index in range(self.slots):
+            lock_file = open(self.get_lock_file_path(index), "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock_file
+            except BlockingIOError:
+                lock_file.close()
+        return None
+
+    def acquire(self) -> TextIO:
+        # block until a slot is free, the slot is held until the returned lock file is released
+        os.makedirs(self.lock_dir, exist_ok=True)
+        while True:
+            lock_file = self.try_acquire()
+            if lock_file is not None:
+                return lock_file
+            time.sleep(BOOT_SLOT_POLL_INTERVAL)
+
+    def release(self, lock_file: TextIO):
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
@@ -0,0 +1,116 @@
+# This file defines the campaign spec file of themis.py (see --campaign).
+# A campaign spec is a json file listing the tools x apks x time budgets x repeats to run, e.g.,
+#
+#   {
+#     "avd": "Android7.1",
+#     "tools": ["monkey", "ape"],
+#     "apk_list": "list_of_apks_to_test.txt",
+#     "apks": ["../nextcloud/nextcloud-#4026.apk, ../nextcloud/login-#4026.py"],
+#     "time": ["1h", "6h"],
+#     "repeat": 5
+#   }
+#
+# "apk_list" is a file in the format of list_of_apks_to_test.txt, "apks" lists entries in the same format
+#   (i.e., "apk path[, login script]"). Both are optional but at least one apk should be given. A relative "apk_list"
+#   is relative to the dir of the campaign spec file, while the apk paths (and the login scripts) are relative to the
+#   working dir, the same as with --apk-list.
+# The campaign is expanded into jobs in a deterministic order, so that N hosts can each take a disjoint slice of
+#   the jobs via --shard i/N.
+
+import json
+import os
+from typing import List
+
+from scheduler import Job
+
+
+def parse_apk_entry(line: str):
+    if "," in line:
+        content = line.split(",")
+        return content[0].strip(), content[1].strip()
+    return line.strip(), "\"\""
+
+
+def get_all_apks(apk_list_file):
+    file = open(apk_list_file, 'r')
+    apk_paths = []
+    apk_login_scripts = []
+    for line in file.readlines():
+        if line.strip().startswith('#') or len(line.strip()) == 0:
+            # skip commented apk files
+            continue
+        apk_path, login_script = parse_apk_entry(line)
+        apk_paths.append(apk_path)
+        apk_login_scripts.append(login_script)
+    file.close()
+    print("Total %s apks under test" % len(apk_paths))
+    return apk_paths, apk_login_scripts
+
+
+def load_campaign(campaign_file_path: str):
+    with open(campaign_file_path, "r") as campaign_file:
+        campaign = json.load(campaign_file)
+    if not isinstance(campaign, dict):
+        raise ValueError("the campaign should be a json object: %s" % campaign_file_path)
+
+    if isinstance(campaign.get('tools'), str):
+        campaign['tools'] = [campaign['tools']]
+    if isinstance(campaign.get('time', '6h'), str):
+        campaign['time'] = [campaign.get('time', '6h')]
+    campaign.setdefault('repeat', 1)
+    if not isinstance(campaign['repeat'], int) or campaign['repeat'] < 1:
+        raise ValueError("the repeat should be a positive integer: %s" % campaign['repeat'])
+
+    if len(campaign.get('tools', [])) == 0:
+        raise ValueError("no tools are given in the campaign: %s" % campaign_file_path)
+    for testing_time in campaign['time']:
+        if not isinstance(testing_time, str) or testing_time[-1:] not in ['h', 'm', 's']:
+            raise ValueError("incorrect time format (%s), should be appended with h, m, or s" % testing_time)
+
+    apk_paths = []
+    apk_login_scripts = []
+    if 'apk_list' in campaign:
+        apk_list_file = os.path.join(os.path.dirname(campaign_file_path), campaign['apk_list'])
+        apk_paths, apk_login_scripts = get_all_apks(apk_list_file)
+    for entry in campaign.get('apks', []):
+        apk_path, login_script = parse_apk_entry(entry)
+        apk_paths.append(apk_path)
+        apk_login_scripts.append(login_script)
+    if len(apk_paths) == 0:
+        raise ValueError("no apks are given in the campaign: %s" % campaign_file_path)
+    campaign['apk_paths'] = apk_paths
+    campaign['apk_login_scripts'] = apk_login_scripts
+
+    return campaign
+
+
+def expand_jobs(tools: List[str], apk_paths: List[str], apk_login_scripts: List[str], testing_times: List[str],
+                repeat: int):
+    # the repeats are the outermost loop so that the first runs of all the cells are scheduled first
+    jobs = []
+    for repeat_index in range(repeat):
+        for testing_time in testing_times:
+            for tool_name in tools:
+                for apk_path, login_script in zip(apk_paths, apk_login_scripts):
+                    jobs.append(Job(tool_name, apk_path, login_script, repeat_index, testing_time))
+    return jobs
+
+
+def expand_campaign(campaign):
+    return expand_jobs(campaign['tools'], campaign['apk_paths'], campaign['apk_login_scripts'], campaign['time'],
+                       campaign['repeat'])
+
+
+def parse_shard(shard_str: str):
+    # e.g., "0/4" means the first of 4 shards
+    shard_index_str, number_of_shards_str = shard_str.split("/")
+    shard_index = int(shard_index_str)
+    number_of_shards = int(number_of_shards_str)
+    if number_of_shards <= 0 or not 0 <= shard_index < number_of_shards:
+        raise ValueError("invalid shard: %s" % shard_str)
+    return shard_index, number_of_shards
+
+
+def select_shard(jobs: List[Job], shard_index: int, number_of_shards: int):
+    # round-robin over the deterministic job order, so that each shard gets a similar mix of tools and apks
+    return [job for job_index, job in enumerate(jobs) if job_index % number_of_shards == shard_index]
@@ -11,9 +11,13 @@ import os
 import shutil
 import subprocess
 import time
+import zipfile
 from argparse import ArgumentParser, Namespace
 from typing import List, Dict, Set
 
+from apk_metadata import get_app_package_name, ManifestParseError
+from tool_registry import add_tool_arguments, detect_tool, get_selected_tool
+
 ALL_APPS = ['ActivityDiary', 'AmazeFileManager', 'and-bible', 'AnkiDroid', 'APhotoManager', 'commons',
             'collect', 'FirefoxLite', 'Frost', 'geohashdroid', 'MaterialFBook', 'nextcloud', 'Omni-Notes',
             'open-event-attendee-android', 'openlauncher', 'osmeditor4android', 'Phonograph', 'Scarlet-Notes',
@@ -345,6 +349,23 @@ app_crash_data = {
 }
 
 
+def get_logcat_time_label(line: str):
+    # e.g., "05-18 10:12:37.503  1234  1234 E AndroidRuntime" of a logcat line, the lines of one crash stack share
+    #   the same time label
+    res = [i for i in range(len(line)) if line.startswith(':', i)]
+    if len(res) < 3:
+        return None
+    return line[0:res[2]]  # the third ":" is the split point
+
+
+def is_crash_stack_matched(stack_lines: List[str], crash_signature_strs: List[str]):
+    # every signature string should appear in the stack
+    for signature_str in crash_signature_strs:
+        if not any(signature_str in line for line in stack_lines):
+            return False
+    return True
+
+
 def get_testing_result_dir(all_testing_result_dirs, app_name, issue_id):
     tmp_paths = []
     for result_dir_path in all_testing_result_dirs:
@@ -366,15 +387,13 @@ def get_apk_info(testing_result_dir: str, app_name: str):
     target_apk_file_name = str(base_name.split(".apk")[0]) + ".apk"
 
     target_apk_file_path = os.path.join("../" + app_name, target_apk_file_name)
-    get_app_package_name_cmd = "aapt dump badging " + target_apk_file_path + " | grep package | awk '{print $2}' | sed s/name=//g | sed s/\\'//g"
     app_package_name = ""
 
     try:
-        p = subprocess.Popen(get_app_package_name_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        # clear the output
-        app_package_name = p.communicate()[0].decode('utf-8').strip()
+        # read from the (cached) manifest of the apk, without aapt
+        app_package_name = get_app_package_name(target_apk_file_path)
         print(app_package_name)
-    except os.error as e:
+    except (OSError, KeyError, zipfile.BadZipFile, ManifestParseError) as e:
         print(e)
 
     return target_apk_file_name, app_package_name
@@ -391,6 +410,9 @@ def main(args: Namespace):
             all_testing_results_dirs.append(subdir_path)
 
     # print(all_testing_results_dirs)
+    # check the results of the given tool, or of all the tools in the output dir (detected by the result dir names)
+    selected_tool = get_selected_tool(args)
+
     # the dict only used for collecting non-target crashes
     #   key: the apk file name
     #   value: list of signatures of crash stacks
@@ -434,113 +456,18 @@ def main(args: Namespace):
             # scanning the testing results of the given issue
             for result_dir in issue_testing_result_dirs:
 
-                logcat_file_path = ""
-                testing_time_file_path = ""
-                login_file_path = ""
-
-                if args.monkey:
-                    # Monkey
-                    logcat_file_path = os.path.join(result_dir, "logcat.log")
-                    login_file_path = os.path.join(result_dir, "login.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "monkey_testing_time_on_emulator.txt")
-                    testing_time_datetime_str = '%Y-%m-%d-%H:%M:%S'
-
-                if args.ape:
-                    # Ape
-                    logcat_file_path = os.path.join(result_dir, "logcat.log")
-                    login_file_path = os.path.join(result_dir, "login.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "ape_testing_time_on_emulator.txt")
-                    testing_time_datetime_str = '%Y-%m-%d-%H:%M:%S'
-
-                if args.combo:
-                    # ComboDroid
-                    logcat_file_path = os.path.join(result_dir, "logcat.log")
-                    login_file_path = os.path.join(result_dir, "login.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "combo_testing_time_on_emulator.txt")
-                    testing_time_datetime_str = '%Y-%m-%d-%H-%M-%S'
-
-                if args.timemachine:
-                    # TimeMachine
-                    logcat_file_path = os.path.join(result_dir, "timemachine-output/crashes.log")
-                    login_file_path = os.path.join(result_dir, "timemachine-run.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "timemachine-output/run_time.log")
-                    testing_time_datetime_str = '%Y-%m-%d-%H:%M:%S'
-
-                if args.humanoid:
-                    # Humanoid
-                    logcat_file_path = os.path.join(result_dir, "logcat.log")
-                    login_file_path = os.path.join(result_dir, "login.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "humanoid_testing_time_on_emulator.txt")
-                    testing_time_datetime_str = '%Y-%m-%d-%H:%M:%S'
-
-                if args.sapienz:
-                    # Sapienz
-                    logcat_file_path = os.path.join(result_dir, "logcat.log")
-                    login_file_path = os.path.join(result_dir, "login.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "sapienz_testing_time_on_emulator.txt")
-                    testing_time_datetime_str = '%Y-%m-%d-%H:%M:%S'
-
-                if args.qtesting:
-                    # Q-testing
-                    logcat_file_path = os.path.join(result_dir, "logcat.log")
-                    login_file_path = os.path.join(result_dir, "login.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "qtesting_testing_time_on_emulator.txt")
-                    testing_time_datetime_str = '%Y-%m-%d-%H:%M:%S'
-
-                if args.weighted:
-                    # Q-testing
-                    logcat_file_path = os.path.join(result_dir, "logcat.log")
-                    login_file_path = os.path.join(result_dir, "login.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "weighted_testing_time_on_emulator.txt")
-                    testing_time_datetime_str = '%Y-%m-%d-%H:%M:%S'
-
-                if args.fastbot:
-                    # Fastbot
-                    logcat_file_path = os.path.join(result_dir, "logcat.log")
-                    login_file_path = os.path.join(result_dir, "login.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "fastbot_testing_time_on_emulator.txt")
-                    testing_time_datetime_str = '%Y-%m-%d-%H:%M:%S'
-                    
-                if args.wetest:
-                    # WeTest
-                    logcat_file_path = os.path.join(result_dir, "logcat.log")
-                    login_file_path = os.path.join(result_dir, "login.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "wetest_testing_time_on_emulator.txt")
-                    testing_time_datetime_str = '%Y-%m-%d-%H:%M:%S'
-                
-                if args.fastbot_new:
-                    # Fastbot
-                    logcat_file_path = os.path.join(result_dir, "logcat.log")
-                    login_file_path = os.path.join(result_dir, "login.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "fastbot_new_testing_time_on_emulator.txt")
-                    testing_time_datetime_str = '%Y-%m-%d-%H:%M:%S'
-                    
-                if args.wetest_new:
-                    # WeTest
-                    logcat_file_path = os.path.join(result_dir, "logcat.log")
-                    login_file_path = os.path.join(result_dir, "login.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "wetest_new_testing_time_on_emulator.txt")
-                    testing_time_datetime_str = '%Y-%m-%d-%H:%M:%S'
-                
-                if args.newmonkey:
-                    # Newmonkey
-                    logcat_file_path = os.path.join(result_dir, "logcat.log")
-                    login_file_path = os.path.join(result_dir, "login.log")
-                    testing_time_file_path = os.path.join(result_dir,
-                                                          "newmonkey_testing_time_on_emulator.txt")
-                    testing_time_datetime_str = '%Y-%m-%d-%H:%M:%S'
+                # the tool given on the command line, or the tool which produced this result dir
+                tool = selected_tool if selected_tool is not None else detect_tool(result_dir)
+                if tool is None:
+                    print(log_tag_name + "Warning: cannot detect the tool of (%s), skip it!" %
+                          os.path.basename(result_dir))
+                    continue
+
+                logcat_file_path = os.path.join(result_dir, tool.logcat_file)
+                login_file_path = os.path.join(result_dir, tool.login_file)
+                testing_time_file_path = os.path.join(result_dir, tool.time_file)
+                testing_time_datetime_str = tool.time_format
+                is_timemachine_crash_log = tool.crash_log_format == 'timemachine'
 
                 if os.path.exists(logcat_file_path) and os.path.exists(testing_time_file_path):
 
@@ -559,7 +486,7 @@ def main(args: Namespace):
                     time.sleep(1)
 
                     # get the start testing datetime
-                    if args.timemachine:
+                    if is_timemachine_crash_log:
                         # special handle timemachine
                         start_testing_datetime_str = lines[0][0:19]
                     else:
@@ -583,7 +510,7 @@ def main(args: Namespace):
                     crash_stack_traces: Dict[str, List[str]] = {}
                     logcat_file = open(logcat_file_path, 'r')
 
-                    if args.timemachine:
+                    if is_timemachine_crash_log:
 
                         if not args.other_crashes:
                             # special handle for TimeMachine (for target crash)
@@ -618,11 +545,8 @@ def main(args: Namespace):
                             if line.startswith("---"):
                                 continue
 
-                            res = [i for i in range(len(line)) if line.startswith(':', i)]
-                            try:
-                                # hot fix
-                                time_label = line[0:res[2]]  # the third ":" is the split point
-                            except IndexError:
+                            time_label = get_logcat_time_label(line)
+                            if time_label is None:
                                 print("Catch IndexError when paring logcat!")
                                 continue
                             if time_label not in crash_stack_traces:
@@ -653,7 +577,7 @@ def main(args: Namespace):
 
                         for time_label in crash_stack_traces:
 
-                            if args.timemachine:
+                            if is_timemachine_crash_log:
                                 # Special handling on timemachine
 
                                 target_stack = crash_stack_traces[time_label]
@@ -775,24 +699,10 @@ def main(args: Namespace):
                         for time_label in crash_stack_traces:
                             target_stack = crash_stack_traces[time_label]
 
-                            is_matched = True
-                            for signature_str in crash_signature_strs:
-
-                                exist = False
-                                for line in target_stack:
-                                    if signature_str in line:
-                                        exist = True
-                                        break
-                                if exist:
-                                    continue
-                                else:
-                                    is_matched = False
-                                    break
-
-                            if is_matched:
+                            if is_crash_stack_matched(target_stack, crash_signature_strs):
 
                                 # compute the time duration to trigger the crash
-                                if args.timemachine:
+                                if is_timemachine_crash_log:
                                     # print("time label: %s" % time_label)
                                     matched_datetime_str = time_label.replace("[", "").replace("]", "")
                                     crash_triggering_datetime_obj = datetime.datetime.strptime(matched_datetime_str,
@@ -883,21 +793,9 @@ if __name__ == '__main__':
     ap.add_argument('-o', required=True, help="the output directory of testing results")
     ap.add_argument('-v', default=False, action='store_true')
 
-    # supported fuzzing tools
-    ap.add_argument('--monkey', default=False, action='store_true')
-    ap.add_argument('--ape', default=False, action='store_true')
-    ap.add_argument('--timemachine', default=False, action='store_true')
-    ap.add_argument('--combo', default=False, action='store_true')
-    ap.add_argument('--humanoid', default=False, action='store_true')
-    ap.add_argument('--sapienz', default=False, action='store_true')
-    ap.add_argument('--qtesting', default=False, action='store_true')
-    ap.add_argument('--weighted', default=False, action='store_true')
-    ap.add_argument('--fastbot', default=False, action='store_true')
-    ap.add_argument('--wetest', default=False, action='store_true')
-    ap.add_argument('--fastbot_new', default=False, action='store_true')
-    ap.add_argument('--wetest_new', default=False, action='store_true')
-    ap.add_argument('--newmonkey', default=False, action='store_true')
-                                                                                                           
+    # supported fuzzing tools (see tool_registry.py), check all the tools if none is given
+    add_tool_arguments(ap)
+
     ap.add_argument('--app', type=str, dest='app_name')
     ap.add_argument('--id', type=str, dest='issue_id')
     ap.add_argument('--csv', type=str, dest='final_result_csv_file_path')
@@ -6,9 +6,12 @@ import os
 import shutil
 import subprocess
 import time
+import zipfile
 from argparse import ArgumentParser, Namespace
 from typing import List, Dict, Set
 
+from apk_metadata import get_app_package_name, ManifestParseError
+
 ALL_APPS = ['ActivityDiary', 'AmazeFileManager', 'and-bible', 'AnkiDroid', 'APhotoManager', 'commons',
             'collect', 'FirefoxLite', 'Frost', 'geohashdroid', 'MaterialFBook', 'nextcloud', 'Omni-Notes',
             'open-event-attendee-android', 'openlauncher', 'osmeditor4android', 'Phonograph', 'Scarlet-Notes',
@@ -309,15 +312,13 @@ def get_apk_info(testing_result_dir: str, app_name: str):
     target_apk_file_name = str(base_name.split(".apk")[0]) + ".apk"
 
     target_apk_file_path = os.path.join("../" + app_name, target_apk_file_name)
-    get_app_package_name_cmd = "aapt dump badging " + target_apk_file_path + " | grep package | awk '{print $2}' | sed s/name=//g | sed s/\\'//g"
     app_package_name = ""
 
     try:
-        p = subprocess.Popen(get_app_package_name_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        # clear the output
-        app_package_name = p.communicate()[0].decode('utf-8').strip()
+        # read from the (cached) manifest of the apk, without aapt
+        app_package_name = get_app_package_name(target_apk_file_path)
         print(app_package_name)
-    except os.error as e:
+    except (OSError, KeyError, zipfile.BadZipFile, ManifestParseError) as e:
         print(e)
 
     return target_apk_file_name, app_package_name
@@ -1,19 +1,35 @@
 import csv
 import json
 import os
+import re
 import subprocess
 import time
 from argparse import ArgumentParser, Namespace
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from xml.dom import minidom
 
 from xml.parsers.expat import ExpatError
 
+from dump_coverage import COVERAGE_DUMP_INTERVAL, COVERAGE_MANIFEST_FILE_NAME
+from jacoco_exec import ExecFileError, ExecutionDataStore
+from jacoco_index import ClassFileError, CoverageIndex, get_coverage_index
+from tool_registry import add_tool_arguments, detect_tool, get_selected_tool, is_result_dir_of, ToolAdapter
+
 ALL_APPS = ['ActivityDiary', 'AmazeFileManager', 'and-bible', 'AnkiDroid', 'APhotoManager', 'commons',
             'collect', 'FirefoxLite', 'Frost', 'geohashdroid', 'MaterialFBook', 'nextcloud', 'Omni-Notes',
             'open-event-attendee-android', 'openlauncher', 'osmeditor4android', 'Phonograph', 'Scarlet-Notes',
             'sunflower', 'WordPress']
 
+# the coverage over time of a run (see compute_coverage_series), cached under its result dir
+COVERAGE_SERIES_FILE_NAME = "coverage_series.csv"
+COVERAGE_SERIES_FIELDS = ['file', 'reason', 'elapsed', 'line', 'branch', 'method', 'class']
+DEFAULT_TIME_STEP = 60
+# the probe index of the class files of an apk (see jacoco_index.py), cached next to the class_files.json of the app
+COVERAGE_INDEX_FILE_SUFFIX = ".coverage_index.npz"
+
+# (app name, apk) -> the probe index of the class files of the apk, None when they cannot be indexed
+coverage_indexes: Dict[Tuple[str, str], Optional[CoverageIndex]] = {}
+
 
 def get_app_name(testing_result_dir):
     for app_name in ALL_APPS:
@@ -43,36 +59,59 @@ def read_coverage_jacoco(jacoco_report_file):
         xmldoc = minidom.parse(jacoco_report_file)
         counters = xmldoc.getElementsByTagName('counter')
 
-        line_coverage = 0
-        branch_coverage = 0
-        method_coverage = 0
-        class_coverage = 0
-
+        # type -> (missed, covered), the last counters of the report are the ones of the whole report
+        coverage_counters: Dict[str, Tuple[int, int]] = {}
         for counter in counters:
-            type_name = counter.getAttribute('type')
-            missed_items = int(counter.getAttribute('missed'))
-            covered_items = int(counter.getAttribute('covered'))
-
-            if type_name == 'LINE':
-                line_coverage = covered_items * 100.0 / (missed_items + covered_items)
+            coverage_counters[counter.getAttribute('type')] = (int(counter.getAttribute('missed')),
+                                                               int(counter.getAttribute('covered')))
+        return get_coverage_of_counters(coverage_counters)
+    except ExpatError:
+        print("*****Parse xml error, catch it!********")
+        return False, 0, 0, 0, 0
 
-            if type_name == 'BRANCH':
-                branch_coverage = covered_items * 100.0 / (missed_items + covered_items)
 
-            if type_name == 'METHOD':
-                method_coverage = covered_items * 100.0 / (missed_items + covered_items)
+def get_coverage_of_counters(coverage_counters):
+    # the coverage (in %) of the counters of a report, the counters without items (left out of the reports) count as 0
+    coverage = {}
+    for type_name in ['LINE', 'BRANCH', 'METHOD', 'CLASS']:
+        missed_items, covered_items = coverage_counters.get(type_name, (0, 0))
+        coverage[type_name] = covered_items * 100.0 / (missed_items + covered_items) \
+            if missed_items + covered_items > 0 else 0
+    line_coverage, branch_coverage, method_coverage, class_coverage = \
+        coverage['LINE'], coverage['BRANCH'], coverage['METHOD'], coverage['CLASS']
+
+    print("-----------")
+    print("Line: " + str(line_coverage) + ", Branch: " + str(branch_coverage) + ", Method: " + str(method_coverage)
+          + ", Class: " + str(class_coverage))
+    print("-----------")
+    return True, float("{:.2f}".format(line_coverage)), float("{:.2f}".format(branch_coverage)), \
+           float("{:.2f}".format(method_coverage)), float("{:.2f}".format(class_coverage))
+
+
+def get_apk_coverage_index(app_name, target_apk_file_name):
+    # the probe index of the class files of an apk (with --coverage_index), built once for all the runs (and the later
+    #   invocations), or None to fall back to "jacococli.jar report" (e.g., for the class files the index does not
+    #   support)
+    key = (app_name, target_apk_file_name)
+    if key not in coverage_indexes:
+        class_files_dirs, source_files_dirs = get_class_source_files_dirs(app_name, target_apk_file_name)
+        index_file_path = os.path.join("../" + app_name, target_apk_file_name + COVERAGE_INDEX_FILE_SUFFIX)
+        try:
+            coverage_indexes[key] = get_coverage_index(
+                [os.path.join("../" + app_name, tmp_dir) for tmp_dir in class_files_dirs], index_file_path)
+        except (ClassFileError, OSError) as e:
+            print("Warning: cannot index the class files of %s, use jacococli.jar report instead: %s" % (
+                target_apk_file_name, e))
+            coverage_indexes[key] = None
+    return coverage_indexes[key]
 
-            if type_name == 'CLASS':
-                class_coverage = covered_items * 100.0 / (missed_items + covered_items)
 
-        print("-----------")
-        print("Line: " + str(line_coverage) + ", Branch: " + str(branch_coverage) + ", Method: " + str(method_coverage)
-              + ", Class: " + str(class_coverage))
-        print("-----------")
-        return True, float("{:.2f}".format(line_coverage)), float("{:.2f}".format(branch_coverage)), \
-               float("{:.2f}".format(method_coverage)), float("{:.2f}".format(class_coverage))
-    except ExpatError:
-        print("*****Parse xml error, catch it!********")
+def read_coverage_index(coverage_index: CoverageIndex, store: ExecutionDataStore):
+    # the same coverage as the one of the jacococli.jar report of the execution data, without the report
+    try:
+        return get_coverage_of_counters(coverage_index.get_counters(store))
+    except ExecFileError as e:
+        print("Warning: %s" % e)
         return False, 0, 0, 0, 0
 
 
@@ -102,95 +141,65 @@ def get_class_files_str(app_name, class_files_dirs):
     return class_files_dirs_str
 
 
+def merge_coverage_ec_files(coverage_ec_files: List[str], merged_coverage_ec_file_path):
+    # the same as "jacococli.jar merge" (see jacoco_exec.py), without starting a JVM and for any number of files, the
+    #   broken coverage files (e.g., a dump cut by a crash) are skipped
+    store = ExecutionDataStore()
+    for ec_file in coverage_ec_files:
+        try:
+            store.load(ec_file)
+        except (ExecFileError, OSError) as e:
+            print("Warning: skip the coverage file %s: %s" % (ec_file, e))
+    store.save(merged_coverage_ec_file_path)
+    print("%d coverage files (%d classes covered) merged into %s" % (len(coverage_ec_files),
+                                                                     store.get_covered_classes(),
+                                                                     merged_coverage_ec_file_path))
+    return store
+
+
 def get_coverage_ec_files_str(coverage_data_dir):
-    # Get the coverage data files #
-    coverage_ec_files = [os.path.join(coverage_data_dir, f) for f in os.listdir(coverage_data_dir) if
-                         os.path.isfile(os.path.join(coverage_data_dir, f)) and f.endswith('.ec')]
+    # Get the coverage data files, except the merged ones #
+    coverage_ec_files = [os.path.join(coverage_data_dir, f) for f in sorted(os.listdir(coverage_data_dir)) if
+                         os.path.isfile(os.path.join(coverage_data_dir, f)) and f.endswith('.ec') and
+                         not f.startswith('coverage_all') and f != "coverage_series.ec"]
 
-    coverage_ec_files_str = ""
-    for ec_file in coverage_ec_files:
-        coverage_ec_files_str += " " + ec_file
+    # handle the case when no coverage data is available
+    if len(coverage_ec_files) == 0:
+        return ""
 
     merged_coverage_ec_file_path = os.path.join(coverage_data_dir, "coverage_all.ec")
 
     if not os.path.exists(merged_coverage_ec_file_path):
         # only merge when the "coverage_all.ec" does not exist
-
-        merge_cmd = "java -jar ../tools/jacococli.jar merge " + coverage_ec_files_str + \
-                    " --destfile " + merged_coverage_ec_file_path
-        print('$ %s' % merge_cmd)
-
-        try:
-            p = subprocess.Popen(merge_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            # clear the output
-            output = p.communicate()[0].decode('utf-8').strip()
-            print(output)
-        except os.error as e:
-            print(e)
+        merge_coverage_ec_files(coverage_ec_files, merged_coverage_ec_file_path)
 
     return merged_coverage_ec_file_path
 
 
-def get_coverage_ec_files_str_optimized(coverage_data_dir):
-    # Get the coverage data files #
-    coverage_ec_files = [os.path.join(coverage_data_dir, f) for f in os.listdir(coverage_data_dir) if
-                         os.path.isfile(os.path.join(coverage_data_dir, f)) and f.endswith('.ec')]
-
-    # split the coverage ec files due to the list is too long
-    split_size = 30
-    coverage_ec_files_list: List[List[str]] = [coverage_ec_files[i:i + split_size] for i in
-                                                     range(0, len(coverage_ec_files), split_size)]
-
-    merged_coverage_file_index = 0
-    merged_coverage_ec_files = []
-
-    for sublist_coverage_ec_files in coverage_ec_files_list:
-
-        coverage_ec_files_str = ""
-        for ec_file in sublist_coverage_ec_files:
-            coverage_ec_files_str += " " + ec_file
-
-        merged_coverage_file_index += 1
-        merged_coverage_ec_file_path = os.path.join(coverage_data_dir, "coverage_all_" + str(merged_coverage_file_index) + ".ec")
-
-        merge_cmd = "java -jar ../tools/jacococli.jar merge " + coverage_ec_files_str + \
-                    " --destfile " + merged_coverage_ec_file_path
-        print('$ %s' % merge_cmd)
-
-        try:
-            p = subprocess.Popen(merge_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            # clear the output
-            output = p.communicate()[0].decode('utf-8').strip()
-            print(output)
-
-            merged_coverage_ec_files.append(merged_coverage_ec_file_path)
-
-        except os.error as e:
-            print(e)
-
-    merged_coverage_ec_files_str = ""
-    for ec_file in merged_coverage_ec_files:
-        merged_coverage_ec_files_str += " " + ec_file
-
-    return merged_coverage_ec_files_str
-
-
-def compute_code_coverage(app_name, tool_name, testing_result_dir, coverage_data_dir):
+def compute_code_coverage(app_name, tool: ToolAdapter, testing_result_dir, coverage_data_dir,
+                          use_coverage_index=False):
     target_apk_file_name = get_apk_name(testing_result_dir)
 
     class_files_dirs, source_files_dirs = get_class_source_files_dirs(app_name, target_apk_file_name)
 
     class_files_dirs_str = get_class_files_str(app_name, class_files_dirs)
 
-    if tool_name == "timemachine":
-        coverage_ec_files_str = get_coverage_ec_files_str_optimized(coverage_data_dir)
-    else:
-        coverage_ec_files_str = get_coverage_ec_files_str(coverage_data_dir)
+    coverage_ec_files_str = get_coverage_ec_files_str(coverage_data_dir)
 
     # handle the case when no coverage data is available
     if len(coverage_ec_files_str) == 0:
         return False, 0, 0, 0, 0
 
+    coverage_index = get_apk_coverage_index(app_name, target_apk_file_name) if use_coverage_index else None
+    if coverage_index is not None:
+        store = ExecutionDataStore()
+        try:
+            store.load(coverage_ec_files_str)
+        except (ExecFileError, OSError) as e:
+            print("Warning: cannot load the coverage file %s: %s" % (coverage_ec_files_str, e))
+            return False, 0, 0, 0, 0
+        return read_coverage_index(coverage_index, store)
+
     # Assemble and execute the coverage computation command #
     xml_coverage_report_file_path = os.path.join(testing_result_dir, "coverage_report.xml")
     cmd = "java -jar ../tools/jacococli.jar report " + coverage_ec_files_str + class_files_dirs_str + " --xml " + \
@@ -205,29 +214,26 @@ def compute_code_coverage(app_name, tool_name, testing_result_dir, coverage_data
     return read_coverage_jacoco(xml_coverage_report_file_path)
 
 
-def compute_single_run_code_coverage(app_name, tool_name, issue_id,
+def compute_single_run_code_coverage(app_name, tool: ToolAdapter, issue_id,
                                      target_app_testing_result_dirs,
-                                     coverage_data_summary_file_path):
+                                     coverage_data_summary_file_path, use_coverage_index=False):
     for tmp_dir in target_app_testing_result_dirs:
 
         # only compute coverage for specific issue
         if issue_id is not None and issue_id not in tmp_dir:
             continue
 
-        if tool_name not in tmp_dir:
+        if not is_result_dir_of(tool, tmp_dir):
             # double check to ensure the testing result dir is indeed from the target tool
             continue
 
         print(tmp_dir)
 
-        if tool_name == "timemachine":
-            coverage_data_dir = os.path.join(tmp_dir, "timemachine-output")
-        else:
-            coverage_data_dir = tmp_dir
+        coverage_data_dir = os.path.join(tmp_dir, tool.coverage_dir)
 
         # If is_valid_data is False, it means the no coverage files exists or parsing coverage report failed.
         is_valid_data, line_coverage, branch_coverage, method_coverage, class_coverage = \
-            compute_code_coverage(app_name, tool_name, tmp_dir, coverage_data_dir)
+            compute_code_coverage(app_name, tool, tmp_dir, coverage_data_dir, use_coverage_index)
 
         # dump info into csv
         if is_valid_data:
@@ -236,14 +242,14 @@ def compute_single_run_code_coverage(app_name, tool_name, issue_id,
             with open(coverage_data_summary_file_path, "a") as csv_file:
                 writer = csv.writer(csv_file)
                 writer.writerow(
-                    [app_name, tool_name, os.path.basename(tmp_dir), line_coverage, branch_coverage, method_coverage,
-                     class_coverage])
+                    [app_name, tool.result_tag, os.path.basename(tmp_dir), line_coverage, branch_coverage,
+                     method_coverage, class_coverage])
             csv_file.close()
 
 
-def compute_average_code_coverage(app_name, tool_name, issue_id,
+def compute_average_code_coverage(app_name, tool: ToolAdapter, issue_id,
                                   target_app_testing_result_dirs,
-                                  average_coverage_data_summary_file_path):
+                                  average_coverage_data_summary_file_path, use_coverage_index=False):
     average_coverage_dict: Dict[str, Dict[str, List[float]]] = {}
 
     for tmp_dir in target_app_testing_result_dirs:
@@ -252,20 +258,17 @@ def compute_average_code_coverage(app_name, tool_name, issue_id,
         if issue_id is not None and issue_id not in tmp_dir:
             continue
 
-        if tool_name not in tmp_dir:
+        if not is_result_dir_of(tool, tmp_dir):
             # double check to ensure the testing result dir is indeed from the target tool
             continue
 
         print(tmp_dir)
 
-        if tool_name == "timemachine":
-            coverage_data_dir = os.path.join(tmp_dir, "timemachine-output")
-        else:
-            coverage_data_dir = tmp_dir
+        coverage_data_dir = os.path.join(tmp_dir, tool.coverage_dir)
 
         # If is_valid_data is False, it means the no coverage files exists or parsing coverage report failed.
         is_valid_data, line_coverage, branch_coverage, method_coverage, class_coverage = \
-            compute_code_coverage(app_name, tool_name, tmp_dir, coverage_data_dir)
+            compute_code_coverage(app_name, tool, tmp_dir, coverage_data_dir, use_coverage_index)
 
         # dump info into csv
         if is_valid_data and line_coverage > 0.0:
@@ -300,6 +303,154 @@ def compute_average_code_coverage(app_name, tool_name, issue_id,
         csv_file.close()
 
 
+def read_coverage_manifest(coverage_data_dir):
+    # the coverage files of a run in the order of their dumps, with their time (in secs) since the start of the dumping
+    manifest_file_path = os.path.join(coverage_data_dir, COVERAGE_MANIFEST_FILE_NAME)
+    snapshots = []
+    if os.path.exists(manifest_file_path):
+        with open(manifest_file_path, "r", newline="") as manifest_file:
+            for row in csv.DictReader(manifest_file):
+                if os.path.isfile(os.path.join(coverage_data_dir, row['file'])):
+                    snapshots.append({'file': row['file'], 'reason': row['reason'], 'elapsed': float(row['elapsed'])})
+    elif os.path.isdir(coverage_data_dir):
+        # the runs before the manifest dumped coverage_<i>.ec every 5 minutes
+        for f in os.listdir(coverage_data_dir):
+            m = re.fullmatch(r"coverage_(\d+)\.ec", f)
+            if m is not None:
+                snapshots.append({'file': f, 'reason': "periodic", 'elapsed': float(int(m.group(1)) *
+                                                                                    COVERAGE_DUMP_INTERVAL)})
+    return sorted(snapshots, key=lambda snapshot: snapshot['elapsed'])
+
+
+def run_jacoco_command(cmd):
+    print('$ %s' % cmd)
+    p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    # clear the output
+    output = p.communicate()[0].decode('utf-8').strip()
+    print(output)
+
+
+def compute_coverage_series(app_name, testing_result_dir, coverage_data_dir, use_coverage_index=False):
+    # the cumulative coverage of a run after each of its coverage dumps, i.e., the coverage of the merge of the coverage
+    #   files up to the dump
+    snapshots = read_coverage_manifest(coverage_data_dir)
+    series_file_path = os.path.join(testing_result_dir, COVERAGE_SERIES_FILE_NAME)
+    if os.path.exists(series_file_path):
+        # only recompute when the run has new coverage files
+        with open(series_file_path, "r", newline="") as series_file:
+            series = [{'file': row['file'], 'reason': row['reason'], 'elapsed': float(row['elapsed']),
+                       'line': float(row['line']), 'branch': float(row['branch']), 'method': float(row['method']),
+                       'class': float(row['class'])} for row in csv.DictReader(series_file)]
+        if [point['file'] for point in series] == [snapshot['file'] for snapshot in snapshots]:
+            return series
+
+    target_apk_file_name = get_apk_name(testing_result_dir)
+    class_files_dirs, source_files_dirs = get_class_source_files_dirs(app_name, target_apk_file_name)
+    class_files_dirs_str = get_class_files_str(app_name, class_files_dirs)
+    coverage_index = get_apk_coverage_index(app_name, target_apk_file_name) if use_coverage_index else None
+
+    # merge the coverage files one by one (in memory) instead of merging all the previous ones for each dump
+    merged_coverage_ec_file_path = os.path.join(testing_result_dir, "coverage_series.ec")
+    xml_coverage_report_file_path = os.path.join(testing_result_dir, "coverage_series_report.xml")
+    store = ExecutionDataStore()
+    series = []
+    for snapshot in snapshots:
+        coverage_ec_file_path = os.path.join(coverage_data_dir, snapshot['file'])
+        try:
+            store.load(coverage_ec_file_path)
+        except (ExecFileError, OSError) as e:
+            print("Warning: skip the coverage file %s: %s" % (coverage_ec_file_path, e))
+            continue
+        if coverage_index is not None:
+            # no merged file nor report, the coverage of the probes in memory
+            is_valid_data, line_coverage, branch_coverage, method_coverage, class_coverage = \
+                read_coverage_index(coverage_index, store)
+        else:
+            store.save(merged_coverage_ec_file_path)
+            run_jacoco_command("java -jar ../tools/jacococli.jar report " + merged_coverage_ec_file_path +
+                               class_files_dirs_str + " --xml " + xml_coverage_report_file_path)
+            is_valid_data, line_coverage, branch_coverage, method_coverage, class_coverage = \
+                read_coverage_jacoco(xml_coverage_report_file_path)
+        if is_valid_data:
+            series.append({'file': snapshot['file'], 'reason': snapshot['reason'], 'elapsed': snapshot['elapsed'],
+                           'line': line_coverage, 'branch': branch_coverage, 'method': method_coverage,
+                           'class': class_coverage})
+
+    for tmp_file_path in [merged_coverage_ec_file_path, xml_coverage_report_file_path]:
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+    with open(series_file_path, "w", newline="") as series_file:
+        writer = csv.DictWriter(series_file, fieldnames=COVERAGE_SERIES_FIELDS)
+        writer.writeheader()
+        writer.writerows(series)
+    return series
+
+
+def get_coverage_at(series, elapsed):
+    # the coverage of the latest dump at or before the given time, or None before the first dump
+    coverage = None
+    for point in series:
+        if point['elapsed'] > elapsed:
+            break
+        coverage = point
+    return coverage
+
+
+def compute_coverage_over_time(app_name, tool: ToolAdapter, issue_id,
+                               target_app_testing_result_dirs,
+                               time_coverage_data_file_path, average_time_coverage_data_file_path, time_step,
+                               use_coverage_index=False):
+    # issue id -> the coverage series of the runs
+    all_series: Dict[str, List[List[Dict]]] = {}
+
+    for tmp_dir in target_app_testing_result_dirs:
+
+        # only compute coverage for specific issue
+        if issue_id is not None and issue_id not in tmp_dir:
+            continue
+
+        if not is_result_dir_of(tool, tmp_dir):
+            # double check to ensure the testing result dir is indeed from the target tool
+            continue
+
+        print(tmp_dir)
+
+        series = compute_coverage_series(app_name, tmp_dir, os.path.join(tmp_dir, tool.coverage_dir),
+                                         use_coverage_index)
+        if len(series) == 0:
+            print("Warning: no coverage over time for %s" % tmp_dir)
+            continue
+        all_series.setdefault(get_issue_id(tmp_dir), []).append(series)
+
+        if time_coverage_data_file_path is not None:
+            with open(time_coverage_data_file_path, "a") as csv_file:
+                writer = csv.writer(csv_file)
+                for point in series:
+                    writer.writerow(
+                        [app_name, tool.result_tag, os.path.basename(tmp_dir), point['elapsed'], point['reason'],
+                         point['line'], point['branch'], point['method'], point['class']])
+
+    if average_time_coverage_data_file_path is None:
+        return
+
+    for issue_id_str in all_series:
+        print("**** [%s] Compute average coverage over time, write to the file ****" % issue_id_str)
+        runs = all_series[issue_id_str]
+        last_elapsed = max(series[-1]['elapsed'] for series in runs)
+        # the runs are compared at the same times, each run counts with the coverage of its latest dump (if any)
+        with open(average_time_coverage_data_file_path, "a") as csv_file:
+            writer = csv.writer(csv_file)
+            elapsed = time_step
+            while elapsed < last_elapsed + time_step:
+                points = [point for point in [get_coverage_at(series, elapsed) for series in runs] if point is not None]
+                if len(points) > 0:
+                    writer.writerow(
+                        [app_name, tool.result_tag, issue_id_str, elapsed, len(points)] +
+                        ["{:.2f}".format(sum(point[kind] for point in points) / len(points))
+                         for kind in ['line', 'branch', 'method', 'class']])
+                elapsed += time_step
+
+
 def cluster_testing_result_dirs_by_apk(testing_result_dirs: List[str]):
     clustered_dict: Dict[str, List[str]] = {}
     for tmp_dir in testing_result_dirs:
@@ -311,54 +462,62 @@ def cluster_testing_result_dirs_by_apk(testing_result_dirs: List[str]):
     return clustered_dict
 
 
-def compute_all_run_code_coverage(app_name: str, output_dir, tool_name,
+def compute_all_run_code_coverage(app_name: str, output_dir, tool: ToolAdapter,
                                   target_app_testing_result_dirs: List[str],
-                                  accumulative_coverage_result_file_path):
+                                  accumulative_coverage_result_file_path, use_coverage_index=False):
     clustered_dict = cluster_testing_result_dirs_by_apk(target_app_testing_result_dirs)
 
     for target_apk_file_name in clustered_dict:
 
         all_run_testing_result_dirs = clustered_dict[target_apk_file_name]
 
-        coverage_ec_files_str = ""
+        coverage_ec_files = []
 
         for tmp_dir in all_run_testing_result_dirs:
 
-            if tool_name not in tmp_dir:
+            if not is_result_dir_of(tool, tmp_dir):
                 # double check to ensure the testing result dir is indeed from the target tool
                 continue
 
-            if tool_name == "timemachine":
-                coverage_data_dir = os.path.join(tmp_dir, "timemachine-output")
-                coverage_ec_files_str += " " + get_coverage_ec_files_str_optimized(coverage_data_dir)
-            else:
-                coverage_data_dir = tmp_dir
-                coverage_ec_files_str += " " + get_coverage_ec_files_str(coverage_data_dir)
+            coverage_data_dir = os.path.join(tmp_dir, tool.coverage_dir)
+            merged_coverage_ec_file_path = get_coverage_ec_files_str(coverage_data_dir)
+            if len(merged_coverage_ec_file_path) > 0:
+                coverage_ec_files.append(merged_coverage_ec_file_path)
+
+        # merge the coverage of all the runs into one file
+        merged_coverage_ec_file_path = os.path.join(output_dir, target_apk_file_name + ".coverage_all.ec")
+        store = merge_coverage_ec_files(coverage_ec_files, merged_coverage_ec_file_path)
+        coverage_ec_files_str = " " + merged_coverage_ec_file_path
 
         class_files_dirs, source_files_dirs = get_class_source_files_dirs(app_name, target_apk_file_name)
 
         class_files_dirs_str = get_class_files_str(app_name, class_files_dirs)
 
-        # Assemble and execute the coverage computation command #
-        xml_coverage_report_file_path = os.path.join(output_dir, target_apk_file_name + ".coverage_report.xml")
-        cmd = "java -jar ../tools/jacococli.jar report " + coverage_ec_files_str + class_files_dirs_str + " --xml " + \
-              xml_coverage_report_file_path
-        print('$ %s' % cmd)
+        coverage_index = get_apk_coverage_index(app_name, target_apk_file_name) if use_coverage_index else None
+        if coverage_index is not None:
+            is_valid_data, line_coverage, branch_coverage, method_coverage, class_coverage = \
+                read_coverage_index(coverage_index, store)
+        else:
+            # Assemble and execute the coverage computation command #
+            xml_coverage_report_file_path = os.path.join(output_dir, target_apk_file_name + ".coverage_report.xml")
+            cmd = "java -jar ../tools/jacococli.jar report " + coverage_ec_files_str + class_files_dirs_str + \
+                  " --xml " + xml_coverage_report_file_path
+            print('$ %s' % cmd)
 
-        p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        # clear the output
-        output = p.communicate()[0].decode('utf-8').strip()
-        print(output)
+            p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            # clear the output
+            output = p.communicate()[0].decode('utf-8').strip()
+            print(output)
 
-        is_valid_data, line_coverage, branch_coverage, method_coverage, class_coverage = \
-            read_coverage_jacoco(xml_coverage_report_file_path)
+            is_valid_data, line_coverage, branch_coverage, method_coverage, class_coverage = \
+                read_coverage_jacoco(xml_coverage_report_file_path)
 
         # dump info into csv
         if is_valid_data:
             with open(accumulative_coverage_result_file_path, "a") as csv_file:
                 writer = csv.writer(csv_file)
                 writer.writerow(
-                    [app_name, tool_name, target_apk_file_name, line_coverage, branch_coverage, method_coverage,
+                    [app_name, tool.result_tag, target_apk_file_name, line_coverage, branch_coverage, method_coverage,
                      class_coverage])
             csv_file.close()
 
@@ -381,23 +540,18 @@ def main(args: Namespace):
     print(all_testing_results_dirs)
     print("---------")
 
-    if args.timemachine:
-        tool_name = "timemachine"
+    # compute the coverage of the given tool, or of all the tools in the output dir (detected by the result dir names)
+    selected_tool = get_selected_tool(args)
+    if selected_tool is not None:
+        tools = [selected_tool]
     else:
-        if args.monkey:
-            tool_name = "monkey"
-        elif args.ape:
-            tool_name = "ape"
-        elif args.combo:
-            tool_name = "combodroid"
-        elif args.humandroid:
-            tool_name = "humandroid"
-        elif args.stoat:
-            tool_name = "stoat"
-        elif args.qtesting:
-            tool_name = "qtesting"
-        else:
-            tool_name = ""
+        tools = []
+        for app_name in all_testing_results_dirs:
+            for tmp_dir in all_testing_results_dirs[app_name]:
+                tool = detect_tool(tmp_dir)
+                if tool is not None and tool.result_tag not in [t.result_tag for t in tools]:
+                    tools.append(tool)
+        print("tools in the output dir: %s" % [tool.result_tag for tool in tools])
 
     if args.acc_csv is not None:
 
@@ -410,10 +564,11 @@ def main(args: Namespace):
             if args.app_name is not None and app_name != args.app_name:
                 continue
             target_app_testing_result_dirs = all_testing_results_dirs[app_name]
-            # compute coverage for all runs of an apk
-            compute_all_run_code_coverage(app_name, args.o, tool_name,
-                                          target_app_testing_result_dirs,
-                                          accumulative_coverage_result_file_path)
+            for tool in tools:
+                # compute coverage for all runs of an apk
+                compute_all_run_code_coverage(app_name, args.o, tool,
+                                              target_app_testing_result_dirs,
+                                              accumulative_coverage_result_file_path, args.coverage_index)
 
     if args.single_csv is not None:
 
@@ -426,9 +581,10 @@ def main(args: Namespace):
             if args.app_name is not None and app_name != args.app_name:
                 continue
             target_app_testing_result_dirs = all_testing_results_dirs[app_name]
-            compute_single_run_code_coverage(app_name, tool_name, args.issue_id,
-                                             target_app_testing_result_dirs,
-                                             single_run_coverage_result_file_path)
+            for tool in tools:
+                compute_single_run_code_coverage(app_name, tool, args.issue_id,
+                                                 target_app_testing_result_dirs,
+                                                 single_run_coverage_result_file_path, args.coverage_index)
     if args.average_csv is not None:
 
         average_coverage_result_file_path = args.average_csv
@@ -440,9 +596,27 @@ def main(args: Namespace):
             if args.app_name is not None and app_name != args.app_name:
                 continue
             target_app_testing_result_dirs = all_testing_results_dirs[app_name]
-            compute_average_code_coverage(app_name, tool_name, args.issue_id,
-                                          target_app_testing_result_dirs,
-                                          average_coverage_result_file_path)
+            for tool in tools:
+                compute_average_code_coverage(app_name, tool, args.issue_id,
+                                              target_app_testing_result_dirs,
+                                              average_coverage_result_file_path, args.coverage_index)
+
+    if args.time_csv is not None or args.average_time_csv is not None:
+
+        for coverage_result_file_path in [args.time_csv, args.average_time_csv]:
+            if coverage_result_file_path is not None and os.path.exists(coverage_result_file_path):
+                os.remove(coverage_result_file_path)
+
+        for app_name in all_testing_results_dirs:
+            # only compute coverage for specific app
+            if args.app_name is not None and app_name != args.app_name:
+                continue
+            target_app_testing_result_dirs = all_testing_results_dirs[app_name]
+            for tool in tools:
+                compute_coverage_over_time(app_name, tool, args.issue_id,
+                                           target_app_testing_result_dirs,
+                                           args.time_csv, args.average_time_csv, args.time_step,
+                                           args.coverage_index)
 
 
 if __name__ == '__main__':
@@ -452,14 +626,8 @@ if __name__ == '__main__':
     ap.add_argument('-o', required=True, help="the output directory of testing results")
     ap.add_argument('-v', default=False, action='store_true')
 
-    # supported fuzzing tools
-    ap.add_argument('--monkey', default=False, action='store_true')
-    ap.add_argument('--ape', default=False, action='store_true')
-    ap.add_argument('--timemachine', default=False, action='store_true')
-    ap.add_argument('--combo', default=False, action='store_true')
-    ap.add_argument('--humandroid', default=False, action='store_true')
-    ap.add_argument('--qtesting', default=False, action='store_true')
-    ap.add_argument('--stoat', default=False, action='store_true')
+    # supported fuzzing tools (see tool_registry.py), compute the coverage of all the tools if none is given
+    add_tool_arguments(ap)
 
     ap.add_argument('--app', type=str, dest='app_name')
     ap.add_argument('--id', type=str, dest='issue_id')
@@ -469,10 +637,22 @@ if __name__ == '__main__':
                     help="compute the coverage of single runs")
     ap.add_argument('--average_csv', type=str, default=None, dest='average_csv',
                     help="compute the average coverage of all runs")
+    ap.add_argument('--time_csv', type=str, default=None, dest='time_csv',
+                    help="compute the coverage over time of single runs (after each coverage dump)")
+    ap.add_argument('--average_time_csv', type=str, default=None, dest='average_time_csv',
+                    help="compute the average coverage over time of all runs (every --time_step secs)")
+    ap.add_argument('--time_step', type=int, default=DEFAULT_TIME_STEP, dest='time_step',
+                    help="the time step (in secs) of the average coverage over time, default: %d" % DEFAULT_TIME_STEP)
+    ap.add_argument('--coverage_index', default=False, action='store_true', dest='coverage_index',
+                    help="compute the coverage from the probe index of the class files of each apk (see "
+                         "jacoco_index.py) instead of \"jacococli.jar report\"")
 
     args = ap.parse_args()
 
     if not os.path.exists(args.o):
         ap.error("Error: the output directory does not exist!")
 
+    if args.time_step <= 0:
+        ap.error("Error: the time step should be positive!")
+
     main(args)
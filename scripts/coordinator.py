@@ -0,0 +1,345 @@
+# This file implements the coordinator/worker mode of themis.py for running a campaign across multiple hosts.
+#
+# The coordinator (themis.py --coordinator HOST:PORT) holds the job queue and the campaign ledger, and serves them over
+#   a small json-over-http protocol:
+#
+#   POST /register   {worker, host, slots}                  register a worker and its free emulator slots
+#   POST /next       {worker, avd_serial}                   lease the next job for a free slot
+#   POST /heartbeat  {worker}                               keep the leases of a worker's running jobs alive
+#   POST /result     {worker, avd_serial, job, status,      report the exit status of a finished run, or that the
+#                     interrupted, invalid_reason}          run was interrupted (e.g., Ctrl-C) or aborted as invalid
+#                                                           by the watchdog of the worker, the job is then re-queued
+#   PUT  /upload?worker=..&name=..                          upload a result dir (tar.gz) into the coordinator's -o dir
+#   GET  /status                                            the progress of the campaign
+#
+# A worker (themis.py --worker http://HOST:PORT) runs one slot thread per local emulator, each of which pulls the next
+#   job from the coordinator as soon as its previous run ends and sends the run's results back when it finishes.
+# The jobs leased by a worker that stops sending heartbeats (e.g., its host crashed) are re-queued.
+# Several workers can run on the same machine (with different --offset), which is how this mode can be tried out.
+
+import io
+import json
+import os
+import socket
+import tarfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib import request as urllib_request
+from urllib.parse import parse_qs, quote, urlparse
+
+from ledger import CampaignLedger, get_job_id, JOB_FAILED, JOB_FINISHED, JOB_QUEUED, JOB_RUNNING
+from scheduler import DeviceSlotScheduler, Job
+from supervisor import get_exit_status, RunOutcome
+from watchdog import DEFAULT_WATCHDOG_RETRIES
+
+# how long (in seconds) a worker may stay silent before its running jobs are re-queued
+LEASE_TIMEOUT = 300
+HEARTBEAT_INTERVAL = 60
+# how long (in seconds) an idle slot waits before asking the coordinator again
+POLL_INTERVAL = 30
+
+
+class CampaignCoordinator:
+
+    def __init__(self, jobs: List[Job], ledger: CampaignLedger, output_dir: str, lease_timeout: int = LEASE_TIMEOUT,
+                 watchdog_retries: int = DEFAULT_WATCHDOG_RETRIES):
+        self.ledger = ledger
+        self.output_dir = output_dir
+        self.lease_timeout = lease_timeout
+        # the maximum number of times a job is re-queued after an invalid run (see --watchdog-retries)
+        self.watchdog_retries = watchdog_retries
+
+        self.pending_jobs: List[Job] = list(jobs)
+        # job id -> (job, worker id, avd serial)
+        self.running_jobs: Dict[str, tuple] = {}
+        self.workers: Dict[str, Dict] = {}
+        self.number_of_finished_jobs = 0
+        self.number_of_failed_jobs = 0
+        # job id -> the number of its runs aborted as invalid by the watchdogs of the workers
+        self.invalid_runs: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.all_done = threading.Event()
+        if len(self.pending_jobs) == 0:
+            self.all_done.set()
+
+    def register(self, worker_id: str, host: str, slots: List[str]):
+        with self.lock:
+            if worker_id in self.workers:
+                # the worker was restarted, its previous runs are lost
+                self.requeue_jobs_of_worker(worker_id)
+            self.workers[worker_id] = {'host': host, 'slots': slots, 'last_seen': time.time()}
+        print("worker registered: %s (%s) with %d slots: %s" % (worker_id, host, len(slots), slots))
+
+    def heartbeat(self, worker_id: str):
+        with self.lock:
+            if worker_id in self.workers:
+                self.workers[worker_id]['last_seen'] = time.time()
+
+    def requeue_jobs_of_worker(self, worker_id: str):
+        for job_id in [job_id for job_id in self.running_jobs if self.running_jobs[job_id][1] == worker_id]:
+            job, _, avd_serial = self.running_jobs.pop(job_id)
+            print("re-queue the job %s from worker %s (%s)" % (job_id, worker_id, avd_serial))
+            self.ledger.record(job, JOB_QUEUED, worker=worker_id, reason="worker lost")
+            self.pending_jobs.insert(0, job)
+
+    def requeue_expired_jobs(self):
+        now = time.time()
+        for worker_id in self.workers:
+            if now - self.workers[worker_id]['last_seen'] > self.lease_timeout:
+                self.requeue_jobs_of_worker(worker_id)
+
+    def next_job(self, worker_id: str, avd_serial: str):
+        # return (job, done): the leased job, or None with whether the whole campaign is done
+        with self.lock:
+            if worker_id in self.workers:
+                self.workers[worker_id]['last_seen'] = time.time()
+            self.requeue_expired_jobs()
+            if len(self.pending_jobs) == 0:
+                return None, len(self.running_jobs) == 0
+            job = self.pending_jobs.pop(0)
+            self.running_jobs[self.ledger.get_job_id(job)] = (job, worker_id, avd_serial)
+        self.ledger.record(job, JOB_RUNNING, worker=worker_id, avd_serial=avd_serial)
+        print("lease the job %s to %s (%s)" % (self.ledger.get_job_id(job), worker_id, avd_serial))
+        return job, False
+
+    def report(self, worker_id: str, avd_serial: str, job: Job, status: Optional[int], interrupted: bool = False,
+               invalid_reason: Optional[str] = None):
+        job_id = self.ledger.get_job_id(job)
+        requeued = False
+        with self.lock:
+            if job_id not in self.running_jobs or self.running_jobs[job_id][1] != worker_id:
+                # the lease has expired and the job was re-queued, ignore the late result
+                print("ignore the result of %s from %s: not leased to this worker" % (job_id, worker_id))
+                return
+            self.running_jobs.pop(job_id)
+            if interrupted:
+                # the worker is stopping (e.g., on Ctrl-C), the job is run again by the next free slot
+                self.pending_jobs.insert(0, job)
+            elif invalid_reason is not None:
+                self.invalid_runs[job_id] = self.invalid_runs.get(job_id, 0) + 1
+                if self.invalid_runs[job_id] <= self.watchdog_retries:
+                    # re-queue the job instead of counting the lost run as a run which found nothing
+                    self.pending_jobs.append(job)
+                    requeued = True
+                else:
+                    self.number_of_failed_jobs += 1
+            elif status == 0:
+                self.number_of_finished_jobs += 1
+            else:
+                self.number_of_failed_jobs += 1
+            if len(self.pending_jobs) == 0 and len(self.running_jobs) == 0:
+                self.all_done.set()
+        if interrupted:
+            print("re-queue the job %s from worker %s (%s): the run was interrupted" % (job_id, worker_id, avd_serial))
+            self.ledger.record(job, JOB_QUEUED, worker=worker_id, avd_serial=avd_serial, reason="interrupted")
+            return
+        if invalid_reason is not None:
+            if requeued:
+                print("re-queue the job %s from worker %s (%s), retry %d/%d after the invalid run: %s" % (
+                    job_id, worker_id, avd_serial, self.invalid_runs[job_id], self.watchdog_retries, invalid_reason))
+                self.ledger.record(job, JOB_QUEUED, worker=worker_id, avd_serial=avd_serial,
+                                   invalid_reason=invalid_reason)
+            else:
+                print("the job %s on %s (%s) failed after %d invalid runs: %s" % (
+                    job_id, worker_id, avd_serial, self.invalid_runs[job_id], invalid_reason))
+                self.ledger.record(job, JOB_FAILED, worker=worker_id, avd_serial=avd_serial, exit_status=status,
+                                   invalid_reason=invalid_reason)
+            return
+        if status == 0:
+            self.ledger.record(job, JOB_FINISHED, worker=worker_id, avd_serial=avd_serial)
+        else:
+            self.ledger.record(job, JOB_FAILED, worker=worker_id, avd_serial=avd_serial, exit_status=status)
+        print("the job %s on %s (%s) ends with status %s" % (job_id, worker_id, avd_serial, status))
+
+    def upload(self, worker_id: str, name: str, data: bytes):
+        # extract the uploaded result dir into the output dir, reject any member escaping the output dir
+        output_dir = os.path.realpath(self.output_dir)
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+            for member in tar.getmembers():
+                member_path = os.path.realpath(os.path.join(output_dir, member.name))
+                if not member_path.startswith(output_dir + os.sep) or member.issym() or member.islnk():
+                    raise ValueError("unsafe path in the uploaded results: %s" % member.name)
+            tar.extractall(output_dir)
+        print("received the results %s from %s (%d bytes)" % (name, worker_id, len(data)))
+
+    def get_status(self):
+        with self.lock:
+            return {'pending': len(self.pending_jobs), 'running': len(self.running_jobs),
+                    'finished': self.number_of_finished_jobs, 'failed': self.number_of_failed_jobs,
+                    'workers': self.workers}
+
+
+def make_request_handler(coordinator: CampaignCoordinator):
+
+    class CoordinatorRequestHandler(BaseHTTPRequestHandler):
+
+        def send_json(self, content, code=200):
+            body = json.dumps(content).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_body(self):
+            length = int(self.headers.get('Content-Length', 0))
+            return self.rfile.read(length)
+
+        def do_GET(self):
+            if urlparse(self.path).path == '/status':
+                self.send_json(coordinator.get_status())
+            else:
+                self.send_json({'error': 'unknown request'}, 404)
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            try:
+                content = json.loads(self.read_body().decode('utf-8'))
+                if path == '/register':
+                    coordinator.register(content['worker'], content['host'], content['slots'])
+                    self.send_json({'ok': True})
+                elif path == '/next':
+                    job, done = coordinator.next_job(content['worker'], content['avd_serial'])
+                    self.send_json({'job': job._asdict() if job is not None else None, 'done': done})
+                elif path == '/heartbeat':
+                    coordinator.heartbeat(content['worker'])
+                    self.send_json({'ok': True})
+                elif path == '/result':
+                    coordinator.report(content['worker'], content['avd_serial'], Job(**content['job']),
+                                       content['status'], content.get('interrupted', False),
+                                       content.get('invalid_reason'))
+                    self.send_json({'ok': True})
+                else:
+                    self.send_json({'error': 'unknown request'}, 404)
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_json({'error': str(e)}, 400)
+
+        def do_PUT(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            try:
+                if url.path == '/upload':
+                    coordinator.upload(query['worker'][0], query['name'][0], self.read_body())
+                    self.send_json({'ok': True})
+                else:
+                    self.send_json({'error': 'unknown request'}, 404)
+            except (ValueError, KeyError, tarfile.TarError) as e:
+                self.send_json({'error': str(e)}, 400)
+
+        def log_message(self, format, *args):
+            # keep the console for the campaign progress
+            pass
+
+    return CoordinatorRequestHandler
+
+
+def run_coordinator(address: str, coordinator: CampaignCoordinator):
+    host, port = address.rsplit(":", 1)
+    server = ThreadingHTTPServer((host, int(port)), make_request_handler(coordinator))
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    print("coordinator is serving the campaign at http://%s:%s" % (host, port))
+
+    coordinator.all_done.wait()
+    # keep serving for a while so that the idle workers learn that the campaign is done
+    time.sleep(POLL_INTERVAL + 5)
+    server.shutdown()
+    status = coordinator.get_status()
+    print("campaign done: %d finished, %d failed" % (status['finished'], status['failed']))
+
+
+class CoordinatorClient:
+
+    def __init__(self, coordinator_url: str, worker_id: Optional[str] = None):
+        self.coordinator_url = coordinator_url.rstrip("/")
+        if worker_id is None:
+            worker_id = "%s-%d" % (socket.gethostname(), os.getpid())
+        self.worker_id = worker_id
+
+    def send(self, path: str, content: Dict = None, data: bytes = None, method: str = 'POST'):
+        if content is not None:
+            data = json.dumps(content).encode('utf-8')
+        req = urllib_request.Request(self.coordinator_url + path, data=data, method=method)
+        req.add_header('Content-Type', 'application/json' if content is not None else 'application/octet-stream')
+        with urllib_request.urlopen(req, timeout=600) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def register(self, slots: List[str]):
+        self.send('/register', {'worker': self.worker_id, 'host': socket.gethostname(), 'slots': slots})
+
+    def next_job(self, avd_serial: str):
+        response = self.send('/next', {'worker': self.worker_id, 'avd_serial': avd_serial})
+        job = Job(**response['job']) if response['job'] is not None else None
+        return job, response['done']
+
+    def heartbeat(self):
+        self.send('/heartbeat', {'worker': self.worker_id})
+
+    def report(self, avd_serial: str, job: Job, status: Optional[int], interrupted: bool = False,
+               invalid_reason: Optional[str] = None):
+        self.send('/result', {'worker': self.worker_id, 'avd_serial': avd_serial, 'job': job._asdict(),
+                              'status': status, 'interrupted': interrupted, 'invalid_reason': invalid_reason})
+
+    def upload_result_dir(self, result_dir: str):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+            tar.add(result_dir, arcname=os.path.basename(result_dir))
+        name = os.path.basename(result_dir)
+        self.send('/upload?worker=%s&name=%s' % (quote(self.worker_id), quote(name)), data=buffer.getvalue(),
+                  method='PUT')
+
+
+class RemoteSlotScheduler(DeviceSlotScheduler):
+    # the worker side: the local device slots pull jobs from the coordinator instead of a local queue
+
+    def __init__(self, avd_serial_list: List[str], run_job: Callable[[Job, str], Optional[RunOutcome]],
+                 client: CoordinatorClient, stagger: int = 10, admission=None):
+        # run_job(job, avd_serial) returns the outcome of the run, whose result dir is sent to the coordinator
+        super().__init__(avd_serial_list, run_job, stagger, admission)
+        self.client = client
+
+    def send_heartbeats(self):
+        while not self.stopped.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.client.heartbeat()
+            except OSError as e:
+                print("Warning: cannot send the heartbeat to the coordinator: %s" % e)
+
+    def next_job(self, avd_serial: str) -> Optional[Job]:
+        while not self.stopped.is_set():
+            try:
+                job, done = self.client.next_job(avd_serial)
+            except OSError as e:
+                print("Warning: cannot reach the coordinator: %s" % e)
+                job, done = None, False
+            if job is not None:
+                with self.condition:
+                    self.number_of_running_jobs += 1
+                return job
+            if done:
+                return None
+            self.stopped.wait(POLL_INTERVAL)
+        return None
+
+    def job_finished(self, job: Job, avd_serial: str, outcome: Optional[RunOutcome], interrupted: bool):
+        # the partial results of an interrupted run are not uploaded, its job is re-queued by the coordinator
+        if not interrupted and outcome is not None and outcome.result_dir is not None:
+            try:
+                self.client.upload_result_dir(outcome.result_dir)
+            except OSError as e:
+                print("Warning: cannot upload the results %s: %s" % (outcome.result_dir, e))
+        try:
+            self.client.report(avd_serial, job, get_exit_status(outcome), interrupted,
+                               outcome.invalid_reason if outcome is not None else None)
+        except OSError as e:
+            # the lease will expire on the coordinator and the job will be re-queued
+            print("Warning: cannot report the result of %s to the coordinator: %s" % (get_job_id(job), e))
+
+    def run(self, jobs: List[Job] = None):
+        self.client.register(self.avd_serial_list)
+        heartbeat_thread = threading.Thread(target=self.send_heartbeats, daemon=True)
+        heartbeat_thread.start()
+        super().run([])
+        self.stopped.set()
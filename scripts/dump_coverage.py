@@ -0,0 +1,318 @@
+# This file dumps the coverage of the app under test during a run (started in the background by the harnesses via
+#   dump_coverage.sh). Periodically, the app is asked to write its coverage file (the COLLECT_COVERAGE broadcast of the
+#   instrumentation), which then ends up in coverage_<i>.ec under the result dir.
+# The period follows the coverage schedule given by themis.py (see --coverage-schedule) in the environment, e.g.,
+#   "30:600,60:1800,300" dumps every 30 secs in the first 10 minutes of the fuzzing, every minute until 30 minutes,
+#   and every 5 minutes afterwards (the coverage grows the fastest at the start of a run). By default, the coverage is
+#   dumped every 5 minutes. The commands go through one adb client (see adb_client.py) for the whole run.
+# The coverage files are not pulled one by one. Each dump is moved into a spool dir on the device (COVERAGE_SPOOL_DIR)
+#   once its size stops changing between two polls. This only means that the app paused writing, not that the file is
+#   complete, so the md5 listed at the drain is the one of the spooled file, not a proof of a complete dump. The app
+#   data and /data/local/tmp may be on different mounts, where "mv" copies the file, so the dump is first moved to a
+#   hidden temporary name in the spool dir and then renamed (atomically, in the same dir) to its final name, i.e.,
+#   the drain never sees a half-copied file. Every COVERAGE_DRAIN_INTERVAL secs and at the end of the
+#   fuzzing, the spool is drained in bulk: the spooled files are streamed in one "tar" through exec (the same as
+#   "adb exec-out"), their sizes and md5 checksums are checked against the ones listed on the device, and only the
+#   verified files are written to the result dir and removed from the spool (the others are drained again later).
+#   Without tar on the device, the spooled files are pulled one by one instead.
+# The coverage collected by the app since the last dump dies with the app process, i.e., it would be lost on every
+#   crash, which is what themis studies. So the dumps are also triggered by the life cycle of the app:
+#   - "crash": a FATAL EXCEPTION of the app in logcat, dumped right away while the process is dying (this only works
+#     when the main thread of the app can still handle the broadcast, e.g., the crash happened in another thread);
+#   - "restart": the pid of the app changed, i.e., the app was restarted (e.g., after a crash or an ANR);
+#   - "final": the dumping is stopped by the harness at the end of the fuzzing.
+#   The periodic dumps are tagged "periodic".
+# Each dump and each drain is recorded as a coverage_pull phase in run_events.jsonl (see telemetry.py), with its reason
+#   (the reason of a drain is "drain"), and each drained file in "coverage_manifest.csv" under the result dir, with its
+#   time since the start of the dumping, its host time, the uptime of the emulator (at the dump), its size and its md5,
+#   from which compute_coverage.py computes the coverage over time.
+
+import csv
+import hashlib
+import io
+import os
+import queue
+import signal
+import sys
+import tarfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from adb_client import AdbClient, AdbDevice, AdbError
+from telemetry import get_monotonic_time, record_run_event
+
+COVERAGE_DUMP_INTERVAL = 300  # dump coverage for every 5 minutes
+# the environment variable of the coverage schedule passed to the harnesses
+COVERAGE_SCHEDULE_ENV = "THEMIS_COVERAGE_SCHEDULE"
+COVERAGE_MANIFEST_FILE_NAME = "coverage_manifest.csv"
+COVERAGE_MANIFEST_FIELDS = ['file', 'reason', 'elapsed', 'host_time', 'device_uptime', 'size', 'md5']
+# the spool dir of the coverage files on the device, drained every COVERAGE_DRAIN_INTERVAL secs
+COVERAGE_SPOOL_DIR = "/data/local/tmp/themis_coverage"
+COVERAGE_DRAIN_INTERVAL = 600
+# how often (in seconds) and how many times the size of a dumped coverage file is checked before spooling it
+COVERAGE_SIZE_POLL_INTERVAL = 0.5
+COVERAGE_SIZE_POLLS = 20
+COLLECT_COVERAGE_ACTION = "edu.gatech.m3.emma.COLLECT_COVERAGE"
+# how often (in seconds) the pid of the app is checked
+APP_PID_POLL_INTERVAL = 2
+# how long (in seconds) to wait before following logcat again after the connection broke
+LOGCAT_RETRY_INTERVAL = 5
+# the reasons of the dumps
+DUMP_PERIODIC = "periodic"
+DUMP_CRASH = "crash"
+DUMP_RESTART = "restart"
+DUMP_FINAL = "final"
+
+
+def parse_coverage_schedule(schedule: str) -> List[Tuple[int, Optional[int]]]:
+    # "30:600,60:1800,300" -> [(30, 600), (60, 1800), (300, None)], i.e., (the interval, until when) in secs, the last
+    #   interval applies until the end of the run
+    phases: List[Tuple[int, Optional[int]]] = []
+    items = schedule.split(",")
+    for index, item in enumerate(items):
+        interval, _, until = item.strip().partition(":")
+        phase = (int(interval), int(until) if until != "" else None)
+        if phase[0] <= 0:
+            raise ValueError("the interval should be positive: %s" % item)
+        if (phase[1] is None) != (index == len(items) - 1):
+            raise ValueError("only the last interval has no end: %s" % item)
+        if phase[1] is not None and len(phases) > 0 and phase[1] <= phases[-1][1]:
+            raise ValueError("the ends of the intervals should increase: %s" % item)
+        phases.append(phase)
+    return phases
+
+
+def get_dump_interval(schedule: List[Tuple[int, Optional[int]]], elapsed: float):
+    # the interval of the schedule at the given time since the start of the dumping
+    for interval, until in schedule:
+        if until is None or elapsed < until:
+            return interval
+    return schedule[-1][0]
+
+
+def get_device_uptime(output: str) -> Optional[float]:
+    # the first line of the output is the one of "cat /proc/uptime", e.g., "1234.56 4321.00"
+    try:
+        return float(output.split()[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def record_coverage_file(output_dir: str, row):
+    manifest_file_path = os.path.join(output_dir, COVERAGE_MANIFEST_FILE_NAME)
+    write_header = not os.path.exists(manifest_file_path)
+    with open(manifest_file_path, "a", newline="") as manifest_file:
+        writer = csv.DictWriter(manifest_file, fieldnames=COVERAGE_MANIFEST_FIELDS)
+        if write_header:
+            writer.writeheader()
+        writer.writerow(row)
+
+
+def spool_coverage_file(device: AdbDevice, remote_coverage_file: str, coverage_file_name: str):
+    # ask the app to dump its coverage, and move the dumped file into the spool once its size is stable, return the
+    #   uptime of the device at the dump. The file is moved to a temporary name in the spool first (a copy when the
+    #   spool is on another mount), which the listing of the spool skips ("coverage_*.ec" does not match dot files),
+    #   and then renamed in the spool.
+    spooled_file = "%s/%s" % (COVERAGE_SPOOL_DIR, coverage_file_name)
+    temp_file = "%s/.%s.part" % (COVERAGE_SPOOL_DIR, coverage_file_name)
+    output = device.shell(
+        "cat /proc/uptime; am broadcast -a %s > /dev/null; f=%s; s=; n=0; "
+        "while [ $n -lt %d ]; do c=$(stat -c %%s $f 2> /dev/null); [ -n \"$c\" ] && [ \"$c\" = \"$s\" ] && break; "
+        "s=$c; n=$((n+1)); sleep %s; done; "
+        "t=%s; if mv $f $t && mv $t %s; then echo SPOOLED; else rm -f $t; fi" % (
+            COLLECT_COVERAGE_ACTION, remote_coverage_file, COVERAGE_SIZE_POLLS, COVERAGE_SIZE_POLL_INTERVAL,
+            temp_file, spooled_file))
+    if "SPOOLED" not in output:
+        raise AdbError("the app did not dump %s: %s" % (remote_coverage_file, output.strip()))
+    return get_device_uptime(output)
+
+
+def list_spooled_files(device: AdbDevice) -> Dict[str, Tuple[int, Optional[str]]]:
+    # file name -> (size, md5) of the spooled files, the md5 is None if md5sum is missing on the device
+    output = device.shell("cd %s && for f in coverage_*.ec; do [ -f $f ] && echo $f $(stat -c %%s $f) $(md5sum $f); "
+                          "done" % COVERAGE_SPOOL_DIR)
+    spooled_files = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and fields[0].endswith(".ec") and fields[1].isdigit():
+            md5 = fields[2] if len(fields) >= 3 and len(fields[2]) == 32 else None
+            spooled_files[fields[0]] = (int(fields[1]), md5)
+    return spooled_files
+
+
+def save_verified_file(output_dir: str, name: str, data: bytes, size: int, md5: Optional[str]):
+    # write the drained file to the result dir only if it is the one listed on the device
+    if len(data) != size:
+        print("Warning: %s has %d bytes instead of %d, drain it again later" % (name, len(data), size))
+        return None
+    data_md5 = hashlib.md5(data).hexdigest()
+    if md5 is not None and data_md5 != md5:
+        print("Warning: the md5 of %s does not match (%s != %s), drain it again later" % (name, data_md5, md5))
+        return None
+    temp_path = os.path.join(output_dir, name + ".part")
+    with open(temp_path, "wb") as local_file:
+        local_file.write(data)
+    os.replace(temp_path, os.path.join(output_dir, name))
+    return data_md5
+
+
+def drain_spool(device: AdbDevice, output_dir: str) -> Dict[str, Tuple[int, str]]:
+    # file name -> (size, md5) of the drained files
+    spooled_files = list_spooled_files(device)
+    if len(spooled_files) == 0:
+        return {}
+    names = sorted(spooled_files)
+    drained_files = {}
+    archive = io.BytesIO()
+    device.exec_out("tar -cf - -C %s %s" % (COVERAGE_SPOOL_DIR, " ".join(names)), archive)
+    archive.seek(0)
+    try:
+        with tarfile.open(fileobj=archive, mode="r:") as tar:
+            for member in tar:
+                if not member.isfile() or member.name not in spooled_files:
+                    continue
+                size, md5 = spooled_files[member.name]
+                data_md5 = save_verified_file(output_dir, member.name, tar.extractfile(member).read(), size, md5)
+                if data_md5 is not None:
+                    drained_files[member.name] = (size, data_md5)
+    except tarfile.TarError as e:
+        # e.g., no tar on the device
+        print("Warning: cannot drain the coverage spool with tar, pull the files one by one: %s" % e)
+        for name in names:
+            size, md5 = spooled_files[name]
+            temp_path = os.path.join(output_dir, name + ".pulled")
+            device.pull("%s/%s" % (COVERAGE_SPOOL_DIR, name), temp_path)
+            with open(temp_path, "rb") as local_file:
+                data = local_file.read()
+            os.remove(temp_path)
+            data_md5 = save_verified_file(output_dir, name, data, size, md5)
+            if data_md5 is not None:
+                drained_files[name] = (size, data_md5)
+    if len(drained_files) > 0:
+        device.shell("cd %s && rm -f %s" % (COVERAGE_SPOOL_DIR, " ".join(sorted(drained_files))))
+    return drained_files
+
+
+def get_app_pid(device: AdbDevice, app_package_name: str) -> Optional[str]:
+    try:
+        pids = device.shell("pidof " + app_package_name).split()
+    except (AdbError, OSError):
+        return None
+    return pids[0] if len(pids) > 0 else None
+
+
+def follow_crashes(device: AdbDevice, app_package_name: str, dump_requests: queue.Queue):
+    # request a dump for each crash of the app, e.g., "E/AndroidRuntime( 1234): Process: com.x, PID: 1234" following
+    #   "E/AndroidRuntime( 1234): FATAL EXCEPTION: main"
+    while True:
+        try:
+            fatal = False
+            # -T 1: only the new lines
+            for line in device.shell_lines("logcat -v brief -T 1 AndroidRuntime:E *:S"):
+                if "FATAL EXCEPTION" in line:
+                    fatal = True
+                elif fatal and "Process: %s," % app_package_name in line:
+                    fatal = False
+                    dump_requests.put(DUMP_CRASH)
+        except (AdbError, OSError):
+            pass
+        time.sleep(LOGCAT_RETRY_INTERVAL)
+
+
+def dump_coverage(avd_serial: str, app_package_name: str, output_dir: str):
+    schedule = parse_coverage_schedule(os.environ.get(COVERAGE_SCHEDULE_ENV, str(COVERAGE_DUMP_INTERVAL)))
+    device = AdbClient().device(avd_serial)
+    remote_coverage_file = "/data/data/%s/files/coverage.ec" % app_package_name
+    dump_requests: queue.Queue = queue.Queue()
+    threading.Thread(target=follow_crashes, args=(AdbClient().device(avd_serial), app_package_name, dump_requests),
+                     name="logcat", daemon=True).start()
+    # the harness stops the dumping with SIGTERM at the end of the fuzzing, the running dump is completed first
+    stop_requested = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_requested.set())
+
+    # start from an empty spool, e.g., the previous run on a pooled emulator may have left files in it
+    try:
+        device.shell("rm -rf %s; mkdir -p %s" % (COVERAGE_SPOOL_DIR, COVERAGE_SPOOL_DIR))
+    except (AdbError, OSError) as e:
+        print("Warning: cannot create the coverage spool (%s): %s" % (avd_serial, e))
+
+    i = 0
+    app_pid = get_app_pid(device, app_package_name)
+    dumping_start = time.monotonic()
+    # the time (since the start of the dumping) of the next periodic dump
+    next_periodic_dump = get_dump_interval(schedule, 0)
+    last_drain = dumping_start
+    # file name -> the manifest row of the spooled files, recorded once they are drained
+    spooled_rows: Dict[str, Dict] = {}
+    while True:
+        try:
+            reason = dump_requests.get(timeout=max(0.0, min(APP_PID_POLL_INTERVAL,
+                                                            dumping_start + next_periodic_dump - time.monotonic())))
+        except queue.Empty:
+            reason = None
+        if stop_requested.is_set():
+            reason = DUMP_FINAL
+        elif reason is None and time.monotonic() - dumping_start >= next_periodic_dump:
+            reason = DUMP_PERIODIC
+            next_periodic_dump += get_dump_interval(schedule, next_periodic_dump)
+        elif reason is None:
+            pid = get_app_pid(device, app_package_name)
+            if pid is not None and app_pid is not None and pid != app_pid:
+                reason = DUMP_RESTART
+            if pid is not None:
+                app_pid = pid
+        if reason is None:
+            continue
+        i += 1
+        elapsed = time.monotonic() - dumping_start
+        start = time.time()
+        start_monotonic = get_monotonic_time()
+        dump_status = 0
+        coverage_file_name = "coverage_%d.ec" % i
+        try:
+            device_uptime = spool_coverage_file(device, remote_coverage_file, coverage_file_name)
+            print("%s: spooled (%s, %s)" % (coverage_file_name, avd_serial, reason))
+            spooled_rows[coverage_file_name] = {'file': coverage_file_name, 'reason': reason,
+                                                'elapsed': round(elapsed, 1), 'host_time': round(start, 3),
+                                                'device_uptime': device_uptime}
+        except (AdbError, OSError) as e:
+            print("Warning: cannot dump the coverage (%s, %s): %s" % (avd_serial, reason, e))
+            dump_status = 1
+        record_run_event(output_dir, "coverage_pull", start, time.time(), start_monotonic, get_monotonic_time(),
+                         dump_status, serial=avd_serial, reason=reason, file=coverage_file_name)
+
+        if reason == DUMP_FINAL or time.monotonic() - last_drain >= COVERAGE_DRAIN_INTERVAL:
+            last_drain = time.monotonic()
+            start = time.time()
+            start_monotonic = get_monotonic_time()
+            drain_status = 0
+            drained_files: Dict[str, Tuple[int, str]] = {}
+            try:
+                drained_files = drain_spool(device, output_dir)
+            except (AdbError, OSError) as e:
+                print("Warning: cannot drain the coverage spool (%s): %s" % (avd_serial, e))
+                drain_status = 1
+            for name in sorted(drained_files, key=lambda name: int(name[len("coverage_"):-len(".ec")])):
+                size, md5 = drained_files[name]
+                # only the files left in the spool when it could not be cleared at the start have no row
+                row = spooled_rows.pop(name, {'file': name})
+                row['size'] = size
+                row['md5'] = md5
+                record_coverage_file(output_dir, row)
+            print("%d coverage files (%d bytes) drained (%s)" % (
+                len(drained_files), sum(size for size, _ in drained_files.values()), avd_serial))
+            record_run_event(output_dir, "coverage_pull", start, time.time(), start_monotonic, get_monotonic_time(),
+                             drain_status, serial=avd_serial, reason="drain", files=len(drained_files),
+                             size=sum(size for size, _ in drained_files.values()))
+
+        if reason == DUMP_FINAL:
+            if len(spooled_rows) > 0:
+                print("Warning: %d coverage files are left in the spool of %s: %s" % (
+                    len(spooled_rows), avd_serial, ", ".join(sorted(spooled_rows))))
+            device.close_sync()
+            return
+
+
+if __name__ == '__main__':
+    dump_coverage(sys.argv[1], sys.argv[2], sys.argv[3])
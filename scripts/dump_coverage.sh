@@ -10,14 +10,5 @@ AVD_SERIAL=$1
 APP_PACKAGE_NAME=$2
 OUTPUT_DIR=$3
 
-#for i in `seq 1 12`;
-i=0
-while true
-do
-  i=$((i+1))
-  sleep 300 & # dump coverage for every 5 minutes
-  wait
-  adb -s $AVD_SERIAL shell am broadcast -a edu.gatech.m3.emma.COLLECT_COVERAGE
-  adb -s $AVD_SERIAL pull /data/data/$APP_PACKAGE_NAME/files/coverage.ec $OUTPUT_DIR/coverage_$i.ec
-  adb -s $AVD_SERIAL shell rm /data/data/$APP_PACKAGE_NAME/files/coverage.ec
-done
\ No newline at end of file
+# dump coverage for every 5 minutes, on the crashes and restarts of the app, and on SIGTERM (final), see dump_coverage.py
+exec python3 $(dirname $0)/dump_coverage.py $AVD_SERIAL $APP_PACKAGE_NAME $OUTPUT_DIR
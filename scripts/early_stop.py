@@ -0,0 +1,127 @@
+# This file implements the early-stop mode of themis.py (see --early-stop).
+# For bug-finding studies only the time to first trigger the target bug matters. In this mode, the logcat.log of a
+#   running run is tailed and matched live against the signature strings of the target crash of its apk (i.e.,
+#   check_crash.app_crash_data, with the same matching as check_crash.py). Once the target crash appears, the fuzzing
+#   is stopped (the harness then tears down the run as usual and frees the emulator for the next job), and the
+#   trigger is recorded in "early_stop.json" under the result dir.
+# The fuzzing is stopped by terminating the "timeout $TEST_TIME <tool>" of the harness. THEMIS_EARLY_STOP is set for
+#   the harnesses of the monitored runs, so that a harness which otherwise runs its tool on the tool's own schedule
+#   (i.e., run_stoat.sh) wraps it in timeout only then.
+
+import asyncio
+import datetime
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+from check_crash import app_crash_data, get_logcat_time_label, is_crash_stack_matched
+from supervisor import RunContext
+from telemetry import get_monotonic_time
+from tool_registry import ToolAdapter
+
+EARLY_STOP_FILE_NAME = "early_stop.json"
+# the environment variable telling the harness that the run may be stopped early
+EARLY_STOP_ENV = "THEMIS_EARLY_STOP"
+# how often (in seconds) the logcat file is read
+LOGCAT_POLL_INTERVAL = 5
+
+
+def get_target_crash(apk_path: str):
+    # (app name, issue id, signature strings) of the bug reproduced by the apk, e.g., "AnkiDroid-debug-#4977.apk"
+    apk_file_name = os.path.basename(apk_path)
+    for app_name in app_crash_data:
+        if not apk_file_name.startswith(app_name):
+            continue
+        for issue_id in app_crash_data[app_name]:
+            # do not take "#497" for "#4977"
+            if re.search(re.escape(issue_id) + r'(?!\d)', apk_file_name):
+                return app_name, issue_id, app_crash_data[app_name][issue_id]
+    return None
+
+
+class LogcatCrashMatcher:
+    # the incremental version of check_crash.py's matching: the logcat lines are grouped into crash stacks by their
+    #   time labels, and a stack matches when it contains all the signature strings
+
+    def __init__(self, crash_signature_strs: List[str]):
+        self.crash_signature_strs = crash_signature_strs
+        self.crash_stack_traces: Dict[str, List[str]] = {}
+
+    def feed(self, line: str) -> Optional[str]:
+        # return the time label of the matched crash stack, or None
+        if line.startswith("---"):
+            return None
+        time_label = get_logcat_time_label(line)
+        if time_label is None:
+            return None
+        stack_lines = self.crash_stack_traces.setdefault(time_label, [])
+        stack_lines.append(line)
+        if is_crash_stack_matched(stack_lines, self.crash_signature_strs):
+            return time_label
+        return None
+
+
+def get_trigger_time_in_minutes(result_dir: str, tool: ToolAdapter, time_label: str):
+    # the same computation as check_crash.py: from the start of the testing (emulator time) to the crash
+    testing_time_file_path = os.path.join(result_dir, tool.time_file)
+    if not os.path.exists(testing_time_file_path):
+        return None
+    with open(testing_time_file_path, "r") as testing_time_file:
+        lines = testing_time_file.readlines()
+    if len(lines) == 0:
+        return None
+    try:
+        start_testing_datetime_obj = datetime.datetime.strptime(lines[0].strip(), tool.time_format)
+        crash_triggering_datetime_obj = datetime.datetime.strptime(
+            "{}-{}".format(start_testing_datetime_obj.year, time_label.split('.')[0]), '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+    return (crash_triggering_datetime_obj - start_testing_datetime_obj).total_seconds() / 60
+
+
+def make_early_stop_monitor(tool: ToolAdapter, apk_path: str):
+    # the monitor of a run (see supervisor.py), or None if the run cannot be stopped early
+    if tool.crash_log_format != "logcat":
+        print("Warning: early stop does not support the crash log of %s, run the full time" % tool.name)
+        return None
+    target_crash = get_target_crash(apk_path)
+    if target_crash is None:
+        print("Warning: no target crash is known for %s, run the full time" % os.path.basename(apk_path))
+        return None
+    app_name, issue_id, crash_signature_strs = target_crash
+
+    async def monitor(context: RunContext):
+        await context.result_dir_created.wait()
+        logcat_file_path = os.path.join(context.result_dir, tool.logcat_file)
+        matcher = LogcatCrashMatcher(crash_signature_strs)
+        offset = 0
+        pending = ""
+        while True:
+            await asyncio.sleep(LOGCAT_POLL_INTERVAL)
+            if not os.path.exists(logcat_file_path):
+                continue
+            with open(logcat_file_path, "rb") as logcat_file:
+                logcat_file.seek(offset)
+                data = logcat_file.read()
+            offset += len(data)
+            lines = (pending + data.decode("utf-8", errors="replace")).split("\n")
+            # the last line may be incomplete
+            pending = lines.pop()
+            for line in lines:
+                time_label = matcher.feed(line + "\n")
+                if time_label is None:
+                    continue
+                trigger_time = get_trigger_time_in_minutes(context.result_dir, tool, time_label)
+                detected, detected_monotonic = time.time(), get_monotonic_time()
+                if not context.stop_fuzzing("the target crash [%s, %s] was triggered at %s (%s mins)" % (
+                        app_name, issue_id, time_label, "?" if trigger_time is None else "%.0f" % trigger_time)):
+                    return
+                with open(os.path.join(context.result_dir, EARLY_STOP_FILE_NAME), "w") as early_stop_file:
+                    json.dump({'app': app_name, 'issue': issue_id, 'time_label': time_label,
+                               'trigger_time_mins': trigger_time, 'detected': detected,
+                               'detected_monotonic': detected_monotonic}, early_stop_file)
+                return
+
+    return monitor
@@ -0,0 +1,340 @@
+# This file implements the warm emulator pool of themis.py (see --warm-pool).
+# Instead of each harness cold-booting its emulator and killing it at the end of the run, the pool keeps one
+#   long-lived emulator per device slot. Before each run, the emulator used by the previous run is reset to a clean
+#   state by loading its quickboot snapshot (seconds instead of a boot of a minute or more), and then handed to the
+#   next job. The harnesses neither boot nor kill a pooled emulator (THEMIS_WARM_POOL, see harness_common.sh).
+# An emulator which cannot be reset (e.g., it crashed or the snapshot cannot be loaded) is killed and booted again.
+#   Each cold boot takes a slot of the host-wide boot semaphore (see boot_semaphore.py).
+# With --preboot, each slot has a second (spare) emulator on a spare port, and the two emulators take turns: once
+#   the fuzzing of a run ends (see make_preboot_monitor), the spare emulator is booted (or reset) in the background,
+#   while the harness still tears down the run and pulls its results, and the next run of the slot starts on it.
+# With --login-snapshot, the pool also keeps a builder emulator on the port after the ones of the slots. It is the only
+#   emulator of the pool booted without -read-only (the emulator refuses to save snapshots in this mode), and the
+#   login snapshots are built and saved on it (see login_snapshot.py), then loaded by the read-only emulators.
+# The boots, resets and restarts are logged to "emulator_pool.log" under the output dir.
+
+import asyncio
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+
+from adb_client import AdbClient
+from adb_servers import AdbServerPartition
+from boot_semaphore import BootSemaphore
+from slot_isolation import SlotIsolation
+from supervisor import RunContext
+from telemetry import read_run_events
+
+# the environment variable telling the harnesses that the emulator is pooled
+WARM_POOL_ENV = "THEMIS_WARM_POOL"
+# the quickboot snapshot of the avd, which the emulator boots from
+DEFAULT_SNAPSHOT = "default_boot"
+POOL_LOG_NAME = "emulator_pool.log"
+# the same timeouts (in seconds) as harness_common.sh
+BOOT_TIMEOUT = 120
+BOOT_RETRY_TIMES = 5
+SHUTDOWN_TIMEOUT = 30
+RESET_TIMEOUT = 60
+# the phase of the run after which the spare emulator is prepared (see harness_common.sh)
+PREBOOT_AFTER_PHASE = "fuzzing"
+# how often (in seconds) the run events are read to detect the end of the fuzzing
+PREBOOT_POLL_INTERVAL = 5
+
+
+def adb(avd_serial: str, *args, timeout: int = 30, env: Optional[Dict[str, str]] = None) -> Optional[str]:
+    # the output of the adb command, or None if it cannot be executed in time (only for the emulator console commands,
+    #   i.e., "adb emu", which do not go through the adb server)
+    try:
+        completed = subprocess.run(['adb', '-s', avd_serial] + list(args), stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, timeout=timeout, env=env)
+    except (subprocess.TimeoutExpired, OSError):
+        return None
+    return completed.stdout.decode("utf-8", errors="replace")
+
+
+class PooledEmulator:
+
+    def __init__(self, avd_serial: str, slot: str, read_only: bool = True):
+        self.avd_serial = avd_serial
+        # the device slot (i.e., its first avd serial) owning the emulator
+        self.slot = slot
+        # the emulators of the slots run with -read-only, so that several emulators can run the same avd, only the
+        #   builder of the login snapshots writes to the avd
+        self.read_only = read_only
+        self.process: Optional[subprocess.Popen] = None
+        # the extra options the running emulator was started with
+        self.options: List[str] = []
+        # the emulator was used by a run since its last boot or reset
+        self.dirty = False
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+
+class PoolSlot:
+
+    def __init__(self, emulators: List[PooledEmulator]):
+        # the emulator of the slot and its spare one (with --preboot)
+        self.emulators = emulators
+        self.active = 0
+        # the background preparation of the spare emulator, and whether it succeeded
+        self.preboot_thread: Optional[threading.Thread] = None
+        self.preboot_ready = False
+
+    def get_active(self):
+        return self.emulators[self.active]
+
+    def get_spare(self):
+        return self.emulators[(self.active + 1) % len(self.emulators)]
+
+
+class EmulatorPool:
+
+    def __init__(self, avd_serial_list: List[str], avd_name: str, screen_option: str, output_dir: str,
+                 snapshot: str = DEFAULT_SNAPSHOT, adb_servers: Optional[AdbServerPartition] = None,
+                 slot_isolation: Optional[SlotIsolation] = None, spare_serial_list: Optional[List[str]] = None,
+                 builder_serial: Optional[str] = None):
+        self.avd_name = avd_name
+        # the quoted empty string ("\"\"") stands for showing the gui
+        self.screen_options = [] if screen_option == "\"\"" else [screen_option]
+        self.snapshot = snapshot
+        self.output_dir = output_dir
+        self.log_file_path = os.path.join(output_dir, POOL_LOG_NAME)
+        # the slots are named by their first avd serial, the spare avd serials (if any) are the pre-booted ones
+        self.slots: Dict[str, PoolSlot] = {}
+        for index, avd_serial in enumerate(avd_serial_list):
+            emulators = [PooledEmulator(avd_serial, avd_serial)]
+            if spare_serial_list is not None:
+                emulators.append(PooledEmulator(spare_serial_list[index], avd_serial))
+            self.slots[avd_serial] = PoolSlot(emulators)
+        # the writable emulator building the login snapshots (see login_snapshot.py), it uses the adb server and the
+        #   cpus of the first slot
+        self.builder: Optional[PooledEmulator] = None
+        if builder_serial is not None:
+            self.builder = PooledEmulator(builder_serial, avd_serial_list[0], read_only=False)
+        # the adb server of each slot (see adb_servers.py), or None for the shared adb server
+        self.adb_servers = adb_servers
+        # the cpus of each slot (see slot_isolation.py), or None
+        self.slot_isolation = slot_isolation
+        # the host-wide limit of the concurrent cold boots (see boot_semaphore.py)
+        self.boot_semaphore = BootSemaphore()
+        self.lock = threading.Lock()
+
+    def log(self, avd_serial: str, event: str, secs: float, status: str):
+        line = "%s %s %s %.1f %s" % (time.strftime("%Y-%m-%d-%H:%M:%S"), avd_serial, event, secs, status)
+        print("[pool] " + line)
+        with self.lock:
+            with open(self.log_file_path, "a") as log_file:
+                log_file.write(line + "\n")
+
+    def get_env(self, slot: str) -> Optional[Dict[str, str]]:
+        # the environment of the emulators and the adb commands of the slot
+        return self.adb_servers.get_env(slot) if self.adb_servers is not None else None
+
+    def get_avd_serial(self, slot: str):
+        # the avd serial of the emulator handed to the next run of the slot
+        return self.slots[slot].get_active().avd_serial
+
+    def get_device(self, slot: str, avd_serial: Optional[str] = None):
+        port = self.adb_servers.get_port(slot) if self.adb_servers is not None else None
+        return AdbClient(port=port).device(avd_serial if avd_serial is not None else self.get_avd_serial(slot))
+
+    def get_process_groups(self, slot: str) -> List[int]:
+        # the process group of the emulator of the run (started in its own session), e.g., for the resource trace of
+        #   the run (see resource_trace.py)
+        emulator = self.slots[slot].get_active()
+        return [emulator.process.pid] if emulator.is_running() else []
+
+    def prepare(self, slot: str, emulator_options: Optional[List[str]] = None, reset: bool = True):
+        # called by the device slot before each run: return True once the emulator is booted and clean (or only
+        #   booted, without reset, e.g., when another snapshot is loaded next)
+        pool_slot = self.slots[slot]
+        emulator_options = emulator_options or []
+        if self.wait_for_preboot(pool_slot):
+            # the run starts on the pre-booted spare emulator
+            pool_slot.active = (pool_slot.active + 1) % len(pool_slot.emulators)
+        return self.prepare_emulator(pool_slot.get_active(), emulator_options, reset)
+
+    def prepare_emulator(self, emulator: PooledEmulator, emulator_options: List[str], reset: bool = True):
+        if emulator.is_running() and emulator.options != emulator_options:
+            # e.g., the tool of the next run needs a writable system image
+            self.kill(emulator)
+        if not emulator.is_running():
+            return self.boot(emulator, emulator_options)
+        if emulator.dirty and reset and not self.reset(emulator):
+            self.kill(emulator)
+            return self.boot(emulator, emulator_options)
+        return True
+
+    def preboot(self, slot: str, emulator_options: Optional[List[str]] = None):
+        # prepare the spare emulator of the slot in the background, e.g., while the current run tears down
+        pool_slot = self.slots[slot]
+        if len(pool_slot.emulators) < 2 or pool_slot.preboot_thread is not None:
+            return
+        spare = pool_slot.get_spare()
+        print("[pool] pre-boot the next emulator of %s on %s" % (slot, spare.avd_serial))
+
+        def prepare_spare():
+            pool_slot.preboot_ready = self.prepare_emulator(spare, emulator_options or [])
+
+        pool_slot.preboot_ready = False
+        pool_slot.preboot_thread = threading.Thread(target=prepare_spare, name="preboot-" + spare.avd_serial)
+        pool_slot.preboot_thread.start()
+
+    def wait_for_preboot(self, pool_slot: PoolSlot):
+        # return True if the spare emulator was pre-booted successfully
+        if pool_slot.preboot_thread is None:
+            return False
+        pool_slot.preboot_thread.join()
+        pool_slot.preboot_thread = None
+        return pool_slot.preboot_ready
+
+    def release(self, slot: str):
+        # called by the device slot after each run, the emulator is reset before its next run
+        self.slots[slot].get_active().dirty = True
+
+    def discard(self, slot: str):
+        # kill the emulator of the run (e.g., it hung), the next run of the slot starts on a freshly booted one
+        emulator = self.slots[slot].get_active()
+        if emulator.is_running():
+            self.kill(emulator)
+
+    def stop(self, slot: str):
+        # free the ports of the emulators of the slot, e.g., for a tool booting its own emulator
+        pool_slot = self.slots[slot]
+        self.wait_for_preboot(pool_slot)
+        for emulator in pool_slot.emulators:
+            if emulator.is_running():
+                self.kill(emulator)
+
+    def prepare_builder(self, emulator_options: Optional[List[str]] = None):
+        # boot the builder of the login snapshots, or reset it to a clean state before the next build
+        return self.prepare_emulator(self.builder, emulator_options or [])
+
+    def release_builder(self):
+        # called after each build, the builder is reset before the next one
+        self.builder.dirty = True
+
+    def get_builder_device(self):
+        return self.get_device(self.builder.slot, self.builder.avd_serial)
+
+    def boot(self, emulator: PooledEmulator, emulator_options: List[str]):
+        avd_port = emulator.avd_serial.split('-')[1]
+        # the builder does not save its state into the quickboot snapshot of the avd when it is killed, the
+        #   snapshot has to stay the clean state the pooled emulators are reset to
+        mode_options = ['-read-only'] if emulator.read_only else ['-no-snapshot-save']
+        argv = ['emulator', '-port', avd_port, '-avd', self.avd_name] + mode_options + self.screen_options + \
+            emulator_options
+        if self.slot_isolation is not None:
+            argv = self.slot_isolation.wrap_argv(emulator.slot, argv)
+        for i in range(BOOT_RETRY_TIMES):
+            start = time.monotonic()
+            boot_slot = self.boot_semaphore.acquire()
+            self.log(emulator.avd_serial, "boot_queue", time.monotonic() - start, "ok")
+            try:
+                start = time.monotonic()
+                print("[pool] start the emulator (%s): %s" % (emulator.avd_serial, ' '.join(argv)))
+                with open(os.path.join(self.output_dir, "%s.emulator.log" % emulator.avd_serial), "ab") as log_file:
+                    # start_new_session: the emulator outlives the runs, i.e., the process groups of their harnesses
+                    emulator.process = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=log_file,
+                                                        stderr=subprocess.STDOUT, start_new_session=True,
+                                                        env=self.get_env(emulator.slot))
+                emulator.options = emulator_options
+                device = self.get_device(emulator.slot, emulator.avd_serial)
+                booted = device.wait_until(BOOT_TIMEOUT, device.is_boot_completed)
+            finally:
+                self.boot_semaphore.release(boot_slot)
+            if booted:
+                emulator.dirty = False
+                self.log(emulator.avd_serial, "boot", time.monotonic() - start, "ok")
+                return True
+            self.log(emulator.avd_serial, "boot", time.monotonic() - start, "timeout")
+            self.kill(emulator)
+        print("[pool] we give up the emulator (%s)..." % emulator.avd_serial)
+        return False
+
+    def reset(self, emulator: PooledEmulator):
+        # restore the snapshot, which drops the app, its data and the tool's files of the previous run
+        if not self.load_emulator_snapshot(emulator, self.snapshot, "reset"):
+            return False
+        emulator.dirty = False
+        return True
+
+    def load_snapshot(self, slot: str, snapshot: str, event: str = "load"):
+        return self.load_emulator_snapshot(self.slots[slot].get_active(), snapshot, event)
+
+    def load_emulator_snapshot(self, emulator: PooledEmulator, snapshot: str, event: str):
+        start = time.monotonic()
+        output = adb(emulator.avd_serial, 'emu', 'avd', 'snapshot', 'load', snapshot, timeout=RESET_TIMEOUT,
+                     env=self.get_env(emulator.slot))
+        if output is None or "KO" in output or "OK" not in output:
+            self.log(emulator.avd_serial, event, time.monotonic() - start,
+                     "failed (%s)" % ("timeout" if output is None else output.strip().replace("\n", " ")))
+            return False
+        device = self.get_device(emulator.slot, emulator.avd_serial)
+        if not device.wait_until(RESET_TIMEOUT, device.is_boot_completed):
+            self.log(emulator.avd_serial, event, time.monotonic() - start, "timeout")
+            return False
+        self.log(emulator.avd_serial, event, time.monotonic() - start, "ok")
+        return True
+
+    def save_builder_snapshot(self, snapshot: str):
+        # save the state of the builder as a snapshot of the avd
+        avd_serial = self.builder.avd_serial
+        start = time.monotonic()
+        output = adb(avd_serial, 'emu', 'avd', 'snapshot', 'save', snapshot, timeout=RESET_TIMEOUT,
+                     env=self.get_env(self.builder.slot))
+        if output is None or "KO" in output or "OK" not in output:
+            self.log(avd_serial, "save", time.monotonic() - start,
+                     "failed (%s)" % ("timeout" if output is None else output.strip().replace("\n", " ")))
+            return False
+        self.log(avd_serial, "save", time.monotonic() - start, "ok")
+        return True
+
+    def has_snapshot(self, slot: str, snapshot: str):
+        # the snapshots are stored with the avd, i.e., shared by all the emulators of the same avd image
+        output = adb(self.get_avd_serial(slot), 'emu', 'avd', 'snapshot', 'list', env=self.get_env(slot))
+        return output is not None and snapshot in output.split()
+
+    def kill(self, emulator: PooledEmulator):
+        start = time.monotonic()
+        if emulator.is_running():
+            adb(emulator.avd_serial, 'emu', 'kill', env=self.get_env(emulator.slot))
+            # the port is only free after the emulator exits
+            try:
+                emulator.process.wait(timeout=SHUTDOWN_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                try:
+                    os.killpg(emulator.process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                emulator.process.wait()
+            self.log(emulator.avd_serial, "shutdown", time.monotonic() - start, "ok")
+        emulator.process = None
+        emulator.dirty = False
+
+    def shutdown(self):
+        # kill all the pooled emulators (in parallel) at the end of the campaign (or on Ctrl-C)
+        threads = [threading.Thread(target=self.stop, args=(slot,)) for slot in self.slots]
+        if self.builder is not None and self.builder.is_running():
+            threads.append(threading.Thread(target=self.kill, args=(self.builder,)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def make_preboot_monitor(pool: EmulatorPool, slot: str, emulator_options: List[str]):
+    # the monitor of a run (see supervisor.py): pre-boot the spare emulator of the slot once the fuzzing ends
+
+    async def monitor(context: RunContext):
+        await context.result_dir_created.wait()
+        while not any(event.get('phase') == PREBOOT_AFTER_PHASE for event in read_run_events(context.result_dir)):
+            await asyncio.sleep(PREBOOT_POLL_INTERVAL)
+        # the preparation runs in its own thread, and goes on after the run ends
+        pool.preboot(slot, emulator_options)
+
+    return monitor
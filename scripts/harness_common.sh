@@ -0,0 +1,312 @@
+#!/bin/bash
+
+# The common functions of the harness scripts (run_<tool>.sh), sourced by each harness.
+# Instead of fixed sleeps, the harnesses wait on readiness probes (the device is booted, the package manager answers,
+#   the app is installed) with bounded retries. The actual wait of each phase is recorded in readiness.log under the
+#   result dir, e.g., "boot 38.2 ok". The probes are polled by adb_client.py over the adb server socket, in one process
+#   per wait instead of one adb process per probe. The rest of the run lifecycle (adb root, the logcat stream, the
+#   device time, the pushes and pulls of the tools' files, the teardown) also goes through adb_client.py, the harnesses
+#   only spawn adb for the fuzzing tools themselves.
+# Each phase of a run (boot, install, login, fuzzing, coverage pulls, teardown) is also recorded as one json line in
+#   run_events.jsonl under the result dir, with its start and end time on the wall clock ("start", "end", in epoch
+#   seconds) and on the host monotonic clock ("start_monotonic", "end_monotonic", i.e., /proc/uptime), and its exit
+#   status. themis.py aggregates these events into the timing summary of the campaign.
+# With the warm emulator pool of themis.py (--warm-pool, see emulator_pool.py), THEMIS_WARM_POOL is set and the
+#   emulator is already booted (and reset to its snapshot) when the harness starts, so the harness neither boots nor
+#   kills it. With the login snapshot cache (--login-snapshot, see login_snapshot.py), THEMIS_LOGIN_SNAPSHOT is also set
+#   and the app is already installed and logged in, so the harness skips the install and the login script.
+# Each cold boot first takes a slot of the host-wide boot semaphore (see boot_semaphore.py), so that at most
+#   THEMIS_BOOT_SLOTS emulators boot at the same time on the host. The wait for the slot is recorded as "boot_queue".
+
+READINESS_POLL_INTERVAL=1 # seconds between two probes
+BOOT_TIMEOUT=120 # seconds to wait for the emulator to boot before restarting it
+BOOT_RETRY_TIMES=5
+SHUTDOWN_TIMEOUT=30 # seconds to wait for a killed emulator to go offline
+PACKAGE_MANAGER_TIMEOUT=60
+INSTALL_RETRY_TIMES=3
+APP_READY_TIMEOUT=30
+TOOL_STOP_TIMEOUT=10 # seconds to wait for the processes of the tool on the device to exit
+# the crash logs kept in logcat.log
+LOGCAT_FILTERS=(AndroidRuntime:E CrashAnrDetector:D System.err:W CustomActivityOnCrash:E ACRA:E WordPress-EDITOR:E
+    '*:F' '*:S')
+THEMIS_SCRIPTS_DIR=$(cd $(dirname ${BASH_SOURCE[0]}) && pwd)
+THEMIS_WARM_POOL=${THEMIS_WARM_POOL:-""}
+THEMIS_LOGIN_SNAPSHOT=${THEMIS_LOGIN_SNAPSHOT:-""}
+THEMIS_BOOT_SLOTS=${THEMIS_BOOT_SLOTS:-4}
+THEMIS_BOOT_LOCK_DIR=${THEMIS_BOOT_LOCK_DIR:-/tmp/themis_boot_locks}
+BOOT_SLOT_FD="" # the fd of the lock file of the held boot slot
+LOGCAT_PID="" # the adb_client.py process streaming the logcat of the run
+
+# the waits and the phase events recorded before the result dir is created
+READINESS_WAITS=()
+READINESS_LOG=""
+RUN_EVENTS_BUFFER=()
+RUN_EVENTS=""
+
+declare -A PHASE_START_TIME
+declare -A PHASE_START_MONOTONIC
+
+function now(){
+    date +%s.%N
+}
+
+function monotonic_now(){
+    awk '{print $1}' /proc/uptime
+}
+
+function elapsed_since(){
+    awk -v start=$1 -v end=`now` 'BEGIN {printf "%.1f", end - start}'
+}
+
+# record_wait PHASE START_TIME STATUS
+function record_wait(){
+    local line="$1 `elapsed_since $2` $3"
+    echo "   readiness (${AVD_SERIAL}): $line"
+    if [[ $READINESS_LOG == "" ]]
+    then
+        READINESS_WAITS+=("$line")
+    else
+        echo "$line" >> $READINESS_LOG
+    fi
+}
+
+# phase_begin PHASE
+function phase_begin(){
+    PHASE_START_TIME[$1]=`now`
+    PHASE_START_MONOTONIC[$1]=`monotonic_now`
+}
+
+# phase_end PHASE [STATUS]: record the event of the phase started by phase_begin
+function phase_end(){
+    local end_time=`now`
+    local end_monotonic=`monotonic_now`
+    local event=`printf '{"phase": "%s", "serial": "%s", "start": %s, "end": %s, "start_monotonic": %s, "end_monotonic": %s, "status": %d}' \
+        $1 $AVD_SERIAL ${PHASE_START_TIME[$1]} $end_time ${PHASE_START_MONOTONIC[$1]} $end_monotonic ${2:-0}`
+    if [[ $RUN_EVENTS == "" ]]
+    then
+        RUN_EVENTS_BUFFER+=("$event")
+    else
+        echo "$event" >> $RUN_EVENTS
+    fi
+}
+
+# set_result_dir RESULT_DIR: write the waits and the events so far and the following ones into the result dir
+function set_result_dir(){
+    local result_dir_path=`realpath $1`
+    READINESS_LOG=$result_dir_path/readiness.log
+    for line in "${READINESS_WAITS[@]}"; do
+        echo "$line" >> $READINESS_LOG
+    done
+    READINESS_WAITS=()
+    RUN_EVENTS=$result_dir_path/run_events.jsonl
+    for event in "${RUN_EVENTS_BUFFER[@]}"; do
+        echo "$event" >> $RUN_EVENTS
+    done
+    RUN_EVENTS_BUFFER=()
+}
+
+# adb_client ARGS...: the adb commands talking to the adb server socket directly (see adb_client.py), e.g., the polled
+#   readiness probes, instead of spawning one adb process per probe. Each call is one python process, so the polls and
+#   retries of a wait run inside the call (e.g., wait-for-package, install-until-installed), not in a shell loop
+function adb_client(){
+    python3 $THEMIS_SCRIPTS_DIR/adb_client.py "$@"
+}
+
+### readiness waits
+
+# get_app_package_name APK_FILE: read from the (cached) manifest of the apk, see apk_metadata.py
+function get_app_package_name(){
+    python3 $THEMIS_SCRIPTS_DIR/apk_metadata.py $1 --field package || \
+        aapt dump badging $1 | grep package | awk '{print $2}' | sed s/name=//g | sed s/\'//g
+}
+
+# wait_for_device AVD_SERIAL: wait until the emulator is fully booted
+function wait_for_device(){
+    local start=`now`
+    if adb_client -s $1 wait-for-boot $BOOT_TIMEOUT
+    then
+        record_wait boot $start ok
+        return 0
+    fi
+    echo "Cannot connect to the device: (${1}) after ${BOOT_TIMEOUT} secs..."
+    record_wait boot $start timeout
+    return 1
+}
+
+# acquire_boot_slot: block until one of the THEMIS_BOOT_SLOTS lock files of the boot semaphore is locked
+function acquire_boot_slot(){
+    local start=`now`
+    mkdir -p $THEMIS_BOOT_LOCK_DIR
+    phase_begin boot_queue
+    while true; do
+        for i in $(seq 0 $((THEMIS_BOOT_SLOTS - 1))); do
+            exec {BOOT_SLOT_FD}>>$THEMIS_BOOT_LOCK_DIR/boot.$i.lock
+            if flock -n $BOOT_SLOT_FD
+            then
+                record_wait boot_queue $start ok
+                phase_end boot_queue 0
+                return 0
+            fi
+            exec {BOOT_SLOT_FD}>&-
+        done
+        sleep $READINESS_POLL_INTERVAL
+    done
+}
+
+# release_boot_slot: let the next emulator boot
+function release_boot_slot(){
+    if [[ $BOOT_SLOT_FD != "" ]]
+    then
+        flock -u $BOOT_SLOT_FD
+        exec {BOOT_SLOT_FD}>&-
+        BOOT_SLOT_FD=""
+    fi
+}
+
+# boot_emulator AVD_SERIAL AVD_NAME HEADLESS [EMULATOR OPTIONS...]: start the emulator and wait until it is booted,
+#   restart it if it does not boot in time
+function boot_emulator(){
+    local avd_serial=$1
+    local avd_name=$2
+    local headless=$3
+    shift 3
+    local avd_port=${avd_serial:9:13}
+    phase_begin boot
+    if [[ $THEMIS_WARM_POOL != "" ]]
+    then
+        # the emulator is kept booted by the pool
+        if wait_for_device $avd_serial
+        then
+            phase_end boot 0
+            return 0
+        fi
+        echo "the pooled emulator (${avd_serial}) is not available..."
+        phase_end boot 1
+        return 1
+    fi
+    for i in $(seq 1 $BOOT_RETRY_TIMES); do
+        acquire_boot_slot
+        echo "try to start the emulator (${avd_serial})..."
+        # the emulator does not inherit the lock file, the slot is released once the emulator is booted
+        emulator -port $avd_port -avd $avd_name -read-only $headless "$@" {BOOT_SLOT_FD}>&- &
+        local emulator_pid=$!
+        if wait_for_device $avd_serial
+        then
+            release_boot_slot
+            phase_end boot 0
+            return 0
+        fi
+        release_boot_slot
+        echo "try to restart the emulator (${avd_serial})..."
+        # the port is only free after the emulator exits
+        local start=`now`
+        adb_client -s $avd_serial emu-kill $SHUTDOWN_TIMEOUT
+        kill $emulator_pid 2> /dev/null
+        wait $emulator_pid 2> /dev/null
+        record_wait shutdown $start ok
+    done
+    echo "we give up the emulator (${avd_serial})..."
+    phase_end boot 1
+    return 1
+}
+
+# shutdown_emulator AVD_SERIAL: kill the emulator at the end of the run, unless it is kept by the pool, and wait until
+#   it is offline
+function shutdown_emulator(){
+    if [[ $THEMIS_WARM_POOL != "" ]]
+    then
+        echo "keep the pooled emulator (${1}) for the next run"
+        return 0
+    fi
+    local start=`now`
+    if adb_client -s $1 emu-kill $SHUTDOWN_TIMEOUT
+    then
+        record_wait shutdown $start ok
+        return 0
+    fi
+    record_wait shutdown $start timeout
+    return 1
+}
+
+# adb_root AVD_SERIAL: restart adbd as root, and wait until the device answers again
+function adb_root(){
+    adb_client -s $1 root $PACKAGE_MANAGER_TIMEOUT
+}
+
+# device_time AVD_SERIAL FORMAT: the time on the emulator, e.g., the start and end of the testing time
+function device_time(){
+    adb_client -s $1 shell date "$2"
+}
+
+# start_logcat AVD_SERIAL LOGCAT_FILE [LOGCAT OPTIONS...]: clear the log and stream the crash logs (LOGCAT_FILTERS) into
+#   the file in the background, in one adb_client.py process for the whole run
+function start_logcat(){
+    local avd_serial=$1
+    local logcat_file=$2
+    shift 2
+    adb_client -s $avd_serial logcat $logcat_file "$@" "${LOGCAT_FILTERS[@]}" &
+    LOGCAT_PID=$!
+}
+
+# stop_logcat: stop the logcat stream of the run
+function stop_logcat(){
+    if [[ $LOGCAT_PID != "" ]]
+    then
+        kill $LOGCAT_PID 2> /dev/null
+        wait $LOGCAT_PID 2> /dev/null
+        LOGCAT_PID=""
+    fi
+}
+
+# stop_tool AVD_SERIAL PROCESS_NAME: kill the processes of the tool left on the device, and wait until they exit
+function stop_tool(){
+    adb_client -s $1 kill-processes $2 $TOOL_STOP_TIMEOUT
+}
+
+# wait_for_package_manager AVD_SERIAL: e.g., after "adb root" restarted adbd, wait until the device answers again
+function wait_for_package_manager(){
+    local start=`now`
+    if adb_client -s $1 wait-for-package android $PACKAGE_MANAGER_TIMEOUT
+    then
+        record_wait package_manager $start ok
+        return 0
+    fi
+    record_wait package_manager $start timeout
+    return 1
+}
+
+# install_app AVD_SERIAL APK_FILE INSTALL_LOG [INSTALL OPTIONS...]: install the app, retry until it is installed
+function install_app(){
+    local avd_serial=$1
+    local apk_file=$2
+    local install_log=$3
+    shift 3
+    local app_package_name=`get_app_package_name $apk_file`
+    phase_begin install
+    wait_for_package_manager $avd_serial
+    local start=`now`
+    # the install attempts and the checks of the installed package run in one adb_client.py process
+    if adb_client -s $avd_serial install-until-installed $apk_file $app_package_name $INSTALL_RETRY_TIMES "$@" \
+        &>> $install_log
+    then
+        record_wait install $start ok
+        phase_end install 0
+        return 0
+    fi
+    record_wait install $start failed
+    phase_end install 1
+    return 1
+}
+
+# wait_for_app_ready AVD_SERIAL APK_FILE: wait until the app under test is installed before starting the fuzzing
+function wait_for_app_ready(){
+    local app_package_name=`get_app_package_name $2`
+    local start=`now`
+    if adb_client -s $1 wait-for-package $app_package_name $APP_READY_TIMEOUT
+    then
+        record_wait app_ready $start ok
+        return 0
+    fi
+    record_wait app_ready $start timeout
+    return 1
+}
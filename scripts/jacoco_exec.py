@@ -0,0 +1,284 @@
+# This file reads, merges and writes the JaCoCo execution data files (*.ec, the "exec" format of JaCoCo 0.7.5+, i.e.,
+#   format version 0x1007) in Python, instead of starting a JVM for each "jacococli.jar merge" of compute_coverage.py.
+# An exec file is a sequence of blocks, each starting with its type byte:
+#   - 0x01 header: the magic number 0xC0C0 and the format version (2-byte chars), repeated when files are concatenated;
+#   - 0x10 session info: the session id (modified UTF-8 with a 2-byte length), the start and dump time stamps (8-byte
+#     longs, in ms);
+#   - 0x11 execution data: the class id (8-byte long, the CRC64 of the class file), the class name (modified UTF-8) and
+#     the probes of the class (a var int length, then the probes packed 8 per byte, the lowest bit first).
+#   All the numbers are big-endian. The probes of a class are held as a numpy bool array, so merging two files is an OR
+#   of the probe arrays of the same classes.
+# The merged file is byte-compatible with the one of "jacococli.jar merge" (ExecFileLoader.save): the session infos
+#   sorted by their dump time stamps (ties in loading order), then the execution data of the classes with hits in the
+#   iteration order of the java.util.HashMap<Long, ExecutionData> of ExecutionDataStore, which is emulated by
+#   get_java_hash_map_order (except for the hash buckets of more than 8 classes in a table of 64+ buckets, which java
+#   turns into trees, i.e., never in practice). Note that jacococli appends the merged data to an existing destfile
+#   (the readers merge the repeated blocks), the same as the command line below, while compute_coverage.py overwrites.
+# Usage (the same as "java -jar jacococli.jar merge"):
+#   python3 jacoco_exec.py merge coverage_1.ec coverage_2.ec --destfile coverage_all.ec
+
+import os
+import struct
+import sys
+from argparse import ArgumentParser
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple
+
+import numpy as np
+
+BLOCK_HEADER = 0x01
+BLOCK_SESSION_INFO = 0x10
+BLOCK_EXECUTION_DATA = 0x11
+MAGIC_NUMBER = 0xC0C0
+FORMAT_VERSION = 0x1007
+# the java.util.HashMap constants
+JAVA_HASH_MAP_INITIAL_CAPACITY = 16
+JAVA_HASH_MAP_LOAD_FACTOR = 0.75
+JAVA_HASH_MAP_TREEIFY_THRESHOLD = 8
+JAVA_HASH_MAP_MIN_TREEIFY_CAPACITY = 64
+
+
+class ExecFileError(Exception):
+    pass
+
+
+class SessionInfo(NamedTuple):
+    id: str
+    start: int
+    dump: int
+
+
+class ExecutionData(NamedTuple):
+    id: int
+    name: str
+    probes: np.ndarray
+
+
+def encode_modified_utf8(value: str):
+    # java's DataOutput.writeUTF: "\0" and the supplementary characters (as surrogate pairs) take 2 and 3+3 bytes
+    data = bytearray()
+    utf16 = value.encode("utf-16-be", errors="surrogatepass")
+    for index in range(0, len(utf16), 2):
+        char = (utf16[index] << 8) | utf16[index + 1]
+        if 0x0001 <= char <= 0x007F:
+            data.append(char)
+        elif char <= 0x07FF:
+            data += bytes([0xC0 | (char >> 6), 0x80 | (char & 0x3F)])
+        else:
+            data += bytes([0xE0 | (char >> 12), 0x80 | ((char >> 6) & 0x3F), 0x80 | (char & 0x3F)])
+    if len(data) > 0xFFFF:
+        raise ExecFileError("the string is too long: %s..." % value[:50])
+    return struct.pack(">H", len(data)) + bytes(data)
+
+
+def decode_modified_utf8(data: bytes):
+    chars = bytearray()
+    index = 0
+    while index < len(data):
+        byte = data[index]
+        if byte < 0x80:
+            char, index = byte, index + 1
+        elif byte >> 5 == 0x06 and index + 1 < len(data):
+            char, index = ((byte & 0x1F) << 6) | (data[index + 1] & 0x3F), index + 2
+        elif byte >> 4 == 0x0E and index + 2 < len(data):
+            char = ((byte & 0x0F) << 12) | ((data[index + 1] & 0x3F) << 6) | (data[index + 2] & 0x3F)
+            index += 3
+        else:
+            raise ExecFileError("malformed modified UTF-8 string: %r" % data)
+        chars += struct.pack(">H", char)
+    return chars.decode("utf-16-be", errors="surrogatepass")
+
+
+class ExecFileReader:
+    # the blocks of an exec file, read from its content in memory
+
+    def __init__(self, data: bytes, path: str = "<memory>"):
+        self.data = data
+        self.path = path
+        self.offset = 0
+
+    def read(self, size: int):
+        if self.offset + size > len(self.data):
+            raise ExecFileError("%s is truncated at byte %d" % (self.path, len(self.data)))
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def read_utf(self):
+        length = struct.unpack(">H", self.read(2))[0]
+        return decode_modified_utf8(self.read(length))
+
+    def read_var_int(self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.read(1)[0]
+            value |= (byte & 0x7F) << shift
+            if byte & 0x80 == 0:
+                return value
+            shift += 7
+
+    def read_probes(self):
+        length = self.read_var_int()
+        packed = np.frombuffer(self.read((length + 7) // 8), dtype=np.uint8)
+        return np.unpackbits(packed, count=length, bitorder="little").astype(bool)
+
+    def read_blocks(self, sessions: List[SessionInfo], execution_data: List[ExecutionData]):
+        first_block = True
+        while self.offset < len(self.data):
+            block_type = self.read(1)[0]
+            if first_block and block_type != BLOCK_HEADER:
+                raise ExecFileError("%s is not a JaCoCo exec file" % self.path)
+            first_block = False
+            if block_type == BLOCK_HEADER:
+                magic_number, version = struct.unpack(">HH", self.read(4))
+                if magic_number != MAGIC_NUMBER:
+                    raise ExecFileError("%s is not a JaCoCo exec file" % self.path)
+                if version != FORMAT_VERSION:
+                    raise ExecFileError("%s has the incompatible format version 0x%x" % (self.path, version))
+            elif block_type == BLOCK_SESSION_INFO:
+                session_id = self.read_utf()
+                start, dump = struct.unpack(">qq", self.read(16))
+                sessions.append(SessionInfo(session_id, start, dump))
+            elif block_type == BLOCK_EXECUTION_DATA:
+                class_id = struct.unpack(">q", self.read(8))[0]
+                execution_data.append(ExecutionData(class_id, self.read_utf(), self.read_probes()))
+            else:
+                raise ExecFileError("%s has the unknown block type 0x%x" % (self.path, block_type))
+
+
+def write_var_int(value: int):
+    data = bytearray()
+    while value & ~0x7F:
+        data.append(0x80 | (value & 0x7F))
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def write_probes(probes: np.ndarray):
+    return write_var_int(len(probes)) + np.packbits(probes, bitorder="little").tobytes()
+
+
+def get_java_hash_map_order(class_ids: List[int]):
+    # the iteration order of a java.util.HashMap<Long, ...> after putting the given keys in order: by hash bucket of
+    #   the final table, then by insertion order within a bucket (the resizes keep the order of the bucket lists)
+    def get_hash(class_id: int):
+        # Long.hashCode, spread by HashMap.hash
+        value = class_id & 0xFFFFFFFFFFFFFFFF
+        h = (value ^ (value >> 32)) & 0xFFFFFFFF
+        return h ^ (h >> 16)
+
+    hashes = [get_hash(class_id) for class_id in class_ids]
+    capacity = JAVA_HASH_MAP_INITIAL_CAPACITY
+    bucket_sizes: Dict[int, int] = {}
+    for size, h in enumerate(hashes, 1):
+        bucket = h & (capacity - 1)
+        bucket_sizes[bucket] = bucket_sizes.get(bucket, 0) + 1
+        resize = size > capacity * JAVA_HASH_MAP_LOAD_FACTOR
+        # a bucket list longer than TREEIFY_THRESHOLD resizes a small table instead of turning into a tree
+        if bucket_sizes[bucket] > JAVA_HASH_MAP_TREEIFY_THRESHOLD and capacity < JAVA_HASH_MAP_MIN_TREEIFY_CAPACITY:
+            capacity *= 2
+            if size > capacity * JAVA_HASH_MAP_LOAD_FACTOR:
+                capacity *= 2
+        elif resize:
+            capacity *= 2
+        else:
+            continue
+        bucket_sizes = {}
+        for other_hash in hashes[:size]:
+            other_bucket = other_hash & (capacity - 1)
+            bucket_sizes[other_bucket] = bucket_sizes.get(other_bucket, 0) + 1
+    return sorted(range(len(class_ids)), key=lambda index: (hashes[index] & (capacity - 1), index))
+
+
+class ExecutionDataStore:
+    # the merged content of exec files, the same as ExecFileLoader of JaCoCo
+
+    def __init__(self):
+        self.sessions: List[SessionInfo] = []
+        # class id -> the execution data, in the order of their first loading
+        self.classes: Dict[int, ExecutionData] = {}
+
+    def put(self, data: ExecutionData):
+        existing = self.classes.get(data.id)
+        if existing is None:
+            # copy the probes, the merges update them in place
+            self.classes[data.id] = ExecutionData(data.id, data.name, data.probes.copy())
+            return
+        if existing.name != data.name:
+            raise ExecFileError("Different class names %s and %s for id %016x" % (
+                existing.name, data.name, data.id & 0xFFFFFFFFFFFFFFFF))
+        if len(existing.probes) != len(data.probes):
+            raise ExecFileError("Incompatible execution data for class %s with id %016x" % (
+                data.name, data.id & 0xFFFFFFFFFFFFFFFF))
+        np.logical_or(existing.probes, data.probes, out=existing.probes)
+
+    def load_bytes(self, data: bytes, path: str = "<memory>"):
+        sessions: List[SessionInfo] = []
+        execution_data: List[ExecutionData] = []
+        ExecFileReader(data, path).read_blocks(sessions, execution_data)
+        self.sessions.extend(sessions)
+        for class_data in execution_data:
+            self.put(class_data)
+
+    def load(self, path: str):
+        with open(path, "rb") as exec_file:
+            self.load_bytes(exec_file.read(), path)
+
+    def get_covered_classes(self):
+        return sum(1 for data in self.classes.values() if data.probes.any())
+
+    def get_covered_probes(self):
+        return sum(int(np.count_nonzero(data.probes)) for data in self.classes.values())
+
+    def write(self, output_file: BinaryIO):
+        output_file.write(struct.pack(">BHH", BLOCK_HEADER, MAGIC_NUMBER, FORMAT_VERSION))
+        # a stable sort by the dump time stamps, as Collections.sort in SessionInfoStore (see SessionInfo.compareTo)
+        for session in sorted(self.sessions, key=lambda session: session.dump):
+            output_file.write(bytes([BLOCK_SESSION_INFO]) + encode_modified_utf8(session.id) +
+                              struct.pack(">qq", session.start, session.dump))
+        classes = list(self.classes.values())
+        for index in get_java_hash_map_order([data.id for data in classes]):
+            data = classes[index]
+            # the same as ExecutionDataWriter, the classes without hits are left out
+            if not data.probes.any():
+                continue
+            output_file.write(bytes([BLOCK_EXECUTION_DATA]) + struct.pack(">q", data.id) +
+                              encode_modified_utf8(data.name) + write_probes(data.probes))
+
+    def save(self, path: str, append: bool = False):
+        if append:
+            with open(path, "ab") as exec_file:
+                self.write(exec_file)
+            return
+        # write a temporary file first, the merged file may be one of the inputs of the next merge
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as exec_file:
+            self.write(exec_file)
+        os.replace(temp_path, path)
+
+
+def merge_exec_files(paths: Iterable[str], dest_path: str, append: bool = False):
+    # the same as "jacococli.jar merge <paths> --destfile <dest_path>" (with append)
+    store = ExecutionDataStore()
+    for path in paths:
+        store.load(path)
+    store.save(dest_path, append)
+    return store
+
+
+if __name__ == '__main__':
+    ap = ArgumentParser()
+    ap.add_argument('command', choices=['merge'])
+    ap.add_argument('execfiles', nargs='*', help="the exec files to merge")
+    ap.add_argument('--destfile', type=str, required=True, help="the merged exec file")
+    args = ap.parse_args()
+
+    try:
+        merged_store = merge_exec_files(args.execfiles, args.destfile, append=True)
+    except (ExecFileError, OSError) as e:
+        print("Error: %s" % e, file=sys.stderr)
+        sys.exit(1)
+    print("%d sessions, %d classes (%d covered), %d covered probes merged into %s" % (
+        len(merged_store.sessions), len(merged_store.classes), merged_store.get_covered_classes(),
+        merged_store.get_covered_probes(), args.destfile))
@@ -0,0 +1,2130 @@
+# This file indexes the class files of an apk once, so that its line, branch, method and class coverage (the counters of
+#   "jacococli.jar report") is computed for any execution data in Python, instead of starting a JVM which analyzes all
+#   the class files again for each report of compute_coverage.py.
+# The analysis is the one of JaCoCo 0.8.5 (the version of tools/jacococli.jar) on the class files read as the ASM tree
+#   API does: the probes of each method (LabelFlowAnalyzer and MethodProbesAdapter), the instructions with their
+#   branches (MethodAnalyzer and InstructionsBuilder), the filters of the compiler generated code (Filters.all, ported
+#   one by one) and the counters of the classes, source files and packages (CoverageBuilder). The coverage of an
+#   instruction only ORs the probes reachable from it, so each item of the report is covered iff one of a fixed set of
+#   probes is executed, which is what the index holds: for each line (merged by source file), branch, method and class,
+#   the ids of its probes in the concatenated probe arrays of the classes. The coverage of execution data is then a
+#   cumulative sum over the executed probes of the index, i.e., milliseconds for the class files of an apk.
+# The index is saved as a .npz file, with a fingerprint of the class files (their paths, sizes and modification times)
+#   to rebuild it when they change. The class files JaCoCo fails on (e.g., the kotlin SMAPs of the newer compilers)
+#   fail the same here, and the subroutines (jsr/ret of the class files before java 6) and pack200 archives, which
+#   JaCoCo supports, are not supported.
+# Usage:
+#   python3 jacoco_index.py index --classfiles app/build/intermediates/javac/debug/classes \
+#     --index app.coverage_index.npz
+#   python3 jacoco_index.py report coverage_all.ec --classfiles app/build/intermediates/javac/debug/classes
+#     (the same counters as "java -jar jacococli.jar report", the index is built on the fly without --index)
+
+import gzip
+import hashlib
+import io
+import os
+import re
+import struct
+import sys
+import time
+import zipfile
+from argparse import ArgumentParser
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from jacoco_exec import decode_modified_utf8, ExecFileError, ExecutionDataStore
+
+# the format version of the index files, to bump when the analysis changes
+COVERAGE_INDEX_VERSION = 1
+# the counters of the index, in the order of the JaCoCo reports
+COUNTER_TYPES = ['LINE', 'BRANCH', 'METHOD', 'CLASS']
+
+# the opcodes of the JVM, as the ASM tree API sees them (e.g., "iload_1" is ILOAD 1, "ldc_w" is LDC, "goto_w" is GOTO)
+OPCODE_NAMES = (
+    "nop aconst_null iconst_m1 iconst_0 iconst_1 iconst_2 iconst_3 iconst_4 iconst_5 lconst_0 lconst_1 fconst_0 "
+    "fconst_1 fconst_2 dconst_0 dconst_1 bipush sipush ldc ldc_w ldc2_w iload lload fload dload aload iload_0 "
+    "iload_1 iload_2 iload_3 lload_0 lload_1 lload_2 lload_3 fload_0 fload_1 fload_2 fload_3 dload_0 dload_1 "
+    "dload_2 dload_3 aload_0 aload_1 aload_2 aload_3 iaload laload faload daload aaload baload caload saload istore "
+    "lstore fstore dstore astore istore_0 istore_1 istore_2 istore_3 lstore_0 lstore_1 lstore_2 lstore_3 fstore_0 "
+    "fstore_1 fstore_2 fstore_3 dstore_0 dstore_1 dstore_2 dstore_3 astore_0 astore_1 astore_2 astore_3 iastore "
+    "lastore fastore dastore aastore bastore castore sastore pop pop2 dup dup_x1 dup_x2 dup2 dup2_x1 dup2_x2 swap "
+    "iadd ladd fadd dadd isub lsub fsub dsub imul lmul fmul dmul idiv ldiv fdiv ddiv irem lrem frem drem ineg lneg "
+    "fneg dneg ishl lshl ishr lshr iushr lushr iand land ior lor ixor lxor iinc i2l i2f i2d l2i l2f l2d f2i f2l f2d "
+    "d2i d2l d2f i2b i2c i2s lcmp fcmpl fcmpg dcmpl dcmpg ifeq ifne iflt ifge ifgt ifle if_icmpeq if_icmpne "
+    "if_icmplt if_icmpge if_icmpgt if_icmple if_acmpeq if_acmpne goto jsr ret tableswitch lookupswitch ireturn "
+    "lreturn freturn dreturn areturn return getstatic putstatic getfield putfield invokevirtual invokespecial "
+    "invokestatic invokeinterface invokedynamic new newarray anewarray arraylength athrow checkcast instanceof "
+    "monitorenter monitorexit wide multianewarray ifnull ifnonnull goto_w jsr_w").split()
+OPCODES = {name: opcode for opcode, name in enumerate(OPCODE_NAMES)}
+ILOAD, ISTORE, ALOAD, ASTORE, IINC = OPCODES['iload'], OPCODES['istore'], OPCODES['aload'], OPCODES['astore'], 132
+IFEQ, IFNE, IF_ICMPNE, IF_ACMPEQ, IF_ACMPNE = 153, 154, 160, 165, 166
+GOTO, JSR, RET, TABLESWITCH, LOOKUPSWITCH = 167, 168, 169, 170, 171
+IRETURN, RETURN, ATHROW = 172, 177, 191
+GETSTATIC, PUTSTATIC, GETFIELD, PUTFIELD = 178, 179, 180, 181
+INVOKEVIRTUAL, INVOKESPECIAL, INVOKESTATIC, INVOKEINTERFACE, INVOKEDYNAMIC = 182, 183, 184, 185, 186
+NEW, CHECKCAST, INSTANCEOF, MONITORENTER, MONITOREXIT, IFNULL, IFNONNULL = 187, 192, 193, 194, 195, 198, 199
+LDC, POP, DUP, ICONST_0, BIPUSH, SIPUSH, NEWARRAY, ANEWARRAY = 18, 87, 89, 3, 16, 17, 188, 189
+
+# the node types of the ASM tree API
+INSN, INT_INSN, VAR_INSN, TYPE_INSN, FIELD_INSN, METHOD_INSN, INVOKE_DYNAMIC_INSN, JUMP_INSN, LABEL, LDC_INSN, \
+    IINC_INSN, TABLESWITCH_INSN, LOOKUPSWITCH_INSN, MULTIANEWARRAY_INSN, FRAME, LINE = range(16)
+
+ACC_PRIVATE = 0x0002
+ACC_STATIC = 0x0008
+ACC_SYNCHRONIZED = 0x0020
+ACC_BRIDGE = 0x0040
+ACC_ABSTRACT = 0x0400
+ACC_SYNTHETIC = 0x1000
+ACC_ENUM = 0x4000
+ACC_MODULE = 0x8000
+
+
+class ClassFileError(Exception):
+    pass
+
+
+class Node:
+    # a node of the instruction list of a method (AbstractInsnNode of ASM), the labels also hold the flags of LabelInfo
+    #   of JaCoCo
+    __slots__ = ('type', 'opcode', 'previous', 'next', 'var', 'operand', 'owner', 'name', 'desc', 'label', 'labels',
+                 'keys', 'cst', 'line', 'target', 'successor', 'multi_target', 'method_invocation_line', 'done',
+                 'probe_id', 'instruction')
+
+    def __init__(self, node_type: int, opcode: int = -1):
+        self.type = node_type
+        self.opcode = opcode
+        self.label: Optional[Node] = None
+        self.labels: List[Node] = []
+        self.var = -1
+        self.operand = 0
+        self.owner: Optional[str] = None
+        self.name: Optional[str] = None
+        self.desc: Optional[str] = None
+        self.keys: List[int] = []
+        self.cst = None
+        self.line = -1
+        self.target = False
+        self.successor = False
+        self.multi_target = False
+        self.method_invocation_line = False
+        self.done = False
+        self.probe_id = -1
+        self.instruction = None
+
+
+class TryCatchBlock(NamedTuple):
+    start: Node
+    end: Node
+    handler: Node
+    type: Optional[str]
+
+
+class MethodInfo(NamedTuple):
+    access: int
+    name: str
+    desc: str
+    signature: Optional[str]
+    # the descriptors of the (visible and invisible) annotations of the method
+    annotations: List[str]
+    instructions: List[Node]
+    try_catch_blocks: List[TryCatchBlock]
+
+
+class ClassInfo(NamedTuple):
+    id: int
+    access: int
+    name: str
+    super_name: Optional[str]
+    interfaces: List[str]
+    source_file: Optional[str]
+    source_debug_extension: Optional[str]
+    annotations: List[str]
+    # the names of the class attributes unknown to ASM
+    attributes: List[str]
+    # the names of the fields
+    fields: List[str]
+    methods: List[MethodInfo]
+
+
+# the standard class attributes of ASM 7 (the others are the class attributes of IFilterContext)
+STANDARD_CLASS_ATTRIBUTES = {'SourceFile', 'InnerClasses', 'EnclosingMethod', 'NestHost', 'NestMembers', 'Signature',
+                             'RuntimeVisibleAnnotations', 'RuntimeVisibleTypeAnnotations', 'Deprecated', 'Synthetic',
+                             'SourceDebugExtension', 'RuntimeInvisibleAnnotations', 'RuntimeInvisibleTypeAnnotations',
+                             'Module', 'ModuleMainClass', 'ModulePackages', 'BootstrapMethods'}
+
+
+def get_crc64_table():
+    table = []
+    for i in range(0x100):
+        value = i
+        for _ in range(8):
+            value = (value >> 1) ^ 0xD800000000000000 if value & 1 else value >> 1
+        table.append(value)
+    return table
+
+
+CRC64_TABLE = get_crc64_table()
+
+
+def get_class_id(data: bytes):
+    # the CRC64 of the class file (CRC64.classId of JaCoCo), signed as the ids in the exec files
+    if len(data) > 7 and data[6] == 0 and data[7] == 53:
+        # the early java 9 class files are checked as java 8 ones
+        data = data[:7] + bytes([52]) + data[8:]
+    crc = 0
+    table = CRC64_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc - (1 << 64) if crc >= 1 << 63 else crc
+
+
+class ClassReader:
+    # reads a class file as ClassReader of ASM does for the analysis of JaCoCo (with the debug information)
+
+    def __init__(self, data: bytes):
+        self.data = data
+        if len(data) < 10 or data[:4] != b"\xca\xfe\xba\xbe":
+            raise ClassFileError("not a class file")
+        # the offsets of the constant pool entries
+        self.constants: List[int] = [0]
+        self.strings: Dict[int, str] = {}
+        offset = 10
+        count = self.u2(8)
+        while len(self.constants) < count:
+            self.constants.append(offset)
+            tag = data[offset]
+            if tag == 1:
+                offset += 3 + self.u2(offset + 1)
+            elif tag in (3, 4, 9, 10, 11, 12, 17, 18):
+                offset += 5
+            elif tag in (5, 6):
+                offset += 9
+                # the longs and doubles take two entries
+                self.constants.append(0)
+            elif tag == 15:
+                offset += 4
+            elif tag in (7, 8, 16, 19, 20):
+                offset += 3
+            else:
+                raise ClassFileError("unknown constant pool tag %d" % tag)
+        self.header = offset
+
+    def u1(self, offset: int):
+        return self.data[offset]
+
+    def u2(self, offset: int):
+        return (self.data[offset] << 8) | self.data[offset + 1]
+
+    def s2(self, offset: int):
+        return struct.unpack_from(">h", self.data, offset)[0]
+
+    def s4(self, offset: int):
+        return struct.unpack_from(">i", self.data, offset)[0]
+
+    def utf8(self, index: int) -> Optional[str]:
+        if index == 0:
+            return None
+        if index not in self.strings:
+            offset = self.constants[index]
+            self.strings[index] = decode_modified_utf8(self.data[offset + 3:offset + 3 + self.u2(offset + 1)])
+        return self.strings[index]
+
+    def class_name(self, index: int) -> Optional[str]:
+        # the name of a CONSTANT_Class (or the content of another constant referring to an utf8 constant)
+        if index == 0:
+            return None
+        return self.utf8(self.u2(self.constants[index] + 1))
+
+    def member_ref(self, index: int):
+        # owner, name, desc of a CONSTANT_Fieldref/Methodref/InterfaceMethodref
+        offset = self.constants[index]
+        name_and_type = self.constants[self.u2(offset + 3)]
+        return self.class_name(self.u2(offset + 1)), self.utf8(self.u2(name_and_type + 1)), \
+            self.utf8(self.u2(name_and_type + 3))
+
+    def constant(self, index: int):
+        # the value of a ldc constant: an int, a float, a str, or a (tag, value) tuple for the other constants
+        offset = self.constants[index]
+        tag = self.data[offset]
+        if tag == 3:
+            return struct.unpack_from(">i", self.data, offset + 1)[0]
+        if tag == 4:
+            return struct.unpack_from(">f", self.data, offset + 1)[0]
+        if tag == 5:
+            return ('long', struct.unpack_from(">q", self.data, offset + 1)[0])
+        if tag == 6:
+            return ('double', struct.unpack_from(">d", self.data, offset + 1)[0])
+        if tag == 8:
+            return self.utf8(self.u2(offset + 1))
+        if tag == 7:
+            return ('class', self.class_name(index))
+        if tag == 16:
+            return ('method_type', self.utf8(self.u2(offset + 1)))
+        return ('constant', tag, index)
+
+    def read_annotations(self, offset: int, annotations: List[str]):
+        # the descriptors of the annotations of a Runtime(In)VisibleAnnotations attribute
+        count = self.u2(offset)
+        offset += 2
+        for _ in range(count):
+            annotations.append(self.utf8(self.u2(offset)))
+            offset = self.skip_annotation(offset)
+
+    def skip_annotation(self, offset: int):
+        pairs = self.u2(offset + 2)
+        offset += 4
+        for _ in range(pairs):
+            offset = self.skip_element_value(offset + 2)
+        return offset
+
+    def skip_element_value(self, offset: int):
+        tag = chr(self.data[offset])
+        if tag == 'e':
+            return offset + 5
+        if tag == '@':
+            return self.skip_annotation(offset + 1)
+        if tag == '[':
+            values = self.u2(offset + 1)
+            offset += 3
+            for _ in range(values):
+                offset = self.skip_element_value(offset)
+            return offset
+        return offset + 3
+
+    def read_attributes(self, offset: int):
+        # name -> the offsets (and lengths) of the attributes, in order, and the offset after them
+        attributes: List = []
+        count = self.u2(offset)
+        offset += 2
+        for _ in range(count):
+            length = struct.unpack_from(">I", self.data, offset + 2)[0]
+            attributes.append((self.utf8(self.u2(offset)), offset + 6, length))
+            offset += 6 + length
+        return attributes, offset
+
+    def read_class(self) -> ClassInfo:
+        access = self.u2(self.header)
+        name = self.class_name(self.u2(self.header + 2))
+        super_name = self.class_name(self.u2(self.header + 4))
+        interfaces = [self.class_name(self.u2(self.header + 8 + 2 * i)) for i in range(self.u2(self.header + 6))]
+        offset = self.header + 8 + 2 * len(interfaces)
+        fields = []
+        count = self.u2(offset)
+        offset += 2
+        for _ in range(count):
+            fields.append(self.utf8(self.u2(offset + 2)))
+            offset = self.read_attributes(offset + 6)[1]
+        method_offsets = []
+        count = self.u2(offset)
+        offset += 2
+        for _ in range(count):
+            method_offsets.append(offset)
+            offset = self.read_attributes(offset + 6)[1]
+        source_file = None
+        source_debug_extension = None
+        annotations: List[str] = []
+        other_attributes = []
+        for attribute_name, attribute_offset, length in self.read_attributes(offset)[0]:
+            if attribute_name == 'SourceFile':
+                source_file = self.utf8(self.u2(attribute_offset))
+            elif attribute_name == 'SourceDebugExtension':
+                source_debug_extension = decode_modified_utf8(self.data[attribute_offset:attribute_offset + length])
+            elif attribute_name in ('RuntimeVisibleAnnotations', 'RuntimeInvisibleAnnotations'):
+                self.read_annotations(attribute_offset, annotations)
+            elif attribute_name not in STANDARD_CLASS_ATTRIBUTES:
+                other_attributes.append(attribute_name)
+        methods = [self.read_method(method_offset) for method_offset in method_offsets]
+        return ClassInfo(get_class_id(self.data), access, name, super_name, interfaces, source_file,
+                         source_debug_extension, annotations, other_attributes, fields, methods)
+
+    def read_method(self, offset: int) -> MethodInfo:
+        access = self.u2(offset)
+        name = self.utf8(self.u2(offset + 2))
+        desc = self.utf8(self.u2(offset + 4))
+        signature = None
+        annotations: List[str] = []
+        code = None
+        for attribute_name, attribute_offset, length in self.read_attributes(offset + 6)[0]:
+            if attribute_name == 'Code':
+                code = attribute_offset
+            elif attribute_name == 'Signature':
+                signature = self.utf8(self.u2(attribute_offset))
+            elif attribute_name == 'Synthetic':
+                access |= ACC_SYNTHETIC
+            elif attribute_name in ('RuntimeVisibleAnnotations', 'RuntimeInvisibleAnnotations'):
+                self.read_annotations(attribute_offset, annotations)
+        instructions: List[Node] = []
+        try_catch_blocks: List[TryCatchBlock] = []
+        if code is not None:
+            self.read_code(code, instructions, try_catch_blocks)
+        return MethodInfo(access, name, desc, signature, annotations, instructions, try_catch_blocks)
+
+    def read_code(self, offset: int, instructions: List[Node], try_catch_blocks: List[TryCatchBlock]):
+        # the instruction list of a Code attribute: the labels (of the jump targets, the try catch blocks, the line
+        #   numbers, the local variables and the frames), the line numbers, the frames and the instructions in the
+        #   order of the ASM tree API
+        code_length = struct.unpack_from(">I", self.data, offset + 4)[0]
+        code_start = offset + 8
+        labels: Dict[int, Node] = {}
+
+        def get_label(label_offset: int):
+            if label_offset not in labels:
+                labels[label_offset] = Node(LABEL)
+            return labels[label_offset]
+
+        nodes: List = []
+        pc = 0
+        while pc < code_length:
+            start = code_start + pc
+            opcode = self.data[start]
+            node = None
+            if opcode == BIPUSH or opcode == NEWARRAY:
+                node = Node(INT_INSN, opcode)
+                node.operand = struct.unpack_from(">b", self.data, start + 1)[0] if opcode == BIPUSH else \
+                    self.data[start + 1]
+                size = 2
+            elif opcode == SIPUSH:
+                node = Node(INT_INSN, opcode)
+                node.operand = self.s2(start + 1)
+                size = 3
+            elif 18 <= opcode <= 20:
+                node = Node(LDC_INSN, LDC)
+                node.cst = self.constant(self.data[start + 1] if opcode == 18 else self.u2(start + 1))
+                size = 2 if opcode == 18 else 3
+            elif 21 <= opcode <= 25 or 54 <= opcode <= 58 or opcode == RET:
+                node = Node(VAR_INSN, opcode)
+                node.var = self.data[start + 1]
+                size = 2
+            elif 26 <= opcode <= 45:
+                node = Node(VAR_INSN, ILOAD + (opcode - 26) // 4)
+                node.var = (opcode - 26) % 4
+                size = 1
+            elif 59 <= opcode <= 78:
+                node = Node(VAR_INSN, ISTORE + (opcode - 59) // 4)
+                node.var = (opcode - 59) % 4
+                size = 1
+            elif opcode == IINC:
+                node = Node(IINC_INSN, opcode)
+                node.var = self.data[start + 1]
+                node.operand = struct.unpack_from(">b", self.data, start + 2)[0]
+                size = 3
+            elif 153 <= opcode <= 168 or opcode == IFNULL or opcode == IFNONNULL:
+                node = Node(JUMP_INSN, opcode)
+                node.label = get_label(pc + self.s2(start + 1))
+                size = 3
+            elif opcode == 200 or opcode == 201:
+                node = Node(JUMP_INSN, GOTO if opcode == 200 else JSR)
+                node.label = get_label(pc + self.s4(start + 1))
+                size = 5
+            elif opcode == TABLESWITCH or opcode == LOOKUPSWITCH:
+                # the operands are aligned on 4 bytes from the start of the code
+                operands = code_start + pc + 4 - pc % 4
+                default = self.s4(operands)
+                if opcode == TABLESWITCH:
+                    node = Node(TABLESWITCH_INSN, opcode)
+                    low, high = self.s4(operands + 4), self.s4(operands + 8)
+                    node.keys = list(range(low, high + 1))
+                    node.labels = [get_label(pc + self.s4(operands + 12 + 4 * i)) for i in range(high - low + 1)]
+                    size = operands + 12 + 4 * (high - low + 1) - start
+                else:
+                    node = Node(LOOKUPSWITCH_INSN, opcode)
+                    pairs = self.s4(operands + 4)
+                    node.keys = [self.s4(operands + 8 + 8 * i) for i in range(pairs)]
+                    node.labels = [get_label(pc + self.s4(operands + 12 + 8 * i)) for i in range(pairs)]
+                    size = operands + 8 + 8 * pairs - start
+                node.label = get_label(pc + default)
+            elif GETSTATIC <= opcode <= PUTFIELD:
+                node = Node(FIELD_INSN, opcode)
+                node.owner, node.name, node.desc = self.member_ref(self.u2(start + 1))
+                size = 3
+            elif INVOKEVIRTUAL <= opcode <= INVOKEINTERFACE:
+                node = Node(METHOD_INSN, opcode)
+                node.owner, node.name, node.desc = self.member_ref(self.u2(start + 1))
+                size = 5 if opcode == INVOKEINTERFACE else 3
+            elif opcode == INVOKEDYNAMIC:
+                node = Node(INVOKE_DYNAMIC_INSN, opcode)
+                name_and_type = self.constants[self.u2(self.constants[self.u2(start + 1)] + 3)]
+                node.name, node.desc = self.utf8(self.u2(name_and_type + 1)), self.utf8(self.u2(name_and_type + 3))
+                size = 5
+            elif opcode in (NEW, ANEWARRAY, CHECKCAST, INSTANCEOF):
+                node = Node(TYPE_INSN, opcode)
+                node.desc = self.class_name(self.u2(start + 1))
+                size = 3
+            elif opcode == 197:
+                node = Node(MULTIANEWARRAY_INSN, opcode)
+                node.desc = self.class_name(self.u2(start + 1))
+                node.operand = self.data[start + 3]
+                size = 4
+            elif opcode == 196:
+                # wide
+                opcode = self.data[start + 1]
+                if opcode == IINC:
+                    node = Node(IINC_INSN, opcode)
+                    node.var = self.u2(start + 2)
+                    node.operand = self.s2(start + 4)
+                    size = 6
+                else:
+                    node = Node(VAR_INSN, opcode)
+                    node.var = self.u2(start + 2)
+                    size = 4
+            elif opcode <= 201:
+                node = Node(INSN, opcode)
+                size = 1
+            else:
+                raise ClassFileError("unknown opcode %d" % opcode)
+            nodes.append((pc, node))
+            pc += size
+
+        offset = code_start + code_length
+        for _ in range(self.u2(offset)):
+            start_pc, end_pc, handler_pc, catch_type = struct.unpack_from(">HHHH", self.data, offset + 2)
+            try_catch_blocks.append(TryCatchBlock(get_label(start_pc), get_label(end_pc), get_label(handler_pc),
+                                                  self.class_name(catch_type)))
+            offset += 8
+        # the line numbers of each offset, in the order of the tables
+        lines: Dict[int, List[int]] = {}
+        frames = set()
+        for attribute_name, attribute_offset, length in self.read_attributes(offset + 2)[0]:
+            if attribute_name == 'LineNumberTable':
+                for i in range(self.u2(attribute_offset)):
+                    start_pc, line = struct.unpack_from(">HH", self.data, attribute_offset + 2 + 4 * i)
+                    if start_pc < code_length:
+                        get_label(start_pc)
+                        pc_lines = lines.setdefault(start_pc, [])
+                        # a first line number 0 is "no line number" for ASM, it is replaced by the next one
+                        if len(pc_lines) > 0 and pc_lines[0] == 0:
+                            pc_lines[0] = line
+                        else:
+                            pc_lines.append(line)
+            elif attribute_name in ('LocalVariableTable', 'LocalVariableTypeTable'):
+                for i in range(self.u2(attribute_offset)):
+                    start_pc, variable_length = struct.unpack_from(">HH", self.data, attribute_offset + 2 + 10 * i)
+                    get_label(start_pc)
+                    get_label(start_pc + variable_length)
+            elif attribute_name == 'StackMapTable':
+                self.read_frame_offsets(attribute_offset, frames, get_label)
+
+        for pc, node in nodes:
+            if pc in labels:
+                instructions.append(labels[pc])
+                for line in lines.get(pc, []):
+                    if line == 0 and lines[pc][0] == 0:
+                        break
+                    line_node = Node(LINE)
+                    line_node.line = line
+                    line_node.label = labels[pc]
+                    instructions.append(line_node)
+            if pc in frames:
+                instructions.append(Node(FRAME))
+            instructions.append(node)
+        if code_length in labels:
+            instructions.append(labels[code_length])
+        previous = None
+        for node in instructions:
+            node.previous = previous
+            node.next = None
+            if previous is not None:
+                previous.next = node
+            previous = node
+
+    def read_frame_offsets(self, offset: int, frames: set, get_label):
+        # the offsets of the frames of a StackMapTable, and the labels of the offsets of its uninitialized types
+
+        def skip_verification_type(type_offset: int):
+            tag = self.data[type_offset]
+            if tag == 8:
+                get_label(self.u2(type_offset + 1))
+            return type_offset + (3 if tag in (7, 8) else 1)
+
+        frame_offset = -1
+        entries = self.u2(offset)
+        offset += 2
+        for _ in range(entries):
+            frame_type = self.data[offset]
+            offset += 1
+            if frame_type < 64:
+                delta = frame_type
+            elif frame_type < 128:
+                delta = frame_type - 64
+                offset = skip_verification_type(offset)
+            else:
+                delta = self.u2(offset)
+                offset += 2
+                if frame_type == 247:
+                    offset = skip_verification_type(offset)
+                elif 252 <= frame_type <= 254:
+                    for _ in range(frame_type - 251):
+                        offset = skip_verification_type(offset)
+                elif frame_type == 255:
+                    for _ in range(2):
+                        count = self.u2(offset)
+                        offset += 2
+                        for _ in range(count):
+                            offset = skip_verification_type(offset)
+            frame_offset += delta + 1
+            frames.add(frame_offset)
+            get_label(frame_offset)
+
+
+def set_target(label: Node):
+    if label.target or label.successor:
+        label.multi_target = True
+    else:
+        label.target = True
+
+
+def set_successor(label: Node):
+    label.successor = True
+    if label.target:
+        label.multi_target = True
+
+
+def mark_labels(method: MethodInfo):
+    # LabelFlowAnalyzer of JaCoCo: marks the labels that are jump targets, successors of the previous instructions or
+    #   the starts of the lines with method invocations, i.e., the labels where the probes are inserted
+    for block in reversed(method.try_catch_blocks):
+        set_target(block.start)
+        set_target(block.handler)
+    successor = False
+    first = True
+    line_start = None
+    for node in method.instructions:
+        if node.type == LABEL:
+            if first:
+                set_target(node)
+            if successor:
+                set_successor(node)
+        elif node.type == LINE:
+            line_start = node.label
+        elif node.type == FRAME:
+            continue
+        elif node.type == JUMP_INSN:
+            if node.opcode == JSR:
+                # JaCoCo inlines the subroutines (of the class files before java 6) first
+                raise ClassFileError("subroutines are not supported")
+            set_target(node.label)
+            successor = node.opcode != GOTO
+            first = False
+        elif node.type == TABLESWITCH_INSN or node.type == LOOKUPSWITCH_INSN:
+            targets = [node.label] + node.labels
+            for label in targets:
+                label.done = False
+            for label in targets:
+                if not label.done:
+                    set_target(label)
+                    label.done = True
+            successor = False
+            first = False
+        else:
+            if node.opcode == RET:
+                raise ClassFileError("subroutines are not supported")
+            successor = node.type != INSN or not (IRETURN <= node.opcode <= RETURN or node.opcode == ATHROW)
+            first = False
+            if (node.type == METHOD_INSN or node.type == INVOKE_DYNAMIC_INSN) and line_start is not None:
+                line_start.method_invocation_line = True
+
+
+class Instruction:
+    # an instruction of the coverage analysis (Instruction of JaCoCo), where a covered branch is the set of the probes
+    #   (a bit mask of the probe ids of the class) whose execution covers it, instead of a flag: the analysis only ORs
+    #   the flags, so a branch is covered by the execution data iff one of its probes is executed
+    __slots__ = ('line', 'branches', 'covered_branches', 'probes', 'predecessor', 'predecessor_branch')
+
+    def __init__(self, line: int):
+        self.line = line
+        self.branches = 0
+        # branch -> the probes covering the branch
+        self.covered_branches: Dict[int, int] = {}
+        # the probes covering the instruction, i.e., any of its branches
+        self.probes = 0
+        self.predecessor: Optional[Instruction] = None
+        self.predecessor_branch = 0
+
+    def add_branch(self, target: 'Instruction', branch: int):
+        self.branches += 1
+        target.predecessor = self
+        target.predecessor_branch = branch
+        if target.probes != 0:
+            propagate_covered_branch(self, branch, target.probes)
+
+    def add_probe(self, probe_id: int, branch: int):
+        self.branches += 1
+        propagate_covered_branch(self, branch, 1 << probe_id)
+
+    def merge(self, other: 'Instruction'):
+        result = Instruction(self.line)
+        result.branches = self.branches
+        result.covered_branches = dict(self.covered_branches)
+        for branch, probes in other.covered_branches.items():
+            result.covered_branches[branch] = result.covered_branches.get(branch, 0) | probes
+        result.probes = self.probes | other.probes
+        return result
+
+    def replace_branches(self, targets: List['Instruction']):
+        # the number of the covered branches is the number of the covered targets
+        result = Instruction(self.line)
+        result.branches = len(targets)
+        for branch, target in enumerate(targets):
+            if target.probes != 0:
+                result.covered_branches[branch] = target.probes
+                result.probes |= target.probes
+        return result
+
+
+def propagate_covered_branch(insn: Optional[Instruction], branch: int, probes: int):
+    # the probes go up the predecessors until the instructions already covered by them
+    while insn is not None and probes != 0:
+        new_probes = probes & ~insn.probes
+        insn.covered_branches[branch] = insn.covered_branches.get(branch, 0) | probes
+        insn.probes |= probes
+        probes = new_probes
+        branch = insn.predecessor_branch
+        insn = insn.predecessor
+
+
+class InstructionsBuilder:
+
+    def __init__(self):
+        self.current_line = -1
+        self.current_insn: Optional[Instruction] = None
+        self.current_labels: List[Node] = []
+        # node -> instruction, in the order of the nodes
+        self.instructions: Dict[Node, Instruction] = {}
+        self.jumps: List = []
+
+    def add_label(self, label: Node):
+        self.current_labels.append(label)
+        if not label.successor:
+            self.current_insn = None
+
+    def add_instruction(self, node: Node):
+        insn = Instruction(self.current_line)
+        for label in self.current_labels:
+            label.instruction = insn
+        self.current_labels = []
+        if self.current_insn is not None:
+            self.current_insn.add_branch(insn, 0)
+        self.current_insn = insn
+        self.instructions[node] = insn
+
+    def add_jump(self, label: Node, branch: int):
+        self.jumps.append((self.current_insn, label, branch))
+
+    def add_probe(self, probe_id: int, branch: int):
+        self.current_insn.add_probe(probe_id, branch)
+
+    def get_instructions(self):
+        for insn, label, branch in self.jumps:
+            insn.add_branch(label.instruction, branch)
+        return self.instructions
+
+
+def build_instructions(method: MethodInfo, probe_id: int):
+    # the instructions of a method with their probes (MethodProbesAdapter and MethodAnalyzer of JaCoCo), and the next
+    #   probe id of the class
+    mark_labels(method)
+    builder = InstructionsBuilder()
+    for node in method.instructions:
+        if node.type == LABEL:
+            if node.successor and (node.multi_target or node.method_invocation_line):
+                builder.add_probe(probe_id, 0)
+                probe_id += 1
+                builder.current_insn = None
+            builder.add_label(node)
+        elif node.type == LINE:
+            builder.current_line = node.line
+        elif node.type == FRAME:
+            continue
+        elif node.type == JUMP_INSN:
+            builder.add_instruction(node)
+            if node.label.multi_target:
+                builder.add_probe(probe_id, 1)
+                probe_id += 1
+            else:
+                builder.add_jump(node.label, 1)
+        elif node.type == TABLESWITCH_INSN or node.type == LOOKUPSWITCH_INSN:
+            # a probe for each multi target label, if any
+            has_probes = False
+            for label in node.labels:
+                label.done = False
+            if node.label.multi_target:
+                node.label.probe_id = probe_id
+                probe_id += 1
+                has_probes = True
+            node.label.done = True
+            for label in node.labels:
+                if label.multi_target and not label.done:
+                    label.probe_id = probe_id
+                    probe_id += 1
+                    has_probes = True
+                label.done = True
+            builder.add_instruction(node)
+            if has_probes:
+                node.label.done = False
+                for label in node.labels:
+                    label.done = False
+                for branch, label in enumerate([node.label] + node.labels):
+                    if not label.done:
+                        if label.probe_id == -1:
+                            builder.add_jump(label, branch)
+                        else:
+                            builder.add_probe(label.probe_id, branch)
+                        label.done = True
+            else:
+                for label in node.labels:
+                    label.done = False
+                builder.add_jump(node.label, 0)
+                node.label.done = True
+                branch = 0
+                for label in node.labels:
+                    if not label.done:
+                        branch += 1
+                        builder.add_jump(label, branch)
+                        label.done = True
+        else:
+            builder.add_instruction(node)
+            if node.type == INSN and (IRETURN <= node.opcode <= RETURN or node.opcode == ATHROW):
+                builder.add_probe(probe_id, 0)
+                probe_id += 1
+    return builder.get_instructions(), probe_id
+
+
+class MethodCoverageCalculator:
+    # the output of the filters (IFilterOutput), i.e., the instructions to ignore, to merge and whose branches to
+    #   replace, then the instructions to count
+
+    def __init__(self, instructions: Dict[Node, Instruction]):
+        self.instructions = instructions
+        self.ignored = set()
+        # node -> the node it is merged into
+        self.merged: Dict[Node, Node] = {}
+        # node -> the nodes whose instructions replace its branches
+        self.replacements: Dict[Node, List[Node]] = {}
+
+    def ignore(self, from_node: Node, to_node: Node):
+        node = from_node
+        while node is not None and node is not to_node:
+            self.ignored.add(node)
+            node = node.next
+        self.ignored.add(to_node)
+
+    def ignore_method(self, method: MethodInfo):
+        if len(method.instructions) > 0:
+            self.ignore(method.instructions[0], method.instructions[-1])
+
+    def find_representative(self, node: Node):
+        while node in self.merged:
+            node = self.merged[node]
+        return node
+
+    def merge(self, node: Node, other: Node):
+        node = self.find_representative(node)
+        other = self.find_representative(other)
+        if node is not other:
+            self.merged[other] = node
+
+    def replace_branches(self, node: Node, targets: List[Node]):
+        # the targets are a set (of nodes)
+        self.replacements[node] = list(dict.fromkeys(targets))
+
+    def calculate(self) -> List[Instruction]:
+        for node in list(self.merged):
+            representative = self.find_representative(node)
+            self.ignored.add(node)
+            self.instructions[representative] = self.instructions[representative].merge(self.instructions[node])
+            self.merged[node] = representative
+        for node, representative in self.merged.items():
+            self.instructions[node] = self.instructions[representative]
+        for node, targets in self.replacements.items():
+            self.instructions[node] = self.instructions[node].replace_branches(
+                [self.instructions[target] for target in targets])
+        return [insn for node, insn in self.instructions.items() if node not in self.ignored]
+
+
+def get_first_node(method: MethodInfo):
+    # the filters are applied to the methods without code too
+    return method.instructions[0] if len(method.instructions) > 0 else None
+
+
+def skip_non_opcodes(node: Optional[Node]):
+    while node is not None and (node.type == LABEL or node.type == LINE or node.type == FRAME):
+        node = node.next
+    return node
+
+
+def get_argument_types(desc: str):
+    # the descriptors of the arguments of a method descriptor
+    types = []
+    index = 1
+    while desc[index] != ')':
+        start = index
+        while desc[index] == '[':
+            index += 1
+        if desc[index] == 'L':
+            index = desc.index(';', index)
+        index += 1
+        types.append(desc[start:index])
+    return types
+
+
+class FilterContext:
+    # the class of the filtered methods (IFilterContext), and the state of the filters in the class
+
+    def __init__(self, class_info: ClassInfo):
+        self.class_info = class_info
+        # see filter_kotlin_inline
+        self.first_generated_line_number = -1
+
+    def is_kotlin_class(self):
+        return "Lkotlin/Metadata;" in self.class_info.annotations
+
+    def is_scala_class(self):
+        return "ScalaSig" in self.class_info.attributes or "Scala" in self.class_info.attributes
+
+
+class Matcher:
+    # AbstractMatcher of JaCoCo: matches the instructions after the cursor, the cursor is None after a mismatch
+
+    def __init__(self):
+        self.cursor: Optional[Node] = None
+        # name -> the first instruction of the variable
+        self.vars: Dict[str, Node] = {}
+
+    def first_is_aload0(self, method: MethodInfo):
+        self.cursor = skip_non_opcodes(get_first_node(method))
+        if self.cursor is not None and (self.cursor.opcode != ALOAD or self.cursor.var != 0):
+            self.cursor = None
+
+    def next(self):
+        if self.cursor is not None:
+            self.cursor = skip_non_opcodes(self.cursor.next)
+
+    def next_is(self, opcode: int):
+        self.next()
+        if self.cursor is not None and self.cursor.opcode != opcode:
+            self.cursor = None
+
+    def next_is_var(self, opcode: int, name: str):
+        self.next_is(opcode)
+        if self.cursor is None:
+            return
+        var = self.vars.get(name)
+        if var is None:
+            self.vars[name] = self.cursor
+        elif var.var != self.cursor.var:
+            self.cursor = None
+
+    def next_is_type(self, opcode: int, desc: str):
+        self.next_is(opcode)
+        if self.cursor is not None and self.cursor.desc != desc:
+            self.cursor = None
+
+    def next_is_invoke(self, opcode: int, owner: str, name: str, desc: str):
+        self.next_is(opcode)
+        if self.cursor is not None and (self.cursor.owner != owner or self.cursor.name != name or
+                                        self.cursor.desc != desc):
+            self.cursor = None
+
+    def next_is_switch(self):
+        self.next()
+        if self.cursor is not None and self.cursor.opcode != TABLESWITCH and self.cursor.opcode != LOOKUPSWITCH:
+            self.cursor = None
+
+
+def filter_enum(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    # the values() and valueOf() methods of the enums
+    class_name = context.class_info.name
+    if context.class_info.super_name == "java/lang/Enum" and (
+            (method.name == "values" and method.desc == "()[L%s;" % class_name) or
+            (method.name == "valueOf" and method.desc == "(Ljava/lang/String;)L%s;" % class_name)):
+        output.ignore_method(method)
+
+
+def filter_synthetic(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    if method.access & ACC_SYNTHETIC == 0 or method.name.startswith("lambda$"):
+        return
+    if context.is_scala_class() and method.name.startswith("$anonfun$"):
+        return
+    if context.is_kotlin_class() and (is_kotlin_default_arguments_method(method) or
+                                      is_kotlin_default_arguments_constructor(method) or
+                                      is_last_argument_continuation(method)):
+        return
+    output.ignore_method(method)
+
+
+def filter_synchronized(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    # the exception handlers releasing the monitors of the synchronized blocks
+    for block in method.try_catch_blocks:
+        if block.type is not None or block.start is block.handler:
+            continue
+        matcher = Matcher()
+        # ecj
+        matcher.cursor = block.handler
+        matcher.next_is(ALOAD)
+        matcher.next_is(MONITOREXIT)
+        matcher.next_is(ATHROW)
+        if matcher.cursor is None:
+            # javac
+            matcher.cursor = block.handler
+            matcher.next_is_var(ASTORE, "t")
+            matcher.next_is(ALOAD)
+            matcher.next_is(MONITOREXIT)
+            matcher.next_is_var(ALOAD, "t")
+            matcher.next_is(ATHROW)
+        if matcher.cursor is not None:
+            output.ignore(block.handler, matcher.cursor)
+
+
+class TryWithResourcesMatcher(Matcher):
+    # the closing of the resources of the try-with-resources statements
+
+    def __init__(self):
+        super().__init__()
+        self.expected_owner: Optional[str] = None
+
+    def next_is_close(self):
+        self.next_is_var(ALOAD, "r")
+        self.next()
+        if self.cursor is None:
+            return
+        if self.cursor.opcode != INVOKEINTERFACE and self.cursor.opcode != INVOKEVIRTUAL:
+            self.cursor = None
+            return
+        if self.cursor.name != "close" or self.cursor.desc != "()V":
+            self.cursor = None
+            return
+        if self.expected_owner is None:
+            self.expected_owner = self.cursor.owner
+        elif self.expected_owner != self.cursor.owner:
+            self.cursor = None
+
+    def ignore_close_and_handler(self, start: Node, end: Node, output: MethodCoverageCalculator, next_is_close):
+        # the closing of the resource in the body of the statement, before the handler from start to end
+        node = start.previous
+        self.cursor = node
+        while not next_is_close():
+            node = node.previous
+            self.cursor = node
+            if self.cursor is None:
+                return False
+        node = node.next
+        close_end = self.cursor
+        self.next()
+        if self.cursor is None or self.cursor.opcode != GOTO:
+            self.cursor = close_end
+        output.ignore(node, self.cursor)
+        output.ignore(start, end)
+        return True
+
+
+class TryWithResourcesJavac11Matcher(TryWithResourcesMatcher):
+
+    def __init__(self):
+        super().__init__()
+        self.with_null_check = False
+
+    def next_is_javac_close(self):
+        if self.with_null_check:
+            self.next_is_var(ALOAD, "r")
+            self.next_is(IFNULL)
+        self.next_is_close()
+        return self.cursor is not None
+
+    def match(self, start: Node, output: MethodCoverageCalculator, with_null_check: bool):
+        self.with_null_check = with_null_check
+        self.vars.clear()
+        self.expected_owner = None
+        self.cursor = start.previous
+        self.next_is_var(ASTORE, "primaryExc")
+        self.next_is_javac_close()
+        self.next_is(GOTO)
+        self.next_is_var(ASTORE, "t")
+        self.next_is_var(ALOAD, "primaryExc")
+        self.next_is_var(ALOAD, "t")
+        self.next_is_invoke(INVOKEVIRTUAL, "java/lang/Throwable", "addSuppressed", "(Ljava/lang/Throwable;)V")
+        self.next_is_var(ALOAD, "primaryExc")
+        self.next_is(ATHROW)
+        if self.cursor is None:
+            return
+        self.ignore_close_and_handler(start, self.cursor, output, self.next_is_javac_close)
+
+
+def filter_try_with_resources_javac11(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    if len(method.try_catch_blocks) == 0:
+        return
+    matcher = TryWithResourcesJavac11Matcher()
+    for block in method.try_catch_blocks:
+        if block.type == "java/lang/Throwable":
+            matcher.match(block.handler, output, True)
+            matcher.match(block.handler, output, False)
+
+
+# the patterns of javac 7 to 10 (in the order of TryWithResourcesJavacFilter)
+JAVAC_OPTIMAL, JAVAC_FULL, JAVAC_OMITTED_NULL_CHECK, JAVAC_METHOD = range(4)
+
+
+class TryWithResourcesJavacMatcher(TryWithResourcesMatcher):
+
+    def start(self, start: Node):
+        self.start_node = start
+        self.cursor = start.previous
+        self.vars.clear()
+        self.expected_owner = None
+
+    def next_is_javac_close(self, pattern: int, ctx: str):
+        if pattern == JAVAC_METHOD or pattern == JAVAC_FULL:
+            self.next_is_var(ALOAD, "r")
+            self.next_is(IFNULL)
+        if pattern == JAVAC_METHOD or pattern == JAVAC_OPTIMAL:
+            self.next_is_var(ALOAD, "primaryExc")
+            self.next_is_var(ALOAD, "r")
+            self.next_is(INVOKESTATIC)
+            if self.cursor is None:
+                return False
+            if self.cursor.name == "$closeResource" and \
+                    self.cursor.desc == "(Ljava/lang/Throwable;Ljava/lang/AutoCloseable;)V":
+                return True
+            self.cursor = None
+            return False
+        self.next_is_var(ALOAD, "primaryExc")
+        self.next_is(IFNULL)
+        self.next_is_close()
+        self.next_is(GOTO)
+        self.next_is_var(ASTORE, ctx + "t")
+        self.next_is_var(ALOAD, "primaryExc")
+        self.next_is_var(ALOAD, ctx + "t")
+        self.next_is_invoke(INVOKEVIRTUAL, "java/lang/Throwable", "addSuppressed", "(Ljava/lang/Throwable;)V")
+        self.next_is(GOTO)
+        self.next_is_close()
+        return self.cursor is not None
+
+    def match_javac(self, pattern: int, output: MethodCoverageCalculator):
+        self.next_is_var(ASTORE, "t1")
+        self.next_is_var(ALOAD, "t1")
+        self.next_is_var(ASTORE, "primaryExc")
+        self.next_is_var(ALOAD, "t1")
+        self.next_is(ATHROW)
+        self.next_is_var(ASTORE, "t2")
+        self.next_is_javac_close(pattern, "e")
+        self.next_is_var(ALOAD, "t2")
+        self.next_is(ATHROW)
+        if self.cursor is None:
+            return False
+        return self.ignore_close_and_handler(self.start_node, self.cursor, output,
+                                             lambda: self.next_is_javac_close(pattern, "n"))
+
+
+def filter_try_with_resources_javac(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    if len(method.try_catch_blocks) == 0:
+        return
+    matcher = TryWithResourcesJavacMatcher()
+    for block in method.try_catch_blocks:
+        if block.type == "java/lang/Throwable":
+            for pattern in (JAVAC_OPTIMAL, JAVAC_FULL, JAVAC_OMITTED_NULL_CHECK, JAVAC_METHOD):
+                matcher.start(block.handler)
+                if matcher.match_javac(pattern, output):
+                    break
+
+
+class TryWithResourcesEcjMatcher(Matcher):
+
+    def __init__(self, output: MethodCoverageCalculator):
+        super().__init__()
+        self.output = output
+        self.start_node: Optional[Node] = None
+        # name -> the owner of the close() method of the resource
+        self.owners: Dict[str, str] = {}
+        # name -> label
+        self.labels: Dict[str, Node] = {}
+
+    def start(self, start: Node):
+        self.start_node = start
+        self.cursor = start.previous
+        self.vars.clear()
+        self.labels.clear()
+        self.owners.clear()
+
+    def match_ecj(self):
+        # the primary exception, then the close of the resources in the reverse order, then the rethrow
+        self.next_is_var(ASTORE, "primaryExc")
+        self.next_is_ecj_close_and_throw("r0")
+        i = 1
+        name = "r%d" % i
+        close_end = self.cursor
+        while self.next_is_ecj_close(name):
+            self.next_is_jump(GOTO, name + ".end")
+            self.next_is_ecj_suppress(name)
+            self.next_is_ecj_close_and_throw(name)
+            i += 1
+            name = "r%d" % i
+            close_end = self.cursor
+        self.cursor = close_end
+        self.next_is_ecj_suppress("last")
+        self.next_is_var(ALOAD, "primaryExc")
+        self.next_is(ATHROW)
+        if self.cursor is None:
+            return False
+        end = self.cursor
+        node = self.start_node.previous
+        self.cursor = node
+        while not self.next_is_ecj_close("r0"):
+            node = node.previous
+            self.cursor = node
+            if self.cursor is None:
+                return False
+        node = node.next
+        self.next()
+        if self.cursor is None or self.cursor.opcode != GOTO:
+            return False
+        self.output.ignore(node, self.cursor)
+        self.output.ignore(self.start_node, end)
+        return True
+
+    def match_ecj_no_flow_out(self):
+        self.next_is_var(ASTORE, "primaryExc")
+        i = 0
+        name = "r%d" % i
+        close_end = self.cursor
+        while self.next_is_ecj_close_and_throw(name) and self.next_is_ecj_suppress(name):
+            i += 1
+            name = "r%d" % i
+            close_end = self.cursor
+        self.cursor = close_end
+        self.next_is_var(ALOAD, "primaryExc")
+        self.next_is(ATHROW)
+        if self.cursor is None:
+            return False
+        end = self.cursor
+        node = self.start_node.previous
+        self.cursor = node
+        while not self.next_is_ecj_close("r0"):
+            node = node.previous
+            self.cursor = node
+            if self.cursor is None:
+                return False
+        node = node.next
+        for j in range(1, i):
+            if not self.next_is_ecj_close("r%d" % j):
+                return False
+        self.output.ignore(node, self.cursor)
+        self.output.ignore(self.start_node, end)
+        return True
+
+    def next_is_ecj_close(self, name: str):
+        self.next_is_var(ALOAD, name)
+        self.next_is_jump(IFNULL, name + ".end")
+        self.next_is_close(name)
+        return self.cursor is not None
+
+    def next_is_ecj_close_and_throw(self, name: str):
+        self.next_is_var(ALOAD, name)
+        self.next_is_jump(IFNULL, name)
+        self.next_is_close(name)
+        self.next_is_label(name)
+        self.next_is_var(ALOAD, "primaryExc")
+        self.next_is(ATHROW)
+        return self.cursor is not None
+
+    def next_is_ecj_suppress(self, name: str):
+        suppressed = name + ".t"
+        suppress_start = name + ".suppressStart"
+        suppress_end = name + ".suppressEnd"
+        self.next_is_var(ASTORE, suppressed)
+        self.next_is_var(ALOAD, "primaryExc")
+        self.next_is_jump(IFNONNULL, suppress_start)
+        self.next_is_var(ALOAD, suppressed)
+        self.next_is_var(ASTORE, "primaryExc")
+        self.next_is_jump(GOTO, suppress_end)
+        self.next_is_label(suppress_start)
+        self.next_is_var(ALOAD, "primaryExc")
+        self.next_is_var(ALOAD, suppressed)
+        self.next_is_jump(IF_ACMPEQ, suppress_end)
+        self.next_is_var(ALOAD, "primaryExc")
+        self.next_is_var(ALOAD, suppressed)
+        self.next_is_invoke(INVOKEVIRTUAL, "java/lang/Throwable", "addSuppressed", "(Ljava/lang/Throwable;)V")
+        self.next_is_label(suppress_end)
+        return self.cursor is not None
+
+    def next_is_close(self, name: str):
+        self.next_is_var(ALOAD, name)
+        self.next()
+        if self.cursor is None:
+            return
+        if self.cursor.opcode != INVOKEINTERFACE and self.cursor.opcode != INVOKEVIRTUAL:
+            self.cursor = None
+            return
+        if self.cursor.name != "close" or self.cursor.desc != "()V":
+            self.cursor = None
+            return
+        owner = self.owners.get(name)
+        if owner is None:
+            self.owners[name] = self.cursor.owner
+        elif owner != self.cursor.owner:
+            self.cursor = None
+
+    def next_is_jump(self, opcode: int, name: str):
+        self.next_is(opcode)
+        if self.cursor is None:
+            return
+        label = self.labels.get(name)
+        if label is None:
+            self.labels[name] = self.cursor.label
+        elif label is not self.cursor.label:
+            self.cursor = None
+
+    def next_is_label(self, name: str):
+        if self.cursor is None:
+            return
+        self.cursor = self.cursor.next
+        if self.cursor is None or self.cursor.type != LABEL:
+            self.cursor = None
+            return
+        if self.labels.get(name) is not self.cursor:
+            self.cursor = None
+
+
+def filter_try_with_resources_ecj(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    if len(method.try_catch_blocks) == 0:
+        return
+    matcher = TryWithResourcesEcjMatcher(output)
+    for block in method.try_catch_blocks:
+        if block.type is None:
+            matcher.start(block.handler)
+            if not matcher.match_ecj():
+                matcher.start(block.handler)
+                matcher.match_ecj_no_flow_out()
+
+
+def next_opcode(node: Node):
+    return skip_non_opcodes(node.next)
+
+
+def get_finally_size(node: Optional[Node]):
+    # the size of the finally block of a handler "astore t; <finally block>; aload t; athrow", 0 if not one
+    if node is None or node.opcode != ASTORE:
+        return 0
+    var = node.var
+    size = -1
+    while True:
+        size += 1
+        node = next_opcode(node)
+        if node is None:
+            return 0
+        if node.opcode == ALOAD and node.var == var:
+            break
+    node = next_opcode(node)
+    if node is None or node.opcode != ATHROW:
+        return 0
+    return size
+
+
+def is_same_finally(size: int, node: Node, other: Optional[Node]):
+    node = next_opcode(node)
+    for _ in range(size):
+        if other is None or node.opcode != other.opcode:
+            return False
+        node = next_opcode(node)
+        other = next_opcode(other)
+    return True
+
+
+def merge_finally(output: MethodCoverageCalculator, size: int, node: Node, other: Optional[Node]):
+    # merges the duplicate of the finally block at other into the one of the handler at node
+    if not is_same_finally(size, node, other):
+        return
+    output.ignore(node, node)
+    node = next_opcode(node)
+    for _ in range(size):
+        output.merge(node, other)
+        node = next_opcode(node)
+        other = next_opcode(other)
+    output.ignore(node, next_opcode(node))
+    if other is not None and other.opcode == GOTO:
+        output.ignore(other, other)
+
+
+def filter_finally(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    # the copies of the finally blocks of javac and ecj are merged into the one of their handler
+    for block in method.try_catch_blocks:
+        if block.type is not None:
+            continue
+        first = next_opcode(block.handler)
+        size = get_finally_size(first)
+        if size <= 0:
+            continue
+        inside = set()
+        for other_block in method.try_catch_blocks:
+            if other_block.handler is block.handler:
+                node = other_block.start
+                while node is not None and node is not other_block.end:
+                    inside.add(node)
+                    node = node.next
+        for other_block in method.try_catch_blocks:
+            if other_block.handler is block.handler:
+                continues = False
+                node = other_block.start
+                while node is not None and node is not other_block.end:
+                    if node.type == JUMP_INSN:
+                        target = next_opcode(node.label)
+                        if target not in inside:
+                            merge_finally(output, size, first, target)
+                        continues = node.opcode != GOTO
+                    elif node.type != LABEL and node.type != FRAME and node.type != LINE:
+                        continues = not (IRETURN <= node.opcode <= RETURN or node.opcode == ATHROW)
+                    node = node.next
+                if node is not None:
+                    node = next_opcode(node)
+                if continues and node not in inside:
+                    merge_finally(output, size, first, node)
+            if other_block is not block and other_block.start is block.start and other_block.end is block.end:
+                node = next_opcode(next_opcode(other_block.handler))
+                if node not in inside:
+                    merge_finally(output, size, first, node)
+
+
+def filter_private_empty_no_arg_constructor(method: MethodInfo, context: FilterContext,
+                                            output: MethodCoverageCalculator):
+    if method.access & ACC_PRIVATE != 0 and method.name == "<init>" and method.desc == "()V":
+        matcher = Matcher()
+        matcher.first_is_aload0(method)
+        matcher.next_is_invoke(INVOKESPECIAL, context.class_info.super_name, "<init>", "()V")
+        matcher.next_is(RETURN)
+        if matcher.cursor is not None:
+            output.ignore_method(method)
+
+
+def match_javac_string_switch(start: Node, second_switch_label: Node):
+    # the hashCode switch of javac, which sets the index of the case of the second switch
+    matcher = Matcher()
+    matcher.cursor = start
+    for _ in range(4):
+        if matcher.cursor is None:
+            break
+        matcher.cursor = matcher.cursor.previous
+    if matcher.cursor is None or matcher.cursor.opcode != OPCODES['iconst_m1']:
+        return False
+    matcher.next_is_var(ISTORE, "c")
+    matcher.next_is_var(ALOAD, "s")
+    matcher.next_is_invoke(INVOKEVIRTUAL, "java/lang/String", "hashCode", "()I")
+    matcher.next()
+    while True:
+        matcher.next_is_var(ALOAD, "s")
+        matcher.next_is(LDC)
+        matcher.next_is_invoke(INVOKEVIRTUAL, "java/lang/String", "equals", "(Ljava/lang/Object;)Z")
+        matcher.next_is(IFEQ)
+        matcher.next()
+        matcher.next_is_var(ISTORE, "c")
+        if matcher.cursor is None:
+            return False
+        if matcher.cursor.next is second_switch_label:
+            break
+        matcher.next_is(GOTO)
+        if matcher.cursor is None or matcher.cursor.label is not second_switch_label:
+            return False
+    matcher.next_is_var(ILOAD, "c")
+    matcher.next_is_switch()
+    return matcher.cursor is not None
+
+
+def filter_string_switch_javac(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    for node in method.instructions:
+        if node.opcode == LOOKUPSWITCH or node.opcode == TABLESWITCH:
+            if match_javac_string_switch(node, node.label):
+                output.ignore(node, node.label)
+
+
+def match_string_switch(matcher: Matcher, start: Node, output: MethodCoverageCalculator, kotlin: bool):
+    # the hashCode switch of ecj and kotlin, whose branches are replaced by the ones of the equals() checks of each
+    #   hash code
+    matcher.cursor = start
+    matcher.next_is_invoke(INVOKEVIRTUAL, "java/lang/String", "hashCode", "()I")
+    matcher.next_is_switch()
+    if matcher.cursor is None:
+        return
+    matcher.vars["s"] = start
+    switch = matcher.cursor
+    default_label = switch.label
+    hash_codes = len(switch.labels)
+    if kotlin and hash_codes == 0:
+        return
+    replacements = [skip_non_opcodes(default_label)]
+    if not kotlin and hash_codes == 0:
+        return
+    for _ in range(hash_codes):
+        while True:
+            matcher.next_is_var(ALOAD, "s")
+            matcher.next_is(LDC)
+            matcher.next_is_invoke(INVOKEVIRTUAL, "java/lang/String", "equals", "(Ljava/lang/Object;)Z")
+            if kotlin:
+                matcher.next_is(IFEQ)
+                jump = matcher.cursor
+                matcher.next_is(GOTO)
+                if matcher.cursor is None:
+                    return
+                replacements.append(skip_non_opcodes(matcher.cursor.label))
+                if jump.label is default_label:
+                    break
+            else:
+                matcher.next_is(IFNE)
+                if matcher.cursor is None:
+                    return
+                replacements.append(skip_non_opcodes(matcher.cursor.label))
+                if matcher.cursor.next is None:
+                    return
+                if matcher.cursor.next.opcode == GOTO:
+                    matcher.next_is(GOTO)
+                    break
+                if matcher.cursor.next is default_label:
+                    break
+    output.ignore(switch.next, matcher.cursor)
+    output.replace_branches(switch, replacements)
+
+
+def filter_string_switch_ecj(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    matcher = Matcher()
+    for node in method.instructions:
+        if node.opcode == ASTORE:
+            match_string_switch(matcher, node, output, False)
+
+
+def filter_enum_empty_constructor(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    if context.class_info.super_name == "java/lang/Enum" and method.name == "<init>" and \
+            method.desc == "(Ljava/lang/String;I)V":
+        matcher = Matcher()
+        matcher.first_is_aload0(method)
+        matcher.next_is(ALOAD)
+        matcher.next_is(ILOAD)
+        matcher.next_is_invoke(INVOKESPECIAL, "java/lang/Enum", "<init>", "(Ljava/lang/String;I)V")
+        matcher.next_is(RETURN)
+        if matcher.cursor is not None:
+            output.ignore_method(method)
+
+
+def is_generated_annotation(desc: str):
+    return "Generated" in desc[max(desc.rfind('/'), desc.rfind('$')) + 1:]
+
+
+def filter_annotation_generated(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    # the classes and the methods annotated with an annotation whose simple name contains "Generated"
+    if any(is_generated_annotation(desc) for desc in context.class_info.annotations + method.annotations):
+        output.ignore_method(method)
+
+
+def filter_kotlin_generated(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    # the methods of the kotlin classes without line numbers
+    if context.class_info.source_file is None or not context.is_kotlin_class():
+        return
+    if any(node.type == LINE for node in method.instructions):
+        return
+    output.ignore_method(method)
+
+
+def filter_kotlin_lateinit(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    matcher = Matcher()
+    for node in method.instructions:
+        if node.opcode != IFNONNULL:
+            continue
+        matcher.cursor = node
+        matcher.next_is(LDC)
+        matcher.next_is_invoke(INVOKESTATIC, "kotlin/jvm/internal/Intrinsics",
+                               "throwUninitializedPropertyAccessException", "(Ljava/lang/String;)V")
+        if matcher.cursor is not None:
+            output.ignore(node, matcher.cursor)
+
+
+def filter_kotlin_when(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    # the throws of NoWhenBranchMatchedException, and the jumps or the default branches of the switches to them
+    matcher = Matcher()
+    for node in method.instructions:
+        if node.type != LABEL:
+            continue
+        matcher.cursor = node
+        matcher.next_is_type(NEW, "kotlin/NoWhenBranchMatchedException")
+        matcher.next_is(DUP)
+        matcher.next_is_invoke(INVOKESPECIAL, "kotlin/NoWhenBranchMatchedException", "<init>", "()V")
+        matcher.next_is(ATHROW)
+        other = matcher.cursor
+        while other is not None:
+            if other.opcode == IFEQ and other.label is node:
+                output.ignore(other, other)
+                output.ignore(node, matcher.cursor)
+                break
+            if (other.opcode == TABLESWITCH or other.opcode == LOOKUPSWITCH) and other.label is node:
+                output.replace_branches(other, [skip_non_opcodes(label) for label in other.labels])
+                output.ignore(node, matcher.cursor)
+                break
+            other = other.previous
+
+
+def filter_kotlin_when_string(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    matcher = Matcher()
+    for node in method.instructions:
+        if node.opcode == ALOAD:
+            match_string_switch(matcher, node, output, True)
+
+
+def filter_kotlin_unsafe_cast_operator(method: MethodInfo, context: FilterContext,
+                                       output: MethodCoverageCalculator):
+    matcher = Matcher()
+    for node in method.instructions:
+        if node.opcode != IFNONNULL:
+            continue
+        matcher.cursor = node
+        matcher.next_is_type(NEW, "kotlin/TypeCastException")
+        matcher.next_is(DUP)
+        matcher.next_is(LDC)
+        if matcher.cursor is None or not isinstance(matcher.cursor.cst, str) or \
+                not matcher.cursor.cst.startswith("null cannot be cast to non-null type"):
+            continue
+        matcher.next_is_invoke(INVOKESPECIAL, "kotlin/TypeCastException", "<init>", "(Ljava/lang/String;)V")
+        matcher.next_is(ATHROW)
+        if matcher.cursor is not None and matcher.cursor.next is node.label:
+            output.ignore(node, matcher.cursor)
+
+
+def filter_kotlin_not_null_operator(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    matcher = Matcher()
+    for node in method.instructions:
+        if node.opcode != IFNONNULL:
+            continue
+        matcher.cursor = node
+        matcher.next_is_invoke(INVOKESTATIC, "kotlin/jvm/internal/Intrinsics", "throwNpe", "()V")
+        if matcher.cursor is not None:
+            output.ignore(node, matcher.cursor)
+
+
+def is_kotlin_default_arguments_method(method: MethodInfo):
+    return method.name.endswith("$default")
+
+
+def is_kotlin_default_arguments_constructor(method: MethodInfo):
+    if method.name != "<init>":
+        return False
+    argument_types = get_argument_types(method.desc)
+    return len(argument_types) >= 2 and argument_types[-1] == "Lkotlin/jvm/internal/DefaultConstructorMarker;"
+
+
+def is_last_argument_continuation(method: MethodInfo):
+    argument_types = get_argument_types(method.desc)
+    return len(argument_types) > 0 and argument_types[-1] == "Lkotlin/coroutines/Continuation;"
+
+
+def filter_kotlin_default_arguments(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    # the checks of the bits of the mask of the default arguments
+    if method.access & ACC_SYNTHETIC == 0 or not context.is_kotlin_class():
+        return
+    if is_kotlin_default_arguments_method(method):
+        constructor = False
+    elif is_kotlin_default_arguments_constructor(method):
+        constructor = True
+    else:
+        return
+    first = get_first_node(method)
+    matcher = Matcher()
+    matcher.cursor = first
+    matcher.next_is(IFNULL)
+    matcher.next_is_type(NEW, "java/lang/UnsupportedOperationException")
+    matcher.next_is(DUP)
+    matcher.next_is(LDC)
+    if matcher.cursor is None or not isinstance(matcher.cursor.cst, str) or \
+            not matcher.cursor.cst.startswith("Super calls with default arguments not supported in this target"):
+        matcher.cursor = None
+    matcher.next_is_invoke(INVOKESPECIAL, "java/lang/UnsupportedOperationException", "<init>",
+                           "(Ljava/lang/String;)V")
+    matcher.next_is(ATHROW)
+    if matcher.cursor is not None:
+        output.ignore(first, matcher.cursor)
+        matcher.next()
+    else:
+        matcher.cursor = first
+    # the mask is the argument before the last one
+    mask_var = 1 if constructor else 0
+    mask_var += sum(2 if argument_type in ("J", "D") else 1 for argument_type in get_argument_types(method.desc)[:-2])
+    ignored = []
+    while matcher.cursor is not None and matcher.cursor.opcode == ILOAD and matcher.cursor.var == mask_var:
+        matcher.next()
+        matcher.next_is(OPCODES['iand'])
+        matcher.next_is(IFEQ)
+        if matcher.cursor is None:
+            return
+        ignored.append(matcher.cursor)
+        matcher.cursor = skip_non_opcodes(matcher.cursor.label)
+    for node in ignored:
+        output.ignore(node, node)
+
+
+# the line and file sections of the kotlin SMAP (in the SourceDebugExtension attribute)
+KOTLIN_SMAP_FILE_INFO = re.compile(r"\+ ([0-9]+) (.+)")
+KOTLIN_SMAP_LINE_INFO = re.compile(r"([0-9]+)(#[0-9]+)?(,[0-9]+)?:([0-9]+)(,[0-9]+)?")
+
+
+def get_kotlin_first_generated_line_number(source_file: str, smap: str):
+    # the first line number of the code inlined from the other files (or other lines of the same file)
+    lines = iter(smap.splitlines())
+
+    def expect_line(expected: Optional[str]):
+        line = next(lines, None)
+        if expected is not None and line != expected:
+            raise ClassFileError("Unexpected SMAP line: %s" % line)
+
+    expect_line("SMAP")
+    expect_line(source_file)
+    expect_line("Kotlin")
+    expect_line("*S Kotlin")
+    expect_line("*F")
+    file_ids = set()
+    while True:
+        line = next(lines, None)
+        if line == "*L":
+            break
+        expect_line(None)
+        m = KOTLIN_SMAP_FILE_INFO.fullmatch(line or "")
+        if m is None:
+            raise ClassFileError("Unexpected SMAP line: %s" % line)
+        if m.group(2) == source_file:
+            file_ids.add(int(m.group(1)))
+    if len(file_ids) == 0:
+        raise ClassFileError("Unexpected SMAP FileSection")
+    first_generated_line_number = 2147483647
+    while True:
+        line = next(lines, None)
+        if line == "*E":
+            break
+        m = KOTLIN_SMAP_LINE_INFO.fullmatch(line or "")
+        if m is None or m.group(2) is None:
+            raise ClassFileError("Unexpected SMAP line: %s" % line)
+        input_start_line = int(m.group(1))
+        output_start_line = int(m.group(4))
+        if int(m.group(2)[1:]) in file_ids and input_start_line == output_start_line:
+            continue
+        first_generated_line_number = min(output_start_line, first_generated_line_number)
+    return first_generated_line_number
+
+
+def filter_kotlin_inline(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    # the code inlined by the kotlin compiler, i.e., the lines after the lines of the source file in the SMAP
+    if context.class_info.source_debug_extension is None or not context.is_kotlin_class():
+        return
+    if context.first_generated_line_number == -1:
+        context.first_generated_line_number = get_kotlin_first_generated_line_number(
+            context.class_info.source_file, context.class_info.source_debug_extension)
+    line = 0
+    for node in method.instructions:
+        if node.type == LINE:
+            line = node.line
+        if line >= context.first_generated_line_number:
+            output.ignore(node, node)
+
+
+class KotlinCoroutineMatcher(Matcher):
+
+    def next_is_throw_on_failure(self):
+        start = self.cursor
+        self.next_is_invoke(INVOKESTATIC, "kotlin/ResultKt", "throwOnFailure", "(Ljava/lang/Object;)V")
+        if self.cursor is not None:
+            return
+        self.cursor = start
+        self.next_is(DUP)
+        self.next_is_type(INSTANCEOF, "kotlin/Result$Failure")
+        self.next_is(IFEQ)
+        self.next_is_type(CHECKCAST, "kotlin/Result$Failure")
+        self.next_is(GETFIELD)
+        self.next_is(ATHROW)
+        self.next_is(POP)
+
+    def next_is_create_state_instance(self):
+        self.next_is(INSTANCEOF)
+        self.next_is(IFEQ)
+        if self.cursor is None:
+            return
+        create_state_instance = skip_non_opcodes(self.cursor.label)
+        self.next_is(ALOAD)
+        self.next_is(CHECKCAST)
+        self.next_is(ASTORE)
+        self.next_is(ALOAD)
+        self.next_is(GETFIELD)
+        self.next_is(LDC)
+        self.next_is(OPCODES['iand'])
+        self.next_is(IFEQ)
+        if self.cursor is None or skip_non_opcodes(self.cursor.label) is not create_state_instance:
+            return
+        self.next_is(ALOAD)
+        self.next_is(DUP)
+        self.next_is(GETFIELD)
+        self.next_is(LDC)
+        self.next_is(OPCODES['isub'])
+        self.next_is(PUTFIELD)
+        self.next_is(GOTO)
+        if self.cursor is None:
+            return
+        continuation_after_created = skip_non_opcodes(self.cursor.label)
+        if skip_non_opcodes(self.cursor.next) is not create_state_instance:
+            return
+        self.cursor = continuation_after_created
+        self.next_is(GETFIELD)
+        self.next_is(ASTORE)
+
+    def match(self, method: MethodInfo, output: MethodCoverageCalculator):
+        # the state machine of a suspending function: the switch on the label of the continuation, the checks of
+        #   the results and the COROUTINE_SUSPENDED returns of the suspension points
+        first = get_first_node(method)
+        self.cursor = first
+        self.next_is_invoke(INVOKESTATIC, "kotlin/coroutines/intrinsics/IntrinsicsKt", "getCOROUTINE_SUSPENDED",
+                            "()Ljava/lang/Object;")
+        if self.cursor is None:
+            self.cursor = skip_non_opcodes(first)
+            self.next_is_create_state_instance()
+            self.next_is_invoke(INVOKESTATIC, "kotlin/coroutines/intrinsics/IntrinsicsKt",
+                                "getCOROUTINE_SUSPENDED", "()Ljava/lang/Object;")
+        self.next_is_var(ASTORE, "COROUTINE_SUSPENDED")
+        self.next_is_var(ALOAD, "this")
+        self.next_is(GETFIELD)
+        self.next_is(TABLESWITCH)
+        if self.cursor is None:
+            return
+        switch = self.cursor
+        ignore = []
+        self.next_is(ALOAD)
+        self.next_is_throw_on_failure()
+        if self.cursor is None:
+            return
+        ignore.append((first, self.cursor))
+        suspension_point = 1
+        node = self.cursor
+        while node is not None and suspension_point < len(switch.labels):
+            self.cursor = node
+            self.next_is_var(ALOAD, "COROUTINE_SUSPENDED")
+            self.next_is(IF_ACMPNE)
+            if self.cursor is None:
+                node = node.next
+                continue
+            continuation_label = skip_non_opcodes(self.cursor.label)
+            self.next_is_var(ALOAD, "COROUTINE_SUSPENDED")
+            self.next_is(OPCODES['areturn'])
+            if self.cursor is None or skip_non_opcodes(self.cursor.next) is not \
+                    skip_non_opcodes(switch.labels[suspension_point]):
+                node = node.next
+                continue
+            other = node
+            while other is not None:
+                self.cursor = other
+                self.next_is(ALOAD)
+                self.next_is_throw_on_failure()
+                self.next_is(ALOAD)
+                if self.cursor is not None and skip_non_opcodes(self.cursor.next) is continuation_label:
+                    ignore.append((node, self.cursor))
+                    suspension_point += 1
+                    break
+                other = other.next
+            node = node.next
+        self.cursor = switch.label
+        self.next_is_type(NEW, "java/lang/IllegalStateException")
+        self.next_is(DUP)
+        self.next_is(LDC)
+        if self.cursor is None or self.cursor.cst != "call to 'resume' before 'invoke' with coroutine":
+            return
+        self.next_is_invoke(INVOKESPECIAL, "java/lang/IllegalStateException", "<init>", "(Ljava/lang/String;)V")
+        self.next_is(ATHROW)
+        if self.cursor is None:
+            return
+        output.ignore(switch.label, self.cursor)
+        for from_node, to_node in ignore:
+            output.ignore(from_node, to_node)
+
+
+def filter_kotlin_coroutine(method: MethodInfo, context: FilterContext, output: MethodCoverageCalculator):
+    if context.is_kotlin_class():
+        KotlinCoroutineMatcher().match(method, output)
+
+
+# the filters of JaCoCo 0.8.5 (Filters.all), in order
+FILTERS = [filter_enum, filter_synthetic, filter_synchronized, filter_try_with_resources_javac11,
+           filter_try_with_resources_javac, filter_try_with_resources_ecj, filter_finally,
+           filter_private_empty_no_arg_constructor, filter_string_switch_javac, filter_string_switch_ecj,
+           filter_enum_empty_constructor, filter_annotation_generated, filter_kotlin_generated,
+           filter_kotlin_lateinit, filter_kotlin_when, filter_kotlin_when_string, filter_kotlin_unsafe_cast_operator,
+           filter_kotlin_not_null_operator, filter_kotlin_default_arguments, filter_kotlin_inline,
+           filter_kotlin_coroutine]
+
+
+class ClassCoverageItems(NamedTuple):
+    # the coverage items of a class, each one as the mask of the probes (ids of the class) covering it
+    id: int
+    name: str
+    probe_count: int
+    # (source file of the package or class name, line) -> probes, the lines are merged by source file
+    lines: Dict
+    branches: List[int]
+    methods: List[int]
+    # None for the classes without code
+    class_probes: Optional[int]
+
+
+def get_class_coverage_items(data: bytes) -> Optional[ClassCoverageItems]:
+    # the analysis of a class file of ClassAnalyzer of JaCoCo, None for the classes JaCoCo skips
+    try:
+        class_info = ClassReader(data).read_class()
+    except (struct.error, IndexError, UnicodeDecodeError, ExecFileError) as e:
+        raise ClassFileError("malformed class file: %s" % e)
+    if class_info.access & (ACC_MODULE | ACC_SYNTHETIC) != 0:
+        return None
+    if "$jacocoData" in class_info.fields or any(method.name == "$jacocoInit" for method in class_info.methods):
+        raise ClassFileError("Cannot process instrumented class %s. Please supply original non-instrumented classes."
+                             % class_info.name)
+    # the lines of the classes of a source file are merged (SourceFileCoverageImpl of JaCoCo)
+    if class_info.source_file is not None:
+        source = ('source', class_info.name[:max(class_info.name.rfind('/'), 0)], class_info.source_file)
+    else:
+        source = ('class', class_info.name)
+    context = FilterContext(class_info)
+    probe_id = 0
+    lines: Dict = {}
+    branches: List[int] = []
+    methods: List[int] = []
+    for method in class_info.methods:
+        instructions, probe_id = build_instructions(method, probe_id)
+        output = MethodCoverageCalculator(instructions)
+        for method_filter in FILTERS:
+            method_filter(method, context, output)
+        counted = output.calculate()
+        if len(counted) == 0:
+            continue
+        method_probes = 0
+        for insn in counted:
+            method_probes |= insn.probes
+            if insn.line != -1:
+                key = (source, insn.line)
+                lines[key] = lines.get(key, 0) | insn.probes
+            if insn.branches >= 2:
+                covered_branches = [probes for probes in insn.covered_branches.values() if probes != 0]
+                branches.extend(covered_branches)
+                branches.extend([0] * (insn.branches - len(covered_branches)))
+        methods.append(method_probes)
+    class_probes = None
+    if len(methods) > 0:
+        class_probes = 0
+        for method_probes in methods:
+            class_probes |= method_probes
+    return ClassCoverageItems(class_info.id, class_info.name, probe_id, lines, branches, methods, class_probes)
+
+
+def get_class_files(path: str):
+    # the content of the class files of a class file, a jar/zip/gzip file or a dir (recursively), with their locations,
+    #   detected by content as Analyzer.analyzeAll of JaCoCo does
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            yield from get_class_files(os.path.join(path, name))
+        return
+    with open(path, "rb") as input_file:
+        yield from get_class_files_of(input_file.read(), path)
+
+
+def get_class_files_of(data: bytes, location: str):
+    if data[:4] == b"\xca\xfe\xba\xbe" and len(data) >= 8 and struct.unpack_from(">H", data, 6)[0] >= 45:
+        yield location, data
+    elif data[:4] == b"PK\x03\x04":
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+                for info in zip_file.infolist():
+                    if not info.is_dir():
+                        yield from get_class_files_of(zip_file.read(info), "%s@%s" % (location, info.filename))
+        except zipfile.BadZipFile as e:
+            raise ClassFileError("Error while analyzing %s: %s" % (location, e))
+    elif data[:2] == b"\x1f\x8b":
+        try:
+            content = gzip.decompress(data)
+        except (OSError, EOFError) as e:
+            raise ClassFileError("Error while analyzing %s: %s" % (location, e))
+        yield from get_class_files_of(content, location)
+    elif data[:4] == b"\xca\xfe\xd0\x0d":
+        raise ClassFileError("Error while analyzing %s: pack200 archives are not supported" % location)
+
+
+def get_class_files_fingerprint(class_files_dirs: List[str]):
+    # the class files are re-indexed when any file of the dirs is added, removed or modified
+    sha1 = hashlib.sha1(("v%d" % COVERAGE_INDEX_VERSION).encode())
+    for class_files_dir in class_files_dirs:
+        sha1.update(b"\0dir\0" + os.path.abspath(class_files_dir).encode("utf-8", errors="surrogateescape"))
+        paths = [class_files_dir]
+        if os.path.isdir(class_files_dir):
+            paths = sorted(os.path.join(root, name) for root, _, names in os.walk(class_files_dir) for name in names)
+        for path in paths:
+            stat = os.stat(path)
+            sha1.update(("\0%s\0%d\0%d" % (os.path.relpath(path, class_files_dir), stat.st_size,
+                                           stat.st_mtime_ns)).encode("utf-8", errors="surrogateescape"))
+    return sha1.hexdigest()
+
+
+def get_probe_indexes(probes: int, offset: int):
+    # the (global) indexes of the probes of a mask
+    indexes = []
+    while probes:
+        lowest = probes & -probes
+        indexes.append(offset + lowest.bit_length() - 1)
+        probes ^= lowest
+    return indexes
+
+
+class CoverageCounter(NamedTuple):
+    missed: int
+    covered: int
+
+    def get_total(self):
+        return self.missed + self.covered
+
+
+class CoverageIndex:
+    # the probes covering each line, branch, method and class of the class files of an apk: a coverage item is
+    #   covered iff one of its probes is executed, so the counters of any execution data are computed without
+    #   analyzing the class files again
+
+    def __init__(self, fingerprint: str, class_ids: np.ndarray, class_names: np.ndarray,
+                 class_probe_counts: np.ndarray, items: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        self.fingerprint = fingerprint
+        self.class_ids = class_ids
+        self.class_names = class_names
+        self.class_probe_counts = class_probe_counts
+        self.class_probe_offsets = np.concatenate(([0], np.cumsum(class_probe_counts, dtype=np.int64)))
+        # class id -> the index of the class
+        self.class_indexes = {int(class_id): index for index, class_id in enumerate(class_ids)}
+        # counter type -> (the start of the probes of each item in probes + the end, probes)
+        self.items = items
+
+    @staticmethod
+    def build(class_files_dirs: List[str]):
+        fingerprint = get_class_files_fingerprint(class_files_dirs)
+        # class name -> id, the duplicates of a class are skipped as in CoverageBuilder of JaCoCo
+        class_ids: Dict[str, int] = {}
+        class_probe_counts: List[int] = []
+        lines: Dict = {}
+        item_probes: Dict[str, List[List[int]]] = {counter_type: [] for counter_type in COUNTER_TYPES}
+        offset = 0
+        for class_files_dir in class_files_dirs:
+            for location, data in get_class_files(class_files_dir):
+                try:
+                    class_items = get_class_coverage_items(data)
+                except ClassFileError as e:
+                    raise ClassFileError("Error while analyzing %s: %s" % (location, e))
+                if class_items is None:
+                    continue
+                class_id = class_ids.get(class_items.name)
+                if class_id is not None:
+                    if class_id != class_items.id:
+                        raise ClassFileError("Can't add different class with same name: %s" % class_items.name)
+                    continue
+                class_ids[class_items.name] = class_items.id
+                class_probe_counts.append(class_items.probe_count)
+                for key, probes in class_items.lines.items():
+                    lines.setdefault(key, []).extend(get_probe_indexes(probes, offset))
+                for probes in class_items.branches:
+                    item_probes['BRANCH'].append(get_probe_indexes(probes, offset))
+                for probes in class_items.methods:
+                    item_probes['METHOD'].append(get_probe_indexes(probes, offset))
+                if class_items.class_probes is not None:
+                    item_probes['CLASS'].append(get_probe_indexes(class_items.class_probes, offset))
+                offset += class_items.probe_count
+        item_probes['LINE'] = list(lines.values())
+        items = {}
+        for counter_type, probes_of_items in item_probes.items():
+            pointers = np.zeros(len(probes_of_items) + 1, dtype=np.int64)
+            pointers[1:] = np.cumsum([len(probes) for probes in probes_of_items], dtype=np.int64)
+            probes = np.fromiter((probe for probes in probes_of_items for probe in probes), dtype=np.int64,
+                                 count=int(pointers[-1]))
+            items[counter_type] = (pointers, probes)
+        return CoverageIndex(fingerprint, np.array(list(class_ids.values()), dtype=np.int64),
+                             np.array(list(class_ids.keys()), dtype=str),
+                             np.array(class_probe_counts, dtype=np.int64), items)
+
+    def save(self, path: str):
+        arrays = {'version': np.array(COVERAGE_INDEX_VERSION), 'fingerprint': np.array(self.fingerprint),
+                  'class_ids': self.class_ids, 'class_names': self.class_names,
+                  'class_probe_counts': self.class_probe_counts}
+        for counter_type, (pointers, probes) in self.items.items():
+            arrays[counter_type + '_pointers'] = pointers
+            arrays[counter_type + '_probes'] = probes
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as index_file:
+            np.savez_compressed(index_file, **arrays)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def load(path: str):
+        with np.load(path, allow_pickle=False) as arrays:
+            if int(arrays['version']) != COVERAGE_INDEX_VERSION:
+                return None
+            items = {counter_type: (arrays[counter_type + '_pointers'], arrays[counter_type + '_probes'])
+                     for counter_type in COUNTER_TYPES}
+            return CoverageIndex(str(arrays['fingerprint']), arrays['class_ids'], arrays['class_names'],
+                                 arrays['class_probe_counts'], items)
+
+    def get_probes(self, store: ExecutionDataStore):
+        # the executed probes of all the classes, the classes unknown to the index are skipped as JaCoCo does
+        executed = np.zeros(int(self.class_probe_offsets[-1]), dtype=bool)
+        for data in store.classes.values():
+            index = self.class_indexes.get(data.id)
+            if index is None:
+                continue
+            count = int(self.class_probe_counts[index])
+            if len(data.probes) < count:
+                raise ExecFileError("Incompatible execution data for class %s with id %016x" % (
+                    data.name, data.id & 0xFFFFFFFFFFFFFFFF))
+            start = int(self.class_probe_offsets[index])
+            executed[start:start + count] = data.probes[:count]
+        return executed
+
+    def get_counters(self, store: ExecutionDataStore) -> Dict[str, CoverageCounter]:
+        # the counters of the bundle of "jacococli.jar report", i.e., the totals of the report
+        executed = self.get_probes(store)
+        counters = {}
+        for counter_type, (pointers, probes) in self.items.items():
+            hits = np.zeros(len(probes) + 1, dtype=np.int64)
+            np.cumsum(executed[probes], out=hits[1:])
+            covered = int(np.count_nonzero(hits[pointers[1:]] != hits[pointers[:-1]]))
+            counters[counter_type] = CoverageCounter(len(pointers) - 1 - covered, covered)
+        return counters
+
+
+def get_coverage_index(class_files_dirs: List[str], index_path: Optional[str] = None):
+    # the index of the class files, (re)built when the index file is missing or outdated
+    if index_path is not None and os.path.isfile(index_path):
+        try:
+            index = CoverageIndex.load(index_path)
+        except (OSError, ValueError, KeyError) as e:
+            print("Warning: cannot load the coverage index %s: %s" % (index_path, e))
+            index = None
+        if index is not None and index.fingerprint == get_class_files_fingerprint(class_files_dirs):
+            return index
+    start_time = time.time()
+    index = CoverageIndex.build(class_files_dirs)
+    if index_path is not None:
+        index.save(index_path)
+    print("indexed %d classes (%d probes) in %.1fs" % (len(index.class_ids), int(index.class_probe_offsets[-1]),
+                                                      time.time() - start_time))
+    return index
+
+
+if __name__ == '__main__':
+    ap = ArgumentParser()
+    ap.add_argument('command', choices=['index', 'report'])
+    ap.add_argument('execfiles', nargs='*', help="the exec files of the report")
+    ap.add_argument('--classfiles', type=str, action='append', required=True,
+                    help="the class files, jars or dirs of class files (repeatable)")
+    ap.add_argument('--index', type=str, help="the index file (built if missing or outdated)")
+    args = ap.parse_args()
+
+    try:
+        if args.command == 'index':
+            if args.index is None:
+                ap.error("the index command requires --index")
+            get_coverage_index(args.classfiles, args.index)
+        else:
+            coverage_index = get_coverage_index(args.classfiles, args.index)
+            execution_data = ExecutionDataStore()
+            for exec_file_path in args.execfiles:
+                execution_data.load(exec_file_path)
+            for name, counter in coverage_index.get_counters(execution_data).items():
+                print("%s: %d missed, %d covered" % (name, counter.missed, counter.covered))
+    except (ClassFileError, ExecFileError, OSError) as e:
+        print("Error: %s" % e, file=sys.stderr)
+        sys.exit(1)
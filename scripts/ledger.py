@@ -0,0 +1,113 @@
+# This file implements a durable, append-only job ledger for a testing campaign.
+# Each state change of a job (queued, running, finished, failed) is appended as one json line to
+#   "campaign_ledger.jsonl" under the output dir, so that an interrupted campaign can be resumed (see --resume).
+
+import json
+import os
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+from scheduler import Job
+
+LEDGER_FILE_NAME = "campaign_ledger.jsonl"
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_FINISHED = "finished"
+JOB_FAILED = "failed"
+
+
+def get_relative_path(path: str, base_dir: str):
+    # the quoted empty string ("\"\"") stands for no login script
+    if path == "\"\"":
+        return path
+    return os.path.relpath(os.path.abspath(path), base_dir)
+
+
+def get_job_id(job: Job, base_dir: Optional[str] = None):
+    # the apk and the login script are relative to the base dir (e.g., the dir of the campaign spec file, default: the
+    #   working dir), so that the apks of the same name in different app dirs, or the same apk with different login
+    #   scripts, are different jobs
+    if base_dir is None:
+        base_dir = os.getcwd()
+    return "%s|%s|%s|%s|%d" % (job.tool, get_relative_path(job.apk, base_dir),
+                               get_relative_path(job.login_script, base_dir), job.time, job.repeat_index)
+
+
+class CampaignLedger:
+
+    def __init__(self, output_dir: str, campaign_id: Optional[str] = None, base_dir: Optional[str] = None):
+        self.ledger_file_path = os.path.join(output_dir, LEDGER_FILE_NAME)
+        if campaign_id is None:
+            campaign_id = time.strftime("%Y-%m-%d-%H-%M-%S")
+        self.campaign_id = campaign_id
+        # the dir the paths in the job ids are relative to, see get_job_id
+        self.base_dir = os.path.abspath(base_dir) if base_dir is not None else os.getcwd()
+        self.lock = threading.Lock()
+
+    def get_job_id(self, job: Job):
+        return get_job_id(job, self.base_dir)
+
+    def record(self, job: Job, state: str, **extra):
+        entry = {'campaign': self.campaign_id, 'job': self.get_job_id(job), 'state': state,
+                 'tool': job.tool, 'apk': job.apk, 'time_budget': job.time, 'repeat': job.repeat_index,
+                 'time': time.strftime("%Y-%m-%d-%H:%M:%S"), 'timestamp': time.time(),
+                 'host': socket.gethostname()}
+        entry.update(extra)
+        line = json.dumps(entry) + "\n"
+        with self.lock:
+            # append and flush each entry to the disk immediately to survive a host reboot
+            with open(self.ledger_file_path, "a") as ledger_file:
+                ledger_file.write(line)
+                ledger_file.flush()
+                os.fsync(ledger_file.fileno())
+
+    def read_entries(self):
+        entries = []
+        if not os.path.exists(self.ledger_file_path):
+            return entries
+        with open(self.ledger_file_path, "r") as ledger_file:
+            for line in ledger_file:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # the last line may be partially written if the host crashed
+                    print("Warning: skip the corrupted ledger entry: %s" % line)
+        return entries
+
+    def get_latest_campaign_id(self):
+        entries = self.read_entries()
+        if len(entries) == 0:
+            return None
+        return entries[-1]['campaign']
+
+    def get_job_states(self) -> Dict[str, str]:
+        # the latest state of each job in this campaign
+        job_states: Dict[str, str] = {}
+        for entry in self.read_entries():
+            if entry['campaign'] == self.campaign_id:
+                job_states[entry['job']] = entry['state']
+        return job_states
+
+    def get_jobs_to_resume(self, jobs: List[Job]):
+        # skip the completed jobs (finished or failed), re-queue the interrupted and not yet started ones
+        job_states = self.get_job_states()
+        jobs_to_resume = []
+        number_of_completed_jobs = 0
+        number_of_interrupted_jobs = 0
+        for job in jobs:
+            state = job_states.get(self.get_job_id(job))
+            if state == JOB_FINISHED or state == JOB_FAILED:
+                number_of_completed_jobs += 1
+                continue
+            if state == JOB_RUNNING:
+                number_of_interrupted_jobs += 1
+            jobs_to_resume.append(job)
+        print("resume campaign %s: skip %d completed jobs, re-queue %d interrupted jobs, %d jobs in total to run" % (
+            self.campaign_id, number_of_completed_jobs, number_of_interrupted_jobs, len(jobs_to_resume)))
+        return jobs_to_resume
@@ -0,0 +1,136 @@
+# This file implements the login snapshot cache of themis.py (see --login-snapshot).
+# For the apps requiring login (e.g., nextcloud, WordPress, commons), instead of reinstalling the apk and replaying the
+#   login script (which mostly waits on a live server) in every run, the app is installed and logged in once per
+#   (apk, login script, avd image, tool) on the builder emulator of the pool, and the state is saved as a named
+#   emulator snapshot. The pooled emulators of the slots run with -read-only, in which the emulator refuses to save
+#   snapshots, while they can load them, so the builder is the one emulator of the pool booted without -read-only
+#   (see emulator_pool.py). The builds are serialized on it.
+#   The tool is the name of its adapter (see tool_registry.py), while the login script gets the device type of the
+#   tool (its result tag), the same as in the harnesses.
+#   The later runs and repeats start from a load of this snapshot, and their harnesses skip the install and the login
+#   (THEMIS_LOGIN_SNAPSHOT, see harness_common.sh).
+# The snapshots are stored with the avd, so they survive across campaigns. The output of each snapshot build is kept
+#   in "login_snapshots/<snapshot>.log" under the output dir.
+
+import hashlib
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, Set
+
+from adb_client import AdbError
+from emulator_pool import EmulatorPool
+
+# the environment variable telling the harnesses that the app is already installed and logged in
+LOGIN_SNAPSHOT_ENV = "THEMIS_LOGIN_SNAPSHOT"
+LOGIN_SNAPSHOT_PREFIX = "themis_login_"
+LOGIN_SNAPSHOTS_DIR_NAME = "login_snapshots"
+# the timeout (in seconds) of replaying the login script
+LOGIN_TIMEOUT = 900
+# printed by the login scripts (e.g., nextcloud/login-#4026.py) once the app is logged in
+LOGIN_SUCCESS_MARKER = "Login SUCCESS"
+
+
+def get_file_digest(file_path: str):
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_login_snapshot_name(apk_path: str, login_script: str, avd_name: str, tool_name: str):
+    # the snapshot is rebuilt whenever the apk or the login script changes
+    digest = hashlib.sha1()
+    for part in [get_file_digest(apk_path), get_file_digest(login_script), avd_name, tool_name]:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return LOGIN_SNAPSHOT_PREFIX + digest.hexdigest()[:16]
+
+
+class LoginSnapshotCache:
+
+    def __init__(self, pool: EmulatorPool, avd_name: str, output_dir: str):
+        self.pool = pool
+        self.avd_name = avd_name
+        self.log_dir = os.path.join(output_dir, LOGIN_SNAPSHOTS_DIR_NAME)
+        # the snapshots built in this campaign, and the ones which could not be built, not retried in this campaign
+        self.built_snapshots: Set[str] = set()
+        self.failed_snapshots: Set[str] = set()
+        # one lock per snapshot, so that the device slots do not build the same snapshot concurrently
+        self.snapshot_locks: Dict[str, threading.Lock] = {}
+        self.lock = threading.Lock()
+        # the builder emulator builds one snapshot at a time
+        self.build_lock = threading.Lock()
+
+    def restore(self, slot: str, apk_path: str, login_script: str, tool_name: str, device_type: str,
+                emulator_options):
+        # called by the device slot before the run instead of EmulatorPool.prepare: bring the emulator to the logged-in
+        #   state of the app, and return the name of the snapshot, or None if the emulator still has to be prepared
+        #   and the harness should install the app and log in itself
+        snapshot = get_login_snapshot_name(apk_path, login_script, self.avd_name, tool_name)
+        # boot the emulator of the slot outside the lock of the snapshot, so that the slots running the same app boot
+        #   their emulators concurrently
+        if not self.pool.prepare(slot, emulator_options, reset=False):
+            return None
+        with self.lock:
+            snapshot_lock = self.snapshot_locks.setdefault(snapshot, threading.Lock())
+        with snapshot_lock:
+            if snapshot in self.failed_snapshots:
+                return None
+            if snapshot not in self.built_snapshots and not self.pool.has_snapshot(slot, snapshot):
+                if not self.build(apk_path, login_script, device_type, snapshot, emulator_options):
+                    self.failed_snapshots.add(snapshot)
+                    return None
+            self.built_snapshots.add(snapshot)
+        # loading the snapshot also drops the state of the previous run
+        if not self.pool.load_snapshot(slot, snapshot):
+            self.pool.release(slot)
+            return None
+        return snapshot
+
+    def build(self, apk_path: str, login_script: str, device_type: str, snapshot: str, emulator_options):
+        with self.build_lock:
+            # build the snapshot from a clean builder emulator
+            if not self.pool.prepare_builder(emulator_options):
+                return False
+            try:
+                return self.build_on_builder(apk_path, login_script, device_type, snapshot)
+            finally:
+                # drop the app (or the half-done install or login) before the next build
+                self.pool.release_builder()
+
+    def build_on_builder(self, apk_path: str, login_script: str, device_type: str, snapshot: str):
+        avd_serial = self.pool.builder.avd_serial
+        print("[pool] build the login snapshot %s of %s on %s" % (snapshot, os.path.basename(apk_path), avd_serial))
+        os.makedirs(self.log_dir, exist_ok=True)
+        start = time.monotonic()
+        with open(os.path.join(self.log_dir, snapshot + ".log"), "a") as log_file:
+            log_file.write("apk: %s, login script: %s, avd: %s, device type: %s\n" % (
+                apk_path, login_script, self.avd_name, device_type))
+            try:
+                output = self.pool.get_builder_device().install(apk_path, '-g')
+            except (AdbError, OSError) as e:
+                output = "the install failed: %s\n" % e
+            log_file.write(output)
+            if "Success" not in output:
+                self.pool.log(avd_serial, "login_snapshot", time.monotonic() - start, "failed (install)")
+                return False
+            try:
+                completed = subprocess.run(['python3', login_script, avd_serial, device_type],
+                                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                           stdin=subprocess.DEVNULL, timeout=LOGIN_TIMEOUT,
+                                           env=self.pool.get_env(self.pool.builder.slot))
+                login_output = completed.stdout.decode("utf-8", errors="replace")
+            except subprocess.TimeoutExpired:
+                login_output = "the login timed out\n"
+            log_file.write(login_output)
+            if LOGIN_SUCCESS_MARKER not in login_output:
+                self.pool.log(avd_serial, "login_snapshot", time.monotonic() - start, "failed (login)")
+                return False
+        if not self.pool.save_builder_snapshot(snapshot):
+            self.pool.log(avd_serial, "login_snapshot", time.monotonic() - start, "failed (save)")
+            return False
+        self.pool.log(avd_serial, "login_snapshot", time.monotonic() - start, "ok")
+        return True
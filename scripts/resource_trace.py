@@ -0,0 +1,171 @@
+# This file implements the host resource trace of the runs of themis.py (disabled by --no-resource-trace).
+# To tell whether a poor result of a tool came from the host contention, a monitor of each run (see supervisor.py)
+#   samples the process tree of the run (its process group, and the one of the pooled emulator, which lives outside
+#   the group of the run) every few seconds from /proc/<pid>/stat, status and io, and appends the samples to
+#   "resource_trace.csv" under the result dir. The processes are split into two groups: the emulator (qemu) and the
+#   tool (everything else, e.g., the harness, the tool, logcat, adb).
+# Each row holds the cpu usage (in % of one cpu) and the io and context switches of the group since the previous
+#   sample, and its rss at the sample time. themis.py prints the peak/average summary of each run.
+
+import asyncio
+import csv
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from supervisor import RunContext
+
+RESOURCE_TRACE_FILE_NAME = "resource_trace.csv"
+# the time (in seconds) between two samples
+RESOURCE_SAMPLE_INTERVAL = 5
+RESOURCE_TRACE_FIELDS = ['elapsed', 'group', 'processes', 'cpu_percent', 'rss_mb', 'read_kb', 'write_kb',
+                         'voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches']
+EMULATOR_GROUP = "emulator"
+TOOL_GROUP = "tool"
+# the command names of the emulator processes
+EMULATOR_COMMAND_PREFIXES = ("qemu-system", "emulator")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def read_process_stat(pid: int):
+    # (command name, process group, cpu time in secs) from /proc/<pid>/stat
+    with open("/proc/%d/stat" % pid, "r") as stat_file:
+        stat = stat_file.read()
+    # the command name is in parentheses and may contain spaces
+    command_name = stat[stat.index("(") + 1:stat.rindex(")")]
+    fields = stat[stat.rindex(")") + 2:].split()
+    return command_name, int(fields[2]), (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def read_process_counters(pid: int) -> Dict[str, int]:
+    # the rss (in kB) and the context switches from /proc/<pid>/status, the io (in bytes) from /proc/<pid>/io
+    counters = {'rss_kb': 0, 'voluntary_ctxt_switches': 0, 'nonvoluntary_ctxt_switches': 0, 'read_bytes': 0,
+                'write_bytes': 0}
+    with open("/proc/%d/status" % pid, "r") as status_file:
+        for line in status_file:
+            name, _, value = line.partition(":")
+            if name == "VmRSS":
+                counters['rss_kb'] = int(value.split()[0])
+            elif name in counters:
+                counters[name] = int(value.strip())
+    try:
+        with open("/proc/%d/io" % pid, "r") as io_file:
+            for line in io_file:
+                name, _, value = line.partition(":")
+                if name in counters:
+                    counters[name] = int(value.strip())
+    except OSError:
+        # e.g., the io of the processes of other users is not readable
+        pass
+    return counters
+
+
+def sample_processes(process_groups: List[int]) -> Dict[int, Dict]:
+    # pid -> the counters of the processes of the given process groups
+    samples = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        pid = int(name)
+        try:
+            command_name, process_group, cpu_time = read_process_stat(pid)
+            if process_group not in process_groups:
+                continue
+            sample = read_process_counters(pid)
+        except (OSError, ValueError, IndexError):
+            # the process exited
+            continue
+        sample['group'] = EMULATOR_GROUP if command_name.startswith(EMULATOR_COMMAND_PREFIXES) else TOOL_GROUP
+        sample['cpu_time'] = cpu_time
+        samples[pid] = sample
+    return samples
+
+
+def get_trace_rows(elapsed: float, interval: float, previous: Dict[int, Dict], current: Dict[int, Dict]):
+    # one row per group, the deltas only count the processes alive in both samples
+    rows = []
+    for group in [EMULATOR_GROUP, TOOL_GROUP]:
+        pids = [pid for pid, sample in current.items() if sample['group'] == group]
+        row = {'elapsed': round(elapsed, 1), 'group': group, 'processes': len(pids), 'cpu_percent': 0.0,
+               'rss_mb': round(sum(current[pid]['rss_kb'] for pid in pids) / 1024, 1), 'read_kb': 0, 'write_kb': 0,
+               'voluntary_ctxt_switches': 0, 'nonvoluntary_ctxt_switches': 0}
+        cpu_time = 0.0
+        for pid in pids:
+            if pid not in previous:
+                continue
+            cpu_time += current[pid]['cpu_time'] - previous[pid]['cpu_time']
+            row['read_kb'] += (current[pid]['read_bytes'] - previous[pid]['read_bytes']) // 1024
+            row['write_kb'] += (current[pid]['write_bytes'] - previous[pid]['write_bytes']) // 1024
+            for name in ['voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches']:
+                row[name] += current[pid][name] - previous[pid][name]
+        row['cpu_percent'] = round(100 * cpu_time / interval, 1) if interval > 0 else 0.0
+        rows.append(row)
+    return rows
+
+
+def make_resource_trace_monitor(get_extra_process_groups: Optional[Callable[[], List[int]]] = None):
+    # the monitor of a run (see supervisor.py), get_extra_process_groups returns the process groups of the run besides
+    #   the one of its harness, e.g., the one of the pooled emulator
+
+    async def monitor(context: RunContext):
+        loop = asyncio.get_event_loop()
+        start = time.monotonic()
+        previous_time = start
+        previous: Optional[Dict[int, Dict]] = None
+        # the rows sampled before the result dir is created
+        pending_rows = []
+        while True:
+            process_groups = [context.pgid]
+            if get_extra_process_groups is not None:
+                process_groups += get_extra_process_groups()
+            # read /proc off the event loop shared by the runs
+            current = await loop.run_in_executor(None, sample_processes, process_groups)
+            now = time.monotonic()
+            if previous is not None:
+                pending_rows.extend(get_trace_rows(now - start, now - previous_time, previous, current))
+            previous, previous_time = current, now
+            if context.result_dir is not None and len(pending_rows) > 0:
+                trace_file_path = os.path.join(context.result_dir, RESOURCE_TRACE_FILE_NAME)
+                write_header = not os.path.exists(trace_file_path)
+                with open(trace_file_path, "a", newline="") as trace_file:
+                    writer = csv.DictWriter(trace_file, fieldnames=RESOURCE_TRACE_FIELDS)
+                    if write_header:
+                        writer.writeheader()
+                    writer.writerows(pending_rows)
+                pending_rows = []
+            await asyncio.sleep(RESOURCE_SAMPLE_INTERVAL)
+
+    return monitor
+
+
+def summarize_resource_trace(result_dir: str):
+    # group -> the peak and average of the cpu usage and rss, and the total io and context switches
+    trace_file_path = os.path.join(result_dir, RESOURCE_TRACE_FILE_NAME)
+    if not os.path.exists(trace_file_path):
+        return {}
+    rows: Dict[str, List[Dict]] = {}
+    with open(trace_file_path, "r", newline="") as trace_file:
+        for row in csv.DictReader(trace_file):
+            rows.setdefault(row['group'], []).append(row)
+    summary = {}
+    for group, group_rows in rows.items():
+        cpu = [float(row['cpu_percent']) for row in group_rows]
+        rss = [float(row['rss_mb']) for row in group_rows]
+        summary[group] = {'cpu_avg': sum(cpu) / len(cpu), 'cpu_peak': max(cpu),
+                          'rss_avg': sum(rss) / len(rss), 'rss_peak': max(rss),
+                          'read_mb': sum(int(row['read_kb']) for row in group_rows) / 1024,
+                          'write_mb': sum(int(row['write_kb']) for row in group_rows) / 1024,
+                          'ctxt_switches': sum(int(row['voluntary_ctxt_switches']) +
+                                               int(row['nonvoluntary_ctxt_switches']) for row in group_rows)}
+    return summary
+
+
+def print_resource_summary(avd_serial: str, summary: Dict[str, Dict]):
+    for group in [EMULATOR_GROUP, TOOL_GROUP]:
+        if group not in summary:
+            continue
+        stats = summary[group]
+        print("[%s] %s resources: cpu avg %.0f%% peak %.0f%%, rss avg %.0f MB peak %.0f MB, io read %.0f MB "
+              "write %.0f MB, %d context switches" % (
+                  avd_serial, group, stats['cpu_avg'], stats['cpu_peak'], stats['rss_avg'], stats['rss_peak'],
+                  stats['read_mb'], stats['write_mb'], stats['ctxt_switches']))
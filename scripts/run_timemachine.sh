@@ -11,6 +11,8 @@ HEADLESS=$6 # e.g., -no-window
 LOGIN_SCRIPT=$7 # the script for app login via uiautomator2
 ADB_PORT=$8
 
+source $(dirname $0)/harness_common.sh
+
 echo "----"
 echo "ADB_PORT: ${ADB_PORT}"
 echo "----"
@@ -34,19 +36,23 @@ apk_dir_path=`dirname $apk_file_path`
 result_dir=$OUTPUT_DIR/$apk_file_name.timemachine.result.$AVD_SERIAL\#$current_date_time
 mkdir -p $result_dir
 echo "** CREATING RESULT DIR (${AVD_SERIAL}): " $result_dir
+set_result_dir $result_dir
 
 # get app package
-app_package_name=`aapt dump badging $APK_FILE | grep package | awk '{print $2}' | sed s/name=//g | sed s/\'//g`
+app_package_name=`get_app_package_name $APK_FILE`
 echo "** PROCESSING APP (${AVD_SERIAL}): " $app_package_name
 
 # run TimeMachine
 # jump into TimeMachine's exec folder
 cd ${TIMEMACHINE_TOOL}/fuzzingandroid
 echo "** RUN TIMEMACHINE "
+# TimeMachine boots its own emulator, so the fuzzing phase also covers the boot and the teardown
+phase_begin fuzzing
 echo "`date "+%Y-%m-%d-%H:%M:%S"`" >> $result_dir/timemachine_testing_time.txt
 cmd="./exec-single-app.bash $apk_dir_path 0 droidtest/timemachine:1.0 $TEST_TIME $result_dir $apk_file_path $ADB_PORT $LOGIN_SCRIPT"
 echo $cmd
 timeout 6.5h ./exec-single-app.bash $apk_dir_path 0 ${headless_option} droidtest/timemachine:1.0 $TEST_TIME $result_dir $apk_file_path $ADB_PORT $LOGIN_SCRIPT
+phase_end fuzzing $?
 echo "`date "+%Y-%m-%d-%H:%M:%S"`" >> $result_dir/timemachine_testing_time.txt
 
 echo "@@@@@@ Finish (${AVD_SERIAL}): " $app_package_name "@@@@@@@"
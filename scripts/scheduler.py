@@ -0,0 +1,181 @@
+# This file implements the device-slot scheduler used by themis.py.
+# Each emulator slot runs in its own thread and pulls the next job from a shared queue as soon as its previous run
+#   ends, instead of waiting for the slowest run of a batch to finish.
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from supervisor import RunInterrupted
+
+
+class Job(NamedTuple):
+    tool: str
+    apk: str
+    login_script: str
+    repeat_index: int
+    time: str
+
+
+class SlotRecord(NamedTuple):
+    avd_serial: str
+    job: Job
+    start_time: float
+    end_time: float
+
+
+class DeviceSlotScheduler:
+
+    def __init__(self, avd_serial_list: List[str], run_job: Callable[[Job, str], Any], stagger: int = 10,
+                 admission=None):
+        # run_job(job, avd_serial) blocks until the run on the given device ends and returns its result (e.g., the
+        #   exit status of the run), which is passed to job_finished()
+        self.avd_serial_list = avd_serial_list
+        self.run_job = run_job
+        # the optional admission controller (see admission.py) deciding whether the host has the headroom for
+        #   one more run before a slot pulls its next job
+        self.admission = admission
+        # the delay (in seconds) between the first dispatches of two consecutive slots to avoid booting all the
+        #   emulators at the same time
+        self.stagger = stagger
+
+        self.pending_jobs: List[Job] = []
+        self.number_of_running_jobs = 0
+        self.condition = threading.Condition()
+        # set by stop(), e.g., on Ctrl-C, the slots then take no more jobs
+        self.stopped = threading.Event()
+
+        self.records: List[SlotRecord] = []
+        self.campaign_start_time = 0.0
+        self.campaign_end_time = 0.0
+
+    def add_job(self, job: Job):
+        with self.condition:
+            if self.stopped.is_set():
+                # e.g., a job re-queued by a run interrupted by stop(), it stays queued in the ledger
+                return
+            self.pending_jobs.append(job)
+            self.condition.notify_all()
+
+    def stop(self):
+        # drop the pending jobs and wake up the waiting slots, the running runs are torn down by the caller
+        with self.condition:
+            self.stopped.set()
+            self.pending_jobs.clear()
+            self.condition.notify_all()
+
+    def next_job(self, avd_serial: str) -> Optional[Job]:
+        # block until a job is available, or return None when no job is pending and no job is running
+        #   (a running job may put new jobs into the queue, e.g., when it is re-queued), or when stopped
+        with self.condition:
+            while len(self.pending_jobs) == 0:
+                if self.number_of_running_jobs == 0 or self.stopped.is_set():
+                    return None
+                self.condition.wait()
+            if self.stopped.is_set():
+                return None
+            self.number_of_running_jobs += 1
+            return self.pending_jobs.pop(0)
+
+    def finish_job(self):
+        with self.condition:
+            self.number_of_running_jobs -= 1
+            self.condition.notify_all()
+
+    def job_finished(self, job: Job, avd_serial: str, result: Any, interrupted: bool):
+        # called when a run ends with the result of run_job (None if it raised, interrupted if it raised
+        #   RunInterrupted), can be overridden to report the result
+        pass
+
+    def run_slot(self, slot_index: int, avd_serial: str):
+        time.sleep(slot_index * self.stagger)
+        while True:
+            if self.admission is not None:
+                self.admission.acquire(avd_serial)
+            job = self.next_job(avd_serial)
+            if job is None:
+                if self.admission is not None:
+                    self.admission.release(avd_serial)
+                break
+            print("Now allocate the apk: %s on %s (%s, %s, repeat #%d)" % (job.apk, avd_serial, job.tool, job.time,
+                                                                           job.repeat_index))
+            print("its login script: %s" % job.login_script)
+            start_time = time.time()
+            result = None
+            interrupted = False
+            try:
+                result = self.run_job(job, avd_serial)
+            except RunInterrupted as e:
+                print("the run of %s on %s was interrupted: %s" % (job.apk, avd_serial, e))
+                interrupted = True
+            except Exception as e:
+                print("Error: the run of %s on %s failed: %s" % (job.apk, avd_serial, e))
+            finally:
+                end_time = time.time()
+                with self.condition:
+                    self.records.append(SlotRecord(avd_serial, job, start_time, end_time))
+                if self.admission is not None:
+                    self.admission.release(avd_serial)
+                self.job_finished(job, avd_serial, result, interrupted)
+                self.finish_job()
+            if interrupted:
+                break
+        print("no more jobs for %s, release the device" % avd_serial)
+
+    def run(self, jobs: List[Job]):
+        for job in jobs:
+            self.add_job(job)
+
+        self.campaign_start_time = time.time()
+        threads = []
+        for slot_index, avd_serial in enumerate(self.avd_serial_list):
+            t = threading.Thread(target=self.run_slot, args=(slot_index, avd_serial,), name=avd_serial)
+            t.start()
+            threads.append(t)
+
+        print("wait the allocated devices to finish...")
+        for t in threads:
+            t.join()
+        self.campaign_end_time = time.time()
+
+    def get_batch_barrier_makespan(self):
+        # estimate the makespan of the same runs under the old batch-barrier scheduling, i.e., the runs are
+        #   dispatched in batches of #slots and each batch waits for its slowest run
+        durations = [r.end_time - r.start_time for r in sorted(self.records, key=lambda r: r.start_time)]
+        number_of_slots = len(self.avd_serial_list)
+        makespan = 0.0
+        for i in range(0, len(durations), number_of_slots):
+            makespan += max(durations[i:i + number_of_slots]) + self.stagger * number_of_slots
+        return makespan
+
+    def print_utilization(self):
+        campaign_time = self.campaign_end_time - self.campaign_start_time
+        if campaign_time <= 0:
+            return
+
+        busy_time_dict: Dict[str, float] = {}
+        number_of_runs_dict: Dict[str, int] = {}
+        for avd_serial in self.avd_serial_list:
+            busy_time_dict[avd_serial] = 0.0
+            number_of_runs_dict[avd_serial] = 0
+        for r in self.records:
+            busy_time_dict[r.avd_serial] += r.end_time - r.start_time
+            number_of_runs_dict[r.avd_serial] += 1
+
+        print("=========")
+        print("campaign time: %.0f secs, %d runs on %d devices" % (campaign_time, len(self.records),
+                                                                  len(self.avd_serial_list)))
+        total_busy_time = 0.0
+        for avd_serial in self.avd_serial_list:
+            busy_time = busy_time_dict[avd_serial]
+            total_busy_time += busy_time
+            print("  %s: %d runs, busy %.0f secs, idle %.0f secs, utilization %.1f%%" % (
+                avd_serial, number_of_runs_dict[avd_serial], busy_time, campaign_time - busy_time,
+                busy_time * 100.0 / campaign_time))
+        print("overall utilization: %.1f%%" % (total_busy_time * 100.0 / (campaign_time * len(self.avd_serial_list))))
+
+        if len(self.records) > 0:
+            barrier_makespan = self.get_batch_barrier_makespan()
+            print("estimated time with batch barriers: %.0f secs (saved %.0f secs)" % (
+                barrier_makespan, barrier_makespan - campaign_time))
+        print("=========")
@@ -0,0 +1,132 @@
+# This file implements the cpu isolation of the device slots of themis.py (see --pin-cpus and --cgroup-root).
+# The tool comparisons assume that each run gets the same compute, while the emulators and the tool processes (e.g.,
+#   the model server of Humanoid, the ruby driver of Stoat) of the concurrent runs otherwise compete for all the cpus
+#   of the host. With the isolation, the cpus of the host are split into one disjoint cpu set per device slot, and
+#   everything started for the slot (the harness with its emulator and tool, the pooled emulator, the adb server of the
+#   slot) is confined to the cpu set of the slot:
+#   - with --cgroup-root (a delegated cgroup v2 dir, e.g., created by "systemd-run --user --scope -p Delegate=yes"),
+#     each slot gets the child cgroup "<serial>" with the cpu set (cpuset.cpus) and a cpu bandwidth of the same number
+#     of cpus (cpu.max), and its processes are moved into it;
+#   - otherwise, the processes of the slot are only pinned to the cpu set (taskset), which the children inherit.
+# After each run, the cpu budget of the run (its cpus x its wall time), and with a cgroup its cpu time and throttling
+#   stats (from cpu.stat), are recorded in "slot_cpu_usage.json" under the result dir, so that the runs which got less
+#   cpu than the others can be spotted.
+
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+SLOT_CPU_USAGE_FILE_NAME = "slot_cpu_usage.json"
+# the period (in microseconds) of the cpu bandwidth of the slot cgroups
+CPU_MAX_PERIOD = 100000
+
+
+def format_cpu_list(cpus: List[int]):
+    # e.g., [0, 1, 2, 5] -> "0-2,5"
+    ranges = []
+    for cpu in sorted(cpus):
+        if len(ranges) > 0 and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join("%d" % first if first == last else "%d-%d" % (first, last) for first, last in ranges)
+
+
+def read_cpu_stat(cgroup_dir: str) -> Dict[str, int]:
+    # e.g., {"usage_usec": ..., "user_usec": ..., "system_usec": ..., "nr_periods": ..., "nr_throttled": ...,
+    #   "throttled_usec": ...}
+    cpu_stat = {}
+    try:
+        with open(os.path.join(cgroup_dir, "cpu.stat"), "r") as cpu_stat_file:
+            for line in cpu_stat_file:
+                fields = line.split()
+                if len(fields) == 2:
+                    cpu_stat[fields[0]] = int(fields[1])
+    except OSError:
+        pass
+    return cpu_stat
+
+
+def write_cgroup_file(cgroup_dir: str, name: str, value: str):
+    with open(os.path.join(cgroup_dir, name), "w") as cgroup_file:
+        cgroup_file.write(value)
+
+
+class SlotIsolation:
+
+    def __init__(self, avd_serial_list: List[str], cpus_per_slot: Optional[int] = None,
+                 cgroup_root: Optional[str] = None):
+        host_cpus = sorted(os.sched_getaffinity(0))
+        if cpus_per_slot is None:
+            cpus_per_slot = max(1, len(host_cpus) // len(avd_serial_list))
+        if cpus_per_slot * len(avd_serial_list) > len(host_cpus):
+            print("Warning: %d cpus for %d slots x %d cpus, the cpu sets of the slots overlap" % (
+                len(host_cpus), len(avd_serial_list), cpus_per_slot))
+        self.cpu_sets: Dict[str, List[int]] = {}
+        for index, avd_serial in enumerate(avd_serial_list):
+            self.cpu_sets[avd_serial] = [host_cpus[(index * cpus_per_slot + i) % len(host_cpus)]
+                                         for i in range(cpus_per_slot)]
+        # avd serial -> the cgroup dir of the slot
+        self.cgroups: Dict[str, str] = {}
+        if cgroup_root is not None:
+            self.create_cgroups(cgroup_root)
+
+    def create_cgroups(self, cgroup_root: str):
+        if not os.path.exists(os.path.join(cgroup_root, "cgroup.controllers")):
+            print("Warning: %s is not a cgroup v2 dir, only pin the slots to their cpus" % cgroup_root)
+            return
+        try:
+            # the root must not have processes of its own to distribute its controllers to the slot cgroups
+            write_cgroup_file(cgroup_root, "cgroup.subtree_control", "+cpu +cpuset")
+            for avd_serial, cpus in self.cpu_sets.items():
+                cgroup_dir = os.path.join(cgroup_root, avd_serial)
+                os.makedirs(cgroup_dir, exist_ok=True)
+                write_cgroup_file(cgroup_dir, "cpuset.cpus", format_cpu_list(cpus))
+                write_cgroup_file(cgroup_dir, "cpu.max", "%d %d" % (len(cpus) * CPU_MAX_PERIOD, CPU_MAX_PERIOD))
+                self.cgroups[avd_serial] = cgroup_dir
+        except OSError as e:
+            print("Warning: cannot set up the slot cgroups under %s, only pin the slots to their cpus: %s" % (
+                cgroup_root, e))
+            self.cgroups = {}
+            return
+        for avd_serial, cgroup_dir in self.cgroups.items():
+            print("the slot %s is isolated in the cgroup %s (cpus %s)" % (
+                avd_serial, cgroup_dir, format_cpu_list(self.cpu_sets[avd_serial])))
+
+    def get_cpu_list(self, avd_serial: str):
+        return format_cpu_list(self.cpu_sets[avd_serial])
+
+    def wrap_argv(self, avd_serial: str, argv: List[str]):
+        # the argv confined to the slot, the wrappers exec the command, i.e., keep its pid
+        if avd_serial in self.cgroups:
+            return ['sh', '-c', 'echo $$ > "$0" && exec "$@"',
+                    os.path.join(self.cgroups[avd_serial], "cgroup.procs")] + argv
+        return ['taskset', '-c', self.get_cpu_list(avd_serial)] + argv
+
+    def begin_run(self, avd_serial: str):
+        # the cpu stats of the slot before the run, the cgroup is shared by the successive runs of the slot
+        return time.monotonic(), read_cpu_stat(self.cgroups[avd_serial]) if avd_serial in self.cgroups else {}
+
+    def record_run(self, avd_serial: str, run_start, result_dir: Optional[str]):
+        start, start_cpu_stat = run_start
+        wall_time = time.monotonic() - start
+        cpus = self.cpu_sets[avd_serial]
+        usage = {'serial': avd_serial, 'cpus': format_cpu_list(cpus), 'cgroup': self.cgroups.get(avd_serial),
+                 'wall_time': round(wall_time, 1), 'cpu_budget': round(len(cpus) * wall_time, 1)}
+        if avd_serial in self.cgroups:
+            end_cpu_stat = read_cpu_stat(self.cgroups[avd_serial])
+            delta = {name: value - start_cpu_stat.get(name, 0) for name, value in end_cpu_stat.items()}
+            usage['cpu_time'] = round(delta.get('usage_usec', 0) / 1e6, 1)
+            usage['user_time'] = round(delta.get('user_usec', 0) / 1e6, 1)
+            usage['system_time'] = round(delta.get('system_usec', 0) / 1e6, 1)
+            usage['nr_periods'] = delta.get('nr_periods', 0)
+            usage['nr_throttled'] = delta.get('nr_throttled', 0)
+            usage['throttled_time'] = round(delta.get('throttled_usec', 0) / 1e6, 1)
+            if usage['cpu_budget'] > 0:
+                print("[%s] the run used %.0f of its %.0f cpu secs, throttled in %d of %d periods" % (
+                    avd_serial, usage['cpu_time'], usage['cpu_budget'], usage['nr_throttled'], usage['nr_periods']))
+        if result_dir is not None and os.path.isdir(result_dir):
+            with open(os.path.join(result_dir, SLOT_CPU_USAGE_FILE_NAME), "w") as usage_file:
+                json.dump(usage, usage_file, indent=2)
+        return usage
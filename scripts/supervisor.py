@@ -0,0 +1,264 @@
+# This file implements the run supervisor of themis.py.
+# Each harness (run_<tool>.sh) is started in its own process group, so that the whole process tree of a run (the
+#   emulator, logcat, dump_coverage.sh and the tool) can be torn down with a single killpg, instead of the harness
+#   grepping the process table for its children.
+# One asyncio event loop (in a background thread) supervises all the runs of the device slots: it streams the stdout
+#   and stderr of each harness to per-run log files and enforces the time budget of each run.
+# The optional monitors of a run (coroutine functions taking the RunContext, e.g., the early-stop monitor) run
+#   alongside the harness on the same event loop and are cancelled when the harness exits. A monitor may also abort
+#   the run as invalid (e.g., the watchdog, when the emulator hung), which tears down the whole run at once.
+
+import asyncio
+import os
+import shutil
+import signal
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from telemetry import get_monotonic_time, record_run_event, RUN_PHASE
+
+# the line echoed by the harnesses after creating the result dir
+RESULT_DIR_MARKER = "** CREATING RESULT DIR"
+# the per-run log files are written here (under the output dir) until the result dir of the run is known
+RUN_LOGS_DIR_NAME = "run_logs"
+HARNESS_STDOUT_LOG = "harness.stdout.log"
+HARNESS_STDERR_LOG = "harness.stderr.log"
+# the time (in seconds) allowed on top of the testing time for booting the emulator, installing the app, logging in,
+#   pulling the coverage files and tearing down
+SETUP_TEARDOWN_GRACE = 30 * 60
+# the time (in seconds) to wait after SIGTERM before sending SIGKILL to the process group
+TERMINATE_TIMEOUT = 10
+
+
+class RunInterrupted(Exception):
+    # the supervisor was shut down (e.g., on Ctrl-C) before or while the run was executing
+    pass
+
+
+class RunOutcome(NamedTuple):
+    # the exit status of the harness (negative if it was killed by a signal)
+    exit_status: Optional[int]
+    result_dir: Optional[str]
+    timed_out: bool
+    duration: float
+    # why a monitor stopped the fuzzing early, or None
+    stop_reason: Optional[str] = None
+    # why a monitor aborted the run as invalid, or None
+    invalid_reason: Optional[str] = None
+
+
+def get_exit_status(outcome: Optional[RunOutcome]):
+    if outcome is None or outcome.timed_out:
+        return None
+    return outcome.exit_status
+
+
+def kill_process_group(pgid: int, sig: int):
+    try:
+        os.killpg(pgid, sig)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+
+def is_process_group_alive(pgid: int):
+    try:
+        os.killpg(pgid, 0)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+
+def get_child_processes(parent_pid: int):
+    # (pid, command name) of the child processes of the given process, from /proc/<pid>/stat
+    children = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % name, "r") as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue
+        # the command name is in parentheses and may contain spaces
+        command_name = stat[stat.index("(") + 1:stat.rindex(")")]
+        fields = stat[stat.rindex(")") + 2:].split()
+        if int(fields[1]) == parent_pid:
+            children.append((int(name), command_name))
+    return children
+
+
+class RunContext:
+    # the state of a running harness shared with the monitors of the run
+
+    def __init__(self, avd_serial: str, pgid: int):
+        self.avd_serial = avd_serial
+        self.pgid = pgid
+        self.result_dir: Optional[str] = None
+        self.result_dir_created = asyncio.Event()
+        self.stop_reason: Optional[str] = None
+        self.invalid_reason: Optional[str] = None
+
+    def set_result_dir(self, result_dir: str):
+        self.result_dir = result_dir
+        self.result_dir_created.set()
+
+    def stop_fuzzing(self, reason: str) -> bool:
+        # end the fuzzing early by terminating the "timeout $TEST_TIME <tool>" of the harness, the harness then
+        #   records the end of the testing time and tears down the run as usual. Return whether the fuzzing was
+        #   stopped, i.e., the harness is running its tool under timeout
+        stopped = False
+        for pid, command_name in get_child_processes(self.pgid):
+            if command_name == "timeout":
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                    stopped = True
+                except ProcessLookupError:
+                    pass
+        if not stopped:
+            print("[%s] cannot stop the fuzzing (no timeout process), run the full time: %s" % (
+                self.avd_serial, reason))
+            return False
+        self.stop_reason = reason
+        print("[%s] stop the fuzzing: %s" % (self.avd_serial, reason))
+        return True
+
+    def abort(self, reason: str):
+        # the run is invalid (e.g., its emulator hung), tear down the whole run instead of only the fuzzing
+        self.invalid_reason = reason
+        print("[%s] abort the run: %s" % (self.avd_serial, reason))
+        kill_process_group(self.pgid, signal.SIGTERM)
+
+
+class RunSupervisor:
+
+    def __init__(self, grace_time: int = SETUP_TEARDOWN_GRACE):
+        self.grace_time = grace_time
+        # avd serial -> the process group id of its running harness
+        self.process_groups: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.stopped = False
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="run-supervisor", daemon=True)
+        self.thread.start()
+
+    def run(self, argv: List[str], avd_serial: str, log_dir: str, log_name: str, time_budget: int,
+            cwd: Optional[str] = None, monitors: Optional[List[Callable[[RunContext], Awaitable]]] = None,
+            env: Optional[Dict[str, str]] = None) -> RunOutcome:
+        # block the calling (slot) thread until the run ends
+        if self.stopped:
+            raise RunInterrupted("the supervisor is stopped")
+        future = asyncio.run_coroutine_threadsafe(
+            self.supervise(argv, avd_serial, log_dir, log_name, time_budget, cwd, monitors or [], env), self.loop)
+        outcome = future.result()
+        if self.stopped:
+            raise RunInterrupted("the run on %s was interrupted" % avd_serial)
+        return outcome
+
+    async def stream_output(self, stream: asyncio.StreamReader, log_file, context: RunContext, echo: bool):
+        pending = b""
+        while True:
+            data = await stream.read(65536)
+            if len(data) == 0:
+                break
+            log_file.write(data)
+            log_file.flush()
+            if not echo:
+                continue
+            pending += data
+            lines = pending.split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                text = line.decode("utf-8", errors="replace")
+                print("[%s] %s" % (context.avd_serial, text))
+                if RESULT_DIR_MARKER in text and context.result_dir is None:
+                    context.set_result_dir(text.split(":", 1)[1].strip())
+
+    async def wait_for_exit(self, process: asyncio.subprocess.Process, timeout: float):
+        # poll the exit status instead of awaiting process.wait(), which (before python 3.12) also waits for the
+        #   pipes to be closed, i.e., for the background processes of the harness inheriting its stdout and stderr
+        deadline = time.monotonic() + timeout
+        while process.returncode is None:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(1)
+        return True
+
+    async def terminate(self, process: asyncio.subprocess.Process, pgid: int):
+        # tear down the whole process tree of the run: SIGTERM first, then SIGKILL for the stragglers
+        if not kill_process_group(pgid, signal.SIGTERM):
+            return
+        deadline = time.monotonic() + TERMINATE_TIMEOUT
+        while time.monotonic() < deadline and is_process_group_alive(pgid):
+            await asyncio.sleep(0.5)
+        kill_process_group(pgid, signal.SIGKILL)
+
+    async def supervise(self, argv: List[str], avd_serial: str, log_dir: str, log_name: str, time_budget: int,
+                        cwd: Optional[str], monitors: List[Callable[[RunContext], Awaitable]],
+                        env: Optional[Dict[str, str]]) -> RunOutcome:
+        os.makedirs(log_dir, exist_ok=True)
+        stdout_log_path = os.path.join(log_dir, log_name + ".stdout.log")
+        stderr_log_path = os.path.join(log_dir, log_name + ".stderr.log")
+        timed_out = False
+        start_time = time.time()
+        start_monotonic = get_monotonic_time()
+
+        with open(stdout_log_path, "wb") as stdout_log, open(stderr_log_path, "wb") as stderr_log:
+            # start_new_session: the harness becomes the leader of a new process group (and session)
+            process = await asyncio.create_subprocess_exec(*argv, stdin=asyncio.subprocess.DEVNULL,
+                                                           stdout=asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.PIPE,
+                                                           cwd=cwd, env=env, start_new_session=True)
+            pgid = process.pid
+            with self.lock:
+                self.process_groups[avd_serial] = pgid
+            context = RunContext(avd_serial, pgid)
+
+            streams = asyncio.gather(
+                self.stream_output(process.stdout, stdout_log, context, True),
+                self.stream_output(process.stderr, stderr_log, context, False))
+            monitor_tasks = [self.loop.create_task(monitor(context)) for monitor in monitors]
+            if not await self.wait_for_exit(process, time_budget + self.grace_time):
+                timed_out = True
+                print("[%s] the run exceeded its time budget (%d secs + %d secs), tear it down" % (
+                    avd_serial, time_budget, self.grace_time))
+            for task in monitor_tasks:
+                if task.done() and not task.cancelled() and task.exception() is not None:
+                    print("[%s] Warning: the monitor of the run failed: %s" % (avd_serial, task.exception()))
+                task.cancel()
+            # kill the leftovers (e.g., logcat, dump_coverage.sh) even if the harness exited normally
+            await self.terminate(process, pgid)
+            await self.wait_for_exit(process, TERMINATE_TIMEOUT)
+            try:
+                # the background processes of the harness may still hold the pipes if they escaped the group
+                await asyncio.wait_for(streams, timeout=TERMINATE_TIMEOUT)
+            except asyncio.TimeoutError:
+                print("[%s] Warning: the output of the run is not closed" % avd_serial)
+            with self.lock:
+                self.process_groups.pop(avd_serial, None)
+
+        result_dir = context.result_dir
+        if result_dir is not None and os.path.isdir(result_dir):
+            # keep the logs of the run with its results
+            shutil.move(stdout_log_path, os.path.join(result_dir, HARNESS_STDOUT_LOG))
+            shutil.move(stderr_log_path, os.path.join(result_dir, HARNESS_STDERR_LOG))
+            record_run_event(result_dir, RUN_PHASE, start_time, time.time(), start_monotonic, get_monotonic_time(),
+                             process.returncode, serial=avd_serial, timed_out=timed_out,
+                             stop_reason=context.stop_reason, invalid_reason=context.invalid_reason)
+
+        return RunOutcome(process.returncode, result_dir, timed_out, get_monotonic_time() - start_monotonic,
+                          context.stop_reason, context.invalid_reason)
+
+    def shutdown(self):
+        # tear down all the running runs, e.g., when themis.py is interrupted
+        self.stopped = True
+        with self.lock:
+            process_groups = list(self.process_groups.items())
+        for avd_serial, pgid in process_groups:
+            print("tear down the run on %s (process group %d)" % (avd_serial, pgid))
+            kill_process_group(pgid, signal.SIGTERM)
+        time.sleep(TERMINATE_TIMEOUT if len(process_groups) > 0 else 0)
+        for avd_serial, pgid in process_groups:
+            kill_process_group(pgid, signal.SIGKILL)
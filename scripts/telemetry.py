@@ -0,0 +1,112 @@
+# This file aggregates the per-phase timing telemetry of the runs.
+# Each harness records the phases of its run (boot, install, login, fuzzing, coverage_pull, teardown, see
+#   harness_common.sh) in "run_events.jsonl" under the result dir, and the run supervisor adds one "run" event
+#   covering the whole harness. The timing summary of a campaign shows where the wall-clock time of its runs goes.
+
+import csv
+import json
+import os
+import statistics
+import time
+from typing import Dict, List
+
+RUN_EVENTS_FILE_NAME = "run_events.jsonl"
+TIMING_SUMMARY_FILE_NAME = "campaign_timing_summary.csv"
+# the event of the whole run, recorded by the supervisor
+RUN_PHASE = "run"
+# the phases overlapping other phases, which are not subtracted from the run time (e.g., the wait for a boot slot is
+#   a part of the boot)
+OVERLAPPING_PHASES = ["coverage_pull", "boot_queue"]
+# the run time not covered by any phase (e.g., starting logcat, pushing the tool to the device)
+OTHER_PHASE = "other"
+
+
+def get_monotonic_time():
+    # the same clock as /proc/uptime used by the harnesses
+    return time.clock_gettime(time.CLOCK_BOOTTIME)
+
+
+def record_run_event(result_dir: str, phase: str, start: float, end: float, start_monotonic: float,
+                     end_monotonic: float, status, **extra):
+    event = {'phase': phase, 'start': start, 'end': end, 'start_monotonic': start_monotonic,
+             'end_monotonic': end_monotonic, 'status': status}
+    event.update(extra)
+    with open(os.path.join(result_dir, RUN_EVENTS_FILE_NAME), "a") as events_file:
+        events_file.write(json.dumps(event) + "\n")
+
+
+def read_run_events(result_dir: str):
+    events = []
+    events_file_path = os.path.join(result_dir, RUN_EVENTS_FILE_NAME)
+    if not os.path.exists(events_file_path):
+        return events
+    with open(events_file_path, "r") as events_file:
+        for line in events_file:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # e.g., the harness was killed while writing the event
+                print("Warning: skip the corrupted run event in %s: %s" % (events_file_path, line))
+    return events
+
+
+def get_phase_durations(result_dirs: List[str]) -> Dict[str, List[float]]:
+    # phase -> the total duration (in seconds) of the phase in each run
+    phase_durations: Dict[str, List[float]] = {}
+    for result_dir in result_dirs:
+        run_phase_durations: Dict[str, float] = {}
+        for event in read_run_events(result_dir):
+            duration = event['end_monotonic'] - event['start_monotonic']
+            run_phase_durations[event['phase']] = run_phase_durations.get(event['phase'], 0.0) + duration
+        if len(run_phase_durations) == 0:
+            continue
+        if RUN_PHASE in run_phase_durations:
+            covered_time = sum(duration for phase, duration in run_phase_durations.items()
+                               if phase != RUN_PHASE and phase not in OVERLAPPING_PHASES)
+            run_phase_durations[OTHER_PHASE] = max(0.0, run_phase_durations[RUN_PHASE] - covered_time)
+        for phase, duration in run_phase_durations.items():
+            phase_durations.setdefault(phase, []).append(duration)
+    return phase_durations
+
+
+def summarize_timing(result_dirs: List[str]):
+    # one row per phase, sorted by the total time spent in the phase
+    phase_durations = get_phase_durations(result_dirs)
+    total_run_time = sum(phase_durations.get(RUN_PHASE, []))
+    rows = []
+    for phase, durations in phase_durations.items():
+        total_time = sum(durations)
+        rows.append({'phase': phase, 'runs': len(durations), 'total_secs': total_time,
+                     'mean_secs': total_time / len(durations), 'median_secs': statistics.median(durations),
+                     'max_secs': max(durations),
+                     'share': total_time / total_run_time if total_run_time > 0 and phase != RUN_PHASE else None})
+    rows.sort(key=lambda row: (row['phase'] != RUN_PHASE, -row['total_secs']))
+    return rows
+
+
+def print_timing_summary(rows):
+    if len(rows) == 0:
+        return
+    print("=========")
+    print("timing summary (per phase, over all runs):")
+    print("  %-16s %6s %12s %10s %10s %10s %7s" % ("phase", "runs", "total secs", "mean", "median", "max", "share"))
+    for row in rows:
+        print("  %-16s %6d %12.0f %10.1f %10.1f %10.1f %7s" % (
+            row['phase'], row['runs'], row['total_secs'], row['mean_secs'], row['median_secs'], row['max_secs'],
+            "-" if row['share'] is None else "%.1f%%" % (row['share'] * 100)))
+    print("=========")
+
+
+def write_timing_summary(output_dir: str, rows):
+    summary_file_path = os.path.join(output_dir, TIMING_SUMMARY_FILE_NAME)
+    with open(summary_file_path, "w") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['phase', 'runs', 'total_secs', 'mean_secs', 'median_secs', 'max_secs', 'share'])
+        for row in rows:
+            writer.writerow([row['phase'], row['runs'], "%.1f" % row['total_secs'], "%.1f" % row['mean_secs'],
+                             "%.1f" % row['median_secs'], "%.1f" % row['max_secs'],
+                             "" if row['share'] is None else "%.4f" % row['share']])
+    print("the timing summary is written to %s" % summary_file_path)
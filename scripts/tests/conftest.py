@@ -0,0 +1,22 @@
+# The scripts import each other as top-level modules (they run from scripts/), so do the tests.
+
+import os
+import sys
+
+import pytest
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+
+@pytest.fixture
+def data_dir():
+    # the stored inputs and outputs of the tests (e.g., coverage files and the jacococli reports of them)
+    return os.path.join(SCRIPTS_DIR, "tests", "data")
+
+
+@pytest.fixture
+def repo_dir():
+    return os.path.dirname(SCRIPTS_DIR)
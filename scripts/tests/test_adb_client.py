@@ -0,0 +1,377 @@
+# adb_client.py against a fake adb server, which speaks the smart-socket framing of the adb server (a 4-hex-digit length
+#   prefixed request, answered by OKAY or FAIL) for host:version, host:transport:, host-serial:<serial>:get-state,
+#   shell:, root: and the sync: protocol (STAT, LIST, RECV, SEND, QUIT), over an in-memory file system. The emulator
+#   console is a fake one speaking the line protocol of the console (banner, auth, kill).
+
+import io
+import socket
+import socketserver
+import stat
+import struct
+import threading
+
+import pytest
+
+from adb_client import AdbClient, AdbError, emulator_console, SyncFailure
+
+SERIAL = "emulator-5554"
+
+
+def read_exactly(sock: socket.socket, size: int):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if len(chunk) == 0:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+def send_fail(sock: socket.socket, message: str):
+    payload = message.encode("utf-8")
+    sock.sendall(b"FAIL" + b"%04x" % len(payload) + payload)
+
+
+def send_sync_fail(sock: socket.socket, message: str):
+    payload = message.encode("utf-8")
+    sock.sendall(b"FAIL" + struct.pack("<I", len(payload)) + payload)
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeAdbHandler)
+        # the files of the device: path -> (mode, content)
+        self.files = {}
+        self.packages = []
+        self.shell_commands = []
+        # the processes of the device: pid -> name
+        self.processes = {}
+        # the lines of the device log, and the ones logged after the log is cleared
+        self.log_lines = []
+        self.new_log_lines = []
+        self.rooted = False
+        # adbd is restarting after root:, the next get-state finds the device offline
+        self.restarting = False
+        # the number of DATA chunks of a pulled file sent before the connection is dropped, None to send all of them
+        self.drop_pull_after = None
+
+    def shell(self, command: str):
+        self.shell_commands.append(command)
+        if command == "getprop sys.boot_completed":
+            return "1\n"
+        if command.startswith("pm path "):
+            package_name = command[len("pm path "):]
+            return "package:/data/app/%s/base.apk\n" % package_name if package_name in self.packages else ""
+        if command.startswith("pm install "):
+            self.packages.append("com.example.app")
+            return "Success\n"
+        if command.startswith("echo "):
+            return command[len("echo "):] + "\n"
+        if command == "ps":
+            return "USER PID PPID VSIZE RSS WCHAN PC NAME\n" + "".join(
+                "root %d 1 0 0 0 0 S %s\n" % (pid, name) for pid, name in sorted(self.processes.items()))
+        if command.startswith("kill "):
+            for pid in command[len("kill "):].split():
+                self.processes.pop(int(pid), None)
+            return ""
+        if command == "logcat -c":
+            self.log_lines = self.new_log_lines
+            return ""
+        if command.startswith("logcat "):
+            return "".join(line + "\r\n" for line in self.log_lines)
+        return "/system/bin/sh: %s: not found\n" % command.split(" ")[0]
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        try:
+            self.serve()
+        except (EOFError, OSError):
+            pass
+
+    def serve(self):
+        sock = self.request
+        transport = None
+        while True:
+            length = int(read_exactly(sock, 4), 16)
+            request = read_exactly(sock, length).decode("utf-8")
+            if request == "host:version":
+                sock.sendall(b"OKAY" + b"0004" + b"0029")
+                return
+            if request.startswith("host-serial:") and request.endswith(":get-state"):
+                state = b"device" if request.split(":")[1] == SERIAL and not self.server.restarting else None
+                self.server.restarting = False
+                if state is None:
+                    send_fail(sock, "device '%s' not found" % request.split(":")[1])
+                else:
+                    sock.sendall(b"OKAY" + b"%04x" % len(state) + state)
+                return
+            if request.startswith("host:transport:"):
+                transport = request[len("host:transport:"):]
+                if transport != SERIAL:
+                    send_fail(sock, "device '%s' not found" % transport)
+                    return
+                sock.sendall(b"OKAY")
+                # the next request on the same connection is the one of a device service
+                continue
+            if transport is None:
+                send_fail(sock, "unknown host service")
+                return
+            if request.startswith("shell:"):
+                sock.sendall(b"OKAY" + self.server.shell(request[len("shell:"):]).encode("utf-8"))
+                return
+            if request == "root:":
+                self.server.rooted = True
+                self.server.restarting = True
+                sock.sendall(b"OKAY" + b"restarting adbd as root\n")
+                return
+            if request == "sync:":
+                sock.sendall(b"OKAY")
+                self.serve_sync(sock)
+                return
+            send_fail(sock, "unknown service: %s" % request)
+            return
+
+    def serve_sync(self, sock: socket.socket):
+        files = self.server.files
+        while True:
+            header = read_exactly(sock, 8)
+            sync_id, length = header[:4], struct.unpack("<I", header[4:])[0]
+            if sync_id == b"QUIT":
+                return
+            path = read_exactly(sock, length).decode("utf-8")
+            if sync_id == b"STAT":
+                if path in files:
+                    mode, content = files[path]
+                elif any(file_path.startswith(path.rstrip("/") + "/") for file_path in files):
+                    mode, content = stat.S_IFDIR | 0o755, b""
+                else:
+                    mode, content = 0, b""
+                sock.sendall(b"STAT" + struct.pack("<III", mode, len(content), 0))
+            elif sync_id == b"LIST":
+                prefix = path.rstrip("/") + "/"
+                entries = {}
+                for file_path, (mode, content) in files.items():
+                    if file_path.startswith(prefix):
+                        name = file_path[len(prefix):].split("/")[0]
+                        if "/" in file_path[len(prefix):]:
+                            entries[name] = (stat.S_IFDIR | 0o755, 0)
+                        else:
+                            entries[name] = (mode, len(content))
+                for name, (mode, size) in [(".", (stat.S_IFDIR | 0o755, 0))] + sorted(entries.items()):
+                    encoded = name.encode("utf-8")
+                    sock.sendall(b"DENT" + struct.pack("<IIII", mode, size, 0, len(encoded)) + encoded)
+                sock.sendall(b"DONE" + struct.pack("<IIII", 0, 0, 0, 0))
+            elif sync_id == b"RECV":
+                if path not in files:
+                    # the device closes the connection after refusing a transfer
+                    send_sync_fail(sock, "remote object '%s' does not exist" % path)
+                    return
+                content = files[path][1]
+                chunks = [content[i:i + 4096] for i in range(0, len(content), 4096)]
+                for index, chunk in enumerate(chunks):
+                    if self.server.drop_pull_after is not None and index >= self.server.drop_pull_after:
+                        return
+                    sock.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+                sock.sendall(b"DONE" + struct.pack("<I", 0))
+            elif sync_id == b"SEND":
+                remote_path, mode = path.rsplit(",", 1)
+                content = b""
+                while True:
+                    header = read_exactly(sock, 8)
+                    chunk_id, value = header[:4], struct.unpack("<I", header[4:])[0]
+                    if chunk_id == b"DATA":
+                        content += read_exactly(sock, value)
+                    elif chunk_id == b"DONE":
+                        break
+                    else:
+                        raise EOFError()
+                if remote_path.startswith("/system/"):
+                    send_sync_fail(sock, "couldn't create file: Read-only file system")
+                    return
+                files[remote_path] = (int(mode), content)
+                sock.sendall(b"OKAY" + struct.pack("<I", 0))
+            else:
+                send_sync_fail(sock, "unknown sync request")
+                return
+
+
+@pytest.fixture
+def adb_server():
+    server = FakeAdbServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def device(adb_server):
+    device = AdbClient(port=adb_server.server_address[1], timeout=5).device(SERIAL)
+    yield device
+    device.close_sync()
+
+
+def test_host_services(adb_server, device):
+    client = device.client
+    assert client.query("host:version") == "0029"
+    assert device.get_state() == "device"
+    assert client.device("emulator-5556").get_state() == "offline"
+
+
+def test_shell(adb_server, device):
+    assert device.shell("echo hello world") == "hello world\n"
+    assert device.is_boot_completed()
+    assert not device.has_package("com.example.app")
+    assert adb_server.shell_commands == ["echo hello world", "getprop sys.boot_completed", "pm path com.example.app"]
+
+
+def test_unknown_device(adb_server):
+    device = AdbClient(port=adb_server.server_address[1], timeout=5).device("emulator-5556")
+    with pytest.raises(AdbError, match="device 'emulator-5556' not found"):
+        device.shell("echo hello")
+    assert not device.is_boot_completed()
+
+
+def test_push_pull(tmp_path, adb_server, device):
+    content = bytes(range(256)) * 1000
+    local_path = tmp_path / "coverage.ec"
+    local_path.write_bytes(content)
+
+    device.push(str(local_path), "/sdcard/coverage.ec")
+    assert device.stat("/sdcard/coverage.ec")[1] == len(content)
+    assert device.stat("/sdcard/missing.ec")[0] == 0
+
+    pulled_path = tmp_path / "pulled.ec"
+    assert device.pull("/sdcard/coverage.ec", str(pulled_path)) == len(content)
+    assert pulled_path.read_bytes() == content
+    assert not (tmp_path / "pulled.ec.part").exists()
+
+
+def test_sync_connection_reused(tmp_path, adb_server, device):
+    local_path = tmp_path / "a.txt"
+    local_path.write_bytes(b"a")
+    device.push(str(local_path), "/sdcard/a.txt")
+    sync_socket = device.sync_socket
+    device.pull("/sdcard/a.txt", str(tmp_path / "b.txt"))
+    assert device.sync_socket is sync_socket
+
+
+def test_pull_fail(tmp_path, adb_server, device):
+    pulled_path = tmp_path / "pulled.ec"
+    with pytest.raises(SyncFailure, match="does not exist"):
+        device.pull("/sdcard/missing.ec", str(pulled_path))
+    assert list(tmp_path.iterdir()) == []
+
+    # the connection closed by the device is reopened for the next transfer
+    adb_server.files["/sdcard/x.ec"] = (0o100644, b"x")
+    assert device.pull("/sdcard/x.ec", str(pulled_path)) == 1
+
+
+def test_pull_broken_connection(tmp_path, adb_server, device):
+    adb_server.files["/sdcard/coverage.ec"] = (0o100644, b"x" * 20000)
+    adb_server.drop_pull_after = 2
+    with pytest.raises(AdbError):
+        device.pull("/sdcard/coverage.ec", str(tmp_path / "pulled.ec"))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_push_fail(tmp_path, adb_server, device):
+    local_path = tmp_path / "a.txt"
+    local_path.write_bytes(b"a")
+    with pytest.raises(SyncFailure, match="Read-only file system"):
+        device.push(str(local_path), "/system/a.txt")
+
+
+def test_install_until_installed(tmp_path, adb_server, device):
+    apk_path = tmp_path / "app.apk"
+    apk_path.write_bytes(b"PK")
+    installed, output = device.install_until_installed(str(apk_path), "com.example.app", 3, "-g")
+    assert installed
+    assert output == "Success\n"
+    assert "pm install -r -g '/data/local/tmp/app.apk'" in adb_server.shell_commands
+    assert "rm -f '/data/local/tmp/app.apk'" in adb_server.shell_commands
+
+
+def test_root(adb_server, device):
+    assert device.root(5) == "restarting adbd as root\n"
+    assert adb_server.rooted
+
+
+def test_logcat(adb_server, device):
+    # the log is cleared before the stream starts
+    adb_server.log_lines = ["old line"]
+    adb_server.new_log_lines = ["07-15 19:28:27.018 13673 13673 E AndroidRuntime: FATAL EXCEPTION: main"]
+    output_file = io.StringIO()
+    device.logcat(output_file, "-v", "time", "AndroidRuntime:E", "*:S")
+    assert output_file.getvalue() == "07-15 19:28:27.018 13673 13673 E AndroidRuntime: FATAL EXCEPTION: main\n"
+    assert adb_server.shell_commands == ["logcat -c", "logcat -v time AndroidRuntime:E *:S"]
+
+
+def test_kill_processes(adb_server, device):
+    adb_server.processes = {1200: "com.android.commands.monkey", 1300: "com.example.app"}
+    assert device.get_pids("monkey") == ["1200"]
+    assert device.kill_processes("monkey", 5)
+    assert adb_server.processes == {1300: "com.example.app"}
+    assert "kill 1200" in adb_server.shell_commands
+    # nothing to kill
+    assert device.kill_processes("monkey", 5)
+
+
+def test_pull_dir(tmp_path, adb_server, device):
+    adb_server.files["/sdcard/sata/sataModel.obj"] = (0o100644, b"model")
+    adb_server.files["/sdcard/sata/mt_data/1.png"] = (0o100644, b"png")
+    assert sorted(name for name, _, _ in device.list_dir("/sdcard/sata")) == ["mt_data", "sataModel.obj"]
+
+    assert device.pull_dir("/sdcard/sata", str(tmp_path / "sata")) == len(b"model") + len(b"png")
+    assert (tmp_path / "sata" / "sataModel.obj").read_bytes() == b"model"
+    assert (tmp_path / "sata" / "mt_data" / "1.png").read_bytes() == b"png"
+
+
+class FakeEmulatorConsole(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, token):
+        super().__init__(("127.0.0.1", 0), FakeEmulatorConsoleHandler)
+        self.token = token
+        self.commands = []
+
+
+class FakeEmulatorConsoleHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.wfile.write(b"Android Console: Authentication required\r\nOK\r\n")
+        authenticated = False
+        for line in self.rfile:
+            command = line.decode("utf-8").strip()
+            self.server.commands.append(command)
+            if command.startswith("auth "):
+                authenticated = command == "auth " + self.server.token
+                self.wfile.write(b"OK\r\n" if authenticated else b"KO: bad auth token\r\n")
+            elif not authenticated:
+                self.wfile.write(b"KO: unknown command, try 'help'\r\n")
+            elif command == "kill":
+                self.wfile.write(b"OK: killing emulator, bye bye\r\n")
+                return
+
+
+def test_emulator_console(tmp_path, monkeypatch):
+    (tmp_path / ".emulator_console_auth_token").write_text("secret\n")
+    monkeypatch.setenv("ANDROID_EMULATOR_HOME", str(tmp_path))
+    console = FakeEmulatorConsole("secret")
+    thread = threading.Thread(target=console.serve_forever, daemon=True)
+    thread.start()
+    try:
+        reply = emulator_console(console.server_address[1], "kill", timeout=5)
+    finally:
+        console.shutdown()
+        console.server_close()
+
+    assert reply.startswith("OK: killing emulator")
+    assert console.commands == ["auth secret", "kill"]
@@ -0,0 +1,94 @@
+# The metadata of the bundled apks read by apk_metadata.py (the parser of the binary AndroidManifest.xml), and its
+#   cache next to the apks. The apks are copied to a temp dir, so that the tests do not write the cache into the repo.
+
+import os
+import shutil
+import threading
+import zipfile
+
+import pytest
+
+from apk_metadata import APK_METADATA_FILE_NAME, get_apk_metadata, ManifestParseError, MANIFEST_FILE_NAME, \
+    read_manifest, read_metadata_cache, update_metadata_cache
+
+# apk -> (package, launchable activity, min sdk, target sdk)
+BUNDLED_APKS = {
+    "APhotoManager/APhotoManager-0.6.4.180314-debug-#116.apk": (
+        "de.k3b.android.androFotoFinder", "de.k3b.android.androFotoFinder.FotoGalleryActivity", 14, 21),
+    "ActivityDiary/ActivityDiary-1.1.8-debug-#118.apk": (
+        "de.rampro.activitydiary.debug", "de.rampro.activitydiary.ui.main.MainActivity", 16, 26),
+    "MaterialFBook/MaterialFBook4.0.2-debug-#224.apk": (
+        "me.zeeroooo.materialfb", "me.zeeroooo.materialfb.activities.MainActivity", 17, 29),
+    "geohashdroid/geohashdroid-0.9.4-#73.apk": (
+        "net.exclaimindustries.geohashdroid", "net.exclaimindustries.geohashdroid.activities.CentralMap", 16, 29),
+    "openlauncher/openlauncher-0.3.1-#67.apk": (
+        "com.benny.openlauncher", "com.benny.openlauncher.activity.Init", 16, 25),
+    "sunflower/sunflower-0.1.6-#239.apk": (
+        "com.google.samples.apps.sunflower", "com.google.samples.apps.sunflower.GardenActivity", 19, 28),
+}
+
+
+def copy_apk(repo_dir, tmp_path, apk):
+    apk_path = str(tmp_path / os.path.basename(apk))
+    shutil.copyfile(os.path.join(repo_dir, apk), apk_path)
+    return apk_path
+
+
+@pytest.mark.parametrize("apk", sorted(BUNDLED_APKS))
+def test_bundled_apk(repo_dir, tmp_path, apk):
+    package_name, launchable_activity, min_sdk, target_sdk = BUNDLED_APKS[apk]
+
+    metadata = get_apk_metadata(copy_apk(repo_dir, tmp_path, apk))
+
+    assert metadata['package'] == package_name
+    assert metadata['launchable_activity'] == launchable_activity
+    assert metadata['min_sdk'] == min_sdk
+    assert metadata['target_sdk'] == target_sdk
+    assert metadata['apk'] == os.path.basename(apk)
+
+
+def test_metadata_cache(repo_dir, tmp_path):
+    apk = "sunflower/sunflower-0.1.6-#239.apk"
+    apk_path = copy_apk(repo_dir, tmp_path, apk)
+
+    metadata = get_apk_metadata(apk_path)
+
+    # only the cache is left next to the apk, e.g., no lock file
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(apk), APK_METADATA_FILE_NAME])
+    cache = read_metadata_cache(str(tmp_path / APK_METADATA_FILE_NAME))
+    assert list(cache.values()) == [metadata]
+    assert get_apk_metadata(apk_path) == metadata
+
+
+def test_concurrent_cache_updates(tmp_path):
+    cache_file_path = str(tmp_path / APK_METADATA_FILE_NAME)
+    threads = [threading.Thread(target=update_metadata_cache, args=(cache_file_path, "%040x" % i, {'package': str(i)}))
+               for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(read_metadata_cache(cache_file_path)) == 16
+    assert os.listdir(tmp_path) == [APK_METADATA_FILE_NAME]
+
+
+def test_corrupted_cache(repo_dir, tmp_path):
+    apk_path = copy_apk(repo_dir, tmp_path, "openlauncher/openlauncher-0.3.1-#67.apk")
+    (tmp_path / APK_METADATA_FILE_NAME).write_text("{\"truncated")
+
+    assert get_apk_metadata(apk_path)['package'] == "com.benny.openlauncher"
+    assert len(read_metadata_cache(str(tmp_path / APK_METADATA_FILE_NAME))) == 1
+
+
+@pytest.mark.parametrize("size", [8, 64, 1024])
+def test_truncated_manifest(repo_dir, tmp_path, size):
+    # the parse errors of a truncated manifest (e.g., struct.error, IndexError) are reported as ManifestParseError
+    with zipfile.ZipFile(os.path.join(repo_dir, "sunflower/sunflower-0.1.6-#239.apk")) as apk:
+        manifest = apk.read(MANIFEST_FILE_NAME)
+    apk_path = str(tmp_path / "truncated.apk")
+    with zipfile.ZipFile(apk_path, "w") as apk:
+        apk.writestr(MANIFEST_FILE_NAME, manifest[:size])
+
+    with pytest.raises(ManifestParseError):
+        read_manifest(apk_path)
@@ -0,0 +1,100 @@
+# The campaign spec of themis.py (see campaign.py): loading, the deterministic expansion into jobs, and the shards.
+
+import json
+from argparse import Namespace
+
+import pytest
+
+import themis
+from campaign import expand_campaign, expand_jobs, load_campaign, parse_shard, select_shard
+from scheduler import Job
+
+
+def write_campaign(path, campaign):
+    path.write_text(json.dumps(campaign))
+    return str(path)
+
+
+def test_load_campaign(tmp_path, monkeypatch):
+    spec_dir = tmp_path / "campaigns"
+    spec_dir.mkdir()
+    (spec_dir / "apks.txt").write_text("# a commented apk\n\n../a.apk, ../login-a.py\n../b.apk\n")
+    campaign_file = write_campaign(spec_dir / "campaign.json", {
+        "avd": "Android7.1", "tools": "monkey", "apk_list": "apks.txt", "apks": ["../c.apk"], "time": "1h"})
+    # the apk list is found next to the spec, not in the working dir
+    monkeypatch.chdir(tmp_path)
+
+    campaign = load_campaign(campaign_file)
+
+    assert campaign['tools'] == ["monkey"]
+    assert campaign['time'] == ["1h"]
+    assert campaign['repeat'] == 1
+    assert campaign['apk_paths'] == ["../a.apk", "../b.apk", "../c.apk"]
+    assert campaign['apk_login_scripts'] == ["../login-a.py", "\"\"", "\"\""]
+
+
+@pytest.mark.parametrize("campaign", [
+    [],
+    {"apks": ["a.apk"]},
+    {"tools": [], "apks": ["a.apk"]},
+    {"tools": ["monkey"]},
+    {"tools": ["monkey"], "apks": ["a.apk"], "time": "6"},
+    {"tools": ["monkey"], "apks": ["a.apk"], "time": [6]},
+    {"tools": ["monkey"], "apks": ["a.apk"], "repeat": 0},
+])
+def test_invalid_campaign(tmp_path, campaign):
+    with pytest.raises(ValueError):
+        load_campaign(write_campaign(tmp_path / "campaign.json", campaign))
+
+
+def test_malformed_json(tmp_path):
+    (tmp_path / "campaign.json").write_text("{\"tools\": [\"monkey\"],")
+    with pytest.raises(ValueError):
+        load_campaign(str(tmp_path / "campaign.json"))
+
+
+def test_main_reports_invalid_campaign(tmp_path, capsys):
+    campaign_file = write_campaign(tmp_path / "campaign.json", {"tools": ["monkey"]})
+    output_dir = tmp_path / "output"
+
+    themis.main(Namespace(campaign=campaign_file, o=str(output_dir)))
+
+    assert "Error: incorrect campaign spec: no apks are given" in capsys.readouterr().out
+    # nothing was started or created for the campaign
+    assert not output_dir.exists()
+
+
+def test_expand_jobs():
+    jobs = expand_jobs(["monkey", "ape"], ["a.apk", "b.apk"], ["\"\"", "login-b.py"], ["1h"], 2)
+
+    assert len(jobs) == 8
+    # the first runs of all the cells come first
+    assert [job.repeat_index for job in jobs] == [0, 0, 0, 0, 1, 1, 1, 1]
+    assert jobs[:4] == [Job("monkey", "a.apk", "\"\"", 0, "1h"), Job("monkey", "b.apk", "login-b.py", 0, "1h"),
+                        Job("ape", "a.apk", "\"\"", 0, "1h"), Job("ape", "b.apk", "login-b.py", 0, "1h")]
+
+
+def test_expand_campaign(tmp_path):
+    campaign = load_campaign(write_campaign(tmp_path / "campaign.json", {
+        "tools": ["monkey"], "apks": ["a.apk", "b.apk"], "time": ["1h", "6h"], "repeat": 3}))
+    assert expand_campaign(campaign) == expand_jobs(["monkey"], ["a.apk", "b.apk"], ["\"\"", "\"\""], ["1h", "6h"], 3)
+
+
+def test_parse_shard():
+    assert parse_shard("0/4") == (0, 4)
+    assert parse_shard("3/4") == (3, 4)
+
+
+@pytest.mark.parametrize("shard", ["4/4", "-1/4", "0/0", "1", "a/b", "1/2/3"])
+def test_invalid_shard(shard):
+    with pytest.raises(ValueError):
+        parse_shard(shard)
+
+
+def test_select_shard():
+    jobs = expand_jobs(["monkey", "ape"], ["a.apk", "b.apk", "c.apk"], ["\"\""] * 3, ["1h"], 3)
+    shards = [select_shard(jobs, shard_index, 4) for shard_index in range(4)]
+
+    # the shards are disjoint, cover all the jobs, and are balanced
+    assert sorted(job for shard in shards for job in shard) == sorted(jobs)
+    assert [len(shard) for shard in shards] == [5, 5, 4, 4]
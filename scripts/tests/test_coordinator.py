@@ -0,0 +1,95 @@
+# The coordinator of the coordinator/worker mode (see coordinator.py): the results reported by the workers and the jobs
+#   it re-queues.
+
+from campaign import expand_jobs
+from coordinator import CampaignCoordinator, RemoteSlotScheduler
+from ledger import JOB_FAILED, JOB_FINISHED, JOB_QUEUED, CampaignLedger, get_job_id
+from supervisor import RunOutcome
+
+
+def make_coordinator(tmp_path, number_of_jobs: int):
+    jobs = expand_jobs(["monkey"], ["app-%d.apk" % i for i in range(number_of_jobs)], ["\"\""] * number_of_jobs,
+                       ["1h"], 1)
+    ledger = CampaignLedger(str(tmp_path), "campaign-1")
+    coordinator = CampaignCoordinator(jobs, ledger, str(tmp_path))
+    coordinator.register("worker-1", "host-1", ["emulator-5554"])
+    return coordinator, ledger
+
+
+def test_finished_and_failed_jobs(tmp_path):
+    coordinator, ledger = make_coordinator(tmp_path, 2)
+    first_job, _ = coordinator.next_job("worker-1", "emulator-5554")
+    coordinator.report("worker-1", "emulator-5554", first_job, 0)
+    second_job, _ = coordinator.next_job("worker-1", "emulator-5554")
+    coordinator.report("worker-1", "emulator-5554", second_job, 1)
+
+    assert coordinator.all_done.is_set()
+    assert ledger.get_job_states() == {get_job_id(first_job): JOB_FINISHED, get_job_id(second_job): JOB_FAILED}
+
+
+def test_interrupted_run(tmp_path):
+    # e.g., the worker was stopped by Ctrl-C, the job is leased again instead of being recorded as failed
+    coordinator, ledger = make_coordinator(tmp_path, 1)
+    job, _ = coordinator.next_job("worker-1", "emulator-5554")
+    coordinator.report("worker-1", "emulator-5554", job, None, interrupted=True)
+
+    assert not coordinator.all_done.is_set()
+    assert ledger.get_job_states() == {get_job_id(job): JOB_QUEUED}
+    assert ledger.get_jobs_to_resume([job]) == [job]
+    assert coordinator.next_job("worker-1", "emulator-5554") == (job, False)
+
+
+def test_invalid_runs(tmp_path):
+    # the runs aborted by the watchdog of a worker are re-queued at most watchdog_retries times
+    coordinator, ledger = make_coordinator(tmp_path, 1)
+    coordinator.watchdog_retries = 1
+    job, _ = coordinator.next_job("worker-1", "emulator-5554")
+    coordinator.report("worker-1", "emulator-5554", job, -15, invalid_reason="the emulator hung")
+    assert ledger.get_job_states() == {get_job_id(job): JOB_QUEUED}
+
+    assert coordinator.next_job("worker-1", "emulator-5554") == (job, False)
+    coordinator.report("worker-1", "emulator-5554", job, -15, invalid_reason="the emulator hung")
+    assert ledger.get_job_states() == {get_job_id(job): JOB_FAILED}
+    assert coordinator.all_done.is_set()
+    assert coordinator.get_status()['failed'] == 1
+
+
+class FakeCoordinatorClient:
+
+    def __init__(self, jobs):
+        self.jobs = list(jobs)
+        self.uploaded = []
+        self.reported = []
+
+    def register(self, slots):
+        pass
+
+    def heartbeat(self):
+        pass
+
+    def next_job(self, avd_serial):
+        if len(self.jobs) == 0:
+            return None, True
+        return self.jobs.pop(0), False
+
+    def upload_result_dir(self, result_dir):
+        self.uploaded.append(result_dir)
+
+    def report(self, avd_serial, job, status, interrupted=False, invalid_reason=None):
+        self.reported.append((job.apk, status, interrupted, invalid_reason))
+
+
+def test_worker_uploads_the_result_dir_of_the_run(tmp_path):
+    # the result dir of the run may be named after another emulator than the slot's (e.g., the spare one of
+    #   --preboot), the worker uploads the one of the run's outcome
+    jobs = expand_jobs(["monkey"], ["app-0.apk", "app-1.apk"], ["\"\""] * 2, ["1h"], 1)
+    client = FakeCoordinatorClient(jobs)
+    outcomes = {
+        "app-0.apk": RunOutcome(0, str(tmp_path / "app-0.apk.monkey.result.emulator-5556#1"), False, 60),
+        "app-1.apk": RunOutcome(-15, None, False, 60, invalid_reason="the emulator hung"),
+    }
+    scheduler = RemoteSlotScheduler(["emulator-5554"], lambda job, avd_serial: outcomes[job.apk], client, stagger=0)
+    scheduler.run()
+
+    assert client.uploaded == [str(tmp_path / "app-0.apk.monkey.result.emulator-5556#1")]
+    assert client.reported == [("app-0.apk", 0, False, None), ("app-1.apk", -15, False, "the emulator hung")]
@@ -0,0 +1,90 @@
+# The coverage schedule of dump_coverage.py, and the spooling of the dumps, whose shell commands are run by the local
+#   shell (with a fake "am" writing the coverage file) instead of the one of a device.
+
+import hashlib
+import os
+import stat
+import subprocess
+
+import pytest
+
+import dump_coverage
+from adb_client import AdbError
+from dump_coverage import get_dump_interval, list_spooled_files, parse_coverage_schedule, spool_coverage_file
+
+
+class LocalShellDevice:
+
+    def __init__(self, env):
+        self.env = env
+
+    def shell(self, command: str, timeout=None):
+        return subprocess.run(["sh", "-c", command], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=self.env,
+                              timeout=timeout).stdout.decode("utf-8")
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setattr(dump_coverage, "COVERAGE_SPOOL_DIR", str(spool_dir))
+    monkeypatch.setattr(dump_coverage, "COVERAGE_SIZE_POLL_INTERVAL", 0.05)
+    return spool_dir
+
+
+def make_device(tmp_path, am_script: str):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    am_path = bin_dir / "am"
+    am_path.write_text("#!/bin/sh\n" + am_script)
+    am_path.chmod(am_path.stat().st_mode | stat.S_IXUSR)
+    return LocalShellDevice(dict(os.environ, PATH="%s:%s" % (bin_dir, os.environ["PATH"])))
+
+
+def test_parse_coverage_schedule():
+    assert parse_coverage_schedule("300") == [(300, None)]
+    assert parse_coverage_schedule("30:600, 60:1800, 300") == [(30, 600), (60, 1800), (300, None)]
+
+
+@pytest.mark.parametrize("schedule", ["0", "30:600", "30,60", "60:1800,30:600,300", "x"])
+def test_invalid_coverage_schedule(schedule):
+    with pytest.raises(ValueError):
+        parse_coverage_schedule(schedule)
+
+
+def test_get_dump_interval():
+    schedule = parse_coverage_schedule("30:600,60:1800,300")
+    assert get_dump_interval(schedule, 0) == 30
+    assert get_dump_interval(schedule, 600) == 60
+    assert get_dump_interval(schedule, 1799) == 60
+    assert get_dump_interval(schedule, 7200) == 300
+
+
+def test_spool_coverage_file(tmp_path, spool_dir):
+    coverage_file = tmp_path / "coverage.ec"
+    device = make_device(tmp_path, "printf 'coverage data' > %s\n" % coverage_file)
+
+    uptime = spool_coverage_file(device, str(coverage_file), "coverage_1.ec")
+
+    assert uptime is not None and uptime > 0
+    assert not coverage_file.exists()
+    assert sorted(os.listdir(spool_dir)) == ["coverage_1.ec"]
+    assert (spool_dir / "coverage_1.ec").read_bytes() == b"coverage data"
+    assert list_spooled_files(device) == {"coverage_1.ec": (13, hashlib.md5(b"coverage data").hexdigest())}
+
+
+def test_spool_listing_skips_temporary_files(tmp_path, spool_dir):
+    device = make_device(tmp_path, "")
+    (spool_dir / "coverage_1.ec").write_bytes(b"x")
+    (spool_dir / ".coverage_2.ec.part").write_bytes(b"half a cop")
+
+    assert list(list_spooled_files(device)) == ["coverage_1.ec"]
+
+
+def test_spool_missing_dump(tmp_path, spool_dir, monkeypatch):
+    monkeypatch.setattr(dump_coverage, "COVERAGE_SIZE_POLLS", 2)
+    device = make_device(tmp_path, "")
+
+    with pytest.raises(AdbError, match="did not dump"):
+        spool_coverage_file(device, str(tmp_path / "coverage.ec"), "coverage_1.ec")
+    assert os.listdir(spool_dir) == []
@@ -0,0 +1,103 @@
+# The live matching of the early-stop mode (see early_stop.py) against the stored crash stack of a target bug.
+
+import os
+import subprocess
+import time
+
+import pytest
+
+from check_crash import app_crash_data
+from early_stop import LogcatCrashMatcher, get_target_crash
+from supervisor import RunContext, get_child_processes
+
+OTHER_LINES = [
+    "07-15 19:28:25.101  1520  1544 I ActivityManager: START u0 {cmp=com.nextcloud.client/.MainActivity} from pid 1\n",
+    "07-15 19:28:26.450 13673 13673 D NetworkSecurityConfig: No Network Security Config specified, using default\n",
+]
+
+
+@pytest.fixture
+def crash_stack_lines(repo_dir):
+    with open(os.path.join(repo_dir, "nextcloud", "crash_stack_#4026.txt"), "r") as crash_stack_file:
+        return crash_stack_file.readlines()
+
+
+def feed_lines(matcher, lines):
+    for line in lines:
+        time_label = matcher.feed(line)
+        if time_label is not None:
+            return time_label
+    return None
+
+
+def test_get_target_crash():
+    app_name, issue_id, crash_signature_strs = get_target_crash("../nextcloud/nextcloud-#4026.apk")
+    assert (app_name, issue_id) == ("nextcloud", "#4026")
+    assert crash_signature_strs == app_crash_data['nextcloud']['#4026']
+    # "#497" is not taken for "#4977"
+    assert get_target_crash("../AnkiDroid/AnkiDroid-debug-#4977.apk")[1] == "#4977"
+    assert get_target_crash("../unknown/unknown-#1.apk") is None
+
+
+def test_match_target_crash(crash_stack_lines):
+    matcher = LogcatCrashMatcher(app_crash_data['nextcloud']['#4026'])
+    assert feed_lines(matcher, OTHER_LINES + crash_stack_lines) == "07-15 19:28:27.018 13673 13673 E AndroidRuntime"
+
+
+def test_other_crash(crash_stack_lines):
+    matcher = LogcatCrashMatcher(app_crash_data['nextcloud']['#1918'])
+    assert feed_lines(matcher, OTHER_LINES + crash_stack_lines) is None
+
+
+def test_signature_split_across_stacks(crash_stack_lines):
+    # the signature strings should all appear in the lines of one crash stack (i.e., of the same time label)
+    crash_signature_strs = app_crash_data['nextcloud']['#4026']
+    first_half = [line for line in crash_stack_lines if crash_signature_strs[0] in line]
+    second_half = [line.replace("19:28:27.018", "19:31:02.774") for line in crash_stack_lines
+                   if crash_signature_strs[0] not in line]
+    matcher = LogcatCrashMatcher(crash_signature_strs)
+    assert feed_lines(matcher, first_half + second_half) is None
+
+
+def test_separator_lines():
+    matcher = LogcatCrashMatcher(["java.lang.NullPointerException"])
+    assert matcher.feed("--------- beginning of crash\n") is None
+    assert matcher.feed("no time label\n") is None
+    assert matcher.feed("07-15 19:28:27.018 13673 13673 E AndroidRuntime: java.lang.NullPointerException\n") == \
+        "07-15 19:28:27.018 13673 13673 E AndroidRuntime"
+
+
+def start_harness(command):
+    # a harness in its own process group, as started by the run supervisor
+    process = subprocess.Popen(["bash", "-c", command], start_new_session=True)
+    # wait for bash to start its tool
+    deadline = time.monotonic() + 5
+    while not get_child_processes(process.pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return process
+
+
+def test_stop_fuzzing_under_timeout():
+    process = start_harness("timeout 30 sleep 30; exit 7")
+    try:
+        context = RunContext("emulator-5554", process.pid)
+        assert context.stop_fuzzing("the target crash was triggered")
+        assert context.stop_reason == "the target crash was triggered"
+        # the harness goes on after the tool ends
+        assert process.wait(timeout=5) == 7
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_stop_fuzzing_without_timeout():
+    # the tool does not run under timeout, the run cannot be stopped and is not reported as stopped
+    process = start_harness("sleep 30; exit 7")
+    try:
+        context = RunContext("emulator-5554", process.pid)
+        assert not context.stop_fuzzing("the target crash was triggered")
+        assert context.stop_reason is None
+        assert process.poll() is None
+    finally:
+        process.kill()
+        process.wait()
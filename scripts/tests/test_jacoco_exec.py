@@ -0,0 +1,82 @@
+# The byte compatibility of jacoco_exec.py with "jacococli.jar merge". The expected files were generated by:
+#   java -jar tools/jacococli.jar merge coverage_sparse.ec coverage_dense.ec --destfile coverage_merged.ec
+#   java -jar tools/jacococli.jar merge coverage_sessions_input.ec --destfile coverage_sessions.ec
+#   (coverage_sessions_input.ec: two concatenated files with session infos, e.g., with ties of their time stamps and
+#   ids with "\0" and supplementary characters)
+
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from jacoco_exec import ExecFileError, ExecutionData, ExecutionDataStore, decode_modified_utf8, \
+    encode_modified_utf8, merge_exec_files  # noqa: E402
+
+
+def read_bytes(path: str):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_merge(tmp_path, data_dir):
+    dest_path = str(tmp_path / "merged.ec")
+    store = merge_exec_files([os.path.join(data_dir, "coverage_sparse.ec"),
+                              os.path.join(data_dir, "coverage_dense.ec")], dest_path)
+
+    assert read_bytes(dest_path) == read_bytes(os.path.join(data_dir, "coverage_merged.ec"))
+    assert store.get_covered_probes() > 0
+
+
+@pytest.mark.parametrize("coverage_file", ["coverage_merged.ec", "coverage_sessions.ec"])
+def test_round_trip(tmp_path, data_dir, coverage_file):
+    store = ExecutionDataStore()
+    store.load(os.path.join(data_dir, coverage_file))
+    store.save(str(tmp_path / coverage_file))
+
+    assert read_bytes(str(tmp_path / coverage_file)) == read_bytes(os.path.join(data_dir, coverage_file))
+
+
+def test_merge_sessions(tmp_path, data_dir):
+    dest_path = str(tmp_path / "merged.ec")
+    store = merge_exec_files([os.path.join(data_dir, "coverage_sessions_input.ec")], dest_path)
+
+    assert read_bytes(dest_path) == read_bytes(os.path.join(data_dir, "coverage_sessions.ec"))
+    assert len(store.sessions) == 5
+
+
+def test_merge_into_existing_file(tmp_path, data_dir):
+    # the same as jacococli, the merged data is appended to the destfile, whose readers merge the repeated blocks
+    dest_path = str(tmp_path / "merged.ec")
+    merge_exec_files([os.path.join(data_dir, "coverage_sparse.ec")], dest_path, append=True)
+    merge_exec_files([os.path.join(data_dir, "coverage_dense.ec")], dest_path, append=True)
+
+    store = ExecutionDataStore()
+    store.load(dest_path)
+    store.save(dest_path)
+    assert read_bytes(dest_path) == read_bytes(os.path.join(data_dir, "coverage_merged.ec"))
+
+
+def test_incompatible_classes():
+    store = ExecutionDataStore()
+    store.put(ExecutionData(1, "a/A", np.zeros(3, dtype=bool)))
+    with pytest.raises(ExecFileError, match="Incompatible execution data"):
+        store.put(ExecutionData(1, "a/A", np.zeros(4, dtype=bool)))
+    with pytest.raises(ExecFileError, match="Different class names"):
+        store.put(ExecutionData(1, "a/B", np.zeros(3, dtype=bool)))
+
+
+def test_truncated_file(data_dir):
+    data = read_bytes(os.path.join(data_dir, "coverage_sparse.ec"))
+    with pytest.raises(ExecFileError):
+        ExecutionDataStore().load_bytes(data[:len(data) // 2])
+
+
+@pytest.mark.parametrize("value", ["com/example/A", "", "a\0b", "café", "中文", "\U0001d11e"])
+def test_modified_utf8(value):
+    encoded = encode_modified_utf8(value)
+    assert decode_modified_utf8(encoded[2:]) == value
+    # no "\0" byte, and the supplementary characters as two 3-byte surrogates
+    assert b"\0" not in encoded[2:]
+    if value == "\U0001d11e":
+        assert len(encoded) == 2 + 6
@@ -0,0 +1,99 @@
+# The parity of jacoco_index.py with "jacococli.jar report": the counters computed from the index of the classes of
+#   tools/jacococli.jar equal the ones of the stored jacococli reports (data/*.xml.gz) of the stored coverage files
+#   (data/*.ec). The reports were generated by:
+#   java -jar tools/jacococli.jar report coverage_<x>.ec --classfiles tools/jacococli.jar --xml coverage_<x>.xml
+
+import gzip
+import os
+from xml.dom import minidom
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from jacoco_exec import ExecutionDataStore  # noqa: E402
+from jacoco_index import COUNTER_TYPES, get_class_coverage_items, get_class_files, get_coverage_index  # noqa: E402
+
+COVERAGE_FILES = ["coverage_sparse", "coverage_dense"]
+
+
+def read_report(path: str):
+    # the counters (type -> (missed, covered)) of the whole report, and of each class
+    with gzip.open(path, "rb") as report_file:
+        document = minidom.parse(report_file)
+
+    def get_counters(element):
+        return {child.getAttribute('type'): (int(child.getAttribute('missed')), int(child.getAttribute('covered')))
+                for child in element.childNodes
+                if child.nodeType == child.ELEMENT_NODE and child.tagName == 'counter'}
+
+    class_counters = {element.getAttribute('name'): get_counters(element)
+                      for element in document.getElementsByTagName('class')}
+    return get_counters(document.documentElement), class_counters
+
+
+def get_class_counters(class_items, probes):
+    # the counters of a class in a report, computed from the probe masks of its coverage items
+    executed = 0
+    if probes is not None:
+        for probe_id in np.flatnonzero(probes[:class_items.probe_count]):
+            executed |= 1 << int(probe_id)
+
+    def count(masks):
+        covered = sum(1 for mask in masks if mask & executed != 0)
+        return len(masks) - covered, covered
+
+    counters = {'LINE': count(list(class_items.lines.values())), 'BRANCH': count(class_items.branches),
+                'METHOD': count(class_items.methods)}
+    if class_items.class_probes is not None:
+        counters['CLASS'] = count([class_items.class_probes])
+    # the reports leave out the counters without items
+    return {counter_type: counter for counter_type, counter in counters.items() if sum(counter) > 0}
+
+
+@pytest.fixture
+def jacococli_jar(repo_dir):
+    return os.path.join(repo_dir, "tools", "jacococli.jar")
+
+
+@pytest.mark.parametrize("coverage_file", COVERAGE_FILES)
+def test_report_counters(data_dir, jacococli_jar, coverage_file):
+    store = ExecutionDataStore()
+    store.load(os.path.join(data_dir, coverage_file + ".ec"))
+    report_counters, _ = read_report(os.path.join(data_dir, coverage_file + ".xml.gz"))
+
+    counters = get_coverage_index([jacococli_jar]).get_counters(store)
+
+    for counter_type in COUNTER_TYPES:
+        assert tuple(counters[counter_type]) == report_counters[counter_type], counter_type
+
+
+@pytest.mark.parametrize("coverage_file", COVERAGE_FILES)
+def test_class_counters(data_dir, jacococli_jar, coverage_file):
+    store = ExecutionDataStore()
+    store.load(os.path.join(data_dir, coverage_file + ".ec"))
+    _, report_class_counters = read_report(os.path.join(data_dir, coverage_file + ".xml.gz"))
+
+    class_names = []
+    for location, data in get_class_files(jacococli_jar):
+        class_items = get_class_coverage_items(data)
+        if class_items is None:
+            continue
+        class_names.append(class_items.name)
+        execution_data = store.classes.get(class_items.id)
+        counters = get_class_counters(class_items, None if execution_data is None else execution_data.probes)
+        report_counters = {counter_type: counter for counter_type, counter in
+                           report_class_counters[class_items.name].items() if counter_type in COUNTER_TYPES}
+        assert counters == report_counters, location
+    assert sorted(class_names) == sorted(report_class_counters)
+
+
+def test_saved_index(tmp_path, data_dir, jacococli_jar):
+    index_path = str(tmp_path / "jacococli.coverage_index.npz")
+    index = get_coverage_index([jacococli_jar], index_path)
+    loaded_index = get_coverage_index([jacococli_jar], index_path)
+
+    store = ExecutionDataStore()
+    store.load(os.path.join(data_dir, "coverage_dense.ec"))
+    assert loaded_index.fingerprint == index.fingerprint
+    assert loaded_index.get_counters(store) == index.get_counters(store)
@@ -0,0 +1,86 @@
+# The campaign ledger (see ledger.py): the latest state of each job, and the jobs re-queued by --resume.
+
+import json
+
+from campaign import expand_jobs
+from ledger import JOB_FAILED, JOB_FINISHED, JOB_QUEUED, JOB_RUNNING, LEDGER_FILE_NAME, CampaignLedger, get_job_id
+from scheduler import Job
+
+
+def make_jobs():
+    return expand_jobs(["monkey"], ["../a/a-#1.apk", "../b/b-#2.apk", "../c/c-#3.apk"], ["\"\""] * 3, ["1h"], 2)
+
+
+def test_job_id(tmp_path):
+    spec_dir = str(tmp_path / "campaigns")
+    assert get_job_id(Job("monkey", str(tmp_path / "a" / "a-#1.apk"), "\"\"", 1, "1h"), spec_dir) == \
+        "monkey|../a/a-#1.apk|\"\"|1h|1"
+    assert get_job_id(Job("monkey", str(tmp_path / "a" / "a-#1.apk"), str(tmp_path / "a" / "login-#1.py"), 1, "1h"),
+                      spec_dir) == "monkey|../a/a-#1.apk|../a/login-#1.py|1h|1"
+
+
+def test_distinct_job_ids(tmp_path):
+    # the entries differing only in the login script, or the apks of the same name in different app dirs, are
+    #   different jobs, and are not skipped by --resume once one of them is done
+    jobs = expand_jobs(["monkey"], ["a/app-#1.apk", "a/app-#1.apk", "b/app-#1.apk"],
+                       ["a/login-1.py", "a/login-2.py", "a/login-1.py"], ["1h"], 1)
+    ledger = CampaignLedger(str(tmp_path), "campaign-1", base_dir=str(tmp_path))
+    assert len(set(ledger.get_job_id(job) for job in jobs)) == 3
+
+    ledger.record(jobs[0], JOB_FINISHED)
+    assert ledger.get_jobs_to_resume(jobs) == jobs[1:]
+
+
+def test_resume(tmp_path):
+    jobs = make_jobs()
+    ledger = CampaignLedger(str(tmp_path), "campaign-1")
+    for job in jobs:
+        ledger.record(job, JOB_QUEUED)
+    ledger.record(jobs[0], JOB_RUNNING, avd_serial="emulator-5554")
+    ledger.record(jobs[0], JOB_FINISHED, avd_serial="emulator-5554", stop_reason=None)
+    ledger.record(jobs[1], JOB_RUNNING, avd_serial="emulator-5556")
+    ledger.record(jobs[1], JOB_FAILED, avd_serial="emulator-5556", exit_status=1)
+    # interrupted while running
+    ledger.record(jobs[2], JOB_RUNNING, avd_serial="emulator-5554")
+    # re-queued after an invalid run
+    ledger.record(jobs[3], JOB_RUNNING, avd_serial="emulator-5556")
+    ledger.record(jobs[3], JOB_QUEUED, avd_serial="emulator-5556", invalid_reason="the emulator hung")
+
+    resumed_ledger = CampaignLedger(str(tmp_path))
+    resumed_ledger.campaign_id = resumed_ledger.get_latest_campaign_id()
+
+    assert resumed_ledger.campaign_id == "campaign-1"
+    assert resumed_ledger.get_jobs_to_resume(jobs) == jobs[2:]
+    assert resumed_ledger.get_job_states()[get_job_id(jobs[2])] == JOB_RUNNING
+
+
+def test_campaigns_are_separate(tmp_path):
+    jobs = make_jobs()
+    first_ledger = CampaignLedger(str(tmp_path), "campaign-1")
+    for job in jobs:
+        first_ledger.record(job, JOB_FINISHED)
+    second_ledger = CampaignLedger(str(tmp_path), "campaign-2")
+    second_ledger.record(jobs[0], JOB_FINISHED)
+
+    assert CampaignLedger(str(tmp_path)).get_latest_campaign_id() == "campaign-2"
+    assert second_ledger.get_jobs_to_resume(jobs) == jobs[1:]
+    assert first_ledger.get_jobs_to_resume(jobs) == []
+
+
+def test_corrupted_last_entry(tmp_path):
+    jobs = make_jobs()
+    ledger = CampaignLedger(str(tmp_path), "campaign-1")
+    ledger.record(jobs[0], JOB_FINISHED)
+    # the host crashed while appending an entry
+    with open(ledger.ledger_file_path, "a") as ledger_file:
+        ledger_file.write(json.dumps({'campaign': "campaign-1", 'job': get_job_id(jobs[1])})[:20])
+
+    assert len(ledger.read_entries()) == 1
+    assert ledger.get_jobs_to_resume(jobs) == jobs[1:]
+
+
+def test_empty_ledger(tmp_path):
+    ledger = CampaignLedger(str(tmp_path))
+    assert ledger.get_latest_campaign_id() is None
+    assert ledger.get_jobs_to_resume(make_jobs()) == make_jobs()
+    assert not (tmp_path / LEDGER_FILE_NAME).exists()
@@ -0,0 +1,153 @@
+# The login snapshot cache (see login_snapshot.py) on a fake emulator pool: the snapshot key, the builds on the builder
+#   emulator, and the restores on the emulators of the slots.
+
+import os
+import threading
+import time
+
+import pytest
+
+from emulator_pool import PooledEmulator
+from login_snapshot import LoginSnapshotCache, get_login_snapshot_name
+
+
+class FakeDevice:
+
+    def install(self, apk_path, *options):
+        return "Success\n"
+
+
+class FakePool:
+
+    def __init__(self, save_ok=True):
+        # whether "avd snapshot save" succeeds on the builder
+        self.save_ok = save_ok
+        self.builder = PooledEmulator("emulator-5560", "emulator-5554", read_only=False)
+        self.snapshots = []
+        self.prepared = []
+        self.saves = []
+        self.loads = []
+        self.events = []
+        # set to make the builds wait, e.g., to check what the other slots do meanwhile
+        self.builder_ready = threading.Event()
+        self.builder_ready.set()
+
+    def prepare(self, slot, emulator_options, reset=True):
+        self.prepared.append(slot)
+        return True
+
+    def release(self, slot):
+        pass
+
+    def prepare_builder(self, emulator_options):
+        self.builder_ready.wait(10)
+        return True
+
+    def release_builder(self):
+        self.builder.dirty = True
+
+    def get_builder_device(self):
+        return FakeDevice()
+
+    def get_env(self, slot):
+        return dict(os.environ)
+
+    def has_snapshot(self, slot, snapshot):
+        return snapshot in self.snapshots
+
+    def save_builder_snapshot(self, snapshot):
+        self.saves.append(snapshot)
+        if self.save_ok:
+            self.snapshots.append(snapshot)
+        return self.save_ok
+
+    def load_snapshot(self, slot, snapshot):
+        self.loads.append((slot, snapshot))
+        return True
+
+    def log(self, avd_serial, event, duration, result):
+        self.events.append((event, result))
+
+
+@pytest.fixture
+def app(tmp_path):
+    apk_path = tmp_path / "app.apk"
+    apk_path.write_bytes(b"PK apk")
+    login_script = tmp_path / "login.py"
+    # the login scripts get the device serial and the device type
+    login_script.write_text("import sys\nprint('logged in on %s as %s' % (sys.argv[1], sys.argv[2]))\n"
+                            "print('Login SUCCESS')\n")
+    return str(apk_path), str(login_script)
+
+
+def test_snapshot_name(app, tmp_path):
+    apk_path, login_script = app
+    name = get_login_snapshot_name(apk_path, login_script, "Android7.1", "monkey")
+
+    assert name.startswith("themis_login_")
+    assert name == get_login_snapshot_name(apk_path, login_script, "Android7.1", "monkey")
+    assert name != get_login_snapshot_name(apk_path, login_script, "Android7.1", "ape")
+    assert name != get_login_snapshot_name(apk_path, login_script, "Android8.0", "monkey")
+    with open(login_script, "a") as f:
+        f.write("# changed\n")
+    assert name != get_login_snapshot_name(apk_path, login_script, "Android7.1", "monkey")
+
+
+def test_build_and_restore(app, tmp_path):
+    apk_path, login_script = app
+    pool = FakePool()
+    cache = LoginSnapshotCache(pool, "Android7.1", str(tmp_path / "output"))
+
+    snapshot = cache.restore("emulator-5554", apk_path, login_script, "monkey", "monkey", [])
+    assert snapshot == get_login_snapshot_name(apk_path, login_script, "Android7.1", "monkey")
+    assert pool.saves == [snapshot]
+    assert ("login_snapshot", "ok") in pool.events
+    # the app is logged in on the writable builder, and the builder is reset before its next build
+    with open(os.path.join(str(tmp_path / "output"), "login_snapshots", snapshot + ".log")) as log_file:
+        assert "logged in on emulator-5560 as monkey" in log_file.read()
+    assert pool.builder.dirty
+    # the read-only emulator of the slot loads the saved snapshot
+    assert pool.loads == [("emulator-5554", snapshot)]
+
+    # the next runs load the snapshot instead of building it again
+    assert cache.restore("emulator-5556", apk_path, login_script, "monkey", "monkey", []) == snapshot
+    assert pool.saves == [snapshot]
+    assert pool.loads == [("emulator-5554", snapshot), ("emulator-5556", snapshot)]
+
+
+def test_boot_outside_the_snapshot_lock(app, tmp_path):
+    # while a slot builds the snapshot of an app, the other slots running the same app already boot their emulators
+    apk_path, login_script = app
+    pool = FakePool()
+    pool.builder_ready.clear()
+    cache = LoginSnapshotCache(pool, "Android7.1", str(tmp_path / "output"))
+
+    threads = [threading.Thread(target=cache.restore, args=(slot, apk_path, login_script, "monkey", "monkey", []))
+               for slot in ["emulator-5554", "emulator-5556"]]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while len(pool.prepared) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert sorted(pool.prepared) == ["emulator-5554", "emulator-5556"]
+    assert pool.saves == []
+    pool.builder_ready.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(pool.saves) == 1
+    assert len(pool.loads) == 2
+
+
+def test_save_failure(app, tmp_path):
+    apk_path, login_script = app
+    pool = FakePool(save_ok=False)
+    cache = LoginSnapshotCache(pool, "Android7.1", str(tmp_path / "output"))
+
+    assert cache.restore("emulator-5554", apk_path, login_script, "monkey", "monkey", []) is None
+    assert ("login_snapshot", "failed (save)") in pool.events
+    # only this snapshot is not retried
+    assert cache.restore("emulator-5554", apk_path, login_script, "monkey", "monkey", []) is None
+    assert cache.restore("emulator-5554", apk_path, login_script, "ape", "ape", []) is None
+    assert len(pool.saves) == 2
+    assert pool.loads == []
@@ -0,0 +1,84 @@
+# The device-slot scheduler: the slots drain the queue, and stop() (e.g., on Ctrl-C) or an interrupted run ends them
+#   without taking the pending jobs.
+
+import threading
+
+from scheduler import DeviceSlotScheduler, Job
+from supervisor import RunInterrupted
+
+
+def make_jobs(number_of_jobs: int):
+    return [Job("monkey", "app-%d.apk" % i, "\"\"", 0, "1m") for i in range(number_of_jobs)]
+
+
+def test_run_all_jobs():
+    done = []
+    lock = threading.Lock()
+
+    def run_job(job, avd_serial):
+        with lock:
+            done.append((job.apk, avd_serial))
+        return 0
+
+    scheduler = DeviceSlotScheduler(["emulator-5554", "emulator-5556"], run_job, stagger=0)
+    scheduler.run(make_jobs(5))
+
+    assert sorted(apk for apk, _ in done) == sorted(job.apk for job in make_jobs(5))
+    assert len(scheduler.records) == 5
+
+
+def test_requeued_job():
+    attempts = []
+
+    def run_job(job, avd_serial):
+        attempts.append(job.apk)
+        if len(attempts) == 1:
+            scheduler.add_job(job)
+        return 0
+
+    scheduler = DeviceSlotScheduler(["emulator-5554"], run_job, stagger=0)
+    scheduler.run(make_jobs(1))
+
+    assert attempts == ["app-0.apk", "app-0.apk"]
+
+
+def test_stop():
+    started = threading.Event()
+    release = threading.Event()
+    done = []
+
+    def run_job(job, avd_serial):
+        started.set()
+        release.wait(10)
+        done.append(job.apk)
+        # a run re-queued after stop() is dropped
+        scheduler.add_job(job)
+        return 0
+
+    scheduler = DeviceSlotScheduler(["emulator-5554"], run_job, stagger=0)
+    thread = threading.Thread(target=scheduler.run, args=(make_jobs(3),))
+    thread.start()
+    assert started.wait(10)
+    scheduler.stop()
+    release.set()
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert done == ["app-0.apk"]
+    assert scheduler.pending_jobs == []
+    assert scheduler.next_job("emulator-5554") is None
+
+
+def test_interrupted_run():
+    done = []
+
+    def run_job(job, avd_serial):
+        done.append(job.apk)
+        raise RunInterrupted("the supervisor is stopped")
+
+    scheduler = DeviceSlotScheduler(["emulator-5554"], run_job, stagger=0)
+    scheduler.run(make_jobs(3))
+
+    # the slot ends instead of pulling the next job
+    assert done == ["app-0.apk"]
+    assert len(scheduler.records) == 1
@@ -1,147 +1,142 @@
 import os
 import time
 from argparse import ArgumentParser, Namespace
-from multiprocessing.pool import ThreadPool
-
-
-def get_time_in_seconds(testing_time):
-    if 'h' in testing_time:
-        testing_time_in_secs = int(testing_time[:-1]) * 60 * 60
-    elif 'm' in testing_time:
-        testing_time_in_secs = int(testing_time[:-1]) * 60
-    elif 's' in testing_time:
-        testing_time_in_secs = int(testing_time[:-1])
-    else:
-        print("Warning: the given time is ZERO seconds!!")
-        testing_time_in_secs = 0  # error!
-
-    return testing_time_in_secs
-
-
-def run_monkey(apk, avd_serial, avd_name, output_dir, testing_time, screen_option, login_script):
-    command = 'bash -x run_monkey.sh %s %s %s %s %s %s %s' % (apk, avd_serial, avd_name,
-                                                              output_dir,
-                                                              testing_time,
-                                                              screen_option,
-                                                              login_script)
-    print('execute monkey: %s' % command)
-    os.system(command)
-
-
-def run_ape(apk, avd_serial, avd_name, output_dir, testing_time, screen_option, login_script):
-    command = 'bash run_ape.sh %s %s %s %s %s %s %s' % (apk, avd_serial, avd_name,
-                                                        output_dir,
-                                                        testing_time,
-                                                        screen_option,
-                                                        login_script)
-    print('execute ape: %s' % command)
-    os.system(command)
-
-
-def run_combodroid(apk, avd_serial, avd_name, output_dir, testing_time, screen_option, login_script):
-    command = 'bash -x run_combodroid.sh %s %s %s %s %s %s %s' % (apk, avd_serial, avd_name,
-                                                                  output_dir,
-                                                                  testing_time,
-                                                                  screen_option,
-                                                                  login_script)
-    print('execute combodroid: %s' % command)
-    os.system(command)
-
-
-def run_combodroid_login(apk, avd_serial, avd_name, output_dir, testing_time, screen_option, login_script):
-    command = 'bash -x run_combodroid_login.sh %s %s %s %s %s %s %s' % (apk, avd_serial, avd_name,
-                                                                        output_dir,
-                                                                        testing_time,
-                                                                        screen_option,
-                                                                        login_script)
-    print('execute combodroid with login: %s' % command)
-    os.system(command)
-
-
-def run_timemachine(apk, avd_serial, avd_name, output_dir, testing_time, screen_option, login_script, adb_port):
-    testing_time_in_secs = get_time_in_seconds(testing_time)
-
-    command = 'bash run_timemachine.sh %s %s %s %s %s %s %s %s' % (apk, avd_serial, avd_name,
-                                                                   output_dir,
-                                                                   testing_time_in_secs,
-                                                                   screen_option,
-                                                                   login_script,
-                                                                   adb_port)
-    print('execute timemachine: %s' % command)
-    os.system(command)
-
-
-def run_humanoid(apk, avd_serial, avd_name, output_dir, testing_time, screen_option, login_script):
-    command = 'bash -x run_humanoid.sh %s %s %s %s %s %s %s' % (apk, avd_serial, avd_name,
-                                                                  output_dir,
-                                                                  testing_time,
-                                                                  screen_option,
-                                                                  login_script)
-    print('execute humanoid: %s' % command)
-    os.system(command)
-
-
-def run_weighted(apk, avd_serial, avd_name, output_dir, testing_time, screen_option, login_script):
-    command = 'bash -x run_weighted.sh %s %s %s %s %s %s %s' % (apk, avd_serial, avd_name,
-                                                                output_dir,
-                                                                testing_time,
-                                                                screen_option,
-                                                                login_script)
-    print('execute weighted exploration: %s' % command)
-    os.system(command)
-
-
-def run_stoat(apk, avd_serial, avd_name, output_dir, testing_time, screen_option, login_script):
-    command = 'bash -x run_stoat.sh %s %s %s %s %s %s %s' % (os.path.abspath(apk), avd_serial, avd_name,
-                                                             os.path.abspath(output_dir),
-                                                             testing_time,
-                                                             screen_option,
-                                                             login_script)
-    print('execute stoat: %s' % command)
-    os.system(command)
-
-
-def run_sapienz(apk, avd_serial, avd_name, output_dir, testing_time, screen_option, login_script):
-    command = 'bash -x run_sapienz.sh %s %s %s %s %s %s %s' % (os.path.abspath(apk), avd_serial, avd_name,
-                                                               os.path.abspath(output_dir),
-                                                               testing_time,
-                                                               screen_option,
-                                                               login_script)
-    print('execute sapienz: %s' % command)
-    os.system(command)
-
-
-def run_qtesting(apk, avd_serial, avd_name, output_dir, testing_time, screen_option, login_script):
-    command = 'bash -x run_qtesting.sh %s %s %s %s %s %s %s' % (os.path.abspath(apk), avd_serial, avd_name,
-                                                                os.path.abspath(output_dir),
-                                                                testing_time,
-                                                                screen_option,
-                                                                login_script)
-    print('execute Q-testing: %s' % command)
-    os.system(command)
-
-
-def get_all_apks(apk_list_file):
-    file = open(apk_list_file, 'r')
-    apk_paths = []
-    apk_login_scripts = []
-    for line in file.readlines():
-        if line.strip().startswith('#'):
-            # skip commented apk files
-            continue
-        if "," in line:
-            content = line.split(",")
-            apk_paths.append(content[0].strip())
-            apk_login_scripts.append(content[1].strip())
-        else:
-            apk_path = line.strip()
-            apk_paths.append(apk_path)
-            apk_login_scripts.append("\"\"")
-    print("Total %s apks under test" % len(apk_paths))
-    return apk_paths, apk_login_scripts
+from typing import Dict, List, Optional
+
+from adb_servers import ADB_SERVER_BASE_PORT, AdbServerPartition
+from admission import AdmissionController
+from boot_semaphore import BOOT_SLOTS_ENV, DEFAULT_BOOT_SLOTS
+from campaign import expand_campaign, expand_jobs, get_all_apks, load_campaign, parse_shard, \
+    select_shard
+from coordinator import CampaignCoordinator, CoordinatorClient, RemoteSlotScheduler, run_coordinator
+from dump_coverage import COVERAGE_DUMP_INTERVAL, COVERAGE_SCHEDULE_ENV, parse_coverage_schedule
+from early_stop import EARLY_STOP_ENV, make_early_stop_monitor
+from emulator_pool import DEFAULT_SNAPSHOT, EmulatorPool, make_preboot_monitor, WARM_POOL_ENV
+from ledger import CampaignLedger, JOB_FAILED, JOB_FINISHED, JOB_QUEUED, JOB_RUNNING
+from login_snapshot import LOGIN_SNAPSHOT_ENV, LoginSnapshotCache
+from resource_trace import make_resource_trace_monitor, print_resource_summary, summarize_resource_trace
+from scheduler import DeviceSlotScheduler, Job
+from slot_isolation import SlotIsolation
+from supervisor import get_exit_status, RUN_LOGS_DIR_NAME, RunInterrupted, RunSupervisor
+from telemetry import print_timing_summary, summarize_timing, write_timing_summary
+from tool_registry import add_tool_arguments, build_harness_argv, get_launchable_tools, get_selected_tool, get_tool, \
+    get_time_in_seconds, ToolAdapter
+from watchdog import DEFAULT_WATCHDOG_RETRIES, make_watchdog_monitor
+
+
+def run_tool(supervisor: RunSupervisor, tool: ToolAdapter, apk, avd_serial, avd_name, output_dir, testing_time,
+             screen_option, login_script, early_stop=False, env=None, slot_isolation=None, resource_trace=True,
+             get_extra_process_groups=None, watchdog=False, slot=None, extra_monitors=None):
+    argv = build_harness_argv(tool, apk, avd_serial, avd_name, output_dir, testing_time, screen_option,
+                              login_script)
+    print('execute %s: %s' % (tool.name, ' '.join(argv)))
+    if slot_isolation is not None:
+        # the harness, its emulator and its tool only run on the cpus of the slot
+        argv = slot_isolation.wrap_argv(slot or avd_serial, argv)
+    log_name = "%s.%s.%s#%s" % (os.path.basename(apk), tool.name, avd_serial, time.strftime("%Y-%m-%d-%H-%M-%S"))
+    monitors = list(extra_monitors or [])
+    if early_stop:
+        # stop the run once the target crash of the apk appears in its logcat
+        early_stop_monitor = make_early_stop_monitor(tool, apk)
+        if early_stop_monitor is not None:
+            monitors.append(early_stop_monitor)
+            env = dict(env or os.environ, **{EARLY_STOP_ENV: "1"})
+    if watchdog:
+        # abort the run as invalid if its emulator hangs during the fuzzing
+        adb_port = env.get('ANDROID_ADB_SERVER_PORT') if env is not None else None
+        monitors.append(make_watchdog_monitor(tool, apk, int(adb_port) if adb_port is not None else None))
+    if resource_trace:
+        # sample the cpu, rss, io and context switches of the processes of the run
+        monitors.append(make_resource_trace_monitor(get_extra_process_groups))
+    outcome = supervisor.run(argv, avd_serial, os.path.join(output_dir, RUN_LOGS_DIR_NAME), log_name,
+                             get_time_in_seconds(testing_time), monitors=monitors, env=env)
+    print('%s on %s exited with status %s after %.0f secs%s%s, result dir: %s' % (
+        tool.name, avd_serial, outcome.exit_status, outcome.duration, ' (timed out)' if outcome.timed_out else '',
+        ' (invalid: %s)' % outcome.invalid_reason if outcome.invalid_reason is not None else '', outcome.result_dir))
+    if resource_trace and outcome.result_dir is not None:
+        print_resource_summary(avd_serial, summarize_resource_trace(outcome.result_dir))
+    return outcome
+
+
+def execute_job(args: Namespace, supervisor: RunSupervisor, job: Job, avd_serial: str, screen_option: str,
+                pool: Optional[EmulatorPool] = None, login_snapshots: Optional[LoginSnapshotCache] = None,
+                adb_servers: Optional[AdbServerPartition] = None, slot_isolation: Optional[SlotIsolation] = None):
+    current_apk = job.apk
+    login_script = job.login_script
+
+    print(os.path.exists(current_apk))
+
+    tool = get_tool(job.tool)
+    if tool is None or tool.harness is None:
+        print("Error: cannot launch the tool: %s" % job.tool)
+        return None
+
+    env = None
+    if adb_servers is not None:
+        # the harness and its tools talk to the adb server of the slot
+        if not adb_servers.ensure_running(avd_serial):
+            print("Error: the adb server of %s is not available" % avd_serial)
+            return None
+        env = adb_servers.get_env(avd_serial)
+    pooled = pool is not None and tool.warm_pool
+    if pool is not None and not tool.warm_pool:
+        # the tool boots its own emulator on the port of the pooled one
+        pool.stop(avd_serial)
+    elif pooled:
+        env = dict(env or os.environ, **{WARM_POOL_ENV: "1"})
+        snapshot = None
+        if login_snapshots is not None and login_script != "\"\"" and tool.login_snapshot:
+            # start from the installed and logged-in app instead of logging in again
+            snapshot = login_snapshots.restore(avd_serial, current_apk, login_script, tool.name, tool.result_tag,
+                                               tool.emulator_options)
+        if snapshot is not None:
+            env[LOGIN_SNAPSHOT_ENV] = snapshot
+        elif not pool.prepare(avd_serial, tool.emulator_options):
+            print("Error: the pooled emulator %s is not available" % avd_serial)
+            return None
+    # the emulator of the run, i.e., the pre-booted spare one of the slot in turn (see --preboot)
+    run_avd_serial = pool.get_avd_serial(avd_serial) if pooled else avd_serial
+    monitors = []
+    if pooled and args.preboot:
+        # prepare the emulator of the next run of the slot once the fuzzing of this run ends
+        monitors.append(make_preboot_monitor(pool, avd_serial, tool.emulator_options))
+    run_start = slot_isolation.begin_run(avd_serial) if slot_isolation is not None else None
+    outcome = None
+    try:
+        outcome = run_tool(supervisor, tool, current_apk, run_avd_serial, args.avd_name, args.o, job.time,
+                           screen_option, login_script, args.early_stop, env, slot_isolation,
+                           not args.no_resource_trace,
+                           (lambda: pool.get_process_groups(avd_serial)) if pooled else None, args.watchdog,
+                           avd_serial, monitors)
+        return outcome
+    finally:
+        if pooled:
+            if outcome is not None and outcome.invalid_reason is not None:
+                # the emulator hung, the next run starts on a freshly booted one
+                pool.discard(avd_serial)
+            else:
+                pool.release(avd_serial)
+        if slot_isolation is not None:
+            slot_isolation.record_run(avd_serial, run_start, outcome.result_dir if outcome is not None else None)
 
 
 def main(args: Namespace):
+    campaign = None
+    if args.campaign is not None:
+        # campaign mode: tools x apks x time budgets x repeats, loaded before any emulator or adb server is started
+        try:
+            campaign = load_campaign(args.campaign)
+        except (ValueError, OSError) as e:
+            print("Error: incorrect campaign spec: %s" % e)
+            return
+        if args.avd_name is None:
+            args.avd_name = campaign.get('avd')
+        for tool_name in campaign['tools']:
+            tool = get_tool(tool_name)
+            if tool is None or tool.harness is None:
+                print("Error: cannot launch the tool in the campaign: %s" % tool_name)
+                return
+
     if not os.path.exists(args.o):
         os.mkdir(args.o)
 
@@ -152,101 +147,197 @@ def main(args: Namespace):
         avd_serial = 'emulator-' + str(start_avd_serial + apk_index * 2)
         avd_serial_list.append(avd_serial)
         print('allocate emulators: %s' % avd_serial)
+    # the spare emulators of the slots take the ports after the ones of the slots (see --preboot)
+    spare_serial_list = None
+    if args.preboot:
+        spare_serial_list = ['emulator-' + str(start_avd_serial + (args.number_of_devices + apk_index) * 2)
+                             for apk_index in range(args.number_of_devices)]
+        print('allocate spare emulators: %s' % ', '.join(spare_serial_list))
+
+    number_of_emulators = args.number_of_devices * (2 if args.preboot else 1)
+    # the writable emulator building the login snapshots takes the port after the ones of the slots (see
+    #   --login-snapshot)
+    builder_serial = None
+    if args.login_snapshot:
+        builder_serial = 'emulator-' + str(start_avd_serial + number_of_emulators * 2)
+        number_of_emulators += 1
+        print('allocate the login snapshot builder: %s' % builder_serial)
+
+    # the emulators on ports beyond 5585 are only detected by adb when the local transport range is extended
+    last_avd_port = start_avd_serial + (number_of_emulators - 1) * 2
+    if last_avd_port > 5584 and 'ADB_LOCAL_TRANSPORT_MAX_PORT' not in os.environ:
+        os.environ['ADB_LOCAL_TRANSPORT_MAX_PORT'] = str(last_avd_port + 1)
+
+    # limit the concurrent cold boots on the host, the harnesses and the pool take the slots of the boot semaphore
+    os.environ[BOOT_SLOTS_ENV] = str(args.max_boots)
+
+    # the coverage schedule of dump_coverage.py in the harnesses
+    os.environ[COVERAGE_SCHEDULE_ENV] = args.coverage_schedule
+
+    # admit a run only while the host has the headroom for one more emulator
+    admission = AdmissionController(args.max_emu, args.emu_cpus, args.emu_memory,
+                                    os.path.join(args.o, "admission.log"),
+                                    enabled=not args.no_admission_control)
 
     if args.no_headless:
         screen_option = "\"\""
     else:
         screen_option = "-no-window"
 
-    if args.apk is not None:
-        # single apk mode
-        all_apks = [args.apk]
-        if args.login_script is None:
-            all_apks_login_scripts = ["\"\""]
+    # each run is executed in its own process group, the supervisor tears it down when it ends or exceeds its budget
+    supervisor = RunSupervisor()
+    # confine each device slot to its own cpus, so that the concurrent runs get the same compute
+    slot_isolation = None
+    if (args.pin_cpus or args.cgroup_root is not None) and args.coordinator is None:
+        slot_isolation = SlotIsolation(avd_serial_list, args.cpus_per_slot, args.cgroup_root)
+    # one adb server per device slot, so that a stalled adb server only affects the run of its slot
+    adb_servers = None
+    if args.adb_server_per_slot and args.coordinator is None:
+        adb_servers = AdbServerPartition(avd_serial_list, args.adb_base_port, slot_isolation)
+        adb_servers.start()
+    # keep the emulators booted across the runs, and reset them between the runs
+    pool = None
+    if args.warm_pool:
+        pool = EmulatorPool(avd_serial_list, args.avd_name, screen_option, args.o, args.pool_snapshot, adb_servers,
+                            slot_isolation, spare_serial_list, builder_serial)
+    login_snapshots = None
+    if args.login_snapshot:
+        login_snapshots = LoginSnapshotCache(pool, args.avd_name, args.o)
+    # the result dirs of the runs, whose phase events are aggregated into the timing summary
+    result_dirs: List[str] = []
+
+    def run_and_collect(job: Job, avd_serial: str):
+        outcome = execute_job(args, supervisor, job, avd_serial, screen_option, pool, login_snapshots,
+                              adb_servers, slot_isolation)
+        if outcome is not None and outcome.result_dir is not None:
+            result_dirs.append(outcome.result_dir)
+        return outcome
+
+    if args.worker is not None:
+        # worker mode: the local device slots pull the jobs from the coordinator
+        client = CoordinatorClient(args.worker)
+        scheduler = RemoteSlotScheduler(avd_serial_list, run_and_collect, client, admission=admission)
+        try:
+            scheduler.run()
+        finally:
+            scheduler.stop()
+            supervisor.shutdown()
+            if pool is not None:
+                pool.shutdown()
+            if adb_servers is not None:
+                adb_servers.stop()
+        scheduler.print_utilization()
+        # the timing of the runs of this host
+        timing_summary = summarize_timing(result_dirs)
+        print_timing_summary(timing_summary)
+        if len(timing_summary) > 0:
+            write_timing_summary(args.o, timing_summary)
+        return
+
+    if campaign is not None:
+        jobs = expand_campaign(campaign)
+    else:
+        if args.apk is not None:
+            # single apk mode
+            all_apks = [args.apk]
+            if args.login_script is None:
+                all_apks_login_scripts = ["\"\""]
+            else:
+                all_apks_login_scripts = [args.login_script]
+        else:
+            # multiple apks mode
+            all_apks, all_apks_login_scripts = get_all_apks(args.apk_list)
+
+        # expand the apks into jobs, one job per (apk, login script, repeat)
+        jobs = expand_jobs([get_selected_tool(args).name], all_apks, all_apks_login_scripts, [args.time], args.repeat)
+
+    if args.shard is not None:
+        # only take this host's slice of the jobs
+        shard_index, number_of_shards = parse_shard(args.shard)
+        jobs = select_shard(jobs, shard_index, number_of_shards)
+        print("shard %d/%d: %d jobs" % (shard_index, number_of_shards, len(jobs)))
+
+    # record the state of each job in the ledger under the output dir, the apks of a campaign are identified by their
+    #   paths relative to the campaign spec file
+    ledger_base_dir = os.path.dirname(os.path.abspath(args.campaign)) if args.campaign is not None else None
+    if args.resume is not None:
+        ledger = CampaignLedger(args.o, base_dir=ledger_base_dir)
+        if args.resume == 'latest':
+            ledger.campaign_id = ledger.get_latest_campaign_id()
+            if ledger.campaign_id is None:
+                print("Error: no campaign to resume in %s" % ledger.ledger_file_path)
+                return
         else:
-            all_apks_login_scripts = [args.login_script]
+            ledger.campaign_id = args.resume
+        jobs = ledger.get_jobs_to_resume(jobs)
     else:
-        # multiple apks mode
-        all_apks, all_apks_login_scripts = get_all_apks(args.apk_list)
-
-    if args.repeat > 1:
-        copy_all_apks = all_apks.copy()
-        copy_all_apks_login_scripts = all_apks_login_scripts.copy()
-        for i in range(1, args.repeat):
-            all_apks = all_apks + copy_all_apks
-            all_apks_login_scripts = all_apks_login_scripts + copy_all_apks_login_scripts
-
-    print("the apk list to fuzz: %s" % str(all_apks))
-
-    number_of_apks = len(all_apks)
-    apk_index = 0
-
-    while 0 <= apk_index < number_of_apks:
-
-        p = ThreadPool(args.number_of_devices)
-        for avd_serial in avd_serial_list:
-            time.sleep(10)
-            if apk_index >= number_of_apks:
-                break
-            current_apk = all_apks[apk_index]
-
-            print(os.path.exists(current_apk))
-
-            print("Now allocate the apk: %s on %s" % (current_apk, avd_serial))
-            login_script = all_apks_login_scripts[apk_index]
-            print("its login script: %s" % login_script)
-
-            if args.monkey:
-                p.apply_async(run_monkey, args=(current_apk, avd_serial, args.avd_name,
-                                                args.o, args.time, screen_option,
-                                                login_script,))
-            elif args.ape:
-                p.apply_async(run_ape, args=(current_apk, avd_serial, args.avd_name,
-                                             args.o, args.time, screen_option,
-                                             login_script,))
-            elif args.timemachine:
-                avd_port = avd_serial.split('-')[1]
-                p.apply_async(run_timemachine, args=(current_apk, avd_serial, args.avd_name,
-                                                     args.o, args.time, screen_option,
-                                                     login_script, avd_port,))
-            elif args.combo:
-                p.apply_async(run_combodroid, args=(current_apk, avd_serial, args.avd_name,
-                                                    args.o, args.time, screen_option,
-                                                    login_script,))
-            elif args.combo_login:
-                p.apply_async(run_combodroid_login, args=(current_apk, avd_serial, args.avd_name,
-                                                          args.o, args.time, screen_option,
-                                                          login_script,))
-            elif args.humanoid:
-                p.apply_async(run_humanoid, args=(current_apk, avd_serial, args.avd_name,
-                                                    args.o, args.time, screen_option,
-                                                    login_script,))
-            elif args.weighted:
-                p.apply_async(run_weighted, args=(current_apk, avd_serial, args.avd_name,
-                                                  args.o, args.time, screen_option,
-                                                  login_script,))
-
-            elif args.stoat:
-                p.apply_async(run_stoat, args=(current_apk, avd_serial, args.avd_name,
-                                               args.o, args.time, screen_option,
-                                               login_script,))
-            elif args.sapienz:
-                p.apply_async(run_sapienz, args=(current_apk, avd_serial, args.avd_name,
-                                                 args.o, args.time, screen_option,
-                                                 login_script,))
-
-            elif args.qtesting:
-                p.apply_async(run_qtesting, args=(current_apk, avd_serial, args.avd_name,
-                                                  args.o, args.time, screen_option,
-                                                  login_script,))
+        ledger = CampaignLedger(args.o, base_dir=ledger_base_dir)
+        for job in jobs:
+            ledger.record(job, JOB_QUEUED)
+
+    print("the apk list to fuzz: %s" % str([job.apk for job in jobs]))
+
+    if args.coordinator is not None:
+        # coordinator mode: serve the jobs to the workers on (possibly) other hosts
+        run_coordinator(args.coordinator, CampaignCoordinator(jobs, ledger, args.o,
+                                                             watchdog_retries=args.watchdog_retries))
+        return
+
+    # job id -> the number of its runs aborted as invalid by the watchdog
+    invalid_runs: Dict[str, int] = {}
+
+    def run_job(job: Job, avd_serial: str):
+        ledger.record(job, JOB_RUNNING, avd_serial=avd_serial)
+        try:
+            outcome = run_and_collect(job, avd_serial)
+        except RunInterrupted:
+            # leave the job as running in the ledger, so that it is re-queued by --resume
+            raise
+        except Exception:
+            ledger.record(job, JOB_FAILED, avd_serial=avd_serial, exit_status=None)
+            raise
+        status = get_exit_status(outcome)
+        if outcome is not None and outcome.invalid_reason is not None:
+            job_id = ledger.get_job_id(job)
+            invalid_runs[job_id] = invalid_runs.get(job_id, 0) + 1
+            if invalid_runs[job_id] <= args.watchdog_retries:
+                # re-queue the job instead of counting the lost run as a run which found nothing
+                print("re-queue %s (%s, repeat #%d), retry %d/%d after the invalid run: %s" % (
+                    job.apk, job.tool, job.repeat_index, invalid_runs[job_id], args.watchdog_retries,
+                    outcome.invalid_reason))
+                ledger.record(job, JOB_QUEUED, avd_serial=avd_serial, invalid_reason=outcome.invalid_reason)
+                scheduler.add_job(job)
             else:
-                pass
-
-            apk_index += 1
-
-        print("wait the allocated devices to finish...")
-        p.close()
-        p.join()
+                ledger.record(job, JOB_FAILED, avd_serial=avd_serial, exit_status=status,
+                              invalid_reason=outcome.invalid_reason)
+            return None
+        if status == 0:
+            # the stop reason of an early stopped run, e.g., the target crash was triggered
+            ledger.record(job, JOB_FINISHED, avd_serial=avd_serial, stop_reason=outcome.stop_reason)
+        else:
+            ledger.record(job, JOB_FAILED, avd_serial=avd_serial, exit_status=status)
+        return status
+
+    # each device slot pulls the next job as soon as its previous run ends
+    scheduler = DeviceSlotScheduler(avd_serial_list, run_job, admission=admission)
+    try:
+        scheduler.run(jobs)
+    finally:
+        # e.g., on Ctrl-C, tear down the running runs instead of leaving their emulators and tools behind, and stop
+        #   the slots from taking more jobs, which would restart the adb servers and boot the emulators again
+        scheduler.stop()
+        supervisor.shutdown()
+        if pool is not None:
+            pool.shutdown()
+        if adb_servers is not None:
+            adb_servers.stop()
+    scheduler.print_utilization()
+
+    # where the wall-clock time of the runs went, e.g., boot, install, fuzzing, teardown
+    timing_summary = summarize_timing(result_dirs)
+    print_timing_summary(timing_summary)
+    if len(timing_summary) > 0:
+        write_timing_summary(args.o, timing_summary)
 
 
 if __name__ == '__main__':
@@ -264,35 +355,132 @@ if __name__ == '__main__':
     ap.add_argument('--time', type=str, default='6h', help="the fuzzing time in hours (e.g., 6h), minutes (e.g., 6m),"
                                                            " or seconds (e.g., 6s), default: 6h")
     ap.add_argument('--repeat', type=int, default=1, help="the repeated number of runs, default: 1")
-    ap.add_argument('--max-emu', type=int, default=16, help="the maximum allowed number of emulators")
+    ap.add_argument('--max-emu', type=int, default=16,
+                    help="the maximum allowed number of concurrently running emulators, default: 16")
+    ap.add_argument('--emu-cpus', type=float, default=2.0, dest='emu_cpus',
+                    help="the idle cpus required to admit one more run, default: 2")
+    ap.add_argument('--emu-memory', type=int, default=3072, dest='emu_memory',
+                    help="the available memory (in MB) required to admit one more run, default: 3072")
+    ap.add_argument('--no-admission-control', default=False, action='store_true', dest='no_admission_control',
+                    help="do not sample the host resources before admitting a run (only --max-emu applies)")
+    ap.add_argument('--max-boots', type=int, default=DEFAULT_BOOT_SLOTS, dest='max_boots',
+                    help="the maximum number of emulators cold booting at the same time on the host (shared with the "
+                         "other themis.py processes), default: %d" % DEFAULT_BOOT_SLOTS)
     ap.add_argument('--no-headless', dest='no_headless', default=False, action='store_true', help="show gui")
     ap.add_argument('--login', type=str, dest='login_script', help="the script for app login")
     ap.add_argument('--wait', type=int, dest='idle_time',
                     help="the idle time to wait before starting the fuzzing")
-
-    # supported fuzzing tools
-    ap.add_argument('--monkey', default=False, action='store_true')
-    ap.add_argument('--ape', default=False, action='store_true')
-    ap.add_argument('--timemachine', default=False, action='store_true')
-    ap.add_argument('--combo', default=False, action='store_true')
-    ap.add_argument('--combo-login', default=False, dest='combo_login', action='store_true')
-    ap.add_argument('--humanoid', default=False, action='store_true')
-    ap.add_argument('--stoat', default=False, action='store_true')
-    ap.add_argument('--sapienz', default=False, action='store_true')
-    ap.add_argument('--qtesting', default=False, action='store_true')
-    ap.add_argument('--weighted', default=False, action='store_true')
+    ap.add_argument('--early-stop', default=False, action='store_true', dest='early_stop',
+                    help="stop a run as soon as the target crash of its apk (see check_crash.py) appears in its "
+                         "logcat, and record the trigger time in early_stop.json under the result dir")
+
+    ap.add_argument('--warm-pool', default=False, action='store_true', dest='warm_pool',
+                    help="keep the emulators booted across the runs and reset each one by loading its quickboot "
+                         "snapshot before the next run, instead of booting and killing one emulator per run")
+    ap.add_argument('--pool-snapshot', type=str, default=DEFAULT_SNAPSHOT, dest='pool_snapshot',
+                    help="the snapshot of the avd loaded to reset a pooled emulator, default: %s" % DEFAULT_SNAPSHOT)
+    ap.add_argument('--login-snapshot', default=False, action='store_true', dest='login_snapshot',
+                    help="(with --warm-pool) install the app and run its login script once per apk, save the logged-in "
+                         "state as an emulator snapshot, and start the later runs from this snapshot (the snapshots "
+                         "are built on an extra emulator without -read-only, on the port after the ones of the slots)")
+
+    ap.add_argument('--preboot', default=False, action='store_true', dest='preboot',
+                    help="(with --warm-pool) give each device slot a spare emulator (on the ports after the ones of "
+                         "the -n emulators), and prepare it for the next run once the fuzzing of the current run ends, "
+                         "while the current run tears down")
+
+    ap.add_argument('--adb-server-per-slot', default=False, action='store_true', dest='adb_server_per_slot',
+                    help="give each device slot its own adb server (via ANDROID_ADB_SERVER_PORT) instead of sharing "
+                         "the default one")
+    ap.add_argument('--adb-base-port', type=int, default=ADB_SERVER_BASE_PORT, dest='adb_base_port',
+                    help="the port of the adb server of the first device slot (with --adb-server-per-slot), "
+                         "default: %d" % ADB_SERVER_BASE_PORT)
+
+    ap.add_argument('--watchdog', default=False, action='store_true', dest='watchdog',
+                    help="check the emulator of each run during the fuzzing (adb and system_server respond, the app "
+                         "runs, the device log grows), and abort and re-queue the run when the emulator hangs")
+    ap.add_argument('--watchdog-retries', type=int, default=DEFAULT_WATCHDOG_RETRIES, dest='watchdog_retries',
+                    help="the maximum number of times a job is re-queued after an invalid run (with --watchdog, "
+                         "given to the coordinator in coordinator/worker mode), default: %d" % DEFAULT_WATCHDOG_RETRIES)
+    ap.add_argument('--coverage-schedule', type=str, default=str(COVERAGE_DUMP_INTERVAL), dest='coverage_schedule',
+                    help="the intervals (in secs) of the coverage dumps of the runs, each until a time (in secs) since "
+                         "the start of the fuzzing, e.g., 30:600,60:1800,300 dumps every 30 secs for 10 minutes, every "
+                         "minute until 30 minutes, then every 5 minutes, default: %d" % COVERAGE_DUMP_INTERVAL)
+    ap.add_argument('--no-resource-trace', default=False, action='store_true', dest='no_resource_trace',
+                    help="do not sample the cpu, rss, io and context switches of the processes of each run into "
+                         "resource_trace.csv under the result dir")
+    ap.add_argument('--pin-cpus', default=False, action='store_true', dest='pin_cpus',
+                    help="split the cpus of the host into one cpu set per device slot, and pin the emulator, the adb "
+                         "server and the tool of each slot to its cpu set")
+    ap.add_argument('--cpus-per-slot', type=int, default=None, dest='cpus_per_slot',
+                    help="the number of cpus of each device slot (with --pin-cpus or --cgroup-root), default: the "
+                         "cpus of the host divided by the number of devices")
+    ap.add_argument('--cgroup-root', type=str, default=None, dest='cgroup_root',
+                    help="a delegated cgroup v2 dir, in which each device slot gets a child cgroup limited to its "
+                         "cpu set (implies --pin-cpus), its cpu time and throttling are recorded with each run")
+
+    # supported fuzzing tools (see tool_registry.py)
+    add_tool_arguments(ap, get_launchable_tools())
 
     ap.add_argument('--offset', type=int, default=0, help="device offset number w.r.t emulator-5554")
+    ap.add_argument('--campaign', type=str, dest='campaign',
+                    help="the campaign spec file (json) listing tools x apks x time budgets x repeats")
+    ap.add_argument('--shard', type=str, dest='shard', metavar='i/N',
+                    help="only run the i-th (0 <= i < N) of N disjoint slices of the jobs, e.g., 0/4")
+    ap.add_argument('--resume', type=str, nargs='?', const='latest', default=None, metavar='CAMPAIGN_ID',
+                    help="resume an interrupted campaign recorded in the ledger of the output dir (default: the "
+                         "latest campaign): skip the completed jobs and re-queue the interrupted ones")
+
+    ap.add_argument('--coordinator', type=str, dest='coordinator', metavar='HOST:PORT',
+                    help="serve the jobs to the workers at the given address instead of running them locally")
+    ap.add_argument('--worker', type=str, dest='worker', metavar='URL',
+                    help="run the jobs pulled from the coordinator at the given url (e.g., http://host:8000) on the "
+                         "local emulators")
 
     args = ap.parse_args()
 
-    if args.number_of_devices + args.offset > 16:
-        if not args.timemachine:
-            # TimeMachine is allowed to run more than 16 instances due to it runs in the docker containers.
-            ap.error('n + offset should not be ge 16')
+    # the spare emulators of --preboot and the builder of --login-snapshot take the ports after the ones of the slots
+    number_of_emulators = args.number_of_devices * (2 if args.preboot else 1) + (1 if args.login_snapshot else 0)
+    if 5554 + (args.offset + number_of_emulators - 1) * 2 > 5682:
+        # the emulator only accepts the console ports from 5554 to 5682
+        ap.error('n + offset (2 * n + offset with --preboot, plus 1 with --login-snapshot) should not be greater '
+                 'than 65')
+
+    if args.apk is None and args.apk_list is None and args.campaign is None and args.worker is None:
+        ap.error('please specify an apk, an apk list or a campaign')
+
+    if args.campaign is not None and not os.path.exists(args.campaign):
+        ap.error('No such file: %s' % args.campaign)
+
+    if args.shard is not None:
+        try:
+            parse_shard(args.shard)
+        except ValueError:
+            ap.error('incorrect shard format, should be i/N with 0 <= i < N')
+
+    if args.campaign is None and args.worker is None and get_selected_tool(args) is None:
+        ap.error('please specify a testing tool')
+
+    if args.adb_server_per_slot and args.adb_base_port + args.number_of_devices > 5554 + args.offset * 2 and \
+            args.adb_base_port < 5554 + (args.offset + number_of_emulators) * 2:
+        ap.error('the ports of the adb servers overlap the ports of the emulators, change --adb-base-port')
+
+    if args.cpus_per_slot is not None and args.cpus_per_slot < 1:
+        ap.error('--cpus-per-slot should be at least 1')
+
+    if args.max_boots < 1:
+        ap.error('--max-boots should be at least 1')
+
+    try:
+        parse_coverage_schedule(args.coverage_schedule)
+    except ValueError as e:
+        ap.error('incorrect coverage schedule: %s' % e)
+
+    if args.login_snapshot and not args.warm_pool:
+        ap.error('--login-snapshot requires --warm-pool')
 
-    if args.apk is None and args.apk_list is None:
-        ap.error('please specify an apk or an apk list')
+    if args.preboot and not args.warm_pool:
+        ap.error('--preboot requires --warm-pool')
 
     if args.apk_list is not None and not os.path.exists(args.apk_list):
         ap.error('No such file: %s' % args.apk_list)
@@ -0,0 +1,150 @@
+# This file is the registry of the supported testing tools.
+# Each tool adapter declares how themis.py launches the tool (its harness script and arguments) and where the
+#   tool's results are, i.e., the naming of its result dirs ("<apk>.<result tag>.result.<avd serial>...") and the files
+#   used by check_crash.py and compute_coverage.py. Adding a tool is one entry in TOOLS.
+
+import os
+from typing import List, NamedTuple, Optional
+
+EMULATOR_TIME_FORMAT = '%Y-%m-%d-%H:%M:%S'
+
+
+class ToolAdapter(NamedTuple):
+    # the tool name, also the command line option (e.g., --monkey) and the tool of a job
+    name: str
+    # the tag in the names of the tool's result dirs
+    result_tag: str
+    # the file recording the start and end testing time, relative to the result dir
+    time_file: str
+    # the harness script launching the tool, or None if themis.py cannot launch the tool
+    harness: Optional[str] = None
+    # the datetime format of the testing time file
+    time_format: str = EMULATOR_TIME_FORMAT
+    # the crash log and login log, relative to the result dir
+    logcat_file: str = "logcat.log"
+    login_file: str = "login.log"
+    # "logcat" or "timemachine" (the crashes.log of TimeMachine)
+    crash_log_format: str = "logcat"
+    # the dir holding the coverage files (*.ec), relative to the result dir
+    coverage_dir: str = ""
+    # the harness takes the absolute paths of the apk and the output dir
+    absolute_paths: bool = False
+    # the harness takes the testing time in seconds and the adb port of the emulator as the last argument
+    time_in_seconds: bool = False
+    adb_port_arg: bool = False
+    # trace the harness (bash -x)
+    trace: bool = True
+    # the extra options of the emulator required by the tool (e.g., -writable-system)
+    emulator_options: List[str] = []
+    # the harness can run on an emulator of the warm pool (i.e., it does not boot its own emulator)
+    warm_pool: bool = True
+    # the app can be installed and logged in once and restored from a snapshot (the tool does not install the app
+    #   itself, e.g., ComboDroid installs an instrumented app)
+    login_snapshot: bool = True
+    # the other command line options of the tool
+    aliases: List[str] = []
+
+
+TOOLS = [
+    ToolAdapter('monkey', 'monkey', 'monkey_testing_time_on_emulator.txt', harness='run_monkey.sh'),
+    ToolAdapter('ape', 'ape', 'ape_testing_time_on_emulator.txt', harness='run_ape.sh', trace=False),
+    ToolAdapter('timemachine', 'timemachine', 'timemachine-output/run_time.log', harness='run_timemachine.sh',
+                logcat_file='timemachine-output/crashes.log', login_file='timemachine-run.log',
+                crash_log_format='timemachine', coverage_dir='timemachine-output',
+                time_in_seconds=True, adb_port_arg=True, trace=False, warm_pool=False),
+    ToolAdapter('combo', 'combodroid', 'combo_testing_time_on_emulator.txt', harness='run_combodroid.sh',
+                time_format='%Y-%m-%d-%H-%M-%S', login_snapshot=False),
+    ToolAdapter('combo_login', 'combodroid', 'combo_testing_time_on_emulator.txt',
+                harness='run_combodroid_login.sh', time_format='%Y-%m-%d-%H-%M-%S', login_snapshot=False),
+    ToolAdapter('humanoid', 'humandroid', 'humandroid_testing_time_on_emulator.txt', harness='run_humanoid.sh',
+                aliases=['--humandroid']),
+    ToolAdapter('stoat', 'stoat', 'stoat_testing_time_on_emulator.txt', harness='run_stoat.sh',
+                absolute_paths=True),
+    ToolAdapter('sapienz', 'sapienz', 'sapienz_testing_time_on_emulator.txt', harness='run_sapienz.sh',
+                absolute_paths=True, emulator_options=['-writable-system']),
+    ToolAdapter('qtesting', 'qtesting', 'qtesting_testing_time_on_emulator.txt', harness='run_qtesting.sh',
+                absolute_paths=True),
+    ToolAdapter('fastbot', 'fastbot', 'fastbot_testing_time_on_emulator.txt', harness='run_fastbot.sh'),
+    # the tools whose results can be analyzed but which cannot be launched by themis.py (no harness script)
+    ToolAdapter('weighted', 'weighted', 'weighted_testing_time_on_emulator.txt'),
+    ToolAdapter('wetest', 'wetest', 'wetest_testing_time_on_emulator.txt'),
+    ToolAdapter('fastbot_new', 'fastbot_new', 'fastbot_new_testing_time_on_emulator.txt'),
+    ToolAdapter('wetest_new', 'wetest_new', 'wetest_new_testing_time_on_emulator.txt'),
+    ToolAdapter('newmonkey', 'newmonkey', 'newmonkey_testing_time_on_emulator.txt'),
+]
+
+TOOLS_BY_NAME = {tool.name: tool for tool in TOOLS}
+
+
+def get_tool(tool_name: str) -> Optional[ToolAdapter]:
+    return TOOLS_BY_NAME.get(tool_name)
+
+
+def get_launchable_tools():
+    return [tool for tool in TOOLS if tool.harness is not None]
+
+
+def add_tool_arguments(ap, tools: List[ToolAdapter] = None):
+    # add one command line option per tool, e.g., --monkey, --combo-login (or --combo_login)
+    if tools is None:
+        tools = TOOLS
+    for tool in tools:
+        option_strings = ['--' + tool.name]
+        if '_' in tool.name:
+            option_strings.insert(0, '--' + tool.name.replace('_', '-'))
+        option_strings += tool.aliases
+        ap.add_argument(*option_strings, dest=tool.name, default=False, action='store_true')
+
+
+def get_selected_tool(args) -> Optional[ToolAdapter]:
+    # the tool selected on the command line, or None
+    for tool in TOOLS:
+        if getattr(args, tool.name, False):
+            return tool
+    return None
+
+
+def detect_tool(result_dir: str) -> Optional[ToolAdapter]:
+    # the tool which produced the given result dir, e.g., "xx.apk.monkey.result.emulator-5554.base#..."
+    for tool in TOOLS:
+        if is_result_dir_of(tool, result_dir):
+            return tool
+    return None
+
+
+def is_result_dir_of(tool: ToolAdapter, result_dir: str):
+    return (".%s.result." % tool.result_tag) in os.path.basename(result_dir)
+
+
+def build_harness_argv(tool: ToolAdapter, apk, avd_serial, avd_name, output_dir, testing_time, screen_option,
+                       login_script):
+    # the harness is executed without a shell, so the quoted empty string ("\"\"") given for an omitted option is
+    #   passed as an empty argument
+    if tool.absolute_paths:
+        apk = os.path.abspath(apk)
+        output_dir = os.path.abspath(output_dir)
+    if tool.time_in_seconds:
+        testing_time = get_time_in_seconds(testing_time)
+    harness_args = [apk, avd_serial, avd_name, output_dir, testing_time, screen_option, login_script]
+    if tool.adb_port_arg:
+        harness_args.append(avd_serial.split('-')[1])
+    argv = ['bash', '-x'] if tool.trace else ['bash']
+    argv.append(tool.harness)
+    for arg in harness_args:
+        arg = str(arg)
+        argv.append('' if arg == '""' else arg)
+    return argv
+
+
+def get_time_in_seconds(testing_time):
+    if 'h' in testing_time:
+        testing_time_in_secs = int(testing_time[:-1]) * 60 * 60
+    elif 'm' in testing_time:
+        testing_time_in_secs = int(testing_time[:-1]) * 60
+    elif 's' in testing_time:
+        testing_time_in_secs = int(testing_time[:-1])
+    else:
+        print("Warning: the given time is ZERO seconds!!")
+        testing_time_in_secs = 0  # error!
+
+    return testing_time_in_secs
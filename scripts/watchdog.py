@@ -0,0 +1,130 @@
+# This file implements the hung-run watchdog of themis.py (see --watchdog).
+# When the emulator hangs in the middle of a run (adb offline, a boot loop, system_server dead), the harness would wait
+#   until "timeout $TEST_TIME" expires, and the lost run would later look like a run in which the tool found nothing.
+# Once the fuzzing of a run starts (i.e., the testing time file of the tool is created), the watchdog of the run checks
+#   the emulator periodically:
+#   - the device is online and system_server is running (the device is considered hung after WATCHDOG_DEVICE_FAILURES
+#     failed checks in a row);
+#   - the process of the app under test exists (the tools may leave the app for a while, so only an absence of
+#     WATCHDOG_APP_ABSENT_TIME counts);
+#   - the log of the device is still growing (the logcat.log of the harnesses only keeps the crashes, so the watchdog
+#     follows the time of the latest line of the device log instead, which stalls when the system hangs).
+# On a failure, the run is marked invalid ("watchdog.json" under the result dir) and torn down, and themis.py re-queues
+#   its job (at most --watchdog-retries times) on a freshly booted emulator.
+
+import asyncio
+import json
+import os
+import time
+import zipfile
+from typing import Optional
+
+from adb_client import AdbClient, AdbDevice, AdbError
+from apk_metadata import get_app_package_name, ManifestParseError
+from supervisor import RunContext
+from tool_registry import ToolAdapter
+
+WATCHDOG_FILE_NAME = "watchdog.json"
+# the time (in seconds) between two checks
+WATCHDOG_INTERVAL = 60
+WATCHDOG_DEVICE_FAILURES = 3
+WATCHDOG_APP_ABSENT_TIME = 10 * 60
+WATCHDOG_LOG_STALL_TIME = 10 * 60
+# the time (in seconds) to wait for the answer of one check
+WATCHDOG_CHECK_TIMEOUT = 20
+DEFAULT_WATCHDOG_RETRIES = 2
+
+
+def is_device_healthy(device: AdbDevice):
+    try:
+        return device.is_online() and len(device.shell("pidof system_server", WATCHDOG_CHECK_TIMEOUT).strip()) > 0
+    except (AdbError, OSError):
+        return False
+
+
+def is_app_running(device: AdbDevice, package_name: str):
+    try:
+        return len(device.shell("pidof " + package_name, WATCHDOG_CHECK_TIMEOUT).strip()) > 0
+    except (AdbError, OSError):
+        return False
+
+
+def get_latest_log_time(device: AdbDevice) -> Optional[float]:
+    # the time (in epoch seconds) of the latest line of the device log
+    try:
+        output = device.shell("logcat -d -t 1 -v epoch -b all", WATCHDOG_CHECK_TIMEOUT)
+    except (AdbError, OSError):
+        return None
+    for line in reversed(output.splitlines()):
+        fields = line.split()
+        if len(fields) > 0:
+            try:
+                return float(fields[0])
+            except ValueError:
+                continue
+    return None
+
+
+class RunWatchdog:
+    # the state of the checks of one run, the checks are blocking (and run off the event loop)
+
+    def __init__(self, device: AdbDevice, package_name: Optional[str]):
+        self.device = device
+        self.package_name = package_name
+        self.device_failures = 0
+        now = time.monotonic()
+        self.app_seen_time = now
+        self.log_time: Optional[float] = None
+        self.log_advanced_time = now
+
+    def check(self) -> Optional[str]:
+        # return why the run is hung, or None
+        now = time.monotonic()
+        if not is_device_healthy(self.device):
+            self.device_failures += 1
+            if self.device_failures >= WATCHDOG_DEVICE_FAILURES:
+                return "the device is offline or system_server is dead (%d checks)" % self.device_failures
+            return None
+        self.device_failures = 0
+        if self.package_name is not None:
+            if is_app_running(self.device, self.package_name):
+                self.app_seen_time = now
+            elif now - self.app_seen_time >= WATCHDOG_APP_ABSENT_TIME:
+                return "the app %s is not running for %.0f secs" % (self.package_name, now - self.app_seen_time)
+        log_time = get_latest_log_time(self.device)
+        if log_time is not None and (self.log_time is None or log_time > self.log_time):
+            self.log_time = log_time
+            self.log_advanced_time = now
+        elif now - self.log_advanced_time >= WATCHDOG_LOG_STALL_TIME:
+            return "the device log is not growing for %.0f secs" % (now - self.log_advanced_time)
+        return None
+
+
+def make_watchdog_monitor(tool: ToolAdapter, apk_path: str, adb_port: Optional[int] = None):
+    # the monitor of a run (see supervisor.py)
+    try:
+        package_name = get_app_package_name(apk_path)
+    except (OSError, KeyError, zipfile.BadZipFile, ManifestParseError) as e:
+        print("Warning: the watchdog cannot read the package name of %s, skip the app check: %s" % (apk_path, e))
+        package_name = None
+
+    async def monitor(context: RunContext):
+        await context.result_dir_created.wait()
+        # only watch the fuzzing, the boot, the install and the login have their own timeouts
+        testing_time_file_path = os.path.join(context.result_dir, tool.time_file)
+        while not os.path.exists(testing_time_file_path):
+            await asyncio.sleep(WATCHDOG_INTERVAL / 4)
+        loop = asyncio.get_event_loop()
+        watchdog = RunWatchdog(AdbClient(port=adb_port, timeout=WATCHDOG_CHECK_TIMEOUT).device(context.avd_serial),
+                               package_name)
+        while True:
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+            reason = await loop.run_in_executor(None, watchdog.check)
+            if reason is None:
+                continue
+            with open(os.path.join(context.result_dir, WATCHDOG_FILE_NAME), "w") as watchdog_file:
+                json.dump({'invalid': True, 'reason': reason, 'detected': time.time()}, watchdog_file)
+            context.abort(reason)
+            return
+
+    return monitor